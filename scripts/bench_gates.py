@@ -0,0 +1,111 @@
+"""
+候选表 Gate 判定基准：逐个判定 vs 线程池并发判定
+在本地 SQLite 中生成若干候选表，对比整批判定的墙钟耗时与最慢单个候选的耗时
+
+用法:
+    python scripts/bench_gates.py                              # 10 张候选表，每张 200000 行
+    python scripts/bench_gates.py --candidates 20 --rows 500000
+    python scripts/bench_gates.py --rows 20000 --latency 0.3   # 模拟远程引擎每次查询 300ms 往返
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.gates import Candidate, GateEngine, GateExecutor, SqliteEngine, load_fixtures
+
+COLUMNS = {"dt": "TEXT", "advertiser_id": "INTEGER", "cost": "REAL", "imp": "INTEGER", "click": "INTEGER"}
+DATES = ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04"]
+
+
+class LatencyEngine(GateEngine):
+    """在本地引擎外加固定往返延迟，模拟远程查询引擎（排队、网络）"""
+
+    def __init__(self, inner: GateEngine, latency: float):
+        self.inner, self.latency = inner, latency
+        self.time_types = inner.time_types
+
+    def columns(self, table):
+        time.sleep(self.latency)
+        return self.inner.columns(table)
+
+    def execute(self, sql, params=(), timeout=30.0):
+        time.sleep(self.latency)
+        return self.inner.execute(sql, params, timeout)
+
+    def table_ref(self, table):
+        return self.inner.table_ref(table)
+
+
+def synth_tables(n_tables: int, n_rows: int, seed: int = 7):
+    rng = random.Random(seed)
+    tables = {}
+    for i in range(n_tables):
+        rows = []
+        for _ in range(n_rows):
+            imp = rng.randint(1, 1000)
+            rows.append([rng.choice(DATES), rng.randint(1, 5000), round(rng.random() * 100, 2), imp, rng.randint(0, imp)])
+        tables[f"bi.dws_ad_cost_{i}_1d_d"] = {"columns": COLUMNS, "rows": rows}
+    return tables
+
+
+def candidates(tables):
+    return [
+        Candidate(
+            table=table, grain_keys=["advertiser_id"], time_field="dt", partition=DATES[0],
+            metrics={"cost": "SUM(cost)", "ctr": "1.0 * SUM(click) / SUM(imp)"},
+            grain_range=(100, 100000), ranges={"cost": (0, None), "ctr": (0, 1)},
+        )
+        for table in tables
+    ]
+
+
+def bench(engine, batch, workers: int, repeat: int):
+    executor = GateExecutor(engine, max_workers=workers)
+    try:
+        best, slowest = None, 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            verdicts = executor.evaluate(batch)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+            slowest = max(v.elapsed_ms for v in verdicts)
+        passed = sum(v.passed for v in verdicts)
+    finally:
+        executor.close()
+    return {"workers": workers, "wall_ms": round(best), "slowest_ms": round(slowest), "passed": passed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="候选表 Gate 判定基准")
+    parser.add_argument("--candidates", type=int, default=10, help="候选表数量")
+    parser.add_argument("--rows", type=int, default=200000, help="每张候选表的行数")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次查询附加的往返延迟（秒）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / "gates.db"
+        start = time.perf_counter()
+        tables = synth_tables(args.candidates, args.rows)
+        load_fixtures(database, tables)
+        print(f"候选表: {args.candidates} 张 × {args.rows} 行，生成耗时 {time.perf_counter() - start:.1f}s")
+        print()
+
+        engine, batch = SqliteEngine(database), candidates(tables)
+        if args.latency:
+            engine = LatencyEngine(engine, args.latency)
+        rows = [bench(engine, batch, 1, args.repeat), bench(engine, batch, args.candidates, args.repeat)]
+        print("| 模式 | 线程数 | 整批耗时 (ms) | 最慢单个候选 (ms) | 通过 |")
+        print("|------|--------|---------------|-------------------|------|")
+        for mode, row in zip(["逐个判定", "并发判定"], rows):
+            print(f"| {mode} | {row['workers']} | {row['wall_ms']} | {row['slowest_ms']} | {row['passed']}/{len(batch)} |")
+
+
+if __name__ == "__main__":
+    main()
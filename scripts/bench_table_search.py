@@ -0,0 +1,130 @@
+"""
+找表检索基准：全量扫描 vs 主题域 × 分层分片裁剪
+对比每次查询的候选集大小和检索耗时
+
+用法:
+    python scripts/bench_table_search.py                      # 合成 50000 张表的目录
+    python scripts/bench_table_search.py --tables 200000
+    python scripts/bench_table_search.py --catalog data/table_catalog.jsonl
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.table_search import TableSearchIndex
+from xagent.table_shards import DEFAULT_DOMAIN_KEYWORDS, ShardedTableIndex
+
+# 合成目录中各分层的占比（接近实际数仓：原始层和明细层最多）
+LAYER_MIX = [("ods", 0.30), ("dwd", 0.30), ("dws", 0.22), ("ads", 0.10), ("dim", 0.05), ("tmp", 0.03)]
+SUBJECTS = ["消耗", "曝光", "点击", "转化", "订单", "人数", "收入", "时长", "播放", "留存"]
+FIELDS = [("cost", "消耗金额"), ("imp_cnt", "曝光次数"), ("click_cnt", "点击次数"), ("conv_cnt", "转化数"),
+          ("order_amt", "订单金额"), ("user_cnt", "人数"), ("income", "收入"), ("play_cnt", "播放次数")]
+
+QUERIES = [
+    "效果广告 消耗 按天",
+    "花火 商单 收入",
+    "品牌 闪屏 曝光",
+    "dmp 人群包 人数",
+    "游戏 充值 留存",
+    "带货 订单 gmv",
+    "bdata 点击",
+    "投放 转化 出价",
+    "昨天 播放次数",
+    "cost imp_cnt 日汇总",
+]
+
+
+def synth_catalog(n_tables: int, seed: int = 7):
+    rng = random.Random(seed)
+    domains = list(DEFAULT_DOMAIN_KEYWORDS.items())
+    layers, weights = zip(*LAYER_MIX)
+    for i in range(n_tables):
+        domain, keywords = rng.choice(domains)
+        layer = rng.choices(layers, weights)[0]
+        subject = rng.choice(SUBJECTS)
+        keyword = rng.choice(keywords)
+        fields = rng.sample(FIELDS, 4)
+        yield {
+            "table": f"db_{i % 50}.{layer}_{keyword if keyword.isascii() else 'biz'}_{i}_1d_d",
+            "comment": f"{domain}{keyword}{subject}{'日汇总' if layer in ('dws', 'ads') else '明细'}",
+            "fields": [{"name": name, "comment": comment} for name, comment in fields],
+        }
+
+
+def load_catalog(path: Path):
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def bench(name: str, search, repeat: int):
+    latencies, candidates = [], []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            _, stats = search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+            candidates.append(stats["candidates"])
+    latencies.sort()
+    return {
+        "mode": name,
+        "avg_candidates": round(statistics.mean(candidates)),
+        "p50_ms": round(latencies[len(latencies) // 2], 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)], 2),
+        "avg_ms": round(statistics.mean(latencies), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="找表检索基准")
+    parser.add_argument("--catalog", type=Path, help="JSONL 表目录（默认生成合成目录）")
+    parser.add_argument("--tables", type=int, default=50000, help="合成目录的表数量")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tables = list(load_catalog(args.catalog) if args.catalog else synth_catalog(args.tables))
+    flat, sharded = TableSearchIndex(), ShardedTableIndex()
+    start = time.perf_counter()
+    for table in tables:
+        flat.upsert(table)
+    flat_build = time.perf_counter() - start
+    start = time.perf_counter()
+    for table in tables:
+        sharded.upsert(table)
+    sharded_build = time.perf_counter() - start
+
+    print(f"表数量: {len(tables)}，分片数: {len(sharded.shard_sizes())}")
+    print(f"建索引: 全量 {flat_build:.2f}s，分片 {sharded_build:.2f}s")
+    print()
+
+    rows = [
+        bench("全量扫描", lambda q: flat.search_with_stats(q, args.top_k), args.repeat),
+        bench("分片（不裁剪）", lambda q: sharded.search_with_stats(q, args.top_k, prune=False), args.repeat),
+        bench("分片 + 主题域/分层裁剪", lambda q: sharded.search_with_stats(q, args.top_k), args.repeat),
+    ]
+    print("| 模式 | 平均候选集 | p50 (ms) | p95 (ms) | 平均 (ms) |")
+    print("|------|-----------|----------|----------|-----------|")
+    for row in rows:
+        print(f"| {row['mode']} | {row['avg_candidates']} | {row['p50_ms']} | {row['p95_ms']} | {row['avg_ms']} |")
+
+    print()
+    print("裁剪后各查询的检索范围:")
+    for query in QUERIES:
+        results, stats = sharded.search_with_stats(query, args.top_k)
+        layers = sorted({r["layer"] for r in results})
+        print(f"  {query:<20} 主题域={'/'.join(stats['domains']) or '全部'}  "
+              f"候选={stats['candidates']}  分片={stats['shards_searched']}  结果分层={','.join(layers)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+WebSocket 并发压测（离线）
+在子进程中启动 webui_server，ClaudeSDKClient 替换为 xagent.stub_sdk 的替身客户端
+（或以 XAGENT_BACKEND=replay 回放录制的真实会话），再用数百个并发 WebSocket 客户端发送消息，
+统计吞吐、帧延迟、每会话内存、事件循环延迟和内存分配
+
+用法:
+    python scripts/bench_websocket.py                              # 200 个会话，每个 3 轮
+    python scripts/bench_websocket.py --sessions 100,300,500 --turns 5
+    python scripts/bench_websocket.py --text-blocks 50 --text-chars 40 --block-delay 0.005
+    python scripts/bench_websocket.py --replay data/recordings.jsonl --time-scale 0.1 --tracemalloc
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from xagent.recording import ReplayCorpus
+from xagent.stub_sdk import StubProfile, stamp_of
+
+LAG_INTERVAL = 0.05
+
+
+def rss_bytes() -> int:
+    """当前进程常驻内存（Linux 读 /proc，其他平台退化为峰值 RSS）"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+# ---------- 服务端（子进程） ----------
+
+def serve(port: int, trace_allocations: bool):
+    """以替身客户端（或回放后端）运行 webui_server，并提供 /bench/stats（内存、事件循环延迟、分配）"""
+    import uvicorn
+    from xagent.stub_sdk import StubClaudeSDKClient
+
+    if trace_allocations:
+        tracemalloc.start()
+    import webui_server
+
+    if webui_server.SDK_BACKEND != "replay":
+        StubClaudeSDKClient.profile = StubProfile.from_env()
+        webui_server.ClaudeSDKClient = StubClaudeSDKClient
+    app = webui_server.app
+    lags: deque = deque(maxlen=100000)
+
+    async def monitor_loop_lag():
+        # 定时睡眠，实际醒来时间超出的部分即事件循环被占用的时间
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL)
+            lags.append(time.perf_counter() - start - LAG_INTERVAL)
+
+    @app.on_event("startup")
+    async def start_monitor():
+        app.state.lag_task = asyncio.create_task(monitor_loop_lag())
+
+    @app.get("/bench/stats")
+    async def bench_stats(reset: bool = False):
+        samples = list(lags)
+        traced, traced_peak = tracemalloc.get_traced_memory() if trace_allocations else (0, 0)
+        if reset:
+            lags.clear()
+            if trace_allocations:
+                tracemalloc.reset_peak()
+        return {
+            "rss_bytes": rss_bytes(),
+            "traced_bytes": traced,
+            "traced_peak_bytes": traced_peak,
+            "lag_p50_ms": percentile(samples, 0.5) * 1000,
+            "lag_p99_ms": percentile(samples, 0.99) * 1000,
+            "lag_max_ms": max(samples, default=0.0) * 1000,
+        }
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", ws_max_queue=1024)
+
+
+# ---------- 压测客户端 ----------
+
+class SessionResult:
+    def __init__(self):
+        self.turns = 0
+        self.frames = 0
+        self.errors = 0
+        self.frame_latencies: List[float] = []
+        self.first_frame_latencies: List[float] = []
+        self.turn_latencies: List[float] = []
+
+
+# 模型响应帧（首帧延迟从发送到收到其中任意一种为止）
+RESPONSE_FRAME_TYPES = {"assistant_text", "thinking", "tool_use", "result", "error"}
+
+
+def _events(raw) -> List[Dict]:
+    data = json.loads(raw)
+    return data["events"] if data.get("type") == "batch" else [data]
+
+
+class Phases:
+    """所有会话共享的阶段：全部连上后同时开始发送，全部跑完后再统一断开"""
+
+    def __init__(self, sessions: int):
+        self.sessions = sessions
+        self.connected = 0
+        self.finished = 0
+        self.all_connected = asyncio.Event()
+        self.all_finished = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def mark_connected(self):
+        self.connected += 1
+        if self.connected == self.sessions:
+            self.all_connected.set()
+
+    def mark_finished(self):
+        self.finished += 1
+        if self.finished == self.sessions:
+            self.all_finished.set()
+
+
+async def run_session(uri: str, prompts: List[str], phases: Phases) -> SessionResult:
+    result = SessionResult()
+    connected = finished = False
+    try:
+        async with websockets.connect(uri, max_size=None, open_timeout=60) as ws:
+            await ws.recv()  # 欢迎消息
+            connected = True
+            phases.mark_connected()
+            await phases.all_connected.wait()
+            for prompt in prompts:
+                start = time.perf_counter()
+                await ws.send(json.dumps({"type": "message", "content": prompt}))
+                first_frame = True
+                done = False
+                while not done:
+                    for event in _events(await ws.recv()):
+                        result.frames += 1
+                        if first_frame and event["type"] in RESPONSE_FRAME_TYPES:
+                            first_frame = False
+                            result.first_frame_latencies.append(time.perf_counter() - start)
+                        if event["type"] == "assistant_text":
+                            sent = stamp_of(event["content"])
+                            if sent is not None:
+                                result.frame_latencies.append(time.time() - sent)
+                        elif event["type"] in ("result", "error"):
+                            result.errors += event["type"] == "error"
+                            done = True
+                result.turn_latencies.append(time.perf_counter() - start)
+                result.turns += 1
+            finished = True
+            phases.mark_finished()
+            # 所有会话跑完后再断开，以便测量会话全部在线时的内存
+            await phases.release.wait()
+    except Exception:
+        # 失败的会话也要计数，避免其他会话一直等待
+        if not connected:
+            phases.mark_connected()
+        if not finished:
+            phases.mark_finished()
+        raise
+    return result
+
+
+async def drive(base_url: str, sessions: int, prompts: List[List[str]], ramp: float) -> Dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as http:
+        baseline = (await http.get("/bench/stats", params={"reset": True})).json()
+        uri = base_url.replace("http", "ws", 1) + "/ws"
+        phases = Phases(sessions)
+        tasks = []
+        for i in range(sessions):
+            tasks.append(asyncio.create_task(run_session(uri, prompts[i % len(prompts)], phases)))
+            await asyncio.sleep(ramp)
+        await phases.all_connected.wait()
+        start = time.perf_counter()
+        await phases.all_finished.wait()
+        elapsed = time.perf_counter() - start
+        loaded = (await http.get("/bench/stats")).json()
+        phases.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    ok = [r for r in results if isinstance(r, SessionResult)]
+    failures = [r for r in results if not isinstance(r, SessionResult)]
+    frame_latencies = [x for r in ok for x in r.frame_latencies]
+    first_frame_latencies = [x for r in ok for x in r.first_frame_latencies]
+    turn_latencies = [x for r in ok for x in r.turn_latencies]
+    total_turns = sum(r.turns for r in ok)
+    total_frames = sum(r.frames for r in ok)
+    return {
+        "sessions": sessions,
+        "failed_sessions": len(failures),
+        "errors": sum(r.errors for r in ok),
+        "turns": total_turns,
+        "elapsed_s": elapsed,
+        "turns_per_s": total_turns / elapsed if elapsed else 0.0,
+        "frames_per_s": total_frames / elapsed if elapsed else 0.0,
+        "frame_p50_ms": percentile(frame_latencies, 0.5) * 1000,
+        "frame_p99_ms": percentile(frame_latencies, 0.99) * 1000,
+        "first_frame_p50_ms": percentile(first_frame_latencies, 0.5) * 1000,
+        "first_frame_p99_ms": percentile(first_frame_latencies, 0.99) * 1000,
+        "turn_p50_ms": percentile(turn_latencies, 0.5) * 1000,
+        "turn_p99_ms": percentile(turn_latencies, 0.99) * 1000,
+        "rss_per_session_kb": (loaded["rss_bytes"] - baseline["rss_bytes"]) / sessions / 1024,
+        "rss_mb": loaded["rss_bytes"] / 1024 / 1024,
+        "alloc_peak_mb": (loaded["traced_peak_bytes"] - baseline["traced_bytes"]) / 1024 / 1024,
+        "lag_p50_ms": loaded["lag_p50_ms"],
+        "lag_p99_ms": loaded["lag_p99_ms"],
+        "lag_max_ms": loaded["lag_max_ms"],
+        "failure_sample": repr(failures[0]) if failures else None,
+    }
+
+
+async def _wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"bench server exited with code {process.returncode}")
+            try:
+                if (await http.get("/bench/stats")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError("bench server did not start")
+
+
+def start_server(port: int, profile: StubProfile, workdir: Path, pool_size: int, args) -> subprocess.Popen:
+    backend = {}
+    if args.replay:
+        backend = dict(
+            XAGENT_BACKEND="replay",
+            XAGENT_RECORDING_FILE=str(args.replay.resolve()),
+            XAGENT_REPLAY_TIME_SCALE=str(args.time_scale),
+        )
+    env = dict(
+        os.environ,
+        **profile.to_env(),
+        **backend,
+        PORT=str(port),
+        XAGENT_SESSION_DB=str(workdir / "sessions.db"),
+        XAGENT_TRACE_FILE=str(workdir / "traces.jsonl"),
+        XAGENT_TABLE_CATALOG="",
+        XAGENT_METADATA_PROXY="false",
+        XAGENT_POOL_MIN_SIZE=str(pool_size),
+        XAGENT_POOL_MAX_SIZE=str(pool_size),
+    )
+    # 服务端日志写入临时目录，避免刷屏（INFO 日志本身也计入压测开销）
+    log = (workdir / "server.log").open("wb")
+    command = [sys.executable, __file__, "--serve", "--port", str(port)]
+    if args.tracemalloc:
+        command.append("--tracemalloc")
+    return subprocess.Popen(command, env=env, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+
+
+def replay_prompts(path: Path) -> List[List[str]]:
+    """按录制时的会话分组取出各轮 prompt，压测会话依次重放"""
+    corpus = ReplayCorpus(path)
+    asyncio.run(corpus.load())
+    sessions = [[turn["prompt"] for turn in turns if turn.get("prompt")] for turns in corpus.sessions()]
+    sessions = [prompts for prompts in sessions if prompts]
+    if not sessions:
+        raise SystemExit(f"{path} 中没有可回放的完整轮次")
+    return sessions
+
+
+def print_rows(rows: List[Dict], stamped: bool, allocations: bool):
+    columns = [
+        ("会话", lambda r: f"{r['sessions']}"),
+        ("轮次/s", lambda r: f"{r['turns_per_s']:.1f}"),
+        ("帧/s", lambda r: f"{r['frames_per_s']:.0f}"),
+        ("首帧 p50/p99 (ms)", lambda r: f"{r['first_frame_p50_ms']:.0f} / {r['first_frame_p99_ms']:.0f}"),
+    ]
+    if stamped:
+        # 回放的文本块没有发送时间戳，只有替身消息流能计算帧延迟
+        columns.append(("帧延迟 p50/p99 (ms)", lambda r: f"{r['frame_p50_ms']:.1f} / {r['frame_p99_ms']:.1f}"))
+    columns += [
+        ("轮次耗时 p50/p99 (ms)", lambda r: f"{r['turn_p50_ms']:.0f} / {r['turn_p99_ms']:.0f}"),
+        ("内存/会话 (KB)", lambda r: f"{r['rss_per_session_kb']:.0f}"),
+    ]
+    if allocations:
+        columns.append(("分配峰值 (MB)", lambda r: f"{r['alloc_peak_mb']:.1f}"))
+    columns += [
+        ("事件循环延迟 p50/p99/max (ms)",
+         lambda r: f"{r['lag_p50_ms']:.1f} / {r['lag_p99_ms']:.1f} / {r['lag_max_ms']:.1f}"),
+        ("失败", lambda r: f"{r['failed_sessions']} 会话 / {r['errors']} 错误"),
+    ]
+    print("| " + " | ".join(name for name, _ in columns) + " |")
+    print("|" + "|".join("------" for _ in columns) + "|")
+    for row in rows:
+        print("| " + " | ".join(fmt(row) for _, fmt in columns) + " |")
+        if row["failure_sample"]:
+            print(f"  首个失败: {row['failure_sample']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket 并发压测（替身 SDK 或回放录制，离线运行）")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--sessions", default="200", help="并发会话数，逗号分隔可依次测多档")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的对话轮数（回放时按录制的会话轮数）")
+    parser.add_argument("--ramp", type=float, default=0.005, help="建立连接的间隔（秒）")
+    parser.add_argument("--pool-size", type=int, default=8, help="预热连接池大小")
+    parser.add_argument("--replay", type=Path, help="回放录制的语料（XAGENT_BACKEND=record 生成）代替替身消息流")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="回放节奏：1 原始，0.1 压缩为十分之一，0 不等待")
+    parser.add_argument("--tracemalloc", action="store_true", help="服务端开启 tracemalloc 统计分配峰值（会变慢）")
+    defaults = StubProfile()
+    for field, cast in StubProfile.FIELDS.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=cast, default=getattr(defaults, field))
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.tracemalloc)
+        return
+
+    profile = StubProfile(**{field: getattr(args, field) for field in StubProfile.FIELDS})
+    if args.replay:
+        prompts = replay_prompts(args.replay)
+        print(f"回放语料: {args.replay}（{len(prompts)} 个会话，节奏 ×{args.time_scale}）")
+    else:
+        prompts = [[f"bench turn {turn}" for turn in range(args.turns)]]
+        print(f"替身消息流: {profile.thinking_blocks} thinking × {profile.thinking_chars} 字符, "
+              f"{profile.tool_calls} 工具调用 × {profile.tool_result_chars} 字符, "
+              f"{profile.text_blocks} 文本块 × {profile.text_chars} 字符, 块间隔 {profile.block_delay * 1000:.0f}ms")
+    print()
+    rows = []
+    for sessions in [int(s) for s in args.sessions.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            process = start_server(args.port, profile, Path(tmp), args.pool_size, args)
+            base_url = f"http://127.0.0.1:{args.port}"
+            try:
+                asyncio.run(_wait_ready(base_url, process))
+                rows.append(asyncio.run(drive(base_url, sessions, prompts, args.ramp)))
+            except Exception:
+                print((Path(tmp) / "server.log").read_text(errors="replace")[-4000:])
+                raise
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    print_rows(rows, stamped=not args.replay, allocations=args.tracemalloc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+生成找表检索的表目录（JSONL，每行一张表）
+输入为 Hive metastore 导出的列清单（TSV，无表头）：库名、表名、表注释、字段名、字段注释
+
+导出（MySQL 存储的 metastore）:
+    mysql -N -B -e "
+      SELECT d.NAME, t.TBL_NAME, tp.PARAM_VALUE, c.COLUMN_NAME, c.COMMENT
+      FROM TBLS t
+      JOIN DBS d ON t.DB_ID = d.DB_ID
+      JOIN SDS s ON t.SD_ID = s.SD_ID
+      JOIN COLUMNS_V2 c ON s.CD_ID = c.CD_ID
+      LEFT JOIN TABLE_PARAMS tp ON tp.TBL_ID = t.TBL_ID AND tp.PARAM_KEY = 'comment'
+      ORDER BY d.NAME, t.TBL_NAME, c.INTEGER_IDX" hive_metastore > data/metastore_columns.tsv
+
+用法:
+    python scripts/build_table_catalog.py data/metastore_columns.tsv
+    python scripts/build_table_catalog.py data/metastore_columns.tsv --db bi_sycpb --db bi_ad -o data/table_catalog.jsonl
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_OUTPUT = Path(__file__).resolve().parent.parent / "data" / "table_catalog.jsonl"
+
+
+def _cell(value: str) -> str:
+    value = (value or "").strip()
+    return "" if value == "NULL" else value
+
+
+def build_catalog(rows, databases=None):
+    """按表聚合列清单，保持输入中的表和字段顺序"""
+    tables = OrderedDict()
+    for row in rows:
+        if len(row) < 4:
+            continue
+        db, name, comment, field = (_cell(value) for value in row[:4])
+        field_comment = _cell(row[4]) if len(row) > 4 else ""
+        if not db or not name or (databases and db not in databases):
+            continue
+        table = tables.setdefault(f"{db}.{name}", {"table": f"{db}.{name}", "comment": comment, "fields": []})
+        if field:
+            table["fields"].append({"name": field, "comment": field_comment})
+    return list(tables.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成找表检索的表目录")
+    parser.add_argument("columns", type=Path, help="metastore 导出的列清单（TSV，无表头）")
+    parser.add_argument("-o", "--output", type=Path, default=DEFAULT_OUTPUT, help="表目录文件")
+    parser.add_argument("--db", action="append", help="只保留指定库（可重复）")
+    args = parser.parse_args()
+
+    csv.field_size_limit(sys.maxsize)
+    with args.columns.open(encoding="utf-8", newline="") as f:
+        tables = build_catalog(csv.reader(f, delimiter="\t", quoting=csv.QUOTE_NONE), set(args.db or ()))
+
+    # 服务按 mtime 热加载目录：先写临时文件再原子替换，避免读到写了一半的文件
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = args.output.with_name(args.output.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        for table in tables:
+            f.write(json.dumps(table, ensure_ascii=False) + "\n")
+    os.replace(tmp, args.output)
+    print(f"已写入 {len(tables)} 张表（{sum(len(t['fields']) for t in tables)} 个字段）: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,7 @@ echo -e "${GREEN}[2/4]${NC} 复制文件..."
 
 # 复制必要文件
 cp webui_server.py "${PACKAGE_DIR}/"
+cp -r xagent/ "${PACKAGE_DIR}/"
 cp -r static/ "${PACKAGE_DIR}/"
 cp requirements.txt "${PACKAGE_DIR}/"
 cp Dockerfile "${PACKAGE_DIR}/"
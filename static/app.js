@@ -3,6 +3,8 @@
 let ws = null;
 let isConnected = false;
 let currentSessionId = null;
+const SESSION_STORAGE_KEY = 'xagent_session_id';  // 刷新页面后用于恢复会话
+const AFFINITY_STORAGE_KEY = 'xagent_affinity';  // 多 worker 部署时的粘性路由键（浏览器首次连接时生成）
 let turnCount = 0;
 let totalCost = 0;
 let isProcessing = false;
@@ -16,21 +18,45 @@ let commandSuggestions = null;
 // 工具调用追踪
 let toolCounter = 0;  // 工具计数器
 let pendingTools = [];  // 待完成的工具ID队列
+const toolDetails = new Map();  // 工具ID -> {input, result}：折叠的工具卡片只保留数据，展开时才渲染
+
+let messageList = null;  // 虚拟化消息列表
 
 // 初始化
 document.addEventListener('DOMContentLoaded', () => {
+    setupMessageList();
     connectWebSocket();
     autoResizeTextarea();
     setupGlobalKeyboardShortcuts();
     setupSlashCommands();
 });
 
+// 粘性路由键：首次连接前生成并保存，之后的 WebSocket 和 HTTP 请求都带上，
+// 新会话在拿到 session_id 之前也能和后续的结果读取路由到同一个 worker
+function affinityKey() {
+    let key = localStorage.getItem(AFFINITY_STORAGE_KEY);
+    if (!key) {
+        key = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        localStorage.setItem(AFFINITY_STORAGE_KEY, key);
+    }
+    return key;
+}
+
 // 连接 WebSocket
 function connectWebSocket() {
     const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${protocol}//${window.location.host}/ws`;
 
-    ws = new WebSocket(wsUrl);
+    // 携带上次的 session_id：服务端据此恢复会话并回放最近的事件；
+    // 多 worker 部署时 nginx 按 affinity 把连接路由到同一个 worker
+    const params = new URLSearchParams({affinity: affinityKey()});
+    const savedSessionId = localStorage.getItem(SESSION_STORAGE_KEY);
+    if (savedSessionId) {
+        params.set('session_id', savedSessionId);
+    }
+
+    ws = new WebSocket(`${protocol}//${window.location.host}/ws?${params}`);
 
     ws.onopen = () => {
         console.log('WebSocket connected');
@@ -40,7 +66,12 @@ function connectWebSocket() {
 
     ws.onmessage = (event) => {
         const data = JSON.parse(event.data);
-        handleMessage(data);
+        // 服务端会把同一微批窗口内的多个帧合并为一条 batch 消息
+        if (data.type === 'batch' && Array.isArray(data.events)) {
+            data.events.forEach(handleMessage);
+        } else {
+            handleMessage(data);
+        }
     };
 
     ws.onerror = (error) => {
@@ -59,8 +90,6 @@ function connectWebSocket() {
 
 // 处理消息
 function handleMessage(data) {
-    const messagesContainer = document.getElementById('messages');
-
     // 如果正在中断，只处理 interrupted 和 error 消息，忽略其他消息
     if (isInterrupting && data.type !== 'interrupted' && data.type !== 'error') {
         console.log('Ignoring message during interrupt:', data.type);
@@ -70,6 +99,22 @@ function handleMessage(data) {
     switch (data.type) {
         case 'system':
             console.log('System:', data.content || data);
+            if (data.subtype === 'resume_failed' || data.subtype === 'session_cleared') {
+                localStorage.removeItem(SESSION_STORAGE_KEY);
+            }
+            if (data.subtype === 'budget_action') {
+                addBudgetNotice(data);
+            }
+            if (data.subtype === 'message_queued') {
+                addSystemNotice('📥', `已排队（第 ${data.position} 条），当前回复完成后发送：${data.content}`);
+            }
+            if (data.subtype === 'turn_queued' || data.subtype === 'turn_admitted') {
+                updateAdmissionNotice(data);
+            }
+            break;
+
+        case 'session_resumed':
+            replaySession(data);
             break;
 
         case 'commands_list':
@@ -85,7 +130,10 @@ function handleMessage(data) {
             break;
 
         case 'user_message':
-            addUserMessage(data.content);
+            // 排队的后续消息开始发送时同样进入处理状态
+            addUserMessage(data.content, data.steered);
+            isProcessing = true;
+            updateUIState();
             break;
 
         case 'assistant_text':
@@ -102,9 +150,8 @@ function handleMessage(data) {
             break;
 
         case 'tool_result':
-            // 工具结果可以选择显示或不显示
-            console.log('Tool result:', data.content);
-            markToolAsCompleted();
+            // 工具结果显示在工具卡片展开区域；大结果只有预览，全文按需分段加载
+            attachToolResult(markToolAsCompleted(), data);
             removeProcessingIndicator();
             break;
 
@@ -123,6 +170,7 @@ function handleMessage(data) {
 
         case 'interrupted':
             addInterruptedMessage();
+            restoreQueuedMessages(data.queued);
             isProcessing = false;
             isInterrupting = false;
             updateUIState();
@@ -133,13 +181,11 @@ function handleMessage(data) {
 }
 
 // 添加用户消息
-function addUserMessage(content) {
-    const messagesContainer = document.getElementById('messages');
-
+function addUserMessage(content, steered = false) {
     // 移除欢迎消息
-    const welcomeMessage = messagesContainer.querySelector('.welcome-message');
+    const welcomeMessage = messageList.container.querySelector('.welcome-message');
     if (welcomeMessage) {
-        welcomeMessage.remove();
+        messageList.remove(welcomeMessage);
     }
 
     const messageDiv = document.createElement('div');
@@ -147,20 +193,18 @@ function addUserMessage(content) {
     messageDiv.innerHTML = `
         <div class="message-header">
             <div class="message-avatar user-avatar">U</div>
-            <div class="message-role">You</div>
+            <div class="message-role">You${steered ? ' · 引导当前回复' : ''}</div>
         </div>
         <div class="message-content">${escapeHtml(content)}</div>
     `;
 
-    messagesContainer.appendChild(messageDiv);
+    messageList.append(messageDiv);
 }
 
-// 添加或更新助手消息
+// 添加或更新助手消息（每个文本块追加到当前消息末尾，增量渲染）
 let currentAssistantMessage = null;
 
 function addOrUpdateAssistantMessage(content) {
-    const messagesContainer = document.getElementById('messages');
-
     if (!currentAssistantMessage) {
         currentAssistantMessage = document.createElement('div');
         currentAssistantMessage.className = 'message assistant';
@@ -172,17 +216,17 @@ function addOrUpdateAssistantMessage(content) {
             <div class="tools-container"></div>
             <div class="message-content"></div>
         `;
-        messagesContainer.appendChild(currentAssistantMessage);
+        messageList.append(currentAssistantMessage);
+        currentAssistantMessage.markdown = new MarkdownStream(
+            currentAssistantMessage.querySelector('.message-content')
+        );
     }
 
-    const contentDiv = currentAssistantMessage.querySelector('.message-content');
-    contentDiv.innerHTML = formatMarkdown(content);
+    currentAssistantMessage.markdown.appendBlock(content);
 }
 
 // 添加思考块
 function addThinkingBlock(content) {
-    const messagesContainer = document.getElementById('messages');
-
     if (!currentAssistantMessage) {
         addOrUpdateAssistantMessage('');
     }
@@ -199,8 +243,6 @@ function addThinkingBlock(content) {
 
 // 添加工具使用
 function addToolUse(toolName, toolInput) {
-    const messagesContainer = document.getElementById('messages');
-
     if (!currentAssistantMessage) {
         addOrUpdateAssistantMessage('');
     }
@@ -249,15 +291,9 @@ function addToolUse(toolName, toolInput) {
                 <span class="tool-expand-icon">▼</span>
             </div>
         </div>
-        <div class="tool-input">${escapeHtml(inputStr)}</div>
     `;
-
-    // 添加点击事件切换展开/折叠
-    toolDiv.addEventListener('click', function(e) {
-        // 防止事件冒泡
-        e.stopPropagation();
-        this.classList.toggle('expanded');
-    });
+    // 输入和结果只保存为数据，展开卡片时才渲染（点击由消息列表统一委托处理）
+    toolDetails.set(toolId, {input: inputStr, result: null});
 
     // 将工具块添加到工具容器中（在消息内容上方）
     const toolsContainer = currentAssistantMessage.querySelector('.tools-container');
@@ -271,9 +307,9 @@ function addToolUse(toolName, toolInput) {
 
 // 添加结果信息
 function addResultInfo(data) {
-    const messagesContainer = document.getElementById('messages');
-
     if (currentAssistantMessage) {
+        currentAssistantMessage.markdown.finish();
+
         // 确保所有工具都标记为完成状态
         markAllToolsAsCompleted();
 
@@ -298,6 +334,9 @@ function addResultInfo(data) {
                     <span class="stat-value">$${data.total_cost_usd.toFixed(6)}</span>
                 </div>
                 ` : ''}
+                ${data.trace_id ? `
+                <button class="trace-toggle" type="button" data-trace-id="${escapeHtml(data.trace_id)}">Trace</button>
+                ` : ''}
             </div>
         `;
 
@@ -307,6 +346,7 @@ function addResultInfo(data) {
     // 更新会话信息
     if (data.session_id) {
         currentSessionId = data.session_id;
+        localStorage.setItem(SESSION_STORAGE_KEY, data.session_id);
         document.getElementById('session-id').textContent = data.session_id.substring(0, 8);
     }
 
@@ -324,10 +364,73 @@ function addResultInfo(data) {
     currentAssistantMessage = null;
 }
 
+// 展开/收起一轮对话的追踪时间线
+async function toggleTrace(resultDiv, traceId) {
+    const existing = resultDiv.querySelector('.trace-timeline');
+    if (existing) {
+        existing.remove();
+        return;
+    }
+
+    const timeline = document.createElement('div');
+    timeline.className = 'trace-timeline';
+    timeline.textContent = 'Loading trace...';
+    resultDiv.appendChild(timeline);
+
+    try {
+        const response = await fetch(`/api/traces/${encodeURIComponent(traceId)}`);
+        if (!response.ok) {
+            throw new Error(response.status === 404 ? 'Trace not found' : `HTTP ${response.status}`);
+        }
+        renderTrace(timeline, await response.json());
+    } catch (error) {
+        timeline.textContent = `Failed to load trace: ${error.message}`;
+    }
+}
+
+// 按开始时间渲染 span 瀑布图（缩进表示父子关系）
+function renderTrace(timeline, trace) {
+    const total = Math.max(trace.duration_ms, 1);
+    const depths = {};
+    const rows = trace.spans
+        .slice()
+        .sort((a, b) => a.start_ms - b.start_ms || a.id - b.id)
+        .map(span => {
+            const depth = span.parent_id === null ? 0 : (depths[span.parent_id] || 0) + 1;
+            depths[span.id] = depth;
+            const left = (span.start_ms / total) * 100;
+            const width = Math.max((span.duration_ms / total) * 100, 0.5);
+            const details = Object.entries(span.attrs || {})
+                .map(([key, value]) => `${key}: ${typeof value === 'object' ? JSON.stringify(value) : value}`)
+                .join('\n');
+            return `
+                <div class="trace-row" title="${escapeHtml(details)}">
+                    <span class="trace-name" style="padding-left: ${depth * 12}px">${escapeHtml(span.name)}</span>
+                    <span class="trace-track">
+                        <span class="trace-bar trace-${escapeHtml(span.kind)}" style="left: ${left}%; width: ${Math.min(width, 100 - left)}%"></span>
+                    </span>
+                    <span class="trace-duration">${span.duration_ms.toFixed(1)}ms</span>
+                </div>
+            `;
+        });
+    timeline.innerHTML = rows.join('');
+}
+
+// 回放恢复的会话
+function replaySession(data) {
+    newChat();
+    localStorage.setItem(SESSION_STORAGE_KEY, data.session_id);
+
+    (data.events || []).forEach(handleMessage);
+
+    currentSessionId = data.session_id;
+    document.getElementById('session-id').textContent = data.session_id.substring(0, 8);
+    isProcessing = false;
+    updateUIState();
+}
+
 // 添加错误消息
 function addErrorMessage(content) {
-    const messagesContainer = document.getElementById('messages');
-
     const errorDiv = document.createElement('div');
     errorDiv.className = 'message assistant';
     errorDiv.innerHTML = `
@@ -340,14 +443,15 @@ function addErrorMessage(content) {
         </div>
     `;
 
-    messagesContainer.appendChild(errorDiv);
+    messageList.append(errorDiv);
     currentAssistantMessage = null;
 }
 
 // 发送消息
-function sendMessage() {
+// 回复进行中发送的消息：queue 排在当前回复之后，steer 直接交给正在进行的回复
+function sendMessage(mode = 'queue') {
     // 中断期间不允许发送新消息
-    if (!isConnected || isProcessing || isInterrupting) return;
+    if (!isConnected || isInterrupting) return;
 
     const input = document.getElementById('message-input');
     const message = input.value.trim();
@@ -360,7 +464,8 @@ function sendMessage() {
     // 发送消息
     ws.send(JSON.stringify({
         type: 'message',
-        content: message
+        content: message,
+        mode: mode
     }));
 
     // 立即清空输入框
@@ -402,21 +507,25 @@ function interruptRequest() {
 
 // 新建聊天
 function newChat() {
-    const messagesContainer = document.getElementById('messages');
-    messagesContainer.innerHTML = `
-        <div class="welcome-message">
-            <div class="welcome-icon">👋</div>
-            <h3>Welcome to XAgent</h3>
-            <p>Start a conversation with XAgent using the input below.</p>
-        </div>
+    const welcomeDiv = document.createElement('div');
+    welcomeDiv.className = 'welcome-message';
+    welcomeDiv.innerHTML = `
+        <div class="welcome-icon">👋</div>
+        <h3>Welcome to XAgent</h3>
+        <p>Start a conversation with XAgent using the input below.</p>
     `;
+    messageList.clear();
+    messageList.append(welcomeDiv);
 
     currentAssistantMessage = null;
+    currentSessionId = null;
+    localStorage.removeItem(SESSION_STORAGE_KEY);
     isInterrupting = false;
     turnCount = 0;
     totalCost = 0;
     toolCounter = 0;
     pendingTools = [];
+    toolDetails.clear();
 
     document.getElementById('turn-count').textContent = '0';
     document.getElementById('cost-display').textContent = '$0.00';
@@ -452,19 +561,13 @@ function updateUIState() {
     const sendBtn = document.getElementById('send-btn');
     const interruptBtn = document.getElementById('interrupt-btn');
 
-    // 发送按钮状态：连接断开、正在处理或正在中断时禁用
-    sendBtn.disabled = isProcessing || !isConnected || isInterrupting;
+    // 发送按钮状态：连接断开或正在中断时禁用（处理中发送的消息排队）
+    sendBtn.disabled = !isConnected || isInterrupting;
+    sendBtn.title = isProcessing ? '排队发送（Alt+Shift+Enter 引导当前回复）' : '';
 
-    // 中断按钮的显示/隐藏
-    if (isProcessing) {
-        // 正在处理：显示中断按钮
-        interruptBtn.style.display = 'flex';
-        sendBtn.style.display = 'none';
-    } else {
-        // 空闲：显示发送按钮，隐藏中断
-        interruptBtn.style.display = 'none';
-        sendBtn.style.display = 'flex';
-    }
+    // 中断按钮的显示/隐藏：正在处理时与发送按钮并列显示
+    interruptBtn.style.display = isProcessing ? 'flex' : 'none';
+    sendBtn.style.display = 'flex';
 }
 
 // 处理按键
@@ -472,7 +575,8 @@ function handleKeyPress(event) {
     // Shift+Enter 发送，Enter 换行
     if (event.key === 'Enter' && event.shiftKey) {
         event.preventDefault();
-        sendMessage();
+        // Alt+Shift+Enter：引导正在进行的回复
+        sendMessage(event.altKey ? 'steer' : 'queue');
     }
 }
 
@@ -487,283 +591,95 @@ function autoResizeTextarea() {
 
 // 滚动到底部
 function scrollToBottom() {
-    const messagesContainer = document.getElementById('messages');
-    messagesContainer.scrollTop = messagesContainer.scrollHeight;
-}
-
-// HTML 转义
-function escapeHtml(text) {
-    const div = document.createElement('div');
-    div.textContent = text;
-    return div.innerHTML;
+    messageList.scrollToBottom();
 }
 
-// 渲染表格
-function renderTable(rows) {
-    if (rows.length === 0) return '';
-
-    // 解析表格行为单元格
-    const parsedRows = rows.map(row => {
-        // 移除首尾的 |，然后按 | 分割
-        return row.slice(1, -1).split('|').map(cell => cell.trim());
-    });
-
-    // 查找分隔符行（包含 --- 的行）
-    let separatorIndex = -1;
-    for (let i = 0; i < parsedRows.length; i++) {
-        if (parsedRows[i].every(cell => /^[\s\-:]+$/.test(cell))) {
-            separatorIndex = i;
-            break;
+// 设置全局键盘快捷键
+function setupGlobalKeyboardShortcuts() {
+    document.addEventListener('keydown', (event) => {
+        // ESC 键：中断请求
+        if (event.key === 'Escape' && isProcessing) {
+            event.preventDefault();
+            interruptRequest();
         }
-    }
+    });
+}
 
-    let html = '<table>';
-
-    if (separatorIndex > 0) {
-        // 有标准的表头和分隔符
-        html += '<thead>';
-        for (let i = 0; i < separatorIndex; i++) {
-            html += '<tr>';
-            parsedRows[i].forEach(cell => {
-                html += `<th>${cell}</th>`;
-            });
-            html += '</tr>';
-        }
-        html += '</thead>';
-
-        // 表体（分隔符后的行）
-        if (separatorIndex + 1 < parsedRows.length) {
-            html += '<tbody>';
-            for (let i = separatorIndex + 1; i < parsedRows.length; i++) {
-                html += '<tr>';
-                parsedRows[i].forEach(cell => {
-                    html += `<td>${cell}</td>`;
-                });
-                html += '</tr>';
-            }
-            html += '</tbody>';
-        }
+// token 预算处理提示（截断工具结果 / 压缩 / 换会话）
+const BUDGET_ACTION_LABELS = {
+    trim: '上下文较大，之后的长工具结果将被截断',
+    compact: '上下文过大，正在压缩当前会话',
+    rotate: '上下文过大，正在基于摘要切换到新会话'
+};
+
+function addBudgetNotice(data) {
+    const label = BUDGET_ACTION_LABELS[data.action] || data.action;
+    let text;
+    if (data.stage === 'running') {
+        text = `⏳ ${label}...`;
+    } else if (data.stage === 'failed') {
+        text = `⚠️ ${label}失败: ${data.error || ''}`;
     } else {
-        // 没有分隔符，第一行作为表头，其余作为表体
-        html += '<thead><tr>';
-        parsedRows[0].forEach(cell => {
-            html += `<th>${cell}</th>`;
-        });
-        html += '</tr></thead>';
-
-        if (parsedRows.length > 1) {
-            html += '<tbody>';
-            for (let i = 1; i < parsedRows.length; i++) {
-                html += '<tr>';
-                parsedRows[i].forEach(cell => {
-                    html += `<td>${cell}</td>`;
-                });
-                html += '</tr>';
-            }
-            html += '</tbody>';
+        const info = data.data || {};
+        const fmt = n => (n === null || n === undefined) ? '?' : n.toLocaleString();
+        text = `🧹 ${label}（上下文 token ${fmt(info.context_tokens_before)} → ${fmt(info.context_tokens_after)}，${data.duration_ms || 0}ms）`;
+        if (data.action === 'rotate' && data.session_id) {
+            localStorage.setItem(SESSION_STORAGE_KEY, data.session_id);
         }
     }
 
-    html += '</table>';
-    return html;
+    addSystemNotice('🧮', text);
 }
 
-// 增强的 Markdown 格式化
-function formatMarkdown(text) {
-    if (!text) return '';
-
-    // 先转义 HTML
-    let html = escapeHtml(text);
-
-    // 处理代码块 ``` - 支持多种格式
-    html = html.replace(/```(\w+)?\s*([\s\S]*?)```/g, (match, lang, code) => {
-        const language = lang ? ` class="language-${lang}"` : '';
-        return `<pre><code${language}>${code.trim()}</code></pre>`;
-    });
-
-    // 处理行内代码 `code`
-    html = html.replace(/`([^`]+)`/g, '<code>$1</code>');
-
-    // 分割成行处理
-    const lines = html.split('\n');
-    const result = [];
-    let inList = false;
-    let inOrderedList = false;
-    let inBlockquote = false;
-    let inTable = false;
-    let tableRows = [];
-
-    for (let i = 0; i < lines.length; i++) {
-        let line = lines[i];
-
-        // 跳过代码块内的行
-        if (line.includes('<pre>') || line.includes('</pre>') || line.includes('<code')) {
-            result.push(line);
-            continue;
-        }
-
-        // 检测表格行
-        const isTableRow = /^\|(.+)\|$/.test(line.trim());
-        const isSeparatorRow = /^\|[\s\-:]+\|$/.test(line.trim());
-
-        if (isTableRow) {
-            // 如果是表格行，收集起来
-            if (!inTable) {
-                // 关闭其他块
-                if (inList) {
-                    result.push('</ul>');
-                    inList = false;
-                }
-                if (inOrderedList) {
-                    result.push('</ol>');
-                    inOrderedList = false;
-                }
-                if (inBlockquote) {
-                    result.push('</p></blockquote>');
-                    inBlockquote = false;
-                }
-                inTable = true;
-                tableRows = [];
-            }
-            tableRows.push(line.trim());
-            continue;
-        } else if (inTable) {
-            // 表格结束，渲染表格
-            result.push(renderTable(tableRows));
-            inTable = false;
-            tableRows = [];
-        }
-
-        // 标题 # ## ### #### ##### ######
-        // 修改正则以支持行首空格和 emoji
-        const headingMatch = line.match(/^\s*(#{1,6})\s+(.+)$/);
-        if (headingMatch) {
-            // 标题前关闭所有列表
-            if (inList) {
-                result.push('</ul>');
-                inList = false;
-            }
-            if (inOrderedList) {
-                result.push('</ol>');
-                inOrderedList = false;
-            }
-            if (inBlockquote) {
-                result.push('</p></blockquote>');
-                inBlockquote = false;
-            }
+// 系统提示（纯文本）
+function addSystemNotice(avatar, text) {
+    const noticeDiv = document.createElement('div');
+    noticeDiv.className = 'message system';
+    noticeDiv.innerHTML = `
+        <div class="message-header">
+            <div class="message-avatar assistant-avatar">${avatar}</div>
+            <div class="message-role">System</div>
+        </div>
+        <div class="message-content">${escapeHtml(text)}</div>
+    `;
+    messageList.append(noticeDiv);
+    scrollToBottom();
+    return noticeDiv;
+}
 
-            const level = headingMatch[1].length;
-            const content = headingMatch[2].trim();
-            line = `<h${level}>${content}</h${level}>`;
-        }
-        // 无序列表 - 或 *
-        else if (/^\s*[\-\*]\s+(.+)$/.test(line)) {
-            const match = line.match(/^\s*[\-\*]\s+(.+)$/);
-            const content = match[1];
-            if (!inList) {
-                line = `<ul><li>${content}</li>`;
-                inList = true;
-            } else {
-                line = `<li>${content}</li>`;
-            }
-        }
-        // 有序列表 1. 2. 3.
-        else if (/^\s*\d+\.\s+(.+)$/.test(line)) {
-            const match = line.match(/^\s*\d+\.\s+(.+)$/);
-            const content = match[1];
-            if (!inOrderedList) {
-                line = `<ol><li>${content}</li>`;
-                inOrderedList = true;
-            } else {
-                line = `<li>${content}</li>`;
-            }
-        }
-        // 引用 >
-        else if (/^\s*&gt;\s*(.*)$/.test(line)) {
-            const match = line.match(/^\s*&gt;\s*(.*)$/);
-            const content = match[1];
-            if (!inBlockquote) {
-                line = `<blockquote><p>${content}`;
-                inBlockquote = true;
-            } else {
-                line = `${content}`;
-            }
-        }
-        // 分隔线 --- 或 ***
-        else if (/^(---|\*\*\*)$/.test(line.trim())) {
-            line = '<hr>';
-        }
-        // 空行 - 关闭列表和引用
-        else if (line.trim() === '') {
-            if (inList) {
-                line = '</ul>';
-                inList = false;
-            } else if (inOrderedList) {
-                line = '</ol>';
-                inOrderedList = false;
-            } else if (inBlockquote) {
-                line = '</p></blockquote>';
-                inBlockquote = false;
-            } else {
-                line = '<br>';
-            }
-        }
-        // 普通段落
-        else {
-            if (inBlockquote) {
-                line = `<br>${line}`;
-            } else if (!inList && !inOrderedList) {
-                // 非空行包装成段落，确保块级布局
-                if (line.trim()) {
-                    line = `<p>${line}</p>`;
-                }
-            }
-        }
+// 服务繁忙时的排队提示：同一轮次只保留一条，位置变化时原地更新
+let admissionNotice = null;
 
-        result.push(line);
+function updateAdmissionNotice(data) {
+    let text;
+    if (data.subtype === 'turn_queued') {
+        const eta = data.eta_seconds === null || data.eta_seconds === undefined
+            ? '' : `，预计等待约 ${Math.max(1, Math.round(data.eta_seconds))} 秒`;
+        text = `服务繁忙，排队中（前面还有 ${data.position - 1} 个请求${eta}）`;
+    } else {
+        text = `已开始处理（排队 ${(data.waited_ms / 1000).toFixed(1)} 秒）`;
     }
-
-    // 关闭未闭合的标签
-    if (inList) result.push('</ul>');
-    if (inOrderedList) result.push('</ol>');
-    if (inBlockquote) result.push('</p></blockquote>');
-    if (inTable && tableRows.length > 0) {
-        result.push(renderTable(tableRows));
+    if (admissionNotice && admissionNotice.isConnected) {
+        admissionNotice.querySelector('.message-content').textContent = text;
+        scrollToBottom();
+    } else {
+        admissionNotice = addSystemNotice('🚦', text);
+    }
+    if (data.subtype === 'turn_admitted') {
+        admissionNotice = null;
     }
-
-    html = result.join('\n');
-
-    // 处理粗体 **text** （只使用星号，避免与下划线冲突）
-    html = html.replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>');
-
-    // 处理斜体 *text* （只使用星号，避免与变量名/文件名冲突）
-    // 注意：不匹配已经在标签内的内容
-    html = html.replace(/\*([^\*]+?)\*/g, '<em>$1</em>');
-
-    // 处理链接 [text](url)
-    html = html.replace(/\[([^\]]+)\]\(([^)]+)\)/g, '<a href="$2" target="_blank" rel="noopener">$1</a>');
-
-    // 处理图片 ![alt](url)
-    html = html.replace(/!\[([^\]]*)\]\(([^)]+)\)/g, '<img src="$2" alt="$1" style="max-width: 100%; border-radius: 6px;">');
-
-    return html;
 }
 
-// 设置全局键盘快捷键
-function setupGlobalKeyboardShortcuts() {
-    document.addEventListener('keydown', (event) => {
-        // ESC 键：中断请求
-        if (event.key === 'Escape' && isProcessing) {
-            event.preventDefault();
-            interruptRequest();
-        }
-    });
+// 中断时丢弃的排队消息退回输入框
+function restoreQueuedMessages(queued) {
+    if (!queued || queued.length === 0) return;
+    const input = document.getElementById('message-input');
+    input.value = [...queued, input.value].filter(text => text.trim()).join('\n\n');
+    autoResizeTextarea();
 }
 
 // 添加中断提示消息（用户触发中断时）
 function addInterruptMessage() {
-    const messagesContainer = document.getElementById('messages');
-
     const interruptDiv = document.createElement('div');
     interruptDiv.className = 'message system';
     interruptDiv.innerHTML = `
@@ -776,14 +692,12 @@ function addInterruptMessage() {
         </div>
     `;
 
-    messagesContainer.appendChild(interruptDiv);
+    messageList.append(interruptDiv);
     scrollToBottom();
 }
 
 // 添加中断完成消息（收到服务器确认）
 function addInterruptedMessage() {
-    const messagesContainer = document.getElementById('messages');
-
     const interruptedDiv = document.createElement('div');
     interruptedDiv.className = 'message system';
     interruptedDiv.innerHTML = `
@@ -797,7 +711,7 @@ function addInterruptedMessage() {
         </div>
     `;
 
-    messagesContainer.appendChild(interruptedDiv);
+    messageList.append(interruptedDiv);
     currentAssistantMessage = null;
     scrollToBottom();
 }
@@ -1052,7 +966,7 @@ function removeProcessingIndicator() {
 
 // 标记工具为已完成
 function markToolAsCompleted() {
-    if (!currentAssistantMessage || pendingTools.length === 0) return;
+    if (!currentAssistantMessage || pendingTools.length === 0) return null;
 
     // 获取队列中第一个待完成的工具ID
     const toolId = pendingTools.shift();
@@ -1071,6 +985,127 @@ function markToolAsCompleted() {
         toolElement.classList.remove('loading');
         toolElement.classList.add('completed');
     }
+    return toolElement;
+}
+
+const TOOL_RESULT_PAGE_CHARS = 262144;  // 每次加载的字符数
+
+// 记录工具结果：result_id 表示服务端只发来预览，展开卡片后可经 HTTP 分段读取剩余部分
+function attachToolResult(toolElement, data) {
+    if (!toolElement) return;
+    const details = toolDetails.get(toolElement.dataset.toolId);
+    if (!details) return;
+
+    const content = data.content || '';
+    details.result = {
+        content,
+        resultId: data.result_id || null,
+        totalChars: data.total_chars || content.length,
+        nextOffset: data.result_id ? content.length : null,
+    };
+    if (toolElement.classList.contains('expanded')) {
+        renderToolDetails(toolElement);
+    }
+}
+
+// 展开 / 折叠工具卡片：折叠时移除输入和结果的 DOM，只保留数据
+function toggleToolDetails(toolElement) {
+    toolElement.classList.toggle('expanded');
+    renderToolDetails(toolElement);
+}
+
+function renderToolDetails(toolElement) {
+    toolElement.querySelectorAll('.tool-input, .tool-result').forEach(node => node.remove());
+    const details = toolDetails.get(toolElement.dataset.toolId);
+    if (!details || !toolElement.classList.contains('expanded')) return;
+
+    const inputDiv = document.createElement('div');
+    inputDiv.className = 'tool-input';
+    inputDiv.textContent = details.input;
+    toolElement.appendChild(inputDiv);
+
+    const result = details.result;
+    if (!result) return;
+
+    const resultDiv = document.createElement('div');
+    resultDiv.className = 'tool-result';
+    const pre = document.createElement('pre');
+    pre.textContent = result.content;
+    resultDiv.appendChild(pre);
+
+    if (result.nextOffset !== null) {
+        const button = document.createElement('button');
+        button.className = 'tool-result-more';
+        button.textContent = result.expired
+            ? '完整结果已过期'
+            : `加载更多（已显示 ${result.nextOffset} / ${result.totalChars} 字符）`;
+        button.disabled = Boolean(result.loading || result.expired);
+        resultDiv.appendChild(button);
+    }
+
+    toolElement.appendChild(resultDiv);
+}
+
+// 分段读取卸载的工具结果，追加到数据后重新渲染卡片（卡片可能已被消息列表重建）
+async function loadMoreToolResult(toolId) {
+    const details = toolDetails.get(toolId);
+    const result = details && details.result;
+    if (!result || result.nextOffset === null || result.loading) return;
+
+    const rerender = () => {
+        const toolElement = messageList.container.querySelector(`[data-tool-id="${toolId}"]`);
+        if (toolElement) renderToolDetails(toolElement);
+    };
+
+    result.loading = true;
+    rerender();
+    try {
+        // 带上与 WebSocket 相同的路由键，多 worker 部署时路由到持有该结果的 worker
+        const params = new URLSearchParams({
+            offset: result.nextOffset,
+            limit: TOOL_RESULT_PAGE_CHARS,
+            affinity: affinityKey()
+        });
+        const response = await fetch(`/api/tool-results/${result.resultId}?${params}`);
+        if (response.ok) {
+            const page = await response.json();
+            result.content += page.content;
+            result.nextOffset = page.next_offset;
+        } else {
+            result.expired = true;
+        }
+    } catch (error) {
+        console.error('Failed to load tool result:', error);
+    } finally {
+        result.loading = false;
+        rerender();
+    }
+}
+
+// 消息列表：虚拟化渲染，消息内的点击统一委托处理（离开窗口的消息重建后无需重新绑定）
+function setupMessageList() {
+    const container = document.getElementById('messages');
+    messageList = new MessageList(container, {
+        isPinned: el => el === currentAssistantMessage,
+    });
+
+    container.addEventListener('click', event => {
+        const moreButton = event.target.closest('.tool-result-more');
+        if (moreButton) {
+            loadMoreToolResult(moreButton.closest('.tool-use').dataset.toolId);
+            return;
+        }
+        const traceButton = event.target.closest('.trace-toggle');
+        if (traceButton) {
+            toggleTrace(traceButton.closest('.result-info'), traceButton.dataset.traceId);
+            return;
+        }
+        if (event.target.closest('.tool-result, .tool-input')) return;
+        const toolElement = event.target.closest('.tool-use');
+        if (toolElement) {
+            toggleToolDetails(toolElement);
+        }
+    });
 }
 
 // 标记所有工具为已完成
@@ -0,0 +1,370 @@
+// XAgent - Markdown 渲染
+// formatMarkdown 渲染整段文本；MarkdownStream 用于流式输出：已完成的块渲染一次后固定为 DOM 节点，
+// 每次更新只重新解析末尾未完成的块（未闭合的代码块只追加新文本）
+
+// HTML 转义
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+// 渲染表格
+function renderTable(rows) {
+    if (rows.length === 0) return '';
+
+    // 解析表格行为单元格
+    const parsedRows = rows.map(row => {
+        // 移除首尾的 |，然后按 | 分割
+        return row.slice(1, -1).split('|').map(cell => cell.trim());
+    });
+
+    // 查找分隔符行（包含 --- 的行）
+    let separatorIndex = -1;
+    for (let i = 0; i < parsedRows.length; i++) {
+        if (parsedRows[i].every(cell => /^[\s\-:]+$/.test(cell))) {
+            separatorIndex = i;
+            break;
+        }
+    }
+
+    let html = '<table>';
+
+    if (separatorIndex > 0) {
+        // 有标准的表头和分隔符
+        html += '<thead>';
+        for (let i = 0; i < separatorIndex; i++) {
+            html += '<tr>';
+            parsedRows[i].forEach(cell => {
+                html += `<th>${cell}</th>`;
+            });
+            html += '</tr>';
+        }
+        html += '</thead>';
+
+        // 表体（分隔符后的行）
+        if (separatorIndex + 1 < parsedRows.length) {
+            html += '<tbody>';
+            for (let i = separatorIndex + 1; i < parsedRows.length; i++) {
+                html += '<tr>';
+                parsedRows[i].forEach(cell => {
+                    html += `<td>${cell}</td>`;
+                });
+                html += '</tr>';
+            }
+            html += '</tbody>';
+        }
+    } else {
+        // 没有分隔符，第一行作为表头，其余作为表体
+        html += '<thead><tr>';
+        parsedRows[0].forEach(cell => {
+            html += `<th>${cell}</th>`;
+        });
+        html += '</tr></thead>';
+
+        if (parsedRows.length > 1) {
+            html += '<tbody>';
+            for (let i = 1; i < parsedRows.length; i++) {
+                html += '<tr>';
+                parsedRows[i].forEach(cell => {
+                    html += `<td>${cell}</td>`;
+                });
+                html += '</tr>';
+            }
+            html += '</tbody>';
+        }
+    }
+
+    html += '</table>';
+    return html;
+}
+
+// 增强的 Markdown 格式化
+function formatMarkdown(text) {
+    if (!text) return '';
+
+    // 先转义 HTML
+    let html = escapeHtml(text);
+
+    // 处理代码块 ``` - 支持多种格式
+    html = html.replace(/```(\w+)?\s*([\s\S]*?)```/g, (match, lang, code) => {
+        const language = lang ? ` class="language-${lang}"` : '';
+        return `<pre><code${language}>${code.trim()}</code></pre>`;
+    });
+
+    // 处理行内代码 `code`
+    html = html.replace(/`([^`]+)`/g, '<code>$1</code>');
+
+    // 分割成行处理
+    const lines = html.split('\n');
+    const result = [];
+    let inList = false;
+    let inOrderedList = false;
+    let inBlockquote = false;
+    let inTable = false;
+    let tableRows = [];
+
+    for (let i = 0; i < lines.length; i++) {
+        let line = lines[i];
+
+        // 跳过代码块内的行
+        if (line.includes('<pre>') || line.includes('</pre>') || line.includes('<code')) {
+            result.push(line);
+            continue;
+        }
+
+        // 检测表格行
+        const isTableRow = /^\|(.+)\|$/.test(line.trim());
+        const isSeparatorRow = /^\|[\s\-:]+\|$/.test(line.trim());
+
+        if (isTableRow) {
+            // 如果是表格行，收集起来
+            if (!inTable) {
+                // 关闭其他块
+                if (inList) {
+                    result.push('</ul>');
+                    inList = false;
+                }
+                if (inOrderedList) {
+                    result.push('</ol>');
+                    inOrderedList = false;
+                }
+                if (inBlockquote) {
+                    result.push('</p></blockquote>');
+                    inBlockquote = false;
+                }
+                inTable = true;
+                tableRows = [];
+            }
+            tableRows.push(line.trim());
+            continue;
+        } else if (inTable) {
+            // 表格结束，渲染表格
+            result.push(renderTable(tableRows));
+            inTable = false;
+            tableRows = [];
+        }
+
+        // 标题 # ## ### #### ##### ######
+        // 修改正则以支持行首空格和 emoji
+        const headingMatch = line.match(/^\s*(#{1,6})\s+(.+)$/);
+        if (headingMatch) {
+            // 标题前关闭所有列表
+            if (inList) {
+                result.push('</ul>');
+                inList = false;
+            }
+            if (inOrderedList) {
+                result.push('</ol>');
+                inOrderedList = false;
+            }
+            if (inBlockquote) {
+                result.push('</p></blockquote>');
+                inBlockquote = false;
+            }
+
+            const level = headingMatch[1].length;
+            const content = headingMatch[2].trim();
+            line = `<h${level}>${content}</h${level}>`;
+        }
+        // 无序列表 - 或 *
+        else if (/^\s*[\-\*]\s+(.+)$/.test(line)) {
+            const match = line.match(/^\s*[\-\*]\s+(.+)$/);
+            const content = match[1];
+            if (!inList) {
+                line = `<ul><li>${content}</li>`;
+                inList = true;
+            } else {
+                line = `<li>${content}</li>`;
+            }
+        }
+        // 有序列表 1. 2. 3.
+        else if (/^\s*\d+\.\s+(.+)$/.test(line)) {
+            const match = line.match(/^\s*\d+\.\s+(.+)$/);
+            const content = match[1];
+            if (!inOrderedList) {
+                line = `<ol><li>${content}</li>`;
+                inOrderedList = true;
+            } else {
+                line = `<li>${content}</li>`;
+            }
+        }
+        // 引用 >
+        else if (/^\s*&gt;\s*(.*)$/.test(line)) {
+            const match = line.match(/^\s*&gt;\s*(.*)$/);
+            const content = match[1];
+            if (!inBlockquote) {
+                line = `<blockquote><p>${content}`;
+                inBlockquote = true;
+            } else {
+                line = `${content}`;
+            }
+        }
+        // 分隔线 --- 或 ***
+        else if (/^(---|\*\*\*)$/.test(line.trim())) {
+            line = '<hr>';
+        }
+        // 空行 - 关闭列表和引用
+        else if (line.trim() === '') {
+            if (inList) {
+                line = '</ul>';
+                inList = false;
+            } else if (inOrderedList) {
+                line = '</ol>';
+                inOrderedList = false;
+            } else if (inBlockquote) {
+                line = '</p></blockquote>';
+                inBlockquote = false;
+            } else {
+                line = '<br>';
+            }
+        }
+        // 普通段落
+        else {
+            if (inBlockquote) {
+                line = `<br>${line}`;
+            } else if (!inList && !inOrderedList) {
+                // 非空行包装成段落，确保块级布局
+                if (line.trim()) {
+                    line = `<p>${line}</p>`;
+                }
+            }
+        }
+
+        result.push(line);
+    }
+
+    // 关闭未闭合的标签
+    if (inList) result.push('</ul>');
+    if (inOrderedList) result.push('</ol>');
+    if (inBlockquote) result.push('</p></blockquote>');
+    if (inTable && tableRows.length > 0) {
+        result.push(renderTable(tableRows));
+    }
+
+    html = result.join('\n');
+
+    // 处理粗体 **text** （只使用星号，避免与下划线冲突）
+    html = html.replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>');
+
+    // 处理斜体 *text* （只使用星号，避免与变量名/文件名冲突）
+    // 注意：不匹配已经在标签内的内容
+    html = html.replace(/\*([^\*]+?)\*/g, '<em>$1</em>');
+
+    // 处理链接 [text](url)
+    html = html.replace(/\[([^\]]+)\]\(([^)]+)\)/g, '<a href="$2" target="_blank" rel="noopener">$1</a>');
+
+    // 处理图片 ![alt](url)
+    html = html.replace(/!\[([^\]]*)\]\(([^)]+)\)/g, '<img src="$2" alt="$1" style="max-width: 100%; border-radius: 6px;">');
+
+    return html;
+}
+
+// 流式 Markdown 渲染
+// 围栏外的空行、代码块的开始和结束行是块边界：边界之前的文本渲染一次后不再改动
+class MarkdownStream {
+    constructor(container) {
+        this.container = container;
+        this.text = '';
+        this.committed = 0;     // 已固定渲染的文本长度
+        this.scanned = 0;       // 下一个待扫描的行首
+        this.inFence = false;   // 是否处于未闭合的代码块中
+        this.fenceBody = 0;     // 未闭合代码块的内容起点
+        this.fenceRendered = 0; // 未闭合代码块已追加到 DOM 的位置
+        this.fenceCode = null;
+        this.tailNodes = [];
+    }
+
+    // 追加一段增量文本
+    append(chunk) {
+        if (!chunk) return;
+        this.text += chunk;
+        this._scan();
+        this._renderTail();
+    }
+
+    // 追加一个完整的文本块（与已有内容之间空一行）
+    appendBlock(text) {
+        if (!text) return;
+        this.append(this.text ? `\n\n${text}` : text);
+    }
+
+    // 输出结束：剩余文本按完整文本渲染
+    finish() {
+        this.inFence = false;
+        this._commit(this.text.length, this.text.length);
+    }
+
+    _scan() {
+        let lineStart = this.scanned;
+        let newline;
+        while ((newline = this.text.indexOf('\n', lineStart)) !== -1) {
+            const line = this.text.slice(lineStart, newline);
+            const fenceToggles = (line.match(/```/g) || []).length % 2 === 1;
+            if (!this.inFence) {
+                if (fenceToggles) {
+                    // 代码块开始：之前的文本是完整的块
+                    this._commit(Math.max(this.committed, lineStart - 1), lineStart);
+                    this.inFence = true;
+                    this.fenceBody = this.fenceRendered = newline + 1;
+                } else if (line.trim() === '') {
+                    this._commit(newline, newline + 1);
+                }
+            } else if (fenceToggles) {
+                // 代码块结束
+                this.inFence = false;
+                this._commit(newline, newline + 1);
+            }
+            lineStart = newline + 1;
+        }
+        this.scanned = lineStart;
+    }
+
+    // 将 [committed, end) 渲染为固定节点，下一个块从 next 开始
+    _commit(end, next) {
+        this._clearTail();
+        const segment = this.text.slice(this.committed, end);
+        if (segment.trim()) {
+            this._insert(formatMarkdown(segment));
+        } else if (end > this.committed || next > end) {
+            // 连续的空行
+            this._insert('<br>');
+        }
+        this.committed = next;
+    }
+
+    _renderTail() {
+        if (this.inFence) {
+            // 未闭合的代码块：只追加新到达的文本
+            if (!this.fenceCode) {
+                this._clearTail();
+                const pre = document.createElement('pre');
+                this.fenceCode = document.createElement('code');
+                pre.appendChild(this.fenceCode);
+                this.container.appendChild(pre);
+                this.tailNodes = [pre];
+            }
+            if (this.text.length > this.fenceRendered) {
+                this.fenceCode.appendChild(document.createTextNode(this.text.slice(this.fenceRendered)));
+                this.fenceRendered = this.text.length;
+            }
+            return;
+        }
+        this._clearTail();
+        this.tailNodes = this._insert(formatMarkdown(this.text.slice(this.committed)));
+    }
+
+    _insert(html) {
+        const template = document.createElement('template');
+        template.innerHTML = html;
+        const nodes = Array.from(template.content.childNodes);
+        this.container.appendChild(template.content);
+        return nodes;
+    }
+
+    _clearTail() {
+        this.tailNodes.forEach(node => node.remove());
+        this.tailNodes = [];
+        this.fenceCode = null;
+    }
+}
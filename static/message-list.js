@@ -0,0 +1,119 @@
+// XAgent - 虚拟化消息列表
+// 只有可视区域上下 buffer 像素内的消息保留完整 DOM；窗口外的消息保存为 HTML 字符串，
+// 原位置换成等高的占位块，重新进入窗口时再重建。消息节点和占位块都回收复用。
+// 正在更新的消息（isPinned 返回 true）始终保留在 DOM 中；消息内的交互通过事件委托处理，重建后无需重新绑定
+
+const NODE_POOL_SIZE = 50;
+
+class MessageList {
+    constructor(container, {buffer = 1500, isPinned = () => false} = {}) {
+        this.container = container;
+        this.buffer = buffer;
+        this.isPinned = isPinned;
+        // 每条消息：el 为 DOM 节点（窗口外时为 null），placeholder 为占位块，className / html 为保存的内容
+        this.items = Array.from(container.children).map(el => ({el, placeholder: null, className: '', html: ''}));
+        this.nodePool = [];
+        this.placeholderPool = [];
+        this.scheduled = false;
+        this.stickToBottom = false;
+        this.parked = 0;
+
+        container.addEventListener('scroll', () => this.refresh(), {passive: true});
+        window.addEventListener('resize', () => this.refresh());
+    }
+
+    append(el) {
+        this.items.push({el, placeholder: null, className: '', html: ''});
+        this.container.appendChild(el);
+        this.refresh();
+        return el;
+    }
+
+    remove(el) {
+        const index = this.items.findIndex(item => item.el === el);
+        if (index !== -1) this.items.splice(index, 1);
+        el.remove();
+    }
+
+    clear() {
+        this.items = [];
+        this.parked = 0;
+        this.container.innerHTML = '';
+    }
+
+    // 滚动到底部（同一帧内多次调用只滚动一次）
+    scrollToBottom() {
+        this.stickToBottom = true;
+        this.refresh();
+    }
+
+    refresh() {
+        if (this.scheduled) return;
+        this.scheduled = true;
+        requestAnimationFrame(() => {
+            this.scheduled = false;
+            if (this.stickToBottom) {
+                this.stickToBottom = false;
+                this.container.scrollTop = this.container.scrollHeight;
+            }
+            this.update();
+        });
+    }
+
+    // 先统一读取位置，再统一换入换出，避免交替读写触发多次布局
+    update() {
+        const top = this.container.scrollTop - this.buffer;
+        const bottom = this.container.scrollTop + this.container.clientHeight + this.buffer;
+        const parks = [];
+        const restores = [];
+
+        this.items.forEach(item => {
+            const node = item.el || item.placeholder;
+            const visible = node.offsetTop + node.offsetHeight >= top && node.offsetTop <= bottom;
+            if (item.el && !visible && !this.isPinned(item.el)) {
+                parks.push([item, this._outerHeight(item.el)]);
+            } else if (!item.el && visible) {
+                restores.push(item);
+            }
+        });
+
+        parks.forEach(([item, height]) => this._park(item, height));
+        restores.forEach(item => this._restore(item));
+    }
+
+    _outerHeight(el) {
+        const style = getComputedStyle(el);
+        return el.offsetHeight + parseFloat(style.marginTop) + parseFloat(style.marginBottom);
+    }
+
+    _park(item, height) {
+        const el = item.el;
+        item.className = el.className;
+        item.html = el.innerHTML;
+        item.placeholder = this.placeholderPool.pop() || document.createElement('div');
+        item.placeholder.className = 'message-placeholder';
+        item.placeholder.style.height = `${height}px`;
+        el.replaceWith(item.placeholder);
+        item.el = null;
+        this.parked++;
+
+        if (this.nodePool.length < NODE_POOL_SIZE) {
+            el.innerHTML = '';
+            this.nodePool.push(el);
+        }
+    }
+
+    _restore(item) {
+        const el = this.nodePool.pop() || document.createElement('div');
+        el.className = item.className;
+        // 重建的消息不再播放进入动画
+        el.classList.add('restored');
+        el.innerHTML = item.html;
+        item.placeholder.replaceWith(el);
+        this.placeholderPool.push(item.placeholder);
+        item.el = el;
+        item.placeholder = null;
+        item.html = '';
+        this.parked--;
+    }
+}
@@ -0,0 +1,134 @@
+"""
+测试轮次准入控制（并发上限、按用户轮转排队、排队位置通知、取消）
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.admission import TurnAdmission
+
+
+async def hold(admission, user, release, order, notices=None):
+    async def on_wait(position, eta):
+        notices.append((position, eta))
+
+    async with admission.slot(user, on_wait if notices is not None else None):
+        order.append(user)
+        await release.wait()
+
+
+def test_limit_and_fair_order():
+    async def run():
+        admission = TurnAdmission(max_concurrent=1)
+        release = asyncio.Event()
+        order = []
+        first = asyncio.create_task(hold(admission, "a", release, order))
+        await asyncio.sleep(0)
+        # a 连发三条，b、c 各一条：放行顺序应在用户间轮转
+        tasks = [asyncio.create_task(hold(admission, user, release, order)) for user in ("a", "a", "a", "b", "c")]
+        await asyncio.sleep(0.01)
+        waiting = admission.waiting()
+        release.set()
+        await asyncio.gather(first, *tasks)
+        return order, waiting, admission
+
+    order, waiting, admission = asyncio.run(run())
+    assert waiting == 5
+    assert order == ["a", "a", "b", "c", "a", "a"]
+    assert admission.running == 0 and admission.queued == 5
+
+
+def test_queue_position_and_eta_notices():
+    async def run():
+        admission = TurnAdmission(max_concurrent=1)
+        admission.avg_hold = 2.0
+        gates = [asyncio.Event() for _ in range(3)]
+        order = []
+        notices = []
+        holders = [asyncio.create_task(hold(admission, f"u{i}", gates[i], order)) for i in range(2)]
+        await asyncio.sleep(0)
+        tail = asyncio.create_task(hold(admission, "u2", gates[2], order, notices))
+        await asyncio.sleep(0)
+        for gate in gates:
+            gate.set()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*holders, tail)
+        return notices
+
+    notices = asyncio.run(run())
+    # u1 排在前面：u2 先是第 2 位，u0 完成后变为第 1 位
+    assert [position for position, _ in notices] == [2, 1]
+    assert notices[0][1] == 4.0
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        admission = TurnAdmission(max_concurrent=1)
+        release = asyncio.Event()
+        order = []
+        first = asyncio.create_task(hold(admission, "a", release, order))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(hold(admission, "b", release, order))
+        last = asyncio.create_task(hold(admission, "c", release, order))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, last)
+        return order, admission
+
+    order, admission = asyncio.run(run())
+    assert order == ["a", "c"] and admission.running == 0 and admission.waiting() == 0
+
+
+class _Sink:
+    async def send_json(self, frame):
+        pass
+
+
+def test_admission_limits_client_spawns():
+    # 预热池未命中时每个新会话都要启动 CLI 子进程：准入名额在初始化客户端前取得，同时启动的进程数受上限约束
+    import webui_server
+    from xagent.stub_sdk import StubClaudeSDKClient, StubProfile
+
+    profile = StubProfile(connect_delay=0.05, first_token_delay=0, block_delay=0, tool_delay=0, tool_calls=0)
+    state = {"connecting": 0, "peak": 0}
+
+    class CountingClient(StubClaudeSDKClient):
+        async def connect(self, prompt=None):
+            state["connecting"] += 1
+            state["peak"] = max(state["peak"], state["connecting"])
+            try:
+                await super().connect(prompt)
+            finally:
+                state["connecting"] -= 1
+
+    async def run():
+        managers = [webui_server.ConversationManager(user=f"u{i}") for i in range(6)]
+        for manager in managers:
+            manager.budget = None
+        await asyncio.gather(*(manager.send_message("hi", _Sink()) for manager in managers))
+        await asyncio.gather(*(manager.close() for manager in managers))
+
+    saved = webui_server.create_client, webui_server.turn_admission
+    webui_server.create_client = lambda options: CountingClient(options, profile=profile)
+    webui_server.turn_admission = TurnAdmission(max_concurrent=2)
+    try:
+        asyncio.run(run())
+    finally:
+        webui_server.create_client, webui_server.turn_admission = saved
+    assert state["peak"] == 2
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试轮次准入控制")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,201 @@
+"""
+测试单连接多路会话（通道表、客户端配额、出站轮转）
+"""
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.channels import ChannelError, ChannelMux, parse_channel
+from xagent.outbound import OutboundWriter
+from xagent.stub_sdk import StubClaudeSDKClient, StubProfile
+
+# 每轮约 0.1s：5 个文本块，间隔 20ms
+STREAM = StubProfile(text_blocks=5, tool_calls=0, thinking_blocks=0, connect_delay=0, first_token_delay=0,
+                     block_delay=0.02, tool_delay=0)
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+
+class FakeManager:
+    """只实现 ChannelMux 需要的接口"""
+
+    def __init__(self, channel, mux):
+        self.channel = channel
+        self.mux = mux
+        self.client = None
+        self.current_task = None
+        self.hibernated = 0
+
+    def client_busy(self):
+        return False
+
+    async def acquire(self):
+        async with self.mux.client_slot(self):
+            self.client = object()
+
+    async def hibernate(self):
+        self.client = None
+        self.hibernated += 1
+
+
+class StreamingManager:
+    """与 ConversationManager 相同的读取方式：引导消息的回复再次经 self.client 读取，close() 归还客户端"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.client = StubClaudeSDKClient(profile=STREAM)
+        self.current_task = None
+        self.recorded = []
+        self.errors = []
+        self.released_while_running = False
+
+    def client_busy(self):
+        return False
+
+    async def run_turn(self, message):
+        try:
+            await self.client.query(message)
+            await self.client.query("steer")
+            for _ in range(2):
+                async for msg in self.client.receive_response():
+                    self.recorded.append(type(msg).__name__)
+        except Exception as e:
+            self.errors.append(e)
+            raise
+
+    async def close(self):
+        self.released_while_running = not self.current_task.done()
+        client, self.client = self.client, None
+        await client.disconnect()
+
+
+def make_mux(**kwargs):
+    holder = {}
+    mux = ChannelMux(lambda channel: FakeManager(channel, holder["mux"]), **kwargs)
+    holder["mux"] = mux
+    return mux
+
+
+def test_parse_channel():
+    assert parse_channel(None) is None and parse_channel("") is None
+    assert parse_channel("tab-1") == "tab-1"
+    for raw in (5, ["a"], "x" * 65):
+        try:
+            parse_channel(raw)
+        except ChannelError:
+            continue
+        raise AssertionError(raw)
+
+
+def test_channel_limit():
+    mux = make_mux(max_channels=2)
+    a = mux.get("a")
+    mux.get(None)
+    assert mux.get("a") is a and len(mux) == 2
+    try:
+        mux.get("b")
+        raise AssertionError("expected ChannelError")
+    except ChannelError:
+        pass
+
+
+def test_hibernates_least_recently_used_idle_client():
+    async def run():
+        mux = make_mux(max_live_clients=2)
+        a, b, c = mux.get("a"), mux.get("b"), mux.get("c")
+        await a.acquire()
+        await b.acquire()
+        mux.get("a")  # a 最近使用过，b 成为最久未使用
+        await c.acquire()
+        return mux, a, b, c
+
+    mux, a, b, c = asyncio.run(run())
+    assert (a.hibernated, b.hibernated) == (0, 1)
+    assert mux.live_clients() == 2 and mux.hibernations == 1
+
+
+def test_waits_while_all_clients_busy():
+    async def run():
+        mux = make_mux(max_live_clients=1)
+        a, b = mux.get("a"), mux.get("b")
+        await a.acquire()
+        a.current_task = asyncio.create_task(asyncio.sleep(10))
+        waiter = asyncio.create_task(b.acquire())
+        await asyncio.sleep(0.05)
+        blocked = not waiter.done()
+        a.current_task.cancel()
+        mux.notify_idle()
+        await asyncio.wait_for(waiter, 1)
+        return blocked, a, b
+
+    blocked, a, b = asyncio.run(run())
+    assert blocked and a.hibernated == 1 and b.client is not None
+
+
+def test_disconnect_mid_stream():
+    async def run(grace):
+        mux = ChannelMux(StreamingManager)
+        managers = [mux.get("a"), mux.get("b")]
+        for manager in managers:
+            manager.current_task = asyncio.create_task(manager.run_turn("hi"))
+        await asyncio.sleep(0.03)  # 两路会话都在流式输出中
+        assert all(manager.recorded for manager in managers)
+        await mux.close_all(grace=grace)
+        return mux, managers
+
+    # 宽限期内轮次照常结束：两条消息的回复都收完，之后才归还客户端
+    mux, managers = asyncio.run(run(grace=5))
+    assert len(mux) == 0
+    for manager in managers:
+        assert manager.recorded.count("ResultMessage") == 2 and not manager.errors
+        assert not manager.released_while_running and manager.client is None
+
+    # 宽限期已过：先取消轮次，再归还客户端
+    _, managers = asyncio.run(run(grace=0.01))
+    for manager in managers:
+        assert manager.current_task.cancelled() and "ResultMessage" not in manager.recorded
+        assert not manager.errors and not manager.released_while_running
+
+
+def test_outbound_round_robin_between_channels():
+    async def run():
+        websocket = FakeWebSocket()
+        writer = OutboundWriter(websocket, batch_window=0, max_batch=64)
+        recorded = []
+        first = writer.channel("a", on_frame=recorded.append)
+        second = writer.channel("b")
+        for i in range(3):
+            await first.send_json({"type": "assistant_text", "content": f"a{i}"})
+        await second.send_json({"type": "assistant_text", "content": "b0"})
+        await writer.send_json({"type": "system", "content": "hello"})
+        writer.start()
+        await writer.close()
+        return websocket.sent, recorded
+
+    sent, recorded = asyncio.run(run())
+    frames = [f for message in sent for f in (message["events"] if message["type"] == "batch" else [message])]
+    assert [f["content"] for f in frames] == ["a0", "b0", "hello", "a1", "a2"]
+    assert [f.get("channel") for f in frames] == ["a", "b", None, "a", "a"]
+    # 会话记录收到的是不带 channel 字段的帧
+    assert all("channel" not in f for f in recorded) and len(recorded) == 3
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试单连接多路会话")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
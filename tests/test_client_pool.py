@@ -0,0 +1,207 @@
+"""
+测试 ClaudeSDKClient 预热连接池
+使用假客户端，无需网络和模型
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.client_pool import ClientPool
+
+
+class FakeClient:
+    """模拟 ClaudeSDKClient 的连接/断开"""
+
+    def __init__(self, connect_delay: float = 0.01):
+        self.connect_delay = connect_delay
+        self.connected = False
+
+    async def connect(self):
+        await asyncio.sleep(self.connect_delay)
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+
+class FlakyFactory:
+    """前 failures 次创建的客户端连接失败（超时或报错）"""
+
+    def __init__(self, failures: int, hang: bool = False):
+        self.failures = failures
+        self.hang = hang
+        self.clients = []
+
+    def __call__(self):
+        client = FakeClient()
+        if len(self.clients) < self.failures:
+            client.connect = self._hang if self.hang else self._fail
+            client.connected = True  # 子进程已启动
+        self.clients.append(client)
+        return client
+
+    @staticmethod
+    async def _fail():
+        raise RuntimeError("CLI exited")
+
+    @staticmethod
+    async def _hang():
+        await asyncio.sleep(10)
+
+
+async def _wait_idle(pool: ClientPool, count: int):
+    for _ in range(200):
+        if pool.idle_count >= count:
+            return
+        await asyncio.sleep(0.01)
+
+
+def test_prewarm_and_hit():
+    async def run():
+        pool = ClientPool(FakeClient, min_size=2, max_size=4)
+        await pool.start()
+        await _wait_idle(pool, 2)
+        assert pool.idle_count == 2
+
+        client, hit = await pool.acquire()
+        assert hit and client.connected
+        assert pool.hits == 1 and pool.misses == 0
+
+        # 后台补充回 min_size
+        await _wait_idle(pool, 2)
+        assert pool.idle_count == 2
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_miss_when_empty():
+    async def run():
+        pool = ClientPool(FakeClient, min_size=0, max_size=2)
+        await pool.start()
+        client, hit = await pool.acquire()
+        assert not hit and client.connected
+        assert pool.stats()["misses"] == 1
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_release_reusable_and_used():
+    async def run():
+        pool = ClientPool(FakeClient, min_size=1, max_size=2)
+        await pool.start()
+        await _wait_idle(pool, 1)
+
+        client, _ = await pool.acquire()
+        await pool.release(client, reusable=True)
+        assert client in list(pool._idle)
+
+        client, _ = await pool.acquire()
+        await pool.release(client, reusable=False)
+        await asyncio.sleep(0.05)
+        assert not client.connected
+        assert pool.live_count <= pool.max_size
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_release_foreign_client_not_pooled():
+    async def run():
+        pool = ClientPool(FakeClient, min_size=0, max_size=2)
+        await pool.start()
+        # 恢复会话的专用客户端不是由池借出的，持有其他会话的上下文
+        resumed = FakeClient()
+        await resumed.connect()
+        await pool.release(resumed, reusable=True)
+        await asyncio.sleep(0.05)
+        assert pool.idle_count == 0 and not resumed.connected
+
+        client, hit = await pool.acquire()
+        assert not hit and client is not resumed
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_max_size_bounds_live_clients():
+    async def run():
+        pool = ClientPool(FakeClient, min_size=2, max_size=3)
+        await pool.start()
+        await _wait_idle(pool, 2)
+        clients = [await pool.acquire() for _ in range(5)]
+        await asyncio.sleep(0.05)
+        assert pool.live_count + pool.stats()["connecting"] <= 3
+        for client, _ in clients:
+            await pool.release(client, reusable=False)
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_failed_connect_disconnects_client():
+    async def run():
+        factory = FlakyFactory(failures=1, hang=True)
+        pool = ClientPool(factory, min_size=0, max_size=2, connect_timeout=0.05)
+        await pool.start()
+        try:
+            await pool.acquire()
+            raise AssertionError("expected TimeoutError")
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(0.01)
+        await pool.close()
+        return factory, pool
+
+    factory, pool = asyncio.run(run())
+    assert not factory.clients[0].connected and pool.connect_failures == 1
+
+
+def test_prewarm_retries_with_backoff():
+    async def run():
+        factory = FlakyFactory(failures=3)
+        pool = ClientPool(factory, min_size=1, max_size=2, retry_delay=0.01)
+        await pool.start()
+        await _wait_idle(pool, 1)
+        idle = pool.idle_count
+        await pool.close()
+        return factory, pool, idle
+
+    factory, pool, idle = asyncio.run(run())
+    assert idle == 1 and pool.connect_failures == 3
+    assert not any(client.connected for client in factory.clients[:3])
+    # 连续失败后退避间隔翻倍，成功后重置
+    assert pool._consecutive_failures == 0 and pool._retry_backoff() == 0.01
+    pool._consecutive_failures = 3
+    assert pool._retry_backoff() == 0.04
+
+
+def test_first_byte_stats():
+    pool = ClientPool(FakeClient, min_size=0, max_size=1)
+    pool.record_first_byte(0.2, hit=True)
+    pool.record_first_byte(3.0, hit=False)
+    stats = pool.stats()["time_to_first_byte"]
+    assert stats["hit"]["count"] == 1 and stats["hit"]["p50_ms"] == 200.0
+    assert stats["miss"]["avg_ms"] == 3000.0
+
+
+def test_interrupt_ready_stats():
+    pool = ClientPool(FakeClient, min_size=0, max_size=1)
+    pool.record_interrupt_ready(0.004)
+    stats = pool.stats()["interrupt_to_ready"]
+    assert stats["count"] == 1 and stats["avg_ms"] == 4.0
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试客户端预热连接池")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,96 @@
+"""
+测试自定义斜杠命令注册表和预编译模板
+使用临时目录，无需真实的 .claude/commands/
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.command_registry import CommandRegistry, CommandTemplate
+
+
+def test_template_render():
+    template = CommandTemplate("查询 $1 表的 $2 字段，原始参数: $ARGUMENTS")
+    assert template.render("dws_a field_b") == "查询 dws_a 表的 field_b 字段，原始参数: dws_a field_b"
+
+    # 没有参数时 $N 原样保留
+    assert template.render("") == "查询 $1 表的 $2 字段，原始参数: "
+
+    # $10 不会被 $1 误伤，参数中的 $2 不会被二次替换
+    template = CommandTemplate("$1|$10")
+    assert template.render("$2") == "$2|$10"
+
+
+def _write(path: Path, text: str, mtime: float):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_registry_load_and_reload():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            commands_dir = Path(tmp) / ".claude" / "commands"
+            _write(
+                commands_dir / "findtable.md",
+                "---\ndescription: 找表\nargument-hint: <关键词>\n---\n查找与 $ARGUMENTS 相关的表",
+                1000,
+            )
+            _write(commands_dir / "sub" / "dqcsql.md", "生成 $1 的 DQC SQL", 1000)
+
+            registry = CommandRegistry(commands_dir, poll_interval=0)
+            await registry.start()
+            assert set(registry.commands) == {"findtable", "dqcsql"}
+            assert registry.get("findtable")["metadata"]["description"] == "找表"
+            assert registry.get("dqcsql")["template"].render("t1") == "生成 t1 的 DQC SQL"
+
+            # 无变化时不重新加载，派生结果命中缓存
+            calls = []
+            registry.derived("names", lambda cmds: calls.append(1) or sorted(cmds))
+            assert not await registry.reload()
+            registry.derived("names", lambda cmds: calls.append(1) or sorted(cmds))
+            assert len(calls) == 1
+
+            # 修改文件 mtime 后只重新解析该文件
+            unchanged = registry.get("dqcsql")
+            _write(commands_dir / "findtable.md", "新的内容", 2000)
+            _write(commands_dir / "newcmd.md", "新命令", 2000)
+            assert await registry.reload()
+            assert registry.get("findtable")["content"] == "新的内容"
+            assert registry.get("dqcsql") is unchanged
+            assert "newcmd" in registry.commands
+            assert registry.derived("names", sorted) == ["dqcsql", "findtable", "newcmd"]
+
+            # 删除文件
+            (commands_dir / "newcmd.md").unlink()
+            assert await registry.reload()
+            assert "newcmd" not in registry.commands
+
+    asyncio.run(run())
+
+
+def test_registry_missing_dir():
+    async def run():
+        registry = CommandRegistry(Path(tempfile.gettempdir()) / "xagent-no-such-dir", poll_interval=0)
+        await registry.start()
+        assert registry.commands == {}
+        assert registry.version == 1
+        assert not await registry.reload()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试自定义命令注册表")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,61 @@
+"""
+测试对话压缩（/compact）
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.compaction import COMPACT_PROMPT, build_seed_prompt, collect_response, context_tokens, format_report
+from xagent.stub_sdk import StubClaudeSDKClient, StubProfile
+
+
+def test_context_tokens():
+    usage = {"input_tokens": 10, "cache_read_input_tokens": 30000, "cache_creation_input_tokens": 500,
+             "output_tokens": 800}
+    assert context_tokens(usage) == 30510
+    assert context_tokens({"input_tokens": 5, "cache_read_input_tokens": None}) == 5
+    assert context_tokens(None) is None and context_tokens({}) is None
+
+
+def test_prompts_keep_contract_and_summary():
+    assert "Query Contract" in COMPACT_PROMPT and "样例数据" in COMPACT_PROMPT
+    seed = build_seed_prompt("选定 bi.dws_effect_cost_1d_d")
+    assert "<conversation_summary>\n选定 bi.dws_effect_cost_1d_d\n</conversation_summary>" in seed
+
+
+def test_collect_response_usage():
+    async def run(text_blocks):
+        profile = StubProfile(text_blocks=text_blocks, text_chars=30, thinking_blocks=0, tool_calls=0,
+                              connect_delay=0, first_token_delay=0, block_delay=0, tool_delay=0)
+        client = StubClaudeSDKClient(profile=profile)
+        await client.connect()
+        return client, await collect_response(client, COMPACT_PROMPT)
+
+    client, (text, result, usage) = asyncio.run(run(2))
+    assert text.count("\n\n") == 1 and result.subtype == "success"
+    # 取最后一次模型调用（最后一个文本块）的 usage
+    assert context_tokens(usage) == client.context_tokens - 15
+
+    # 没有 AssistantMessage 时退化为 ResultMessage.usage
+    _, (text, result, usage) = asyncio.run(run(0))
+    assert text == "" and usage == result.usage
+
+
+def test_format_report():
+    report = format_report(120000, 6000, "摘要内容")
+    assert "**120,000** → **6,000**（减少 95%）" in report and report.endswith("摘要内容")
+    assert "未获取到 usage" in format_report(None, 10, "x")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试对话压缩")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
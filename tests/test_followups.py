@@ -0,0 +1,75 @@
+"""
+测试后续消息队列（排队 / 引导）
+"""
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from claude_agent_sdk import ResultMessage
+
+from xagent.followups import QUEUE, STEER, FollowUpQueue, parse_mode
+from xagent.recording import Recorder, RecordingClient
+from xagent.stub_sdk import StubClaudeSDKClient, StubProfile
+
+PROFILE = StubProfile(text_blocks=1, tool_calls=0, thinking_blocks=0, connect_delay=0, first_token_delay=0,
+                      block_delay=0, tool_delay=0)
+
+
+def test_queue_order_limit_and_clear():
+    queue = FollowUpQueue(max_pending=2)
+    assert queue.push("a") and queue.push("b") and not queue.push("c")
+    assert len(queue) == 2
+
+    first = queue.pop()
+    assert first.message == "a" and first.waited() >= 0
+    assert queue.push("c")
+    assert queue.clear() == ["b", "c"] and len(queue) == 0 and queue.pop() is None
+
+
+def test_parse_mode():
+    assert parse_mode("steer") == STEER
+    assert parse_mode("queue") == QUEUE
+    assert parse_mode(None) == QUEUE and parse_mode("cancel") == QUEUE
+
+
+def test_steered_prompts_get_their_own_results():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "recordings.jsonl"
+            client = RecordingClient(StubClaudeSDKClient(profile=PROFILE), Recorder(path))
+            await client.connect()
+            await client.query("first")
+            results = []
+            steered = False
+            async for msg in client.receive_response():
+                if isinstance(msg, ResultMessage):
+                    results.append(msg)
+                elif not steered:
+                    # 轮次进行中写入引导消息
+                    steered = True
+                    await client.query("steer")
+            async for msg in client.receive_response():
+                if isinstance(msg, ResultMessage):
+                    results.append(msg)
+            turns = [json.loads(line) for line in path.read_text().splitlines()]
+            return results, turns
+
+    results, turns = asyncio.run(run())
+    assert [r.num_turns for r in results] == [1, 2]
+    assert [t["prompt"] for t in turns] == ["first", "steer"]
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试后续消息队列")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
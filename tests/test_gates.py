@@ -0,0 +1,159 @@
+"""
+测试四段式 Gate 判定（SQLite 样例数据、遇到失败即停止、候选表并发判定）
+"""
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.gates import (
+    INVARIANT,
+    QUERY,
+    SCHEMA,
+    SHAPE,
+    Candidate,
+    GateEngine,
+    GateError,
+    GateExecutor,
+    SqliteEngine,
+    load_fixtures,
+)
+
+AD_COLUMNS = {"dt": "TEXT", "advertiser_id": "INTEGER", "cost": "REAL", "imp": "INTEGER", "click": "INTEGER"}
+
+
+def _fixtures():
+    good = [["2024-01-01", i, 10.0 * i, 100, 5] for i in range(1, 51)]
+    good += [["2024-01-02", i, 1.0, 100, 5] for i in range(1, 11)]
+    return {
+        "bi.dws_ad_cost_1d_d": {"columns": AD_COLUMNS, "rows": good},
+        # 一半广告主的消耗缺失
+        "bi.dws_ad_cost_sparse": {"columns": AD_COLUMNS, "rows": [["2024-01-01", i, None if i % 2 else 1.0, 100, 5]
+                                                                  for i in range(40)]},
+        # 点击数大于曝光数（CTR > 1）
+        "bi.dwd_ad_click_bad": {"columns": AD_COLUMNS, "rows": [["2024-01-01", i, 1.0, 10, 50] for i in range(20)]},
+        "ods.ad_raw": {"columns": {"log_date": "TEXT", "advertiser_id": "INTEGER"}, "rows": []},
+    }
+
+
+def _candidate(table, **kwargs):
+    spec = dict(
+        table=table, grain_keys=["advertiser_id"], time_field="dt", partition="2024-01-01",
+        metrics={"cost": "SUM(cost)", "ctr": "1.0 * SUM(click) / SUM(imp)"},
+        ranges={"cost": (0, None), "ctr": (0, 1)},
+    )
+    spec.update(kwargs)
+    return Candidate(**spec)
+
+
+def test_gates_with_sqlite_fixtures():
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / "fixtures.db"
+        load_fixtures(database, _fixtures())
+        executor = GateExecutor(SqliteEngine(database), max_workers=4)
+        try:
+            verdicts = executor.evaluate([
+                _candidate("bi.dws_ad_cost_1d_d", grain_range=(10, 1000), baselines={"cost": 12750.0}),
+                _candidate("ods.ad_raw"),
+                _candidate("bi.not_exists"),
+                _candidate("bi.dws_ad_cost_1d_d", partition="2023-12-31"),
+                _candidate("bi.dws_ad_cost_sparse"),
+                _candidate("bi.dwd_ad_click_bad"),
+                _candidate("bi.dws_ad_cost_1d_d", baselines={"cost": 9999.0}),
+                _candidate("bi.dws_ad_cost_1d_d", filters=["1 = 1; DROP TABLE x"]),
+                _candidate("bi.dws_ad_cost_1d_d", metrics={"cost": "SUM(no_such_column)"}),
+            ])
+        finally:
+            executor.close()
+
+    good = verdicts[0]
+    assert good.passed and [g.gate for g in good.gates] == [SCHEMA, QUERY, SHAPE, INVARIANT]
+    assert good.gates[1].evidence["rows"] == 50 and "LIMIT 1000" in good.gates[1].evidence["sql"]
+    assert good.gates[2].evidence["grain_count"] == 50
+    assert good.gates[3].evidence["ctr"]["max"] == 0.05
+    # 第一个失败即停止，后面的 Gate 不再执行
+    expected = [SCHEMA, SCHEMA, SHAPE, SHAPE, INVARIANT, INVARIANT, SCHEMA, QUERY]
+    assert [v.failed_gate for v in verdicts[1:]] == expected
+    assert all(len(v.gates) == [SCHEMA, QUERY, SHAPE, INVARIANT].index(v.failed_gate) + 1 for v in verdicts[1:])
+    assert verdicts[1].gates[0].evidence["missing"] == ["dt"]
+    assert verdicts[4].gates[2].evidence["null_rates"]["cost"] == 0.5
+    assert verdicts[5].gates[3].evidence["ctr"]["violations"] == 20
+    assert "sql" in verdicts[8].gates[1].evidence
+    assert good.to_dict()["gates"][0]["gate"] == SCHEMA
+    assert executor.stats()["failures"][SCHEMA] == 3
+
+
+def test_sqlite_query_timeout():
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Path(tmp) / "fixtures.db"
+        load_fixtures(database, _fixtures())
+        engine = SqliteEngine(database)
+        slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+        start = time.perf_counter()
+        try:
+            engine.execute(slow, timeout=0.1)
+            raise AssertionError("expected GateError")
+        except GateError as e:
+            assert "超时" in str(e)
+        assert time.perf_counter() - start < 2
+
+
+class SlowEngine(GateEngine):
+    """每次查询固定耗时，用于验证候选表并发判定"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def columns(self, table):
+        return {"dt": "string", "advertiser_id": "bigint", "cost": "double"}
+
+    def execute(self, sql, params=(), timeout=30.0):
+        time.sleep(self.delay)
+        return ["advertiser_id", "cost"], [(1, 2.0)]
+
+
+def test_partial_engine_rejected():
+    class SchemaOnlyEngine(GateEngine):
+        def columns(self, table):
+            return {}
+
+    try:
+        SchemaOnlyEngine()
+        raise AssertionError("expected TypeError")
+    except TypeError as e:
+        assert "execute" in str(e)
+
+
+def test_candidates_judged_concurrently():
+    async def run():
+        executor = GateExecutor(SlowEngine(0.2), max_workers=10)
+        candidates = [
+            Candidate(table=f"bi.t{i}", grain_keys=["advertiser_id"], time_field="dt", partition="2024-01-01",
+                      metrics={"cost": "SUM(cost)"})
+            for i in range(10)
+        ]
+        start = time.perf_counter()
+        verdicts = await executor.evaluate_async(candidates)
+        elapsed = time.perf_counter() - start
+        executor.close()
+        return verdicts, elapsed
+
+    verdicts, elapsed = asyncio.run(run())
+    assert all(v.passed for v in verdicts) and [v.table for v in verdicts] == [f"bi.t{i}" for i in range(10)]
+    # 串行需要 10 × 0.2s，并发接近单个候选的耗时
+    assert elapsed < 0.8
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试四段式 Gate 判定")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,225 @@
+"""
+测试 berserker-metadata MCP 读穿缓存代理
+上游使用本地替身 MCP 服务器（ASGI 应用），无需网络
+"""
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.mcp_proxy import McpCachingProxy, McpHttpClient, ToolResultCache, proxy_access_denied
+
+
+class StandInServer:
+    """替身 MCP 服务器：记录每个工具的调用次数，tools/call 以 SSE 返回"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = {}
+        self.initializations = 0
+        self.sessions = set()
+        self.app = FastAPI()
+        self.app.post("/mcp")(self.handle)
+
+    async def handle(self, request: Request):
+        message = await request.json()
+        method = message.get("method")
+        if "id" not in message:
+            return Response(status_code=202)
+        if method == "initialize":
+            self.initializations += 1
+            session_id = f"s{self.initializations}"
+            self.sessions.add(session_id)
+            return JSONResponse(
+                {"jsonrpc": "2.0", "id": message["id"], "result": {"protocolVersion": "2025-03-26"}},
+                headers={"mcp-session-id": session_id},
+            )
+        if request.headers.get("mcp-session-id") not in self.sessions:
+            return Response(status_code=404)
+
+        if method == "tools/list":
+            result = {"tools": [{"name": "getHiveTableSchema", "inputSchema": {"type": "object"}}]}
+        elif method == "tools/call":
+            name = message["params"]["name"]
+            arguments = message["params"]["arguments"]
+            self.calls[name] = self.calls.get(name, 0) + 1
+            await asyncio.sleep(self.delay)
+            if name == "missing":
+                reply = {"jsonrpc": "2.0", "id": message["id"], "error": {"code": -32602, "message": "Unknown tool"}}
+                return JSONResponse(reply)
+            result = {
+                "content": [{"type": "text", "text": f"{name}:{json.dumps(arguments, sort_keys=True)}"}],
+                "isError": name == "broken",
+            }
+        else:
+            result = {}
+        body = json.dumps({"jsonrpc": "2.0", "id": message["id"], "result": result})
+        return Response(f"event: message\ndata: {body}\n\n", media_type="text/event-stream")
+
+
+def _proxy(server: StandInServer, **cache_kwargs) -> McpCachingProxy:
+    cache_kwargs.setdefault("ttls", {"getHiveTableSchema": 60, "broken": 60, "getTableDataDemo": 0})
+    upstream = McpHttpClient("http://stand-in/mcp", transport=httpx.ASGITransport(app=server.app))
+    return McpCachingProxy(upstream, ToolResultCache(**cache_kwargs))
+
+
+def _call(request_id: int, name: str, **arguments):
+    return {"jsonrpc": "2.0", "id": request_id, "method": "tools/call",
+            "params": {"name": name, "arguments": arguments}}
+
+
+def test_initialize_and_tools_list_cached():
+    async def run():
+        server = StandInServer()
+        proxy = _proxy(server)
+        reply = await proxy.handle({"jsonrpc": "2.0", "id": 1, "method": "initialize",
+                                    "params": {"protocolVersion": "2025-06-18"}})
+        assert reply["result"]["protocolVersion"] == "2025-06-18"
+        assert await proxy.handle({"jsonrpc": "2.0", "method": "notifications/initialized"}) is None
+
+        for i in range(3):
+            reply = await proxy.handle({"jsonrpc": "2.0", "id": 2 + i, "method": "tools/list"})
+            assert reply["result"]["tools"][0]["name"] == "getHiveTableSchema"
+        assert proxy.cache.hits == 2
+        await proxy.close()
+
+    asyncio.run(run())
+
+
+def test_repeated_calls_hit_cache():
+    async def run():
+        server = StandInServer()
+        proxy = _proxy(server)
+        first = await proxy.handle(_call(1, "getHiveTableSchema", table="a"))
+        second = await proxy.handle(_call(2, "getHiveTableSchema", table="a"))
+        assert first["result"] == second["result"] and second["id"] == 2
+        await proxy.handle(_call(3, "getHiveTableSchema", table="b"))
+        assert server.calls["getHiveTableSchema"] == 2
+
+        # TTL 为 0 的工具不缓存
+        await proxy.handle(_call(4, "getTableDataDemo", table="a"))
+        await proxy.handle(_call(5, "getTableDataDemo", table="a"))
+        assert server.calls["getTableDataDemo"] == 2
+        assert proxy.cache.stats()["bypassed"] == 2
+        await proxy.close()
+
+    asyncio.run(run())
+
+
+def test_concurrent_calls_coalesce():
+    async def run():
+        server = StandInServer(delay=0.05)
+        proxy = _proxy(server)
+        replies = await asyncio.gather(*(
+            proxy.handle(_call(i, "getHiveTableSchema", table="hot")) for i in range(5)
+        ))
+        assert [reply["id"] for reply in replies] == list(range(5))
+        assert server.calls["getHiveTableSchema"] == 1
+        assert proxy.cache.coalesced == 4
+        await proxy.close()
+
+    asyncio.run(run())
+
+
+def test_lru_eviction_and_ttl_expiry():
+    async def run():
+        server = StandInServer()
+        proxy = _proxy(server, max_entries=2)
+        for table in ("a", "b", "a", "c"):
+            await proxy.handle(_call(1, "getHiveTableSchema", table=table))
+        # b 最久未使用，被淘汰
+        assert proxy.cache.evictions == 1
+        await proxy.handle(_call(2, "getHiveTableSchema", table="a"))
+        assert server.calls["getHiveTableSchema"] == 3
+        await proxy.handle(_call(3, "getHiveTableSchema", table="b"))
+        assert server.calls["getHiveTableSchema"] == 4
+
+        proxy.cache.ttls["getHiveTableSchema"] = 0.01
+        await proxy.handle(_call(4, "getHiveTableSchema", table="d"))
+        await asyncio.sleep(0.02)
+        await proxy.handle(_call(5, "getHiveTableSchema", table="d"))
+        assert server.calls["getHiveTableSchema"] == 6
+        await proxy.close()
+
+    asyncio.run(run())
+
+
+def test_errors_not_cached():
+    async def run():
+        server = StandInServer()
+        proxy = _proxy(server, ttls={"broken": 60, "missing": 60})
+        for i in range(2):
+            reply = await proxy.handle(_call(i, "broken"))
+            assert reply["result"]["isError"]
+        assert server.calls["broken"] == 2
+
+        reply = await proxy.handle(_call(3, "missing"))
+        assert reply["error"]["code"] == -32602
+        await proxy.handle(_call(4, "missing"))
+        assert server.calls["missing"] == 2
+        await proxy.close()
+
+    asyncio.run(run())
+
+
+def test_upstream_session_expiry_reconnects():
+    async def run():
+        server = StandInServer()
+        proxy = _proxy(server)
+        await proxy.handle(_call(1, "getHiveTableSchema", table="a"))
+        server.sessions.clear()  # 上游重启，旧会话失效
+        reply = await proxy.handle(_call(2, "getHiveTableSchema", table="b"))
+        assert "result" in reply
+        assert server.initializations == 2
+        await proxy.close()
+
+    asyncio.run(run())
+
+
+def test_proxy_access_check():
+    assert proxy_access_denied("127.0.0.1", "Bearer t0k", "t0k") is None
+    assert proxy_access_denied("::1", "Bearer t0k", "t0k") is None
+    assert proxy_access_denied("172.17.0.1", "Bearer t0k", "t0k") == 403
+    assert proxy_access_denied(None, "Bearer t0k", "t0k") == 403
+    assert proxy_access_denied("127.0.0.1", None, "t0k") == 401
+    assert proxy_access_denied("127.0.0.1", "Bearer wrong", "t0k") == 401
+    assert proxy_access_denied("127.0.0.1", "Bearer 令牌", "t0k") == 401
+
+
+def test_proxy_endpoint_rejects_foreign_requests():
+    import webui_server
+
+    async def post(client_host, headers=None):
+        transport = httpx.ASGITransport(app=webui_server.app, client=(client_host, 50000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://xagent") as client:
+            # 通知不转发到上游，放行时直接返回 202
+            response = await client.post(webui_server.METADATA_PROXY_PATH, headers=headers or {},
+                                         json={"jsonrpc": "2.0", "method": "notifications/initialized"})
+            return response.status_code
+
+    token = {"Authorization": f"Bearer {webui_server.METADATA_PROXY_TOKEN}"}
+    server = webui_server.build_agent_options().mcp_servers["berserker-metadata"]
+    assert server["headers"] == token
+
+    async def run():
+        return [await post("203.0.113.5", token), await post("127.0.0.1"), await post("127.0.0.1", token)]
+
+    assert asyncio.run(run()) == [403, 401, 202]
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试元数据 MCP 缓存代理")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,103 @@
+"""
+测试 Prometheus 指标（计数器、仪表、直方图、回调指标）
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent import metrics
+from xagent.metrics import MetricsRegistry
+
+
+def _samples(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    calls = registry.counter("x_calls_total", "Calls", ["tool"])
+    calls.inc(tool="a")
+    calls.inc(2, tool='b"q')
+    gauge = registry.gauge("x_open", "Open")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    text = registry.render()
+    assert "# TYPE x_calls_total counter" in text and "# TYPE x_open gauge" in text
+    samples = _samples(text)
+    assert samples['x_calls_total{tool="a"}'] == 1
+    assert samples['x_calls_total{tool="b\\"q"}'] == 2
+    assert samples["x_open"] == 1
+    # 重复注册返回同一个指标
+    assert registry.counter("x_calls_total", "Calls", ["tool"]) is calls
+
+
+def test_histogram_cumulative_buckets():
+    registry = MetricsRegistry()
+    hist = registry.histogram("x_seconds", "Latency", ["outcome"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.observe(value, outcome="success")
+
+    samples = _samples(registry.render())
+    assert samples['x_seconds_bucket{outcome="success",le="0.1"}'] == 2
+    assert samples['x_seconds_bucket{outcome="success",le="1"}'] == 3
+    assert samples['x_seconds_bucket{outcome="success",le="+Inf"}'] == 4
+    assert samples['x_seconds_count{outcome="success"}'] == 4
+    assert abs(samples['x_seconds_sum{outcome="success"}'] - 3.65) < 1e-9
+    assert hist.count(outcome="success") == 4
+
+
+def test_callback_metric_evaluated_on_scrape():
+    registry = MetricsRegistry()
+    state = {"idle": 2}
+    registry.callback("x_clients", "Clients", "gauge", lambda: {("idle",): state["idle"]}, ["state"])
+    assert _samples(registry.render())['x_clients{state="idle"}'] == 2
+    state["idle"] = 5
+    assert _samples(registry.render())['x_clients{state="idle"}'] == 5
+
+    registry.callback("x_broken", "Broken", "gauge", lambda: 1 / 0)
+    assert "x_broken collection failed" in registry.render()
+
+
+def test_record_usage():
+    before_input = metrics.tokens_total.value(type="input")
+    before_cost = metrics.cost_usd_total.value()
+    metrics.record_usage({"input_tokens": 100, "output_tokens": 20, "cache_read_input_tokens": 0}, 0.02)
+    metrics.record_usage(None, None)
+    assert metrics.tokens_total.value(type="input") - before_input == 100
+    assert abs(metrics.cost_usd_total.value() - before_cost - 0.02) < 1e-9
+
+
+def test_record_usage_counts_cost_delta():
+    # ResultMessage.total_cost_usd 是会话累计值：同一会话连续两轮只累加增量
+    before = metrics.cost_usd_total.value()
+    meter = metrics.CostMeter()
+    metrics.record_usage(None, 0.02, meter)
+    metrics.record_usage(None, 0.05, meter)
+    assert abs(metrics.cost_usd_total.value() - before - 0.05) < 1e-9
+
+    # 换用新客户端后累计值从 0 开始
+    meter.reset()
+    metrics.record_usage(None, 0.01, meter)
+    # 没有调用 reset 但累计值变小（客户端进程已更换）时也从头计
+    metrics.record_usage(None, 0.004, meter)
+    assert abs(metrics.cost_usd_total.value() - before - 0.064) < 1e-9
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试 Prometheus 指标")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,126 @@
+"""
+测试 WebSocket 出站写入器（微批合并、背压、thinking 帧合并/丢弃）
+使用假 WebSocket，无需启动服务器
+"""
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.outbound import OutboundStats, OutboundWriter, dumps
+
+
+class FakeWebSocket:
+    """记录发送的文本帧，可模拟慢客户端"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent = []
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(text))
+
+    def events(self):
+        result = []
+        for message in self.sent:
+            result.extend(message["events"] if message["type"] == "batch" else [message])
+        return result
+
+
+def test_dumps_matches_stdlib():
+    data = {"type": "assistant_text", "content": "你好", "usage": {"input_tokens": 1}}
+    assert json.loads(dumps(data)) == data
+
+
+def test_batches_frames_within_window():
+    async def run():
+        websocket = FakeWebSocket()
+        writer = OutboundWriter(websocket, batch_window=0.02, stats=OutboundStats())
+        writer.start()
+        for i in range(5):
+            await writer.send_json({"type": "assistant_text", "content": str(i)})
+        await writer.close()
+        assert len(websocket.sent) == 1
+        assert [e["content"] for e in websocket.events()] == ["0", "1", "2", "3", "4"]
+        assert writer.stats.frames_sent == 5 and writer.stats.messages_sent == 1
+
+    asyncio.run(run())
+
+
+def test_slow_client_merges_and_drops_thinking():
+    async def run():
+        websocket = FakeWebSocket(delay=0.05)
+        stats = OutboundStats()
+        writer = OutboundWriter(websocket, max_queue=4, batch_window=0, max_batch=1, stats=stats)
+        writer.start()
+        await writer.send_json({"type": "assistant_text", "content": "first"})
+        await asyncio.sleep(0.01)  # 第一帧正在发送中
+        await writer.send_json({"type": "thinking", "content": "a"})
+        await writer.send_json({"type": "assistant_text", "content": "x"})
+        await writer.send_json({"type": "thinking", "content": "b"})
+        # 队列达到高水位，相邻的 thinking 帧被合并
+        await writer.send_json({"type": "thinking", "content": "c"})
+        assert stats.thinking_merged == 1
+        await writer.send_json({"type": "assistant_text", "content": "z"})
+        # 队列已满，最早的 thinking 帧被丢弃以腾出空间
+        await writer.send_json({"type": "assistant_text", "content": "y"})
+        assert stats.thinking_dropped == 1
+        await writer.close()
+
+        events = websocket.events()
+        contents = [e["content"] for e in events]
+        assert contents == ["first", "x", "b\n\nc", "z", "y"]
+        assert stats.queue_depth == 0
+
+    asyncio.run(run())
+
+
+def test_backpressure_blocks_producer():
+    async def run():
+        websocket = FakeWebSocket(delay=0.02)
+        stats = OutboundStats()
+        writer = OutboundWriter(websocket, max_queue=2, batch_window=0, max_batch=1, stats=stats)
+        writer.start()
+        for i in range(6):
+            await writer.send_json({"type": "assistant_text", "content": str(i)})
+        assert stats.backpressure_waits > 0
+        await writer.close()
+        # 非 thinking 帧从不丢弃
+        assert [e["content"] for e in websocket.events()] == [str(i) for i in range(6)]
+
+    asyncio.run(run())
+
+
+def test_send_failure_stops_writer():
+    class BrokenWebSocket:
+        async def send_text(self, text):
+            raise RuntimeError("disconnected")
+
+    async def run():
+        stats = OutboundStats()
+        writer = OutboundWriter(BrokenWebSocket(), batch_window=0, stats=stats)
+        writer.start()
+        await writer.send_json({"type": "assistant_text", "content": "a"})
+        await asyncio.sleep(0.01)
+        await writer.send_json({"type": "assistant_text", "content": "b"})
+        await writer.close()
+        assert stats.send_failures == 1
+        assert stats.queue_depth == 0 and stats.active_writers == 0
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试 WebSocket 出站写入器")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
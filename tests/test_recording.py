@@ -0,0 +1,111 @@
+"""
+测试录制 / 回放后端
+"""
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from claude_agent_sdk import AssistantMessage, ResultMessage, SystemMessage, TextBlock, ToolUseBlock, UserMessage
+
+from xagent.recording import (
+    Recorder,
+    RecordingClient,
+    ReplayClient,
+    ReplayCorpus,
+    decode_message,
+    encode_message,
+)
+from xagent.stub_sdk import StubClaudeSDKClient, StubProfile
+
+PROFILE = StubProfile(text_blocks=2, connect_delay=0, first_token_delay=0.1, block_delay=0.02, tool_delay=0.05)
+
+
+async def _record(path: Path, prompts):
+    client = RecordingClient(StubClaudeSDKClient(profile=PROFILE), Recorder(path))
+    await client.connect()
+    for prompt in prompts:
+        await client.query(prompt)
+        async for _ in client.receive_response():
+            pass
+    return client
+
+
+def test_encode_decode_round_trip():
+    msg = AssistantMessage(
+        content=[TextBlock(text="你好"), ToolUseBlock(id="t1", name="Read", input={"file_path": "a"})],
+        model="m",
+        session_id="old",
+    )
+    entry = json.loads(json.dumps(encode_message(msg)))
+    decoded = decode_message(entry, session_id="new")
+    assert decoded.content == msg.content and decoded.session_id == "new"
+
+    init = decode_message(encode_message(SystemMessage(subtype="init", data={"session_id": "old"})), "new")
+    assert init.data == {"session_id": "new"}
+    assert encode_message(object()) is None
+
+
+def test_record_then_replay():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "recordings.jsonl"
+            recorded = await _record(path, ["hello", "second"])
+            corpus = ReplayCorpus(path)
+            await corpus.load()
+            assert len(corpus.turns) == 2 and corpus.turns[0]["session_id"] == recorded.client.session_id
+
+            replay = ReplayClient(corpus, time_scale=1.0)
+            await replay.query("second")
+            start = time.perf_counter()
+            messages = [msg async for msg in replay.receive_response()]
+            elapsed = time.perf_counter() - start
+            return corpus, messages, elapsed, replay
+
+    corpus, messages, elapsed, replay = asyncio.run(run())
+    assert [type(m) for m in messages] == [AssistantMessage, AssistantMessage, UserMessage,
+                                           AssistantMessage, AssistantMessage, ResultMessage]
+    assert messages[-1].num_turns == 2 and messages[-1].session_id == replay.session_id
+    # 按原始节奏回放（录制约 0.23s）
+    assert 0.2 <= elapsed < 0.4
+    assert [[t["prompt"] for t in turns] for turns in corpus.sessions()] == [["hello", "second"]]
+
+
+def test_compressed_timing_and_unknown_prompt():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "recordings.jsonl"
+            await _record(path, ["hello"])
+            with path.open("a") as f:
+                f.write("not json\n")
+                f.write(json.dumps({"prompt": "partial", "messages": []}) + "\n")
+            corpus = ReplayCorpus(path)
+            await corpus.load()
+
+            replay = ReplayClient(corpus, time_scale=0.1)
+            await replay.query("never recorded")
+            start = time.perf_counter()
+            messages = [msg async for msg in replay.receive_response()]
+            return corpus, messages, time.perf_counter() - start
+
+    corpus, messages, elapsed = asyncio.run(run())
+    # 损坏的行和没有 ResultMessage 的轮次被跳过
+    assert len(corpus.turns) == 1
+    assert isinstance(messages[0], SystemMessage) and isinstance(messages[-1], ResultMessage)
+    assert elapsed < 0.1
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试录制 / 回放后端")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
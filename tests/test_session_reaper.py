@@ -0,0 +1,98 @@
+"""
+测试空闲会话回收（空闲超时休眠、全局客户端上限）
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.session_reaper import SessionReaper
+
+
+class FakeManager:
+    """只实现 SessionReaper 需要的接口"""
+
+    def __init__(self, reaper, idle_for=0.0):
+        self.reaper = reaper
+        self.client = None
+        self.current_task = None
+        self.last_activity_time = time.monotonic() - idle_for
+        self.reasons = []
+        reaper.track(self)
+
+    def client_busy(self):
+        return False
+
+    async def acquire(self):
+        async with self.reaper.client_slot(self):
+            self.client = object()
+        self.last_activity_time = time.monotonic()
+
+    async def hibernate(self, reason):
+        self.client = None
+        self.reasons.append(reason)
+
+
+def test_sweep_hibernates_idle_sessions():
+    async def run():
+        reaper = SessionReaper(idle_timeout=60)
+        stale, fresh, busy = FakeManager(reaper), FakeManager(reaper), FakeManager(reaper)
+        for manager in (stale, fresh, busy):
+            await manager.acquire()
+        stale.last_activity_time -= 120
+        busy.last_activity_time -= 120
+        busy.current_task = asyncio.create_task(asyncio.sleep(10))
+        count = await reaper.sweep()
+        busy.current_task.cancel()
+        return count, stale, fresh, busy
+
+    count, stale, fresh, busy = asyncio.run(run())
+    assert count == 1 and stale.reasons == ["idle"]
+    assert fresh.client is not None and busy.client is not None and not busy.reasons
+
+
+def test_global_cap_evicts_least_recently_used():
+    async def run():
+        reaper = SessionReaper(idle_timeout=0, max_live_clients=2)
+        a, b, c = FakeManager(reaper), FakeManager(reaper), FakeManager(reaper)
+        await a.acquire()
+        await b.acquire()
+        a.last_activity_time = time.monotonic()  # a 最近活动过，b 成为最久未使用
+        await c.acquire()
+        return reaper, a, b, c
+
+    reaper, a, b, c = asyncio.run(run())
+    assert b.reasons == ["global_cap"] and not a.reasons
+    assert len(reaper.live()) == 2 and reaper.hibernations == 1
+
+
+def test_global_cap_is_soft_while_all_busy():
+    async def run():
+        reaper = SessionReaper(idle_timeout=0, max_live_clients=1)
+        a, b = FakeManager(reaper), FakeManager(reaper)
+        await a.acquire()
+        a.current_task = asyncio.create_task(asyncio.sleep(10))
+        await asyncio.wait_for(b.acquire(), 1)  # 不等待忙碌的会话
+        over_cap = len(reaper.live())
+        a.current_task.cancel()
+        await asyncio.sleep(0)
+        await reaper.sweep()  # a 空闲后由后台检查压回上限
+        return over_cap, reaper, a, b
+
+    over_cap, reaper, a, b = asyncio.run(run())
+    assert over_cap == 2 and len(reaper.live()) == 1
+    assert a.reasons == ["global_cap"] and b.client is not None
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试空闲会话回收")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,98 @@
+"""
+测试持久化会话存储（SQLite WAL）
+使用临时数据库文件
+"""
+import asyncio
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.session_store import SessionStore
+
+
+def _store(tmp: str, **kwargs) -> SessionStore:
+    store = SessionStore(Path(tmp) / "sessions.db", **kwargs)
+    store.start()
+    return store
+
+
+def test_append_and_replay():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            store = _store(tmp)
+            for i in range(5):
+                store.append_event("sess-1", {"type": "assistant_text", "content": f"m{i}"})
+            store.update_session("sess-1", num_turns=3, total_cost_usd=0.02)
+            store.flush()
+
+            assert await store.has_session("sess-1")
+            assert not await store.has_session("sess-2")
+            events = await store.recent_events("sess-1", 3)
+            assert [e["content"] for e in events] == ["m2", "m3", "m4"]
+            store.close()
+
+            conn = sqlite3.connect(str(Path(tmp) / "sessions.db"))
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("SELECT num_turns FROM sessions").fetchone()[0] == 3
+            conn.close()
+
+    asyncio.run(run())
+
+
+def test_rename_and_truncate():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            store = _store(tmp, max_event_chars=10)
+            store.append_event("old", {"type": "tool_result", "content": "x" * 100})
+            store.rename_session("old", "new")
+            store.flush()
+
+            assert not await store.has_session("old")
+            events = await store.recent_events("new", 10)
+            assert len(events) == 1 and events[0]["truncated"]
+            assert events[0]["content"].startswith("x" * 10)
+
+            store.delete_session("new")
+            store.flush()
+            assert await store.recent_events("new", 10) == []
+            store.close()
+
+    asyncio.run(run())
+
+
+def test_worker_ownership_shared_between_stores():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            # 两个 store 模拟两个 worker 进程共享同一个数据库
+            store_a = _store(tmp)
+            store_b = _store(tmp)
+            store_a.update_session("sess-1", num_turns=1, worker_id="0")
+            store_a.flush()
+            assert await store_b.session_owner("sess-1") == "0"
+
+            store_b.update_session("sess-1", num_turns=2, worker_id="1")
+            store_b.flush()
+            # 未指定 worker_id 的更新不覆盖归属
+            store_a.update_session("sess-1", num_turns=3)
+            store_a.flush()
+            assert await store_a.session_owner("sess-1") == "1"
+            assert await store_a.session_owner("missing") is None
+            store_a.close()
+            store_b.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试持久化会话存储")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,130 @@
+"""
+测试 SQL 骨架填空（各意图族的骨架、参数校验、工具输出）
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.sql_skeletons import (
+    SKELETONS,
+    SqlSkeletonEngine,
+    SqlSkeletonError,
+    SqlTemplate,
+    build_sql_skeleton_tool,
+    create_sql_skeleton_server,
+    quote,
+)
+
+CASES = {
+    "aggregate": {
+        "table": "bi_sycpb.dws_ad_cost_1d_d", "start_date": "2024-01-01", "end_date": "2024-01-31",
+        "dims": ["log_date"], "metrics": ["SUM(cost_amt) AS cost"], "filters": ["a = 1 or b = 2"],
+    },
+    "funnel": {
+        "table": "ods.event_log", "start_date": "20240101", "end_date": "20240107",
+        "user_field": "mid", "step_field": "event", "steps": ["view", "click", "order"],
+    },
+    "retention": {
+        "table": "dws.user_active_1d", "start_date": "20240101", "end_date": "20240107",
+        "user_field": "mid", "retention_days": [7, 1],
+    },
+    "topn": {
+        "table": "dws.up_stat", "start_date": "2024-01-01", "dims": ["up_mid"],
+        "metrics": ["SUM(play_cnt) AS plays"], "partition_by": ["dt"], "n": 5,
+    },
+    "detail": {
+        "table": "ods.order_detail", "start_date": "2024-01-01", "columns": ["order_id", "amount"],
+        "order_by": ["order_id desc"], "offset": 100, "limit": 50,
+    },
+    "compare": {
+        "table": "dws.exp_metrics", "start_date": "2024-01-01", "group_field": "exp_group",
+        "groups": ["control", "treat-1"], "metrics": ["SUM(click) AS clicks"],
+    },
+}
+
+
+def test_template_precompiled():
+    template = SqlTemplate("SELECT {a} FROM {b}{c}")
+    assert template.names == {"a", "b", "c"}
+    assert template.render({"a": "x", "b": "t", "c": ""}) == "SELECT x FROM t"
+    try:
+        template.render({"a": "x"})
+        raise AssertionError("expected SqlSkeletonError")
+    except SqlSkeletonError:
+        pass
+
+
+def test_every_family_renders():
+    engine = SqlSkeletonEngine()
+    assert set(CASES) == set(SKELETONS)
+    sql = {family: engine.render(family, args) for family, args in CASES.items()}
+    assert "GROUP BY log_date" in sql["aggregate"] and "AND (a = 1 or b = 2)" in sql["aggregate"]
+    assert "event IN ('view', 'click', 'order')" in sql["funnel"] and "step_3_rate" in sql["funnel"]
+    # 留存要多看 max(days) 天，日期按 yyyyMMdd 分区格式给出
+    assert "dt BETWEEN '20240101' AND '20240114'" in sql["retention"]
+    assert "BETWEEN '2024-01-01' AND '2024-01-07'" in sql["retention"] and "day_7_rate" in sql["retention"]
+    assert "PARTITION BY dt ORDER BY plays DESC" in sql["topn"] and "rank_no <= 5" in sql["topn"]
+    assert "ORDER BY order_id DESC\nLIMIT 100, 50" in sql["detail"]
+    assert "clicks_treat_1_lift" in sql["compare"]
+    assert all("{" not in text for text in sql.values())
+    assert engine.renders[("topn", "ok")] == 1 and engine.output_chars > engine.input_chars
+
+
+def test_invalid_arguments_rejected():
+    engine = SqlSkeletonEngine()
+    base = CASES["aggregate"]
+    bad = [
+        ("aggregate", {**base, "table": "a.b; drop table c"}),
+        ("aggregate", {**base, "metrics": ["SUM(cost_amt)"]}),  # 表达式缺别名
+        ("aggregate", {**base, "filters": ["1 = 1 -- x"]}),
+        ("aggregate", {**base, "filters": ["id IN (SELECT id FROM t)"]}),
+        ("aggregate", {**base, "filters": ["name = 'x"]}),
+        ("aggregate", {**base, "start_date": "2024-02-30"}),
+        ("aggregate", {**base, "start_date": "20240101"}),  # 与 end_date 格式不一致
+        ("detail", {**CASES["detail"], "order_by": None}),  # 分页需要排序
+        ("funnel", {**CASES["funnel"], "steps": ["view"]}),
+        ("funnel", {**CASES["funnel"], "steps": ["view", float("nan")]}),  # json.loads 接受 NaN / Infinity
+        ("funnel", {**CASES["funnel"], "steps": ["view", float("-inf")]}),
+        ("unknown", base),
+    ]
+    for family, args in bad:
+        try:
+            engine.render(family, args)
+        except SqlSkeletonError:
+            continue
+        raise AssertionError(f"expected SqlSkeletonError: {family} {args}")
+    assert sum(engine.renders.values()) == len(bad) and engine.output_chars == 0
+    assert [quote(v) for v in (3, 2.5, "it's")] == ["3", "2.5", "'it\\'s'"]
+    # 字符串内的关键字和引号不受影响
+    sql = engine.render("aggregate", {**base, "filters": ["note = 'don\\'t select; --'"]})
+    assert "note = 'don\\'t select; --'" in sql
+
+
+def test_tool_output():
+    async def run():
+        engine = SqlSkeletonEngine()
+        server = create_sql_skeleton_server(engine)
+        assert server["type"] == "sdk" and server["name"] == "sql-skeleton"
+
+        fill = build_sql_skeleton_tool(engine)
+        reply = await fill.handler({"family": "topn", **CASES["topn"]})
+        assert "```sql" in reply["content"][0]["text"] and not reply.get("is_error")
+
+        reply = await fill.handler({"family": "topn", **CASES["topn"], "n": 0})
+        assert reply["is_error"] and "n 必须在" in reply["content"][0]["text"]
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试 SQL 骨架填空")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
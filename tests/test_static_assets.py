@@ -0,0 +1,99 @@
+"""
+测试静态资源缓存（预压缩、指纹、ETag）
+"""
+import asyncio
+import gzip
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from xagent.static_assets import CachedStaticFiles, StaticAssets, accepted_encodings, asset_response
+
+APP_JS = "console.log('xagent');\n" * 100
+
+
+def make_app(directory: Path, assets: StaticAssets) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/")
+    async def index(request: Request):
+        return asset_response(assets.index, request.headers)
+
+    app.mount("/static", CachedStaticFiles(directory=str(directory), assets=assets), name="static")
+    return app
+
+
+def write_static(directory: Path):
+    (directory / "index.html").write_text('<script src="/static/app.js"></script>', encoding="utf-8")
+    (directory / "app.js").write_text(APP_JS, encoding="utf-8")
+    (directory / "logo.txt").write_text("logo", encoding="utf-8")
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate, br;q=0") == {"gzip": 1.0, "deflate": 1.0, "br": 0.0}
+    assert accepted_encodings("") == {}
+
+
+def test_fingerprint_compression_and_etag():
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        write_static(directory)
+        assets = StaticAssets(directory, poll_interval=0)
+        asyncio.run(assets.reload())
+        asset = assets.get("app.js")
+        client = TestClient(make_app(directory, assets))
+
+        index = client.get("/")
+        assert f'"/static/{asset.url_name}"' in index.text and index.headers["cache-control"] == "no-cache"
+
+        response = client.get(f"/static/{asset.url_name}", headers={"Accept-Encoding": "gzip"})
+        assert response.text == APP_JS and response.headers["content-encoding"] == "gzip"
+        assert "immutable" in response.headers["cache-control"]
+        assert response.headers["etag"] == f'"{asset.digest}-gzip"'
+        assert len(asset.bodies["gzip"]) < len(APP_JS) and gzip.decompress(asset.bodies["gzip"]).decode() == APP_JS
+
+        plain = client.get("/static/app.js", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers and plain.headers["etag"] == f'"{asset.digest}"'
+        assert plain.headers["cache-control"] == "no-cache"
+
+        cached = client.get("/static/app.js", headers={"Accept-Encoding": "gzip", "If-None-Match": f'W/"{asset.digest}-gzip"'})
+        assert cached.status_code == 304 and cached.content == b""
+
+        # 不在缓存中的文件交给 StaticFiles
+        assert client.get("/static/logo.txt").text == "logo"
+
+
+def test_reload_on_change():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            write_static(directory)
+            assets = StaticAssets(directory, poll_interval=0)
+            await assets.reload()
+            before = assets.get("app.js").url_name
+            unchanged = await assets.reload()
+            (directory / "app.js").write_text(APP_JS + "// v2\n", encoding="utf-8")
+            changed = await assets.reload()
+            after = assets.get("app.js").url_name
+            return before, after, unchanged, changed, assets.index.bodies["identity"].decode(), assets.get(before)
+
+    before, after, unchanged, changed, index, stale = asyncio.run(run())
+    assert not unchanged and changed and before != after
+    assert f"/static/{after}" in index and stale is None
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试静态资源缓存")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,97 @@
+"""
+测试离线替身 SDK 客户端（压测使用）
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from claude_agent_sdk import AssistantMessage, ResultMessage, SystemMessage, TextBlock, ToolUseBlock, UserMessage
+
+from xagent.stub_sdk import StubClaudeSDKClient, StubProfile, stamp_of
+from xagent.tracing import ToolHookTimer
+
+FAST = dict(connect_delay=0, first_token_delay=0, block_delay=0, tool_delay=0)
+
+
+async def _collect(client):
+    return [msg async for msg in client.receive_response()]
+
+
+def test_message_stream_shape():
+    async def run():
+        profile = StubProfile(text_blocks=3, text_chars=50, thinking_blocks=2, tool_calls=2, **FAST)
+        client = StubClaudeSDKClient(profile=profile)
+        await client.connect()
+        await client.query("hi")
+        first = await _collect(client)
+        await client.query("again")
+        second = await _collect(client)
+        return client, first, second
+
+    client, first, second = asyncio.run(run())
+    assert isinstance(first[0], SystemMessage) and first[0].data["session_id"] == client.session_id
+    assert not any(isinstance(msg, SystemMessage) for msg in second)
+    assert sum(isinstance(msg, UserMessage) for msg in first) == 2
+    texts = [b for m in first if isinstance(m, AssistantMessage) for b in m.content if isinstance(b, TextBlock)]
+    assert len(texts) == 3 and all(len(b.text) == 50 for b in texts)
+    assert abs(stamp_of(texts[0].text) - time.time()) < 5
+    assert isinstance(second[-1], ResultMessage) and second[-1].num_turns == 2
+    assert StubProfile().frames_per_turn() == 7
+
+
+def test_hooks_and_interrupt():
+    async def run():
+        timer = ToolHookTimer()
+        options = SimpleNamespace(hooks=timer.hooks(), resume="sess-1")
+        client = StubClaudeSDKClient(options, profile=StubProfile(tool_calls=1, text_blocks=5, **FAST))
+        await client.query("hi")
+        tool_use_id = None
+        seen = []
+        async for msg in client.receive_response():
+            seen.append(msg)
+            if isinstance(msg, AssistantMessage) and isinstance(msg.content[0], ToolUseBlock):
+                tool_use_id = msg.content[0].id
+            if isinstance(msg, UserMessage):
+                await client.interrupt()
+        return client, timer, tool_use_id, seen
+
+    client, timer, tool_use_id, seen = asyncio.run(run())
+    assert client.session_id == "sess-1"
+    pre, post = timer.pop(tool_use_id)
+    assert pre is not None and post is not None and pre <= post
+    # 中断后不再产生文本块和结果
+    assert isinstance(seen[-1], UserMessage)
+
+
+def test_profile_env_round_trip():
+    profile = StubProfile(text_blocks=9, block_delay=0.5)
+    env = profile.to_env()
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        loaded = StubProfile.from_env()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    assert loaded.text_blocks == 9 and loaded.block_delay == 0.5
+    assert stamp_of("no stamp") is None
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试离线替身 SDK 客户端")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
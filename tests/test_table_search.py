@@ -0,0 +1,164 @@
+"""
+测试本地找表检索（BM25 + 倒排索引）
+使用内存中的小型表目录和临时目录文件
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.table_search import (
+    TableCatalog,
+    TableSearchIndex,
+    build_search_tool,
+    create_table_search_server,
+    tokenize,
+)
+
+TABLES = [
+    {
+        "table": "bi_sycpb.dws_ad_cost_1d_d",
+        "comment": "广告消耗日汇总",
+        "fields": [
+            {"name": "cost_amt", "comment": "消耗金额"},
+            {"name": "imp_cnt", "comment": "曝光次数"},
+            {"name": "log_date", "comment": "日期"},
+        ],
+    },
+    {
+        "table": "bi_sycpb.dws_dmp_group_people_group_1d_d",
+        "comment": "DMP 人群包日汇总",
+        "fields": [
+            {"name": "group_id", "comment": "人群包ID"},
+            {"name": "people_cnt", "comment": "人数"},
+        ],
+    },
+    {
+        "table": "ods.ods_order_detail",
+        "comment": "订单明细原始表",
+        "fields": [{"name": "orderAmount", "comment": "订单金额 GMV"}],
+    },
+]
+
+
+def _index() -> TableSearchIndex:
+    index = TableSearchIndex()
+    for table in TABLES:
+        index.upsert(table)
+    return index
+
+
+def test_tokenize_mixed_text():
+    assert tokenize("dws_ad_cost_1d_d") == ["dws", "ad", "cost", "1d", "d"]
+    assert tokenize("orderAmount") == ["order", "amount"]
+    tokens = tokenize("消耗金额")
+    assert "消耗" in tokens and "金额" in tokens and "耗金" in tokens
+
+
+def test_search_ranks_by_relevance():
+    index = _index()
+    results = index.search("广告消耗", top_k=2)
+    assert results[0]["table"] == "bi_sycpb.dws_ad_cost_1d_d"
+    assert results[0]["matched_fields"][0]["name"] == "cost_amt"
+
+    assert index.search("人群包")[0]["table"] == "bi_sycpb.dws_dmp_group_people_group_1d_d"
+    assert index.search("order amount")[0]["table"] == "ods.ods_order_detail"
+    # 完整表名和短表名都能精确命中
+    assert index.search("bi_sycpb.dws_ad_cost_1d_d")[0]["table"] == "bi_sycpb.dws_ad_cost_1d_d"
+    assert index.search("ods_order_detail")[0]["table"] == "ods.ods_order_detail"
+    assert index.search("完全无关 xyz") == []
+
+
+def test_incremental_upsert_and_remove():
+    index = _index()
+    index.upsert({"table": "bi_sycpb.dws_ad_cost_1d_d", "comment": "花火订单", "fields": []})
+    assert all(r["table"] != "bi_sycpb.dws_ad_cost_1d_d" for r in index.search("消耗金额"))
+    assert {r["table"] for r in index.search("花火")} == {"bi_sycpb.dws_ad_cost_1d_d"}
+
+    assert index.remove("ods.ods_order_detail")
+    assert not index.remove("ods.ods_order_detail")
+    assert len(index) == 2
+    assert all(r["table"] != "ods.ods_order_detail" for r in index.search("订单"))
+
+
+def test_search_latency_on_large_index():
+    index = TableSearchIndex()
+    for i in range(5000):
+        index.upsert({
+            "table": f"db_{i % 20}.dws_metric_{i}_1d_d",
+            "comment": f"业务指标 {i} 日汇总",
+            "fields": [{"name": f"field_{j}", "comment": f"指标{j}"} for j in range(20)],
+        })
+    start = time.perf_counter()
+    for _ in range(20):
+        results = index.search("业务指标 日汇总 field_3", top_k=10)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / 20
+    assert len(results) == 10
+    assert elapsed_ms < 500
+
+
+def test_catalog_incremental_reload():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "catalog.jsonl"
+            path.write_text("\n".join(json.dumps(t, ensure_ascii=False) for t in TABLES), encoding="utf-8")
+            catalog = TableCatalog(path, poll_interval=0)
+            await catalog.start()
+            assert len(catalog.index) == 3
+            assert not await catalog.reload()
+
+            tables = TABLES[:2] + [{"table": "ads.ads_brand_report", "comment": "品牌报表", "fields": []}]
+            path.write_text("\n".join(json.dumps(t, ensure_ascii=False) for t in tables), encoding="utf-8")
+            os.utime(path, (time.time() + 5, time.time() + 5))
+            assert await catalog.reload()
+            assert "ads.ads_brand_report" in catalog.index
+            assert "ods.ods_order_detail" not in catalog.index
+            await catalog.stop()
+
+    asyncio.run(run())
+
+
+def test_search_tool_output():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "catalog.jsonl"
+            path.write_text("\n".join(json.dumps(t, ensure_ascii=False) for t in TABLES), encoding="utf-8")
+            catalog = TableCatalog(path, poll_interval=0)
+            await catalog.start()
+            server = create_table_search_server(catalog)
+            assert server["type"] == "sdk" and server["name"] == "table-search"
+
+            search_tables = build_search_tool(catalog, default_top_k=1)
+            reply = await search_tables.handler({"query": "曝光"})
+            text = reply["content"][0]["text"]
+            assert "1 个候选" in text
+            assert "bi_sycpb.dws_ad_cost_1d_d" in text and "imp_cnt(曝光次数)" in text
+
+            # 非法的 top_k 回退到默认值，不让工具调用抛异常
+            for top_k in ("abc", [3], float("inf"), True):
+                reply = await search_tables.handler({"query": "日汇总", "top_k": top_k})
+                assert "1 个候选" in reply["content"][0]["text"]
+            reply = await search_tables.handler({"query": "日汇总", "top_k": "2"})
+            assert "2 个候选" in reply["content"][0]["text"]
+
+            reply = await search_tables.handler({"query": "不存在的词"})
+            assert "未找到" in reply["content"][0]["text"]
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试本地找表检索")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
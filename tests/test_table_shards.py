@@ -0,0 +1,113 @@
+"""
+测试按主题域 × 数仓分层分片的找表索引
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.table_search import TableSearchIndex, format_results
+from xagent.table_shards import (
+    CROSS_DOMAIN_RISK_LABEL,
+    GENERAL_DOMAIN,
+    DomainClassifier,
+    ShardedTableIndex,
+    detect_layer,
+)
+
+TABLES = [
+    {"table": "bi.ads_effect_cost_report_1d_d", "comment": "效果广告消耗报表",
+     "fields": [{"name": "cost", "comment": "消耗"}]},
+    {"table": "bi.dws_effect_cost_1d_d", "comment": "效果广告消耗日汇总",
+     "fields": [{"name": "cost", "comment": "消耗"}]},
+    {"table": "bi.dwd_effect_cost_detail", "comment": "效果广告消耗明细",
+     "fields": [{"name": "cost", "comment": "消耗"}]},
+    {"table": "ods.ods_effect_cost_log", "comment": "效果广告消耗日志",
+     "fields": [{"name": "cost", "comment": "消耗"}]},
+    {"table": "bi.dws_brand_cost_1d_d", "comment": "品牌广告消耗日汇总",
+     "fields": [{"name": "cost", "comment": "消耗"}]},
+    {"table": "bi.dws_dmp_crowd_1d_d", "comment": "DMP 人群包日汇总",
+     "fields": [{"name": "crowd_id", "comment": "人群包ID"}]},
+    {"table": "bi.dim_date", "comment": "日期维表", "fields": [{"name": "log_date", "comment": "日期"}]},
+]
+
+
+def _index() -> ShardedTableIndex:
+    index = ShardedTableIndex()
+    for table in TABLES:
+        index.upsert(table)
+    return index
+
+
+def test_detect_layer_and_classify():
+    assert detect_layer("bi.dws_effect_cost_1d_d") == "dws"
+    assert detect_layer("ODS_LOG") == "ods"
+    assert detect_layer("bi.report_tmp") == "other"
+
+    classifier = DomainClassifier()
+    assert classifier.classify("效果广告的消耗按天") == ["效果"]
+    assert classifier.classify("dmp 人群包覆盖人数")[0] == "DMP"
+    assert classifier.classify("昨天的数据") == []
+    assert classifier.classify_table(TABLES[6]) == GENERAL_DOMAIN
+
+
+def test_primary_layers_first_then_fallback_with_risk_labels():
+    index = _index()
+    results, stats = index.search_with_stats("效果 消耗", top_k=2)
+    assert stats["domains"] == ["效果"]
+    assert {r["layer"] for r in results} == {"ADS", "DWS"}
+    assert all(r["risk_labels"] == [] for r in results)
+    # 只检索了效果/通用域的汇总层分片
+    assert stats["candidates"] == 2 and stats["total"] == len(TABLES)
+
+    results, _ = index.search_with_stats("效果 消耗", top_k=4)
+    assert [r["layer"] for r in results][2:] == ["DWD", "ODS"]
+    assert "DWD 明细层" in results[2]["risk_labels"][0]
+    assert "ODS 原始层" in results[3]["risk_labels"][0]
+
+
+def test_cross_domain_fallback_and_forced_domain():
+    index = _index()
+    results, _ = index.search_with_stats("效果 消耗", top_k=5)
+    assert results[-1]["table"] == "bi.dws_brand_cost_1d_d"
+    assert CROSS_DOMAIN_RISK_LABEL in results[-1]["risk_labels"]
+
+    results, stats = index.search_with_stats("消耗", top_k=1, domain="品牌")
+    assert stats["domains"] == ["品牌"]
+    assert results[0]["table"] == "bi.dws_brand_cost_1d_d"
+
+
+def test_global_scores_match_unsharded_index():
+    sharded = _index()
+    flat = TableSearchIndex()
+    for table in TABLES:
+        flat.upsert(table)
+    expected = {r["table"]: r["score"] for r in flat.search("广告 消耗 日汇总", top_k=10)}
+    results, stats = sharded.search_with_stats("广告 消耗 日汇总", top_k=10, prune=False)
+    assert {r["table"]: r["score"] for r in results} == expected
+    assert stats["candidates"] == len(TABLES)
+
+
+def test_incremental_move_between_shards():
+    index = _index()
+    index.upsert({"table": "bi.dws_effect_cost_1d_d", "comment": "花火商单消耗", "domain": "花火"})
+    assert index.shard_sizes()["花火/dws"] == 1
+    assert "效果/dws" not in index.shard_sizes()
+    assert index.remove("bi.dim_date") and len(index) == len(TABLES) - 1
+
+    results, stats = index.search_with_stats("花火 消耗", top_k=1)
+    text = format_results(results, stats, 0.5)
+    assert "[花火/DWS] bi.dws_effect_cost_1d_d" in text
+    assert "主题域: 花火" in text and "检索范围" in text
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试分片找表索引")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,115 @@
+"""
+测试会话 token 预算
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from claude_agent_sdk import ClaudeAgentOptions, ToolResultBlock, UserMessage
+
+from xagent.compaction import compact_in_place
+from xagent.token_budget import COMPACT, ROTATE, TRIM, TokenBudget, ToolOutputTrimmer, trim_tool_output
+from xagent.stub_sdk import StubClaudeSDKClient, StubProfile
+
+PROFILE = StubProfile(text_blocks=1, text_chars=100, thinking_blocks=0, tool_calls=1, tool_result_chars=6000,
+                      connect_delay=0, first_token_delay=0, block_delay=0, tool_delay=0, base_context_tokens=1000)
+
+
+def test_budget_escalation():
+    budget = TokenBudget(trim_tokens=100, compact_tokens=200, rotate_tokens=300)
+    budget.observe(50, 0.01)
+    assert budget.next_action() is None
+
+    budget.observe(120, 0.02)
+    assert budget.next_action() == TRIM
+    budget.trimming = True
+    assert budget.next_action() is None
+
+    budget.observe(250, 0.03)
+    assert budget.next_action() == COMPACT
+    budget.mark_compacted()
+    assert budget.next_action() is None and budget.snapshot()["compacted"]
+
+    # 压缩后又涨过 compact 阈值，升级为换会话
+    budget.observe(210, 0.04)
+    assert budget.next_action() == ROTATE
+    budget.reset()
+    budget.observe(350, None)
+    assert budget.next_action() == ROTATE and budget.turns == 1
+
+
+def test_budget_rotate_on_cost_and_disabled_levels():
+    budget = TokenBudget(trim_tokens=0, compact_tokens=0, rotate_tokens=0, rotate_cost_usd=1.0)
+    budget.observe(10 ** 6, 0.5)
+    assert budget.next_action() is None
+    budget.observe(None, 1.2)
+    assert budget.next_action() == ROTATE and budget.context_tokens == 10 ** 6
+
+
+def test_trim_tool_output_shapes():
+    assert trim_tool_output("short", 10) == "short"
+    trimmed = trim_tool_output("x" * 50, 10)
+    assert trimmed.startswith("x" * 10 + "\n\n[结果过长，已截断 40 字符")
+
+    blocks = [{"type": "text", "text": "a" * 8}, {"type": "image", "data": "..."}, {"type": "text", "text": "b" * 8}]
+    trimmed = trim_tool_output({"content": blocks, "isError": False}, 10)
+    assert trimmed["content"][0]["text"] == "a" * 8 and trimmed["content"][1] == blocks[1]
+    assert trimmed["content"][2]["text"].startswith("bb\n\n") and trimmed["isError"] is False
+    assert blocks[2]["text"] == "b" * 8
+
+
+def test_trimmer_only_for_enabled_sessions():
+    async def run():
+        trimmer = ToolOutputTrimmer(max_chars=500)
+        options = ClaudeAgentOptions(hooks=trimmer.hooks())
+        client = StubClaudeSDKClient(options, profile=PROFILE)
+        await client.connect()
+
+        async def tool_result():
+            await client.query("q")
+            for msg in [m async for m in client.receive_response()]:
+                if isinstance(msg, UserMessage):
+                    return next(b for b in msg.content if isinstance(b, ToolResultBlock)).content
+
+        full = await tool_result()
+        trimmer.enable(client.session_id)
+        trimmed = await tool_result()
+        trimmer.disable(client.session_id)
+        return full, trimmed, trimmer
+
+    full, trimmed, trimmer = asyncio.run(run())
+    assert len(full) == 6000
+    assert trimmed.startswith(full[:500]) and "已截断 5500 字符" in trimmed
+    assert trimmer.trimmed_results == 1 and trimmer.trimmed_chars > 0
+
+
+def test_stub_context_growth_and_compact():
+    async def run():
+        client = StubClaudeSDKClient(profile=PROFILE)
+        await client.connect()
+        usages = []
+        for _ in range(3):
+            await client.query("q" * 100)
+            usages.append([m async for m in client.receive_response()][-1].usage["input_tokens"])
+        pre_tokens, result = await compact_in_place(client)
+        return usages, pre_tokens, result, client.context_tokens
+
+    usages, pre_tokens, result, after = asyncio.run(run())
+    # 每轮：prompt 50 + 工具结果 3000 + 文本 50 token
+    assert usages[1] - usages[0] == usages[2] - usages[1] == 3100
+    assert pre_tokens == usages[2] and result.subtype == "success"
+    assert after == 1000 + (pre_tokens - 1000) // 10
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试会话 token 预算")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
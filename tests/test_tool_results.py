@@ -0,0 +1,94 @@
+"""
+测试大工具结果卸载
+"""
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.tool_results import ToolResultStore, tool_result_text
+
+
+def test_tool_result_text():
+    assert tool_result_text("abc") == "abc" and tool_result_text(None) == ""
+    blocks = [{"type": "text", "text": "a"}, {"type": "text", "text": "b"}]
+    assert tool_result_text(blocks) == "a\nb"
+    mixed = [{"type": "text", "text": "表"}, {"type": "image", "data": "..."}]
+    assert json.loads(tool_result_text(mixed)) == mixed
+
+
+def test_inline_and_range_read():
+    async def run():
+        store = ToolResultStore(inline_chars=10, preview_chars=4)
+        small = await store.offload("short")
+        big = await store.offload("0123456789abcdef")
+        pages = [await store.read(big["result_id"], offset, 6) for offset in (0, 6, 12, 20)]
+        return small, big, pages, await store.read("missing")
+
+    small, big, pages, missing = asyncio.run(run())
+    assert small == {"content": "short"}
+    assert big["content"] == "0123" and big["total_chars"] == 16 and big["truncated"]
+    assert pages == [("012345", 16), ("6789ab", 16), ("cdef", 16), ("", 16)]
+    assert missing is None
+
+
+def test_spill_to_disk_and_caps():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ToolResultStore(Path(tmp), inline_chars=0, max_memory_bytes=25, max_disk_bytes=25)
+            store.start()
+            ids = [(await store.offload(ch * 10))["result_id"] for ch in "abcde"]
+            reads = [await store.read(result_id) for result_id in ids]
+            files = sorted(p.stem for p in Path(tmp).glob("*.txt"))
+            stats = store.stats()
+            # 其他 worker 写入的文件按 id 也能读到
+            other = ToolResultStore(Path(tmp))
+            shared = await other.read(ids[1])
+            store.close()
+            return ids, reads, files, stats, shared, list(Path(tmp).iterdir())
+
+    ids, reads, files, stats, shared, left = asyncio.run(run())
+    # 内存保留最近的 d、e，a、b、c 依次溢出到磁盘；磁盘只容得下 2 个文件，最早的 a 被删除
+    assert [r[0] if r else None for r in reads] == [None, "b" * 10, "c" * 10, "d" * 10, "e" * 10]
+    assert files == sorted(ids[1:3]) and shared == ("b" * 10, 10)
+    assert stats["memory_bytes"] == 20 and stats["disk_bytes"] == 20
+    assert stats["spilled"] == 3 and stats["evicted"] == 1
+    assert left == []
+
+
+def test_read_through_second_worker():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            # 多 worker 默认不占内存：结果直接写入共享目录，另一个 worker 的 store 分段读取
+            producer = ToolResultStore(Path(tmp), inline_chars=10, preview_chars=4, max_memory_bytes=0)
+            consumer = ToolResultStore(Path(tmp), inline_chars=10, max_memory_bytes=0)
+            producer.start()
+            consumer.start()
+            big = await producer.offload("0123456789abcdef")
+            pages = [await consumer.read(big["result_id"], offset, 10) for offset in (4, 14)]
+            names = sorted(p.name for p in Path(tmp).iterdir())
+            stats = producer.stats()
+            producer.close()
+            return big, pages, names, stats, await consumer.read(big["result_id"])
+
+    big, pages, names, stats, after_close = asyncio.run(run())
+    assert big["content"] == "0123" and pages == [("456789abcd", 16), ("ef", 16)]
+    assert names == [f"{big['result_id']}.txt"]
+    assert stats["memory_bytes"] == 0 and stats["disk_bytes"] == 16
+    # 写入的 worker 退出时删除自己的文件
+    assert after_close is None
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试大工具结果卸载")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -0,0 +1,118 @@
+"""
+测试对话轮次追踪（span 树、工具钩子计时、滚动 JSONL 写入）
+"""
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from xagent.tracing import ToolHookTimer, TraceWriter, TurnTrace
+
+
+def _by_name(trace: dict) -> dict:
+    return {span["name"]: span for span in trace["spans"]}
+
+
+def test_span_tree_for_turn():
+    trace = TurnTrace("s1", message="hi")
+    query = trace.span("client.query", "query")
+    trace.end(query)
+    trace.query_sent()
+    model = trace.model_output()
+    trace.thinking("abc")
+    trace.tool_use("t1", "Read", {"file_path": "x" * 500})
+    span = trace.tool_result("t1", "content", False)
+    assert span is not None and span.attrs["timing"] == "stream"
+    assert trace.tool_result("unknown", "", None) is None
+    trace.result(subtype="success", num_turns=1)
+
+    data = trace.finish("success")
+    spans = _by_name(data)
+    root = spans["turn"]
+    assert root["parent_id"] is None and root["attrs"] == {"message": "hi", "outcome": "success"}
+    assert spans["client.query"]["parent_id"] == root["id"]
+    assert spans["thinking"]["parent_id"] == model.span_id and spans["thinking"]["attrs"]["chars"] == 3
+    assert spans["Read"]["kind"] == "tool" and len(spans["Read"]["attrs"]["input"]) < 250
+    assert all(s["end_ms"] is not None and s["start_ms"] >= 0 for s in data["spans"])
+    assert data["session_id"] == "s1"
+
+
+def test_tool_span_uses_hook_times():
+    timer = ToolHookTimer()
+    trace = TurnTrace(hook_timer=timer)
+    trace.tool_use("t1", "Bash", {"command": "ls"})
+    time.sleep(0.01)
+
+    async def run_hooks():
+        await timer.pre_tool_use({}, "t1", None)
+        time.sleep(0.02)
+        await timer.post_tool_use({}, "t1", None)
+
+    asyncio.run(run_hooks())
+    time.sleep(0.01)
+    span = trace.tool_result("t1", "ok", True)
+    assert span.attrs["timing"] == "hooks" and span.attrs["is_error"] is True
+    assert span.attrs["queued_ms"] >= 10
+    assert 0.02 <= span.duration < 0.035
+    assert timer.pop("t1") == (None, None)
+
+
+def test_unfinished_spans_on_interrupt():
+    trace = TurnTrace()
+    trace.tool_use("t1", "Bash", {})
+    spans = _by_name(trace.finish("interrupted"))
+    assert spans["Bash"]["attrs"]["unfinished"] is True
+    assert spans["turn"]["attrs"]["outcome"] == "interrupted"
+
+
+def test_writer_rotates_and_finds_old_traces():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = TraceWriter(Path(tmp) / "traces.jsonl", max_bytes=2000, backup_count=3, recent=2)
+            writer.start()
+            ids = []
+            for i in range(10):
+                trace = TurnTrace(f"s{i}", message="查询" * 50)
+                ids.append(trace.trace_id)
+                writer.write(trace.finish("success"))
+            writer.close()
+
+            assert len(list(Path(tmp).glob("traces.jsonl*"))) > 1
+            # 最近的在内存中，较早的从滚动文件中扫描
+            assert (await writer.get(ids[-1]))["session_id"] == "s9"
+            assert (await writer.get(ids[-4]))["spans"][0]["attrs"]["message"] == "查询" * 50
+            assert await writer.get("missing") is None
+
+    asyncio.run(run())
+
+
+def test_writer_finds_traces_of_other_workers():
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "traces.jsonl"
+            other = TraceWriter(path, worker="1")
+            other.start()
+            trace = TurnTrace("s1")
+            other.write(trace.finish("success"))
+            other.close()
+
+            writer = TraceWriter(path, worker="0")
+            assert writer.path.name == "traces.0.jsonl" and other.path.name == "traces.1.jsonl"
+            assert (await writer.get(trace.trace_id))["session_id"] == "s1"
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("测试对话轮次追踪")
+    print("=" * 60)
+    for name, func in list(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print(f"✅ {name}")
+    print("=" * 60)
+    print("测试完成 ✅")
@@ -4,15 +4,18 @@ FastAPI + WebSocket 实现的实时聊天服务器
 """
 
 import asyncio
+import contextlib
+import dataclasses
 import json
 import os
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+import secrets
+import time
+import weakref
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from pathlib import Path
 import logging
-import yaml
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -27,9 +30,46 @@ from claude_agent_sdk import (
     ToolUseBlock,
     ToolResultBlock,
     ResultMessage,
-    SystemMessage
+    SystemMessage,
+    UserMessage
 )
 
+from xagent.channels import ChannelError, ChannelMux, parse_channel
+from xagent.client_pool import ClientPool
+from xagent.command_registry import CommandRegistry
+from xagent.outbound import OutboundChannel, OutboundWriter, outbound_stats
+from xagent.session_store import RECORDED_EVENT_TYPES, SessionStore
+from xagent.workers import WORKER_ID_ENV, WorkerSupervisor, worker_id
+from xagent.mcp_proxy import (
+    DEFAULT_TOOL_TTLS,
+    McpCachingProxy,
+    McpHttpClient,
+    ToolResultCache,
+    parse_ttls,
+    proxy_access_denied,
+)
+from xagent.table_search import TableCatalog, TableSearchIndex, create_table_search_server
+from xagent.table_shards import DomainClassifier, ShardedTableIndex, load_domain_keywords
+from xagent.sql_skeletons import SqlSkeletonEngine, create_sql_skeleton_server
+from xagent import metrics
+from xagent.tracing import ToolHookTimer, TraceWriter, TurnTrace
+from xagent.recording import Recorder, RecordingClient, ReplayClient, ReplayCorpus
+from xagent.compaction import (
+    COMPACT_PROMPT,
+    build_seed_prompt,
+    collect_response,
+    compact_in_place,
+    context_tokens,
+    format_report,
+)
+from xagent.token_budget import COMPACT, TRIM, TokenBudget, ToolOutputTrimmer
+from xagent.followups import QUEUE, STEER, FollowUpQueue, parse_mode
+from xagent.tool_results import ToolResultStore, tool_result_text
+from xagent.static_assets import CachedStaticFiles, StaticAssets, asset_response
+from xagent.session_reaper import SessionReaper
+from xagent.admission import TurnAdmission
+from xagent.config import env_bool, env_float, env_int, env_str
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -38,73 +78,492 @@ logger = logging.getLogger(__name__)
 app = FastAPI(title="XAgent", version="1.0.0")
 
 
+# berserker-metadata MCP 上游地址及本地读穿缓存代理
+METADATA_MCP_URL = env_str(
+    "XAGENT_METADATA_MCP_URL",
+    "http://cm-mng.bilibili.co/ad-data-public-mcp/mcp/berserker-metadata",
+)
+METADATA_PROXY_PATH = "/mcp/berserker-metadata"
+METADATA_PROXY_URL = f"http://127.0.0.1:{env_int('PORT', 8000)}{METADATA_PROXY_PATH}"
+# 代理以服务端的上游凭据转发：只接受本机请求，并要求本进程启动时生成的令牌（经 MCP 配置的请求头传给 CLI）
+METADATA_PROXY_TOKEN = secrets.token_urlsafe(32)
+
+metadata_proxy = McpCachingProxy(
+    McpHttpClient(METADATA_MCP_URL, timeout=env_float("XAGENT_METADATA_TIMEOUT", 60.0)),
+    ToolResultCache(
+        max_entries=env_int("XAGENT_METADATA_CACHE_SIZE", 2048),
+        ttls={**DEFAULT_TOOL_TTLS, **parse_ttls(env_str("XAGENT_METADATA_CACHE_TTLS"))},
+    ),
+) if env_bool("XAGENT_METADATA_PROXY", True) else None
+
+
+# 本地找表检索（BM25 + 倒排索引），表目录文件按 mtime 增量刷新
+_table_catalog_path = env_str("XAGENT_TABLE_CATALOG", str(Path(__file__).parent / "data" / "table_catalog.jsonl"))
+# 默认按主题域 × 数仓分层分片：先识别主题域，只检索 DWS/ADS，候选不足再退到其他分层
+_table_domains_path = env_str("XAGENT_TABLE_DOMAINS")
+_domain_classifier = DomainClassifier(
+    load_domain_keywords(Path(_table_domains_path)) if _table_domains_path else None
+)
+table_catalog = TableCatalog(
+    Path(_table_catalog_path),
+    poll_interval=env_float("XAGENT_TABLE_CATALOG_POLL_INTERVAL", 30.0),
+    index_factory=(
+        (lambda: ShardedTableIndex(_domain_classifier))
+        if env_bool("XAGENT_TABLE_SEARCH_SHARDED", True) else TableSearchIndex
+    ),
+) if _table_catalog_path else None
+table_search_server = create_table_search_server(
+    table_catalog, default_top_k=env_int("XAGENT_TABLE_SEARCH_TOP_K", 10)
+) if table_catalog is not None else None
+
+# 按意图族的 SQL 骨架填空工具：模型只选骨架、填表和字段，不再从零手写 SQL
+sql_skeleton_engine = SqlSkeletonEngine() if env_bool("XAGENT_SQL_SKELETONS", True) else None
+sql_skeleton_server = create_sql_skeleton_server(sql_skeleton_engine) if sql_skeleton_engine is not None else None
+
+
+# 对话轮次追踪：span 树写入滚动 JSONL（XAGENT_TRACE_FILE 为空时关闭）
+_trace_file = env_str("XAGENT_TRACE_FILE", str(Path(__file__).parent / "data" / "traces.jsonl"))
+trace_writer = TraceWriter(
+    Path(_trace_file),
+    max_bytes=env_int("XAGENT_TRACE_MAX_BYTES", 10 * 1024 * 1024),
+    backup_count=env_int("XAGENT_TRACE_BACKUPS", 5),
+    worker=os.getenv(WORKER_ID_ENV),
+) if _trace_file else None
+# 通过 PreToolUse/PostToolUse 钩子记录工具真实执行时间（追踪和工具耗时指标共用）
+tool_hook_timer = ToolHookTimer() if env_bool("XAGENT_TRACE_TOOL_HOOKS", True) else None
+
+
+# 会话 token 预算：上下文超过阈值时逐级截断工具结果 / 原地压缩 / 带摘要换会话（阈值为 0 表示不启用该级）
+TOKEN_BUDGET_ENABLED = env_bool("XAGENT_TOKEN_BUDGET", True)
+tool_output_trimmer = ToolOutputTrimmer(
+    max_chars=env_int("XAGENT_BUDGET_TRIM_CHARS", 4000)
+) if TOKEN_BUDGET_ENABLED else None
+
+
+def build_token_budget() -> Optional[TokenBudget]:
+    if not TOKEN_BUDGET_ENABLED:
+        return None
+    return TokenBudget(
+        trim_tokens=env_int("XAGENT_BUDGET_TRIM_TOKENS", 60000),
+        compact_tokens=env_int("XAGENT_BUDGET_COMPACT_TOKENS", 100000),
+        rotate_tokens=env_int("XAGENT_BUDGET_ROTATE_TOKENS", 150000),
+        rotate_cost_usd=env_float("XAGENT_BUDGET_ROTATE_COST_USD", 0.0),
+    )
+
+
+def build_agent_options() -> ClaudeAgentOptions:
+    """构建 XAgent 客户端配置（连接池与会话共用）"""
+    # 配置 MCP 服务器
+    # 开启元数据缓存代理时，CLI 连接本进程的代理端点，由代理转发到远端
+    if metadata_proxy is not None:
+        metadata_server = {
+            "type": "http",
+            "url": METADATA_PROXY_URL,
+            "headers": {"Authorization": f"Bearer {METADATA_PROXY_TOKEN}"}
+        }
+    else:
+        metadata_server = {
+            "type": "http",
+            "url": METADATA_MCP_URL
+        }
+    mcp_servers = {
+        "berserker-metadata": metadata_server
+    }
+    if sql_skeleton_server is not None:
+        mcp_servers["sql-skeleton"] = sql_skeleton_server
+
+    # 配置允许的工具（包含基础工具和 MCP 工具）
+    allowed_tools = [
+        # 基础工具
+        "Read", "Write", "Edit", "Bash", "Glob", "Grep",
+        # berserker-metadata MCP 工具
+        "mcp__berserker-metadata__getInfo",
+        "mcp__berserker-metadata__getTableUpstreamLineage",
+        "mcp__berserker-metadata__getTableDownstreamLineage",
+        "mcp__berserker-metadata__getTableDataDemo",
+        "mcp__berserker-metadata__getFieldEnumDistribution",
+        "mcp__berserker-metadata__getHiveTableSchema",
+        "mcp__berserker-metadata__getFieldEnumValues",
+        "mcp__berserker-metadata__getJobUpstreamLineage",
+        "mcp__berserker-metadata__getTableGenerationSql",
+        "mcp__berserker-metadata__getJobDownstreamLineage",
+        # SQL 骨架填空工具
+        "mcp__sql-skeleton__fill_sql_skeleton",
+    ]
+    # 本地找表检索工具：表目录未生成或为空时不提供，避免模型按工具说明先调用它、白白多一轮
+    if table_search_server is not None and len(table_catalog.index) > 0:
+        mcp_servers["table-search"] = table_search_server
+        allowed_tools.append("mcp__table-search__search_tables")
+
+    # 工具计时钩子在前，截断钩子在后（计时不受截断影响）
+    hooks = {}
+    for source in (tool_hook_timer, tool_output_trimmer):
+        if source is not None:
+            for event, matchers in source.hooks().items():
+                hooks.setdefault(event, []).extend(matchers)
+
+    return ClaudeAgentOptions(
+        allowed_tools=allowed_tools,
+        mcp_servers=mcp_servers,
+        permission_mode="acceptEdits",
+        cwd="/Users/xionghaoqiang/Xagent",
+        hooks=hooks or None,
+    )
+
+
+# SDK 后端：sdk（默认）/ record（录制真实消息流）/ replay（回放录制的消息流，不需要网络和凭据）
+SDK_BACKEND = env_str("XAGENT_BACKEND", "sdk").lower()
+if SDK_BACKEND not in ("sdk", "record", "replay"):
+    raise ValueError(f"Unknown XAGENT_BACKEND: {SDK_BACKEND} (expected sdk, record or replay)")
+_recording_file = Path(env_str("XAGENT_RECORDING_FILE", str(Path(__file__).parent / "data" / "recordings.jsonl")))
+recorder = Recorder(_recording_file) if SDK_BACKEND == "record" else None
+replay_corpus = ReplayCorpus(_recording_file) if SDK_BACKEND == "replay" else None
+# 回放节奏：1 为录制时的原始节奏，0.1 压缩为十分之一，0 不等待；MAX_GAP 限制单次等待（秒，0 表示不限制）
+_replay_time_scale = env_float("XAGENT_REPLAY_TIME_SCALE", 1.0)
+_replay_max_gap = env_float("XAGENT_REPLAY_MAX_GAP", 0.0)
+
+
+def create_client(options: ClaudeAgentOptions):
+    """按 XAGENT_BACKEND 创建客户端（连接池和恢复会话共用）"""
+    if replay_corpus is not None:
+        return ReplayClient(
+            replay_corpus,
+            options,
+            time_scale=_replay_time_scale,
+            max_gap=_replay_max_gap or None,
+        )
+    client = ClaudeSDKClient(options=options)
+    if recorder is not None:
+        return RecordingClient(client, recorder)
+    return client
+
+
+# 进程级预热连接池，所有 WebSocket 会话共享
+client_pool = ClientPool(
+    client_factory=lambda: create_client(build_agent_options()),
+    min_size=env_int("XAGENT_POOL_MIN_SIZE", 2),
+    max_size=env_int("XAGENT_POOL_MAX_SIZE", 8),
+    connect_timeout=env_float("XAGENT_POOL_CONNECT_TIMEOUT", 60.0),
+    retry_delay=env_float("XAGENT_POOL_RETRY_DELAY", 1.0),
+    max_retry_delay=env_float("XAGENT_POOL_RETRY_MAX_DELAY", 60.0),
+)
+
+
+# 静态资源内存缓存（预压缩 + 指纹 + ETag），按文件 mtime 自动刷新
+static_assets = StaticAssets(
+    Path(__file__).parent / "static",
+    poll_interval=env_float("XAGENT_STATIC_POLL_INTERVAL", 2.0),
+)
+
+# 进程级自定义命令注册表，启动时异步加载，按文件 mtime 自动刷新
+command_registry = CommandRegistry(
+    Path(build_agent_options().cwd) / ".claude" / "commands",
+    poll_interval=env_float("XAGENT_COMMANDS_POLL_INTERVAL", 2.0),
+)
+
+# 大工具结果卸载：WebSocket 只推送预览和句柄，全文按需经 /api/tool-results 分段读取
+# （XAGENT_TOOL_RESULT_SPILL_DIR 为空时不落盘，超出内存上限的结果直接丢弃）
+# 多 worker 时「加载更多」可能落到其他 worker（路由漂移、worker 重启），默认不占内存、直接写入共享目录
+_tool_result_dir = env_str("XAGENT_TOOL_RESULT_SPILL_DIR", str(Path(__file__).parent / "data" / "tool_results"))
+_tool_result_shared = env_int("XAGENT_WORKERS", 1) > 1
+if _tool_result_shared and not _tool_result_dir:
+    logger.warning("XAGENT_TOOL_RESULT_SPILL_DIR is empty with multiple workers; "
+                   "offloaded tool results are only readable on the worker that produced them")
+tool_result_store = ToolResultStore(
+    Path(_tool_result_dir) if _tool_result_dir else None,
+    inline_chars=env_int("XAGENT_TOOL_RESULT_INLINE_CHARS", 8192),
+    preview_chars=env_int("XAGENT_TOOL_RESULT_PREVIEW_CHARS", 2000),
+    max_memory_bytes=env_int(
+        "XAGENT_TOOL_RESULT_MEMORY_BYTES", 0 if _tool_result_shared and _tool_result_dir else 64 * 1024 * 1024
+    ),
+    max_disk_bytes=env_int("XAGENT_TOOL_RESULT_DISK_BYTES", 512 * 1024 * 1024),
+)
+TOOL_RESULT_MAX_PAGE = 1024 * 1024  # 单次分段读取的最大字符数
+
+# 持久化会话存储（XAGENT_SESSION_DB 为空时关闭）
+_session_db = env_str("XAGENT_SESSION_DB", str(Path(__file__).parent / "data" / "sessions.db"))
+session_store = SessionStore(
+    Path(_session_db),
+    max_event_chars=env_int("XAGENT_SESSION_MAX_EVENT_CHARS", 65536),
+    retention_days=env_float("XAGENT_SESSION_RETENTION_DAYS", 7.0),
+) if _session_db else None
+
+# 恢复会话使用的专用客户端（不经过预热池），只用于统计存活客户端数
+dedicated_clients: "weakref.WeakSet" = weakref.WeakSet()
+
+# 空闲会话回收：空闲超时的会话休眠（下一条消息时恢复），全进程持有的客户端数超出上限时先休眠最久未使用的会话
+session_reaper = SessionReaper(
+    idle_timeout=env_float("XAGENT_SESSION_IDLE_TIMEOUT", 1800.0),
+    max_live_clients=env_int("XAGENT_MAX_LIVE_CLIENTS", 0),
+    interval=env_float("XAGENT_SESSION_REAP_INTERVAL", 60.0),
+)
+
+# 轮次准入控制：进程内同时执行的轮次数受限，超出时按用户轮转排队
+turn_admission = TurnAdmission(max_concurrent=env_int("XAGENT_MAX_CONCURRENT_TURNS", 8))
+# 区分用户的请求头（SSO 网关可改为 X-Forwarded-User 等），缺失时使用对端地址
+USER_HEADER = env_str("XAGENT_USER_HEADER", "X-Real-IP")
+# 连接断开后进行中的轮次最多再运行的秒数（输出写入会话记录，重连后可回放），超时则取消
+WS_DISCONNECT_GRACE = env_float("XAGENT_WS_DISCONNECT_GRACE", 60.0)
+
+
+def _sdk_client_counts() -> Dict[tuple, float]:
+    stats = client_pool.stats()
+    return {
+        ("idle",): stats["idle"],
+        ("in_use",): stats["in_use"],
+        ("connecting",): stats["connecting"],
+        ("dedicated",): len(dedicated_clients),
+    }
+
+
+def _mcp_cache_counts() -> Dict[tuple, float]:
+    if metadata_proxy is None:
+        return {}
+    stats = metadata_proxy.cache.stats()
+    results = {"hit": "hits", "miss": "misses", "coalesced": "coalesced", "bypassed": "bypassed"}
+    return {(result,): stats[key] for result, key in results.items()}
+
+
+# 抓取时从连接池和缓存代理读取，不在热路径上记录
+metrics.registry.callback(
+    "xagent_sdk_clients", "Live SDK clients by state", "gauge", _sdk_client_counts, ["state"]
+)
+metrics.registry.callback(
+    "xagent_tool_result_store_bytes", "Offloaded tool result bytes held by tier", "gauge",
+    lambda: {("memory",): tool_result_store.memory_bytes, ("disk",): tool_result_store.disk_bytes}, ["tier"],
+)
+metrics.registry.callback(
+    "xagent_admission_turns", "Agent turns running or waiting for admission", "gauge",
+    lambda: {("running",): turn_admission.running, ("queued",): turn_admission.waiting()}, ["state"],
+)
+metrics.registry.callback(
+    "xagent_sql_skeleton_renders_total", "SQL skeleton fills by family and result", "counter",
+    lambda: dict(sql_skeleton_engine.renders) if sql_skeleton_engine is not None else {}, ["family", "status"],
+)
+metrics.registry.callback(
+    "xagent_sql_skeleton_chars_total", "Characters of skeleton arguments written by the model and SQL generated",
+    "counter",
+    lambda: {("input",): sql_skeleton_engine.input_chars, ("output",): sql_skeleton_engine.output_chars}
+    if sql_skeleton_engine is not None else {},
+    ["part"],
+)
+metrics.registry.callback(
+    "xagent_metadata_cache_requests_total", "Metadata MCP proxy lookups by result", "counter",
+    _mcp_cache_counts, ["result"],
+)
+
+# 内置斜杠命令（名称, 描述）
+BUILTIN_COMMANDS = [
+    ("help", "显示所有可用的斜杠命令"),
+    ("clear", "清除当前对话历史"),
+    ("compact", "压缩对话历史以减少 token 使用")
+]
+
+
+def build_commands_list(custom_commands: Dict[str, Dict]) -> List[Dict]:
+    """构建发送给前端的命令列表"""
+    available_commands = []
+
+    # 先添加自定义命令（优先级更高）
+    for cmd_name, cmd_data in custom_commands.items():
+        available_commands.append({
+            "name": f"/{cmd_name}",
+            "description": cmd_data["metadata"].get("description", "自定义命令")
+        })
+
+    # 添加内置命令（如果没有同名自定义命令）
+    for cmd_name, cmd_desc in BUILTIN_COMMANDS:
+        if cmd_name not in custom_commands:
+            available_commands.append({
+                "name": f"/{cmd_name}",
+                "description": cmd_desc
+            })
+
+    return available_commands
+
+
+def build_help_text(custom_commands: Dict[str, Dict]) -> str:
+    """构建 /help 命令的帮助文本"""
+    help_text = "## 可用的斜杠命令\n\n"
+    help_text += "### 内置命令\n\n"
+    help_text += "**`/help`**\n  显示所有可用的斜杠命令\n\n"
+    help_text += "**`/clear`**\n  清除当前对话历史\n\n"
+    help_text += "**`/compact`**\n  总结当前对话（保留关键决策、选定的表和 Query Contract），在新会话中继续\n\n"
+
+    # 添加自定义命令
+    if custom_commands:
+        help_text += "### 自定义命令\n\n"
+        for cmd_name, cmd_data in custom_commands.items():
+            desc = cmd_data["metadata"].get("description", "自定义命令")
+            arg_hint = cmd_data["metadata"].get("argument-hint", "")
+            help_text += f"**`/{cmd_name}`** {arg_hint}\n  {desc}\n\n"
+
+    help_text += "---\n\n"
+    help_text += "💡 **提示**: 斜杠命令以 `/` 开头，可以用来控制会话或执行特定操作。"
+    return help_text
+
+
 class ConversationManager:
     """管理 XAgent 对话会话"""
 
-    def __init__(self):
+    def __init__(
+        self,
+        client_pool: Optional[ClientPool] = None,
+        command_registry: Optional[CommandRegistry] = None,
+        session_store: Optional[SessionStore] = None,
+        trace_writer: Optional[TraceWriter] = None,
+        channels: Optional[ChannelMux] = None,
+        reaper: Optional[SessionReaper] = None,
+        user: str = "anonymous",
+    ):
         self.client = None
+        self.client_pool = client_pool
+        self.command_registry = command_registry
+        self.session_store = session_store
+        self.trace_writer = trace_writer
+        self.channels = channels  # 所在连接的多路会话表（限制连接持有的客户端数）
+        self.reaper = reaper  # 进程级空闲回收（限制全进程持有的客户端数）
+        self.user = user  # 轮次准入按用户公平排队
+        self.outbound: Optional[OutboundChannel] = None  # 该会话在连接上的发送接口
+        self.session_id: Optional[str] = None  # 当前 SDK 会话 id
+        self.resume_session_id: Optional[str] = None  # 下次初始化时要恢复的 SDK 会话 id
+        self._pending_events: List[Dict] = []  # 会话 id 确定前产生的事件
         self.is_interrupted = False
         self.current_task = None
-        self.custom_commands: Dict[str, Dict] = {}
-        self.last_activity_time = None  # 记录最后活动时间
-
-        # 配置 MCP 服务器
-        mcp_servers = {
-            "berserker-metadata": {
-                "type": "http",
-                "url": "http://cm-mng.bilibili.co/ad-data-public-mcp/mcp/berserker-metadata"
-            }
-        }
+        self.last_activity_time = time.monotonic()  # 最后活动时间（收到消息、轮次结束），空闲回收按此排序
+        self._client_used = False  # 当前客户端是否已发送过查询（已使用的客户端不能放回池中）
+        self._client_dedicated = False  # 当前客户端是否为恢复会话的专用客户端（持有其他会话的上下文，不能放回池中）
+        self._client_from_pool_hit = False
+        self._cost_meter = metrics.CostMeter()  # ResultMessage 的累计费用换算为增量，计入 xagent_cost_usd_total
+        self._client_lock = asyncio.Lock()
+        self._swap_task: Optional[asyncio.Task] = None
+        self._background_tasks: set = set()
+        self.replay_limit = env_int("XAGENT_SESSION_REPLAY_EVENTS", 200)
+        self.budget = build_token_budget()
+        # 轮次进行中到达的消息：排队在其后发送，或引导（写入）正在运行的轮次
+        self.follow_ups = FollowUpQueue(max_pending=env_int("XAGENT_MAX_QUEUED_MESSAGES", 10))
+        self.pending_steers = 0  # 已写入运行中会话、尚未收到 ResultMessage 的引导消息数
+        self._turn_started: Optional[float] = None  # 正在流式接收的轮次发送查询的时间
+        self._turn_tool_calls = 0
+
+        self.options = build_agent_options()
+        if reaper is not None:
+            reaper.track(self)
+
+    @property
+    def custom_commands(self) -> Dict[str, Dict]:
+        """自定义命令（来自进程级共享注册表，不再每个连接扫描磁盘）"""
+        if self.command_registry is None:
+            return {}
+        return self.command_registry.commands
+
+    async def initialize(self, admitted: bool = False):
+        """初始化客户端（优先从预热池中取出已连接的客户端）
+
+        预热池未命中或恢复会话时要启动 CLI 子进程，同样受轮次准入限制：轮次内（已取得名额，admitted=True）
+        直接连接，后台调用（中断后换备用客户端、恢复会话预连接、重置）在连接期间占用一个名额。
+        """
+        # 加锁避免中断后的备用切换与新消息同时借出客户端
+        async with self._client_lock:
+            if self.client is not None:
+                return
+            # 同一连接和全进程的客户端数都受限，必要时先让最久未使用的空闲会话休眠
+            slot = self.channels.client_slot(self) if self.channels is not None else contextlib.nullcontext()
+            global_slot = self.reaper.client_slot(self) if self.reaper is not None else contextlib.nullcontext()
+            admission = contextlib.nullcontext() if admitted else turn_admission.slot(self.user)
+            async with slot, global_slot, admission:
+                await self._connect_client()
+
+    async def _connect_client(self):
+        """取得客户端：恢复会话时新建专用客户端，否则优先从预热池取出（调用方持有客户端锁）"""
+        # 新客户端的累计费用从 0 开始
+        self._cost_meter.reset()
+        if self.resume_session_id:
+            # 恢复已有会话需要专用客户端（预热池中的客户端都是新会话）
+            options = dataclasses.replace(self.options, resume=self.resume_session_id)
+            self.resume_session_id = None
+            start = time.perf_counter()
+            self.client = create_client(options)
+            await self.client.connect()
+            metrics.client_resume_duration.observe(time.perf_counter() - start)
+            dedicated_clients.add(self.client)
+            self._client_from_pool_hit = False
+            self._client_used = False
+            self._client_dedicated = True
+            logger.info(f"XAgent client resumed session {options.resume}")
+        else:
+            if self.client_pool is not None:
+                self.client, self._client_from_pool_hit = await self.client_pool.acquire()
+            else:
+                self.client = create_client(self.options)
+                await self.client.connect()
+                self._client_from_pool_hit = False
+            self._client_used = False
+            self._client_dedicated = False
+            logger.info("XAgent client initialized")
 
-        # 配置允许的工具（包含基础工具和 MCP 工具）
-        allowed_tools = [
-            # 基础工具
-            "Read", "Write", "Edit", "Bash", "Glob", "Grep",
-            # berserker-metadata MCP 工具
-            "mcp__berserker-metadata__getInfo",
-            "mcp__berserker-metadata__getTableUpstreamLineage",
-            "mcp__berserker-metadata__getTableDownstreamLineage",
-            "mcp__berserker-metadata__getTableDataDemo",
-            "mcp__berserker-metadata__getFieldEnumDistribution",
-            "mcp__berserker-metadata__getHiveTableSchema",
-            "mcp__berserker-metadata__getFieldEnumValues",
-            "mcp__berserker-metadata__getJobUpstreamLineage",
-            "mcp__berserker-metadata__getTableGenerationSql",
-            "mcp__berserker-metadata__getJobDownstreamLineage"
-        ]
-
-        self.options = ClaudeAgentOptions(
-            allowed_tools=allowed_tools,
-            mcp_servers=mcp_servers,
-            permission_mode="acceptEdits",
-            cwd="/Users/xionghaoqiang/Xagent"
-        )
+    def _client_reusable(self) -> bool:
+        """当前客户端能否放回预热池：只有未发送过查询、也不是恢复会话的专用客户端才能复用"""
+        return not self._client_used and not self._client_dedicated
 
-        # 加载自定义命令
-        self._load_custom_commands()
+    async def _release_client(self):
+        """归还或断开当前客户端"""
+        client, self.client = self.client, None
+        if client is None:
+            return
+        dedicated_clients.discard(client)
+        if self.client_pool is not None:
+            await self.client_pool.release(client, reusable=self._client_reusable())
+        else:
+            await client.disconnect()
+
+    async def send_message(self, message: str, websocket: OutboundWriter):
+        """发送消息并流式返回响应（初始化客户端前取得准入名额，预算处理完成后归还）"""
+        async with contextlib.AsyncExitStack() as admission:
+            await self._send_message(message, websocket, admission)
+
+    async def _admit(self, websocket: OutboundWriter, admission: contextlib.AsyncExitStack):
+        """取得轮次准入名额；排队时向前端推送排队位置和预计等待时间"""
+        async def on_wait(position: int, eta: Optional[float]):
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "turn_queued",
+                "position": position,
+                "eta_seconds": eta
+            })
 
-    async def initialize(self):
-        """初始化客户端"""
-        if self.client is None:
-            self.client = ClaudeSDKClient(options=self.options)
-            await self.client.connect()
-            logger.info("XAgent client initialized")
+        waited = await admission.enter_async_context(turn_admission.slot(self.user, on_wait))
+        metrics.admission_wait.observe(waited)
+        if waited >= 0.001:
+            logger.info(f"Turn admitted for {self.user} after {waited:.2f}s in queue")
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "turn_admitted",
+                "waited_ms": round(waited * 1000, 1)
+            })
 
-    async def send_message(self, message: str, websocket: WebSocket):
-        """发送消息并流式返回响应"""
+    async def _send_message(self, message: str, websocket: OutboundWriter, admission: contextlib.AsyncExitStack):
+        # 轮次结果（发送查询后才计入指标）：success / error / interrupted / 其他 ResultMessage.subtype
+        outcome = None
+        turn_start = time.perf_counter()
+        trace = TurnTrace(self.session_id, hook_timer=tool_hook_timer, message=message[:200])
         try:
             # 重置中断标志
             self.is_interrupted = False
 
-            # 确保客户端已初始化
-            await self.initialize()
-
             # 发送用户消息到前端
             await websocket.send_json({
                 "type": "user_message",
                 "content": message
             })
 
+            # 并发轮次数受限，必要时排队；先取得名额再初始化客户端，
+            # 预热池未命中时启动 CLI 子进程同样受准入上限约束
+            await self._admit(websocket, admission)
+
+            # 确保客户端已初始化
+            await self.initialize(admitted=True)
+
             # 检查是否是斜杠命令
             if self._is_slash_command(message):
                 logger.info(f"Detected slash command: {message}")
@@ -117,13 +576,10 @@ class ConversationManager:
                     logger.info(f"Expanding custom command: /{command}")
                     cmd_data = self.custom_commands[command]
 
-                    # 替换参数占位符
-                    content = cmd_data["content"]
-                    if args:
-                        arg_list = args.split()
-                        for i, arg in enumerate(arg_list, 1):
-                            content = content.replace(f"${i}", arg)
-                    content = content.replace("$ARGUMENTS", args)
+                    # 替换参数占位符（预编译模板，单次拼接）
+                    expand_span = trace.span("command.expand", "command", command=command)
+                    content = cmd_data["template"].render(args)
+                    trace.end(expand_span, chars=len(content))
 
                     # 发送展开后的内容给 XAgent
                     message = content
@@ -135,17 +591,41 @@ class ConversationManager:
                     await self._handle_builtin_command(command, websocket)
                     return  # 内置命令处理完成，不发送给 XAgent
 
-            # 发送查询到 XAgent
+            # 发送查询到 XAgent（首次查询时记录首字节耗时，用于评估预热池效果）
+            record_first_byte = not self._client_used and self.client_pool is not None
+            self._client_used = True
+            outcome = "incomplete"
+            query_start = time.perf_counter()
+            first_token = True
+            last_usage = None  # 最后一次模型调用的 usage（上下文大小）
+            query_span = trace.span("client.query", "query", chars=len(message))
             await self.client.query(message)
+            trace.end(query_span)
+            trace.query_sent()
+            self._turn_started = query_start
+            self._turn_tool_calls = 0
+
+            # 流式接收响应（包括轮次中引导消息的回复）
+            async for msg in self._responses():
+                if record_first_byte:
+                    record_first_byte = False
+                    self.client_pool.record_first_byte(
+                        time.perf_counter() - turn_start, self._client_from_pool_hit
+                    )
 
-            # 流式接收响应
-            async for msg in self.client.receive_response():
                 # 如果被中断，停止处理后续消息
                 if self.is_interrupted:
                     logger.info("Message processing interrupted, stopping...")
+                    outcome = "interrupted"
                     break
 
                 if isinstance(msg, AssistantMessage):
+                    trace.model_output()
+                    if msg.usage:
+                        last_usage = msg.usage
+                    if first_token:
+                        first_token = False
+                        metrics.time_to_first_token.observe(time.perf_counter() - query_start)
                     for block in msg.content:
                         if isinstance(block, TextBlock):
                             # 发送文本消息
@@ -155,6 +635,7 @@ class ConversationManager:
                             })
 
                         elif isinstance(block, ThinkingBlock):
+                            trace.thinking(block.thinking)
                             # 发送思考过程
                             await websocket.send_json({
                                 "type": "thinking",
@@ -162,6 +643,7 @@ class ConversationManager:
                             })
 
                         elif isinstance(block, ToolUseBlock):
+                            trace.tool_use(block.id, block.name, block.input)
                             # 发送工具使用信息
                             await websocket.send_json({
                                 "type": "tool_use",
@@ -171,12 +653,38 @@ class ConversationManager:
 
                         elif isinstance(block, ToolResultBlock):
                             # 发送工具结果
-                            await websocket.send_json({
-                                "type": "tool_result",
-                                "content": block.content if isinstance(block.content, str) else str(block.content)
-                            })
+                            await websocket.send_json(await self._tool_result_frame(block))
+
+                elif isinstance(msg, UserMessage):
+                    # 工具结果随 UserMessage 返回：记录追踪和工具耗时，并转发给前端（大结果只发预览和句柄）
+                    if isinstance(msg.content, list):
+                        for block in msg.content:
+                            if isinstance(block, ToolResultBlock):
+                                self._turn_tool_calls += 1
+                                span = trace.tool_result(block.tool_use_id, block.content, block.is_error)
+                                if span is not None:
+                                    self._record_tool(span)
+                                await websocket.send_json(await self._tool_result_frame(block))
 
                 elif isinstance(msg, ResultMessage):
+                    outcome = "success" if msg.subtype == "success" else msg.subtype
+                    metrics.record_usage(msg.usage, msg.total_cost_usd, self._cost_meter)
+                    if self.budget is not None:
+                        self.budget.observe(context_tokens(last_usage or msg.usage), msg.total_cost_usd)
+                    trace.result(
+                        subtype=msg.subtype,
+                        duration_ms=msg.duration_ms,
+                        num_turns=msg.num_turns,
+                        total_cost_usd=msg.total_cost_usd,
+                        usage=msg.usage,
+                    )
+                    # 记录会话（结果帧随后按该 session_id 存储）
+                    self._bind_session(msg.session_id)
+                    if self.session_store is not None and msg.session_id:
+                        self.session_store.update_session(
+                            msg.session_id, msg.num_turns, msg.total_cost_usd, worker_id=worker_id()
+                        )
+
                     # 发送完成消息
                     await websocket.send_json({
                         "type": "result",
@@ -185,10 +693,14 @@ class ConversationManager:
                         "num_turns": msg.num_turns,
                         "session_id": msg.session_id,
                         "total_cost_usd": msg.total_cost_usd,
-                        "usage": msg.usage
+                        "usage": msg.usage,
+                        "trace_id": trace.trace_id if self.trace_writer is not None else None,
                     })
 
                 elif isinstance(msg, SystemMessage):
+                    if msg.subtype == "init":
+                        self._bind_session(msg.data.get("session_id"))
+
                     # 发送系统消息
                     await websocket.send_json({
                         "type": "system",
@@ -198,16 +710,183 @@ class ConversationManager:
 
         except asyncio.CancelledError:
             logger.info("Task was cancelled")
+            if outcome is not None:
+                outcome = "interrupted"
             raise  # 重新抛出以正确处理取消
         except Exception as e:
             logger.error(f"Error in send_message: {e}")
+            if outcome is not None:
+                outcome = "error"
             await websocket.send_json({
                 "type": "error",
                 "content": str(e)
             })
+        finally:
+            self._turn_started = None
+            self.pending_steers = 0
+            if outcome is not None:
+                metrics.turns_total.inc(outcome=outcome)
+                metrics.turn_duration.observe(time.perf_counter() - turn_start, outcome=outcome)
+                if self.trace_writer is not None:
+                    self.trace_writer.write(trace.finish(outcome, self.session_id))
+
+        # 结果帧已发出，预算处理不计入本轮耗时；期间到达的消息排在其后
+        if outcome == "success" and self.budget is not None:
+            await self._enforce_budget(websocket)
+
+    async def _responses(self):
+        """当前轮次的消息流；每条引导消息各自对应一个 ResultMessage，全部收完为止"""
+        while True:
+            async for msg in self.client.receive_response():
+                yield msg
+            if self.pending_steers <= 0 or self.is_interrupted:
+                return
+            self.pending_steers -= 1
+
+    async def submit(self, message: str, websocket: OutboundWriter, mode: str = QUEUE):
+        """处理前端发来的消息：空闲时开始新轮次；轮次进行中按 mode 排队或引导，不取消当前轮次"""
+        self.last_activity_time = time.monotonic()
+        if self.current_task is None or self.current_task.done():
+            self.current_task = asyncio.create_task(self._run_turns(message, websocket))
+            return
+
+        if self._turn_started is not None:
+            # 取消重来会丢弃的工作：当前轮次已进行的时间和已完成的工具调用
+            metrics.followup_preserved_turn.observe(time.perf_counter() - self._turn_started)
+            metrics.followup_preserved_tool_calls_total.inc(self._turn_tool_calls)
+
+        if mode == STEER and self._turn_started is not None and not self._is_slash_command(message):
+            self.pending_steers += 1
+            try:
+                await self.client.query(message)
+            except Exception:
+                self.pending_steers -= 1
+                raise
+            metrics.followup_messages_total.inc(mode=STEER)
+            logger.info(f"Steered running turn ({self.pending_steers} pending)")
+            await websocket.send_json({
+                "type": "user_message",
+                "content": message,
+                "steered": True
+            })
+            return
+
+        # 斜杠命令和没有流式输出中的轮次时（初始化、预算处理）无法引导，按排队处理
+        if not self.follow_ups.push(message):
+            metrics.followup_messages_total.inc(mode="rejected")
+            await websocket.send_json({
+                "type": "error",
+                "content": f"排队消息已达上限（{self.follow_ups.max_pending} 条），请等待当前回复完成或中断后再发送"
+            })
+            return
+        metrics.followup_messages_total.inc(mode=QUEUE)
+        logger.info(f"Queued follow-up message ({len(self.follow_ups)} pending)")
+        await websocket.send_json({
+            "type": "system",
+            "subtype": "message_queued",
+            "position": len(self.follow_ups),
+            "content": message
+        })
+
+    async def _run_turns(self, message: str, websocket: OutboundWriter):
+        """发送消息，随后依次发送期间排队的后续消息"""
+        try:
+            await self.send_message(message, websocket)
+            while True:
+                follow_up = self.follow_ups.pop()
+                if follow_up is None:
+                    return
+                metrics.followup_wait.observe(follow_up.waited())
+                await self.send_message(follow_up.message, websocket)
+        finally:
+            self.last_activity_time = time.monotonic()
+            if self.channels is not None:
+                self.channels.notify_idle()
+
+    async def _enforce_budget(self, websocket: OutboundWriter):
+        """按预算处理上下文：trim 开启工具结果截断，compact 原地压缩，rotate 带摘要换到新会话"""
+        action = self.budget.next_action()
+        if action is None:
+            return
+        before = self.budget.context_tokens
+        start = time.perf_counter()
+        try:
+            if action == TRIM:
+                self.budget.trimming = True
+                tool_output_trimmer.enable(self.session_id)
+                after = before
+            else:
+                await websocket.send_json({
+                    "type": "system",
+                    "subtype": "budget_action",
+                    "action": action,
+                    "stage": "running",
+                    "data": self.budget.snapshot()
+                })
+                if action == COMPACT:
+                    pre_tokens, result = await compact_in_place(self.client)
+                    if result is not None:
+                        metrics.record_usage(result.usage, result.total_cost_usd, self._cost_meter)
+                        self._bind_session(result.session_id)
+                    before = pre_tokens or before
+                    after = None
+                    self.budget.mark_compacted()
+                else:
+                    rotated = await self._rotate_session()
+                    if rotated is None:
+                        return
+                    _, before, after, _ = rotated
+            if self.is_interrupted:
+                return
+
+            duration_ms = int((time.perf_counter() - start) * 1000)
+            metrics.budget_actions_total.inc(action=action)
+            logger.info(f"Token budget {action} for session {self.session_id}: {before} -> {after} "
+                        f"context tokens in {duration_ms}ms")
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "budget_action",
+                "action": action,
+                "stage": "done",
+                "duration_ms": duration_ms,
+                "session_id": self.session_id,
+                "data": {
+                    **self.budget.snapshot(),
+                    "context_tokens_before": before,
+                    "context_tokens_after": after,
+                }
+            })
+        except Exception as e:
+            logger.error(f"Token budget {action} failed: {e}")
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "budget_action",
+                "action": action,
+                "stage": "failed",
+                "error": str(e)
+            })
 
-    async def interrupt(self, websocket: WebSocket):
-        """中断当前请求"""
+    def _reset_budget(self):
+        """换会话后重新计数，并停止截断旧会话的工具结果"""
+        if self.budget is not None:
+            self.budget.reset()
+        if tool_output_trimmer is not None:
+            tool_output_trimmer.disable(self.session_id)
+
+    @staticmethod
+    def _record_tool(span):
+        is_error = span.attrs.get("is_error")
+        metrics.tool_calls_total.inc(tool=span.name, status="error" if is_error else "ok")
+        metrics.tool_duration.observe(span.duration, tool=span.name)
+
+    async def interrupt(self, websocket: OutboundWriter):
+        """中断当前请求
+
+        旧客户端立即摘下并在后台中断、断开；同时从预热池换上一个已连接的备用客户端，
+        中断期间到达的新消息不会再碰到旧客户端。
+        """
+        interrupt_start = time.perf_counter()
+        metrics.interrupts_total.inc()
         try:
             logger.info("Setting interrupt flag")
             # 立即设置中断标志
@@ -225,15 +904,26 @@ class ConversationManager:
                 except Exception as e:
                     logger.warning(f"Error waiting for task cancellation: {e}")
 
+            # 摘下旧客户端，交给后台清理
+            old_client, self.client = self.client, None
+            if old_client is not None:
+                self._spawn_background(self._retire_client(old_client, reusable=self._client_reusable()))
+
+            # 显式中断同时丢弃尚未发送的排队消息，退回前端输入框
+            dropped = self.follow_ups.clear()
+            if dropped:
+                metrics.followup_dropped_total.inc(len(dropped))
+
             # 立即发送中断确认消息给前端
             await websocket.send_json({
                 "type": "interrupted",
-                "content": "Request interrupted successfully"
+                "content": "Request interrupted successfully",
+                "queued": dropped
             })
             logger.info("Interrupt response sent to frontend")
 
-            # 在后台异步清理客户端（不阻塞响应）
-            asyncio.create_task(self._cleanup_client_after_interrupt())
+            # 后台换上备用客户端（不阻塞响应）
+            self._swap_task = self._spawn_background(self._swap_in_standby(interrupt_start, websocket))
 
         except Exception as e:
             logger.error(f"Error in interrupt: {e}")
@@ -244,102 +934,191 @@ class ConversationManager:
                 "content": "Request interrupted"
             })
 
-    async def _cleanup_client_after_interrupt(self):
-        """在后台清理和重新初始化客户端"""
+    async def _swap_in_standby(self, interrupt_start: float, websocket: OutboundWriter):
+        """换上备用客户端并记录中断到可用的耗时"""
         try:
-            if self.client:
-                logger.info("Starting background client cleanup")
-                try:
-                    # 带超时的中断调用
-                    await asyncio.wait_for(self.client.interrupt(), timeout=3.0)
-                    logger.info("Client interrupt completed")
-                except asyncio.TimeoutError:
-                    logger.warning("Client interrupt timed out, forcing disconnect")
-                except Exception as e:
-                    logger.warning(f"Error during client.interrupt(): {e}")
-
-                try:
-                    # 带超时的断开连接
-                    await asyncio.wait_for(self.client.disconnect(), timeout=3.0)
-                    logger.info("Client disconnected")
-                except asyncio.TimeoutError:
-                    logger.warning("Client disconnect timed out")
-                except Exception as e:
-                    logger.warning(f"Error during client.disconnect(): {e}")
+            await self.initialize()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 下一条消息到达时会再次尝试初始化
+            logger.error(f"Error swapping in standby client: {e}")
+            return
 
-                # 强制重置客户端
-                self.client = None
+        ready_ms = round((time.perf_counter() - interrupt_start) * 1000, 1)
+        metrics.interrupt_to_ready.observe(ready_ms / 1000)
+        if self.client_pool is not None:
+            self.client_pool.record_interrupt_ready(ready_ms / 1000)
+        logger.info(f"Standby client ready {ready_ms}ms after interrupt")
+        try:
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "interrupt_ready",
+                "interrupt_to_ready_ms": ready_ms
+            })
+        except Exception:
+            # 连接可能已关闭
+            pass
 
-                # 重新初始化（带超时）
-                try:
-                    await asyncio.wait_for(self.initialize(), timeout=5.0)
-                    logger.info("Client reinitialized successfully")
-                except asyncio.TimeoutError:
-                    logger.error("Client reinitialization timed out")
-                    self.client = None
-                except Exception as e:
-                    logger.error(f"Error during reinitialization: {e}")
-                    self.client = None
+    async def _retire_client(self, client, reusable: bool):
+        """在后台中断并断开被替换下来的客户端"""
+        if not reusable:
+            try:
+                # 带超时的中断调用
+                await asyncio.wait_for(client.interrupt(), timeout=3.0)
+                logger.info("Retired client interrupt completed")
+            except asyncio.TimeoutError:
+                logger.warning("Retired client interrupt timed out, forcing disconnect")
+            except Exception as e:
+                logger.warning(f"Error during client.interrupt(): {e}")
 
+        dedicated_clients.discard(client)
+        try:
+            if self.client_pool is not None:
+                await self.client_pool.release(client, reusable=reusable)
+            else:
+                await asyncio.wait_for(client.disconnect(), timeout=3.0)
+            logger.info("Retired client released")
+        except asyncio.TimeoutError:
+            logger.warning("Retired client disconnect timed out")
         except Exception as e:
-            logger.error(f"Error in background cleanup: {e}")
-            self.client = None
+            logger.warning(f"Error during client.disconnect(): {e}")
+
+    def _spawn_background(self, coro) -> asyncio.Task:
+        """创建后台任务并保持引用，防止被垃圾回收"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def record_event(self, frame: Dict):
+        """记录发往前端的渲染事件（出站写入器的旁路回调）"""
+        if self.session_store is None or frame.get("type") not in RECORDED_EVENT_TYPES:
+            return
+        if self.session_id:
+            self.session_store.append_event(self.session_id, frame)
+        elif len(self._pending_events) < 1000:
+            self._pending_events.append(frame)
+
+    def _bind_session(self, session_id: Optional[str]):
+        """确定当前 SDK 会话 id，并写入此前缓存的事件"""
+        if not session_id or session_id == self.session_id:
+            return
+        if self.session_store is not None:
+            if self.session_id:
+                # 恢复会话后 SDK 分配了新 id，历史记录随之迁移
+                self.session_store.rename_session(self.session_id, session_id)
+            for frame in self._pending_events:
+                self.session_store.append_event(session_id, frame)
+        self._pending_events.clear()
+        self.session_id = session_id
+
+    def forget_session(self):
+        """开始新会话（/clear、reset）"""
+        self._reset_budget()
+        self.session_id = None
+        self.resume_session_id = None
+        self._pending_events.clear()
+
+    async def resume(self, session_id: str, websocket: OutboundWriter):
+        """按 session_id 恢复会话：回放最近的事件，并在后台连接恢复该会话的客户端"""
+        if self.session_store is None or not session_id or not await self.session_store.has_session(session_id):
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "resume_failed",
+                "session_id": session_id
+            })
+            return
 
-    async def close(self):
-        """关闭客户端"""
-        if self.client:
-            await self.client.disconnect()
-            self.client = None
-            logger.info("XAgent client closed")
+        events = await self.session_store.recent_events(session_id, self.replay_limit)
 
-    def _load_custom_commands(self):
-        """从 .claude/commands/ 目录加载自定义命令"""
-        commands_dir = Path(self.options.cwd) / ".claude" / "commands"
+        # 多 worker 部署时会话应由同一 worker 处理；路由漂移（扩缩容、worker 重启）时仍可恢复，
+        # SDK 会话文件在同一主机上共享
+        owner = await self.session_store.session_owner(session_id)
+        if owner is not None and owner != worker_id():
+            logger.info(f"Session {session_id} moved from worker {owner} to worker {worker_id()}")
+        self.session_store.update_session(session_id, worker_id=worker_id())
 
-        if not commands_dir.exists():
-            logger.info("No custom commands directory found")
-            return
+        # 换下当前客户端（通常是尚未使用的预热客户端，可直接归还）
+        async with self._client_lock:
+            old_client, self.client = self.client, None
+        if old_client is not None:
+            self._spawn_background(self._retire_client(old_client, reusable=self._client_reusable()))
 
-        # 递归查找所有 .md 文件
-        for md_file in commands_dir.rglob("*.md"):
-            try:
-                # 命令名称是文件名（不含 .md）
-                command_name = md_file.stem
-
-                # 读取文件内容
-                content = md_file.read_text(encoding="utf-8")
-
-                # 解析 YAML 前言（如果有）
-                metadata = {}
-                command_content = content
-
-                if content.startswith("---"):
-                    parts = content.split("---", 2)
-                    if len(parts) >= 3:
-                        try:
-                            metadata = yaml.safe_load(parts[1]) or {}
-                            command_content = parts[2].strip()
-                        except Exception as e:
-                            logger.warning(f"Failed to parse YAML in {md_file}: {e}")
-
-                # 存储命令
-                self.custom_commands[command_name] = {
-                    "name": command_name,
-                    "content": command_content,
-                    "metadata": metadata,
-                    "file_path": str(md_file)
-                }
+        self._reset_budget()
+        self.session_id = session_id
+        self.resume_session_id = session_id
+        self._pending_events.clear()
 
-                logger.info(f"Loaded custom command: /{command_name}")
+        await websocket.send_json({
+            "type": "session_resumed",
+            "session_id": session_id,
+            "events": events
+        })
+        logger.info(f"Resumed session {session_id}, replayed {len(events)} events")
 
-            except Exception as e:
-                logger.error(f"Failed to load command from {md_file}: {e}")
+        # 提前连接，用户发出下一条消息时客户端已就绪
+        self._swap_task = self._spawn_background(self._prepare_client())
+
+    async def _prepare_client(self):
+        """在后台初始化客户端，失败时等下一条消息再重试"""
+        try:
+            await self.initialize()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error preparing client: {e}")
+
+    async def close(self):
+        """关闭客户端"""
+        # 取消尚未完成的备用客户端切换，避免关闭后又借出新客户端
+        if self._swap_task and not self._swap_task.done():
+            self._swap_task.cancel()
+            try:
+                await self._swap_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._swap_task = None
+        async with self._client_lock:
+            if self.client:
+                await self._release_client()
+                logger.info("XAgent client closed")
+
+    def client_busy(self) -> bool:
+        """正在取得、切换或释放客户端"""
+        return self._client_lock.locked() or (self._swap_task is not None and not self._swap_task.done())
+
+    async def hibernate(self, reason: str = "channel_cap"):
+        """断开客户端但保留会话 id，下一条消息到达时恢复该会话"""
+        async with self._client_lock:
+            if self.client is None:
+                return
+            await self._release_client()
+            # 恢复后尚未发送查询的客户端同样持有该会话，只要有会话 id 就在下次初始化时恢复
+            if self.session_id:
+                self.resume_session_id = self.session_id
+        metrics.client_hibernations_total.inc(reason=reason)
+        logger.info(f"Hibernated session {self.session_id} ({reason})")
+
+    async def _tool_result_frame(self, block: ToolResultBlock) -> Dict:
+        """tool_result 帧：超过内联上限的结果保存在服务端，帧中只带预览和 result_id"""
+        text = tool_result_text(block.content)
+        fields = await tool_result_store.offload(text)
+        delivery = "offloaded" if "result_id" in fields else "inline"
+        metrics.tool_results_total.inc(delivery=delivery)
+        metrics.tool_result_chars_total.inc(len(text), delivery=delivery)
+        return {
+            "type": "tool_result",
+            "tool_use_id": block.tool_use_id,
+            "is_error": bool(block.is_error),
+            **fields,
+        }
 
     def _is_slash_command(self, message: str) -> bool:
         """检测消息是否是斜杠命令"""
         return message.strip().startswith("/")
 
-    async def _handle_builtin_command(self, command: str, websocket: WebSocket):
+    async def _handle_builtin_command(self, command: str, websocket: OutboundWriter):
         """处理内置斜杠命令"""
         if command == "help":
             await self._handle_help_command(websocket)
@@ -348,27 +1127,15 @@ class ConversationManager:
         elif command == "compact":
             await self._handle_compact_command(websocket)
 
-    async def _handle_help_command(self, websocket: WebSocket):
+    async def _handle_help_command(self, websocket: OutboundWriter):
         """处理 /help 命令"""
         logger.info("Handling /help command")
 
-        # 构建帮助文本
-        help_text = "## 可用的斜杠命令\n\n"
-        help_text += "### 内置命令\n\n"
-        help_text += "**`/help`**\n  显示所有可用的斜杠命令\n\n"
-        help_text += "**`/clear`**\n  清除当前对话历史\n\n"
-        help_text += "**`/compact`**\n  压缩对话历史以减少 token 使用（即将推出）\n\n"
-
-        # 添加自定义命令
-        if self.custom_commands:
-            help_text += "### 自定义命令\n\n"
-            for cmd_name, cmd_data in self.custom_commands.items():
-                desc = cmd_data["metadata"].get("description", "自定义命令")
-                arg_hint = cmd_data["metadata"].get("argument-hint", "")
-                help_text += f"**`/{cmd_name}`** {arg_hint}\n  {desc}\n\n"
-
-        help_text += "---\n\n"
-        help_text += "💡 **提示**: 斜杠命令以 `/` 开头，可以用来控制会话或执行特定操作。"
+        # 帮助文本按命令表版本缓存
+        if self.command_registry is not None:
+            help_text = self.command_registry.derived("help_text", build_help_text)
+        else:
+            help_text = build_help_text({})
 
         # 发送响应
         await websocket.send_json({
@@ -387,13 +1154,19 @@ class ConversationManager:
         })
         logger.info("/help command completed")
 
-    async def _handle_clear_command(self, websocket: WebSocket):
+    async def _handle_clear_command(self, websocket: OutboundWriter):
         """处理 /clear 命令"""
         try:
             logger.info("Handling /clear command")
             # 关闭并重新初始化客户端
             await self.close()
-            await self.initialize()
+            self.forget_session()
+            await self.initialize(admitted=True)
+
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "session_cleared"
+            })
 
             await websocket.send_json({
                 "type": "assistant_text",
@@ -418,24 +1191,114 @@ class ConversationManager:
                 "content": f"❌ 清除对话失败: {str(e)}"
             })
 
-    async def _handle_compact_command(self, websocket: WebSocket):
-        """处理 /compact 命令"""
+    async def _handle_compact_command(self, websocket: OutboundWriter):
+        """处理 /compact 命令：生成交接摘要，在新的 SDK 会话中基于摘要继续"""
         logger.info("Handling /compact command")
-        await websocket.send_json({
-            "type": "assistant_text",
-            "content": "ℹ️ **`/compact` 命令**\n\n此命令将在未来版本中实现。\n\n该命令将压缩对话历史以减少 token 使用，同时保留重要的上下文信息。"
-        })
+        if not self._client_used:
+            await websocket.send_json({
+                "type": "assistant_text",
+                "content": "ℹ️ 当前会话还没有对话内容，无需压缩。"
+            })
+            await self._send_command_result(websocket)
+            return
+
+        start = time.perf_counter()
+        try:
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "compacting"
+            })
+            rotated = await self._rotate_session()
+            if rotated is None:
+                return
+            summary, before, after, cost = rotated
+            await websocket.send_json({
+                "type": "system",
+                "subtype": "context_compacted",
+                "data": {"context_tokens_before": before, "context_tokens_after": after}
+            })
+            await websocket.send_json({
+                "type": "assistant_text",
+                "content": format_report(before, after, summary)
+            })
+            await self._send_command_result(
+                websocket,
+                duration_ms=int((time.perf_counter() - start) * 1000),
+                session_id=self.session_id or "",
+                total_cost_usd=cost,
+                usage={"context_tokens_before": before, "context_tokens_after": after},
+            )
+            logger.info("/compact command completed")
+
+        except Exception as e:
+            logger.error(f"Failed to compact conversation: {e}")
+            await websocket.send_json({
+                "type": "error",
+                "content": f"❌ 压缩对话失败: {str(e)}"
+            })
 
+    async def _rotate_session(self) -> Optional[Tuple[str, Optional[int], Optional[int], float]]:
+        """生成交接摘要，换到以摘要初始化的新 SDK 会话
+
+        返回 (摘要, 压缩前上下文 token 数, 压缩后上下文 token 数, 费用)；被中断时返回 None。
+        换会话过程中失败或被取消时，下次初始化恢复原会话。
+        """
+        summary, summary_result, summary_usage = await collect_response(self.client, COMPACT_PROMPT)
+        if summary_result is not None:
+            # 换客户端前按旧客户端的累计费用记账
+            metrics.record_usage(summary_result.usage, summary_result.total_cost_usd, self._cost_meter)
+        if self.is_interrupted:
+            return None
+        if not summary:
+            raise RuntimeError("模型没有返回摘要")
+
+        # 换用新客户端（已使用的客户端不会放回池中）；保留 session_id，
+        # 新会话绑定时历史事件随之迁移，刷新页面后仍能看到压缩前的对话
+        old_session_id = self.session_id
+        await self.close()
+        self.resume_session_id = None
+        try:
+            await self.initialize(admitted=True)
+            self._client_used = True
+            _, seed_result, seed_usage = await collect_response(self.client, build_seed_prompt(summary))
+        except (Exception, asyncio.CancelledError):
+            client, self.client = self.client, None
+            if client is not None:
+                self._spawn_background(self._retire_client(client, reusable=False))
+            self.resume_session_id = old_session_id
+            raise
+        if self.is_interrupted:
+            return None
+
+        results = [r for r in (summary_result, seed_result) if r is not None]
+        if seed_result is not None:
+            metrics.record_usage(seed_result.usage, seed_result.total_cost_usd, self._cost_meter)
+        self._reset_budget()
+        new_session_id = seed_result.session_id if seed_result is not None else None
+        self._bind_session(new_session_id)
+        if self.session_store is not None and new_session_id:
+            self.session_store.update_session(
+                new_session_id, seed_result.num_turns, seed_result.total_cost_usd, worker_id=worker_id()
+            )
+
+        before, after = context_tokens(summary_usage), context_tokens(seed_usage)
+        if self.budget is not None:
+            self.budget.observe(after, seed_result.total_cost_usd if seed_result is not None else None)
+        logger.info(f"Rotated session {old_session_id} -> {new_session_id}: {before} -> {after} context tokens")
+        return summary, before, after, sum(r.total_cost_usd or 0 for r in results)
+
+    async def _send_command_result(self, websocket: OutboundWriter, duration_ms: int = 0, session_id: str = "",
+                                   total_cost_usd: float = 0, usage: Optional[Dict] = None):
+        """内置命令的完成消息"""
         await websocket.send_json({
             "type": "result",
             "subtype": "slash_command",
-            "duration_ms": 0,
+            "duration_ms": duration_ms,
             "num_turns": 1,
-            "session_id": "",
-            "total_cost_usd": 0,
-            "usage": {}
+            "session_id": session_id,
+            "total_cost_usd": total_cost_usd,
+            "usage": usage or {}
         })
-        logger.info("/compact command completed")
 
 
 # 不再使用全局会话管理器，改为每个连接独立创建
@@ -443,114 +1306,273 @@ class ConversationManager:
 
 
 @app.get("/")
-async def get():
-    """返回主页面"""
-    html_path = Path(__file__).parent / "static" / "index.html"
-    if html_path.exists():
-        return HTMLResponse(content=html_path.read_text(), status_code=200)
-    else:
-        return HTMLResponse(content="""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>XAgent</title>
-        </head>
-        <body>
-            <h1>XAgent</h1>
-            <p>Static files not found. Please create static/index.html</p>
-        </body>
-        </html>
-        """, status_code=200)
+async def get(request: Request):
+    """返回主页面（内存缓存，文件变化时自动更新）"""
+    asset = static_assets.index
+    if asset is not None:
+        return asset_response(asset, request.headers)
+    return HTMLResponse(content="""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>XAgent</title>
+    </head>
+    <body>
+        <h1>XAgent</h1>
+        <p>Static files not found. Please create static/index.html</p>
+    </body>
+    </html>
+    """, status_code=200)
+
+
+@app.get("/health")
+async def health():
+    """健康检查（不读文件、不访问 SDK，供容器和负载均衡探活）"""
+    return {"status": "ok", "worker": worker_id()}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 指标（多 worker 部署时每个 worker 单独抓取）"""
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/api/pool/stats")
+async def pool_stats():
+    """返回预热连接池统计（命中率、首字节耗时），用于按峰值连接速率调整池大小"""
+    return client_pool.stats()
+
+
+@app.get("/api/worker")
+async def worker_info():
+    """返回当前 worker 信息，用于检查粘性路由是否生效"""
+    return {"worker_id": worker_id(), "pid": os.getpid()}
+
+
+@app.post(METADATA_PROXY_PATH)
+async def metadata_proxy_endpoint(request: Request):
+    """berserker-metadata MCP 读穿缓存代理（Streamable HTTP，仅 JSON 响应）"""
+    if metadata_proxy is None:
+        return Response(status_code=404)
+    client_host = request.client.host if request.client else None
+    denied = proxy_access_denied(client_host, request.headers.get("authorization"), METADATA_PROXY_TOKEN)
+    if denied is not None:
+        logger.warning(f"Rejected metadata proxy request from {client_host} ({denied})")
+        return Response(status_code=denied)
+    try:
+        payload = await request.json()
+    except ValueError:
+        return JSONResponse(
+            {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "Parse error"}},
+            status_code=400,
+        )
+    reply = await metadata_proxy.handle(payload)
+    if reply is None:
+        return Response(status_code=202)
+    return JSONResponse(reply)
+
+
+@app.get(METADATA_PROXY_PATH)
+async def metadata_proxy_stream():
+    """代理不主动推送消息，不提供 SSE 流"""
+    return Response(status_code=405, headers={"Allow": "POST"})
+
+
+@app.get("/api/mcp-cache/stats")
+async def mcp_cache_stats():
+    """返回元数据缓存代理统计（命中率、合并的并发请求、淘汰数）"""
+    if metadata_proxy is None:
+        return {"enabled": False}
+    return {"enabled": True, "upstream": METADATA_MCP_URL, **metadata_proxy.cache.stats()}
+
+
+@app.get("/api/tables/search")
+async def table_search_endpoint(q: str, top_k: int = 10, domain: Optional[str] = None, prune: bool = True):
+    """直接调用找表检索（与 search_tables 工具使用同一个索引），便于调试召回效果
+
+    prune=false 时跳过主题域/分层裁剪，检索全部分片，用于对比候选集大小和耗时。
+    """
+    if table_catalog is None:
+        return {"enabled": False, "results": []}
+    start = time.perf_counter()
+    results, stats = table_catalog.index.search_with_stats(
+        q, max(1, min(top_k, 50)), domain=domain, prune=prune
+    )
+    return {
+        "enabled": True,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+        **stats,
+        "results": results,
+    }
+
+
+@app.get("/api/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """返回一轮对话的追踪（span 树），供结果卡片展示时间线"""
+    trace = await trace_writer.get(trace_id) if trace_writer is not None else None
+    if trace is None:
+        return JSONResponse({"error": "Trace not found"}, status_code=404)
+    return trace
+
+
+@app.get("/api/tool-results/{result_id}")
+async def get_tool_result(result_id: str, offset: int = 0, limit: int = 65536):
+    """分段读取卸载的工具结果全文：返回 [offset, offset + limit) 字符，next_offset 为 null 表示已读完"""
+    limit = max(1, min(limit, TOOL_RESULT_MAX_PAGE))
+    found = await tool_result_store.read(result_id, offset, limit)
+    if found is None:
+        return JSONResponse({"error": "Tool result not found or expired"}, status_code=404)
+    content, total = found
+    offset = max(0, offset)
+    end = offset + len(content)
+    return {
+        "result_id": result_id,
+        "offset": offset,
+        "total_chars": total,
+        "content": content,
+        "next_offset": end if end < total else None,
+    }
+
+
+@app.get("/api/tool-results")
+async def tool_result_stats():
+    """返回工具结果卸载统计（内存 / 磁盘占用、卸载和淘汰数）"""
+    return tool_result_store.stats()
+
+
+@app.get("/api/outbound/stats")
+async def outbound_stats_endpoint():
+    """返回出站写入统计（队列深度、合并/丢弃的 thinking 帧、发送耗时）"""
+    return outbound_stats.snapshot()
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket 端点 - 每个连接独立会话"""
+    """WebSocket 端点 - 一个连接可承载多路独立会话（入站帧的 channel 字段，缺省为默认会话）"""
     await websocket.accept()
     logger.info("WebSocket connection established")
+    metrics.active_websockets.inc()
+
+    # 出站写入器：所有发往该连接的帧都经由它合并发送，各路会话的帧轮流发出
+    outbound = OutboundWriter(
+        websocket,
+        max_queue=env_int("XAGENT_WS_MAX_QUEUE", 256),
+        batch_window=env_float("XAGENT_WS_BATCH_WINDOW_MS", 10.0) / 1000,
+        max_batch=env_int("XAGENT_WS_MAX_BATCH", 64),
+    )
+    outbound.start()
+
+    def open_conversation(channel: Optional[str]) -> ConversationManager:
+        # 每路会话独立的会话管理器，出站帧带上 channel 字段
+        manager = ConversationManager(
+            client_pool=client_pool,
+            command_registry=command_registry,
+            session_store=session_store,
+            trace_writer=trace_writer,
+            channels=channels,
+            reaper=session_reaper,
+            user=user,
+        )
+        manager.outbound = outbound.channel(channel, on_frame=manager.record_event)
+        metrics.active_channels.inc()
+        return manager
+
+    async def close_conversation(channel: Optional[str]):
+        await channels.close(channel)
+        outbound.remove_channel(channel)
+        metrics.active_channels.dec()
 
-    # 为每个连接创建独立的会话管理器
-    conversation_manager = ConversationManager()
+    channels = ChannelMux(
+        open_conversation,
+        max_channels=env_int("XAGENT_WS_MAX_CHANNELS", 8),
+        max_live_clients=env_int("XAGENT_WS_MAX_LIVE_CLIENTS", 3),
+    )
+
+    # 轮次准入按用户排队：优先使用网关传入的用户头，否则按对端地址区分
+    user = websocket.headers.get(USER_HEADER) or (websocket.client.host if websocket.client else None) or "anonymous"
+
+    # 连接 URL 中的 session_id 同时用于 nginx 粘性路由和默认会话的恢复
+    resume_session_id = websocket.query_params.get("session_id")
 
     try:
         # 发送欢迎消息
-        await websocket.send_json({
+        await outbound.send_json({
             "type": "system",
             "content": "Connected to XAgent"
         })
 
-        # 发送可用命令列表
-        available_commands = []
-
-        # 先添加自定义命令（优先级更高）
-        for cmd_name, cmd_data in conversation_manager.custom_commands.items():
-            available_commands.append({
-                "name": f"/{cmd_name}",
-                "description": cmd_data["metadata"].get("description", "自定义命令")
-            })
-
-        # 添加内置命令（如果没有同名自定义命令）
-        custom_cmd_names = set(conversation_manager.custom_commands.keys())
-        builtin_commands = [
-            ("help", "显示所有可用的斜杠命令"),
-            ("clear", "清除当前对话历史"),
-            ("compact", "压缩对话历史以减少 token 使用")
-        ]
-        for cmd_name, cmd_desc in builtin_commands:
-            if cmd_name not in custom_cmd_names:
-                available_commands.append({
-                    "name": f"/{cmd_name}",
-                    "description": cmd_desc
-                })
+        # 发送可用命令列表（按命令表版本缓存，不随连接数重复构建）
+        available_commands = command_registry.derived("commands_list", build_commands_list)
 
         logger.info(f"Sending {len(available_commands)} commands to frontend")
-        await websocket.send_json({
+        await outbound.send_json({
             "type": "commands_list",
             "commands": available_commands
         })
-        logger.info(f"Commands sent: {[cmd['name'] for cmd in available_commands]}")
+
+        if resume_session_id:
+            conversation_manager = channels.get(None)
+            await conversation_manager.resume(resume_session_id, conversation_manager.outbound)
 
         while True:
             # 接收客户端消息
             data = await websocket.receive_text()
             message_data = json.loads(data)
+            message_type = message_data.get("type")
+            if message_type not in ("message", "interrupt", "resume", "reset", "close_channel"):
+                continue
 
-            if message_data.get("type") == "message":
+            try:
+                channel = parse_channel(message_data.get("channel"))
+                if message_type == "close_channel":
+                    # 关闭一路会话：取消进行中的轮次并释放客户端（会话记录保留，可再按 session_id 恢复）
+                    if channel in channels:
+                        await close_conversation(channel)
+                    await outbound.send_json({
+                        "type": "system",
+                        "subtype": "channel_closed",
+                        "channel": channel
+                    })
+                    continue
+                conversation_manager = channels.get(channel)
+            except ChannelError as e:
+                await outbound.send_json({
+                    "type": "error",
+                    "channel": message_data.get("channel"),
+                    "content": str(e)
+                })
+                continue
+            sender = conversation_manager.outbound
+
+            if message_type == "message":
                 user_message = message_data.get("content", "")
-                logger.info(f"Received message: {user_message}")
-
-                # 如果有正在运行的任务，先取消它
-                if conversation_manager.current_task and not conversation_manager.current_task.done():
-                    logger.info("Cancelling previous task before starting new one")
-                    conversation_manager.current_task.cancel()
-                    try:
-                        await conversation_manager.current_task
-                    except asyncio.CancelledError:
-                        logger.info("Previous task cancelled successfully")
-                    except Exception as e:
-                        logger.error(f"Error waiting for task cancellation: {e}")
-                else:
-                    logger.info("No previous task to cancel or task already done")
+                mode = parse_mode(message_data.get("mode"))
+                logger.info(f"Received message ({mode}, channel {channel!r}): {user_message}")
 
-                # 在后台任务中处理消息，不阻塞 WebSocket
-                logger.info("Creating new task for message processing")
-                conversation_manager.current_task = asyncio.create_task(
-                    conversation_manager.send_message(user_message, websocket)
-                )
-                logger.info(f"Task created: {conversation_manager.current_task}")
+                # 轮次进行中到达的消息排队或引导当前轮次，只有显式中断才取消；在后台任务中处理，不阻塞 WebSocket
+                await conversation_manager.submit(user_message, sender, mode)
 
-            elif message_data.get("type") == "interrupt":
+            elif message_type == "interrupt":
                 # 中断请求
-                logger.info("Interrupt request received")
+                logger.info(f"Interrupt request received (channel {channel!r})")
                 # 立即发送中断确认，并取消当前任务
-                await conversation_manager.interrupt(websocket)
+                await conversation_manager.interrupt(sender)
+
+            elif message_type == "resume":
+                # 页面刷新或断线重连后恢复会话
+                logger.info(f"Resume request received (channel {channel!r})")
+                await conversation_manager.resume(message_data.get("session_id", ""), sender)
 
-            elif message_data.get("type") == "reset":
+            elif message_type == "reset":
                 # 重置会话
                 await conversation_manager.close()
+                conversation_manager.forget_session()
                 await conversation_manager.initialize()
-                await websocket.send_json({
+                await sender.send_json({
                     "type": "system",
+                    "subtype": "session_cleared",
                     "content": "Session reset"
                 })
 
@@ -559,12 +1581,13 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
-        # 清理：关闭该连接的会话管理器
-        logger.info("Cleaning up connection manager")
-        try:
-            await conversation_manager.close()
-        except Exception as e:
-            logger.error(f"Error closing conversation manager: {e}")
+        # 清理：释放该连接所有会话的客户端
+        opened = len(channels)
+        logger.info(f"Cleaning up {opened} conversation channel(s)")
+        await channels.close_all(grace=WS_DISCONNECT_GRACE)
+        metrics.active_channels.dec(opened)
+        await outbound.close()
+        metrics.active_websockets.dec()
 
 
 @app.on_event("startup")
@@ -574,6 +1597,31 @@ async def startup_event():
     # 创建 static 目录
     static_dir = Path(__file__).parent / "static"
     static_dir.mkdir(exist_ok=True)
+    # 打开会话存储
+    if session_store is not None:
+        session_store.start()
+    if trace_writer is not None:
+        trace_writer.start()
+    # 清理上次运行遗留的工具结果文件
+    await asyncio.to_thread(tool_result_store.start)
+    # 回放模式先加载语料（预热池创建的回放客户端依赖它）
+    if replay_corpus is not None:
+        await replay_corpus.load()
+    if SDK_BACKEND != "sdk":
+        logger.info(f"SDK backend: {SDK_BACKEND} ({_recording_file})")
+    # 加载静态资源缓存并启动 mtime 检查
+    await static_assets.start()
+    # 加载自定义命令并启动 mtime 检查
+    await command_registry.start()
+    # 加载表目录索引
+    if table_catalog is not None:
+        await table_catalog.start()
+        if not len(table_catalog.index):
+            logger.info("Table catalog is empty, search_tables is not offered until it is generated")
+    # 启动预热连接池（表目录加载后再创建，客户端配置按目录是否为空决定是否提供找表工具）
+    await client_pool.start()
+    # 启动空闲会话回收
+    session_reaper.start()
 
 
 @app.on_event("shutdown")
@@ -581,14 +1629,38 @@ async def shutdown_event():
     """应用关闭事件"""
     logger.info("Shutting down XAgent Server")
     # 不再需要关闭全局 conversation_manager，因为每个连接都独立管理
-
-
-# 挂载静态文件
+    await session_reaper.stop()
+    await command_registry.stop()
+    await static_assets.stop()
+    if table_catalog is not None:
+        await table_catalog.stop()
+    await client_pool.close()
+    if metadata_proxy is not None:
+        await metadata_proxy.close()
+    if session_store is not None:
+        await asyncio.to_thread(session_store.close)
+    if trace_writer is not None:
+        await asyncio.to_thread(trace_writer.close)
+    await asyncio.to_thread(tool_result_store.close)
+
+
+# 挂载静态文件（index.html 引用的 JS / CSS 由内存缓存提供，其余文件交给 StaticFiles）
 static_path = Path(__file__).parent / "static"
 static_path.mkdir(exist_ok=True)
-app.mount("/static", StaticFiles(directory=str(static_path)), name="static")
+app.mount("/static", CachedStaticFiles(directory=str(static_path), assets=static_assets), name="static")
 
 
 if __name__ == "__main__":
+    host = env_str("HOST", "0.0.0.0")
+    port = env_int("PORT", 8000)
+    workers = env_int("XAGENT_WORKERS", 1)
+
+    if workers > 1:
+        # 多 worker 模式：每个 worker 监听 PORT + i，由 nginx 按前端的路由键粘性路由
+        supervisor = WorkerSupervisor(
+            "webui_server:app", host, port, workers, cwd=Path(__file__).parent
+        )
+        raise SystemExit(supervisor.run())
+
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host=host, port=port)
@@ -0,0 +1,4 @@
+"""
+XAgent 服务端组件
+webui_server.py 使用的连接池、缓存、指标等基础设施
+"""
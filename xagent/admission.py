@@ -0,0 +1,158 @@
+"""
+轮次准入控制
+进程内同时执行的 agent 轮次（client.query 到收完回复）数受上限约束；超出时按用户公平排队：
+各用户的等待队列轮流放行，单个用户的多路会话或连发消息不会挤占其他用户。
+排队期间通过 on_wait 回调告知排队位置和预计等待时间（按最近轮次平均占用时长估算）
+"""
+
+import asyncio
+import contextlib
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# on_wait(position, eta_seconds)：position 从 1 开始；还没有轮次时长样本时 eta 为 None
+WaitCallback = Callable[[int, Optional[float]], Awaitable[None]]
+
+
+class _Waiter:
+    __slots__ = ("user", "wakeup", "granted")
+
+    def __init__(self, user: str):
+        self.user = user
+        self.wakeup = asyncio.Event()  # 放行或排队位置变化
+        self.granted = False
+
+
+class TurnAdmission:
+    """全局轮次并发上限 + 按用户轮转的等待队列
+
+    max_concurrent 为 0 时不限制；hold_alpha 为轮次占用时长指数滑动平均的权重（用于估算等待时间）。
+    """
+
+    def __init__(self, max_concurrent: int = 8, hold_alpha: float = 0.2):
+        self.max_concurrent = max(0, max_concurrent)
+        self.hold_alpha = hold_alpha
+        self.running = 0
+        self.avg_hold: Optional[float] = None
+        # 用户 -> 等待队列；第一个用户下一个被放行，放行后移到末尾
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self.admitted = 0
+        self.queued = 0
+
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user: str, on_wait: Optional[WaitCallback] = None) -> AsyncIterator[float]:
+        """在此范围内执行一个轮次，返回排队等待的秒数"""
+        start = time.perf_counter()
+        await self._acquire(user, on_wait)
+        admitted = time.perf_counter()
+        try:
+            yield admitted - start
+        finally:
+            self._observe_hold(time.perf_counter() - admitted)
+            self._release()
+
+    async def _acquire(self, user: str, on_wait: Optional[WaitCallback]):
+        self.admitted += 1
+        if self.max_concurrent == 0 or (self.running < self.max_concurrent and not self._queues):
+            self.running += 1
+            return
+
+        waiter = _Waiter(user)
+        self._queues.setdefault(user, deque()).append(waiter)
+        self.queued += 1
+        last_position = None
+        try:
+            while not waiter.granted:
+                waiter.wakeup.clear()
+                position = self.position(waiter)
+                if on_wait is not None and position != last_position:
+                    last_position = position
+                    await on_wait(position, self.eta(position))
+                if not waiter.granted:
+                    await waiter.wakeup.wait()
+        except BaseException:
+            # 取消（中断、连接断开）或通知失败：已放行则归还名额，否则移出队列
+            if waiter.granted:
+                self._release()
+            else:
+                self._remove(waiter)
+            raise
+
+    def _release(self):
+        self.running -= 1
+        self._grant()
+
+    def _grant(self):
+        """有空闲名额时按用户轮转放行，其余等待者重新计算排队位置"""
+        while self._queues and self.running < self.max_concurrent:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            waiter.granted = True
+            self.running += 1
+            waiter.wakeup.set()
+        for queue in self._queues.values():
+            for waiter in queue:
+                waiter.wakeup.set()
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.user)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[waiter.user]
+        self._grant()
+
+    def position(self, waiter: _Waiter) -> int:
+        """按轮转顺序，waiter 前面还有多少个等待者（加 1）"""
+        queue = self._queues.get(waiter.user)
+        if queue is None:
+            return 1
+        index = queue.index(waiter)
+        ahead = index
+        before = True
+        for user, other in self._queues.items():
+            if user == waiter.user:
+                before = False
+                continue
+            # 排在前面的用户本轮也会放行一个
+            ahead += min(len(other), index + 1 if before else index)
+        return ahead + 1
+
+    def eta(self, position: int) -> Optional[float]:
+        """预计等待秒数：每批放行 max_concurrent 个，每批约为一个平均轮次时长"""
+        if self.avg_hold is None or self.max_concurrent == 0:
+            return None
+        return round(math.ceil(position / self.max_concurrent) * self.avg_hold, 1)
+
+    def _observe_hold(self, seconds: float):
+        if self.avg_hold is None:
+            self.avg_hold = seconds
+        else:
+            self.avg_hold += self.hold_alpha * (seconds - self.avg_hold)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "waiting": self.waiting(),
+            "users_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "avg_turn_seconds": round(self.avg_hold, 3) if self.avg_hold is not None else None,
+        }
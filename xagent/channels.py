@@ -0,0 +1,135 @@
+"""
+单个 WebSocket 连接上的多路会话
+入站帧的 channel 字段选择会话（缺省为默认会话，兼容旧协议），每路会话一个独立的 ConversationManager；
+各会话共用连接和出站写入器，持有的 SDK 客户端数受上限约束：超出时先让最久未使用的空闲会话休眠
+（断开客户端、保留会话 id，下一条消息时恢复），全部忙碌时等待有会话空闲
+"""
+
+import asyncio
+import contextlib
+import logging
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_CHANNEL_ID_LENGTH = 64
+
+
+class ChannelError(Exception):
+    """通道 id 无效或通道数超出上限"""
+
+
+def parse_channel(raw: Any) -> Optional[str]:
+    """入站帧的 channel 字段：缺省或空为默认会话（None），否则必须是不超过 64 字符的字符串"""
+    if raw is None or raw == "":
+        return None
+    if not isinstance(raw, str) or len(raw) > MAX_CHANNEL_ID_LENGTH:
+        raise ChannelError(f"无效的 channel: {str(raw)[:MAX_CHANNEL_ID_LENGTH]}")
+    return raw
+
+
+class ChannelMux:
+    """连接内的会话表（按最近使用排序）及 SDK 客户端配额
+
+    factory(channel) 创建会话管理器；会话管理器需提供 client、current_task、client_busy()、hibernate()，
+    在 client_slot(manager) 内取得客户端，并在轮次结束后调用 notify_idle()。
+    """
+
+    def __init__(self, factory: Callable[[Optional[str]], Any], max_channels: int = 8, max_live_clients: int = 3):
+        self.factory = factory
+        self.max_channels = max(1, max_channels)
+        self.max_live_clients = max(1, max_live_clients)
+        self._channels: "OrderedDict[Optional[str], Any]" = OrderedDict()
+        self._idle = asyncio.Event()
+        self._reserved: Set[Any] = set()  # 已获准、正在取得客户端的会话
+        self.hibernations = 0
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def __contains__(self, channel: Optional[str]) -> bool:
+        return channel in self._channels
+
+    def items(self) -> Iterator[Tuple[Optional[str], Any]]:
+        return iter(list(self._channels.items()))
+
+    def get(self, channel: Optional[str]) -> Any:
+        """取出（必要时创建）会话，并标记为最近使用"""
+        manager = self._channels.get(channel)
+        if manager is None:
+            if len(self._channels) >= self.max_channels:
+                raise ChannelError(f"会话数已达上限（{self.max_channels} 个），请先关闭不用的会话")
+            manager = self._channels[channel] = self.factory(channel)
+            logger.info(f"Opened channel {channel!r} ({len(self._channels)} on connection)")
+        else:
+            self._channels.move_to_end(channel)
+        return manager
+
+    @staticmethod
+    def _busy(manager: Any) -> bool:
+        task = manager.current_task
+        return task is not None and not task.done()
+
+    def live_clients(self) -> int:
+        return sum(1 for manager in self._channels.values() if manager.client is not None)
+
+    def notify_idle(self):
+        self._idle.set()
+
+    @contextlib.asynccontextmanager
+    async def client_slot(self, requester: Any) -> AsyncIterator[None]:
+        """requester 在此范围内取得客户端；已获准的会话计入配额，避免并发初始化时超出上限"""
+        await self._make_room(requester)
+        self._reserved.add(requester)
+        try:
+            yield
+        finally:
+            self._reserved.discard(requester)
+
+    async def _make_room(self, requester: Any):
+        """已达上限时让最久未使用的空闲会话休眠，没有空闲会话时等待"""
+        while True:
+            live = [m for m in self._channels.values()
+                    if m is not requester and (m.client is not None or m in self._reserved)]
+            if len(live) < self.max_live_clients:
+                return
+            # OrderedDict 按最近使用排序，第一个空闲会话即最久未使用
+            victim = next((m for m in live if m.client is not None and not self._busy(m) and not m.client_busy()),
+                          None)
+            if victim is not None:
+                self.hibernations += 1
+                await victim.hibernate()
+                continue
+            self._idle.clear()
+            await self._idle.wait()
+
+    async def close(self, channel: Optional[str], grace: float = 0.0):
+        """关闭会话并释放客户端
+
+        进行中的轮次最多再运行 grace 秒，仍未结束则取消；轮次结束后才释放客户端，
+        避免客户端被归还或断开时轮次仍在读取它的消息流。
+        """
+        manager = self._channels.pop(channel, None)
+        if manager is not None:
+            task = manager.current_task
+            if self._busy(manager):
+                if grace > 0:
+                    await asyncio.wait({task}, timeout=grace)
+                if not task.done():
+                    logger.info(f"Cancelling turn in progress on channel {channel!r}")
+                    task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+            await manager.close()
+        self.notify_idle()
+
+    async def close_all(self, grace: float = 0.0):
+        """连接断开：关闭所有会话。进行中的轮次最多再运行 grace 秒（输出照常写入会话记录），超时则取消"""
+        channels = [channel for channel, _ in self.items()]
+        results = await asyncio.gather(*(self.close(channel, grace) for channel in channels), return_exceptions=True)
+        for channel, result in zip(channels, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error closing channel {channel!r}: {result}")
@@ -0,0 +1,261 @@
+"""
+ClaudeSDKClient 预热连接池
+进程级共享，提前完成 CLI 子进程启动和 MCP 握手，新会话直接取用已连接的客户端
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    """计算百分位数（样本为空时返回 0）"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _summarize(samples) -> Dict[str, Any]:
+    """耗时样本汇总（毫秒）"""
+    data = list(samples)
+    return {
+        "count": len(data),
+        "avg_ms": round(sum(data) / len(data) * 1000, 1) if data else 0.0,
+        "p50_ms": round(_percentile(data, 50) * 1000, 1),
+        "p95_ms": round(_percentile(data, 95) * 1000, 1),
+    }
+
+
+class ClientPool:
+    """已连接客户端的预热池
+
+    - min_size: 保持预热的空闲客户端数量，低于该值时后台补充
+    - max_size: 池管理的客户端总数上限（空闲 + 已借出），超出后 acquire 直接新建、归还时直接断开
+    - retry_delay / max_retry_delay: 预热失败后的重试间隔，连续失败时翻倍，直到 max_retry_delay
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        min_size: int = 2,
+        max_size: int = 8,
+        connect_timeout: float = 60.0,
+        disconnect_timeout: float = 3.0,
+        retry_delay: float = 1.0,
+        max_retry_delay: float = 60.0,
+        sample_size: int = 1000,
+    ):
+        self.client_factory = client_factory
+        self.min_size = max(0, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.connect_timeout = connect_timeout
+        self.disconnect_timeout = disconnect_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max(retry_delay, max_retry_delay)
+
+        self._idle: Deque[Any] = deque()
+        self._in_use = 0  # 已借出且计入池容量的客户端数量
+        self._connecting = 0  # 正在后台预热的客户端数量
+        self._pooled_ids = set()  # 计入池容量的已借出客户端
+        self._background: set = set()
+        self._closed = False
+        self._started = False
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.connect_failures = 0
+        self._consecutive_failures = 0  # 连续连接失败次数，决定预热重试的退避间隔
+        self._connect_times: Deque[float] = deque(maxlen=sample_size)
+        self._ttfb: Dict[str, Deque[float]] = {
+            "hit": deque(maxlen=sample_size),
+            "miss": deque(maxlen=sample_size),
+        }
+        self._interrupt_ready: Deque[float] = deque(maxlen=sample_size)
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    @property
+    def live_count(self) -> int:
+        """池管理的客户端总数（空闲 + 已借出）"""
+        return len(self._idle) + self._in_use
+
+    async def start(self):
+        """启动连接池，在后台预热到 min_size"""
+        if self._started:
+            return
+        self._started = True
+        self._closed = False
+        logger.info(f"Starting client pool (min={self.min_size}, max={self.max_size})")
+        self._replenish()
+
+    async def acquire(self) -> Tuple[Any, bool]:
+        """借出一个已连接的客户端，返回 (client, 是否命中预热池)
+
+        池为空时现场连接（记为 miss）。
+        """
+        if self._idle:
+            client = self._idle.popleft()
+            self._in_use += 1
+            self._pooled_ids.add(id(client))
+            self.hits += 1
+            self._replenish()
+            logger.info(f"Client pool hit (idle={len(self._idle)}, in_use={self._in_use})")
+            return client, True
+
+        self.misses += 1
+        pooled = self.live_count + self._connecting < self.max_size
+        if pooled:
+            # 先占位，避免并发 acquire 超出上限
+            self._in_use += 1
+        try:
+            client = await self._connect()
+        except BaseException:
+            if pooled:
+                self._in_use -= 1
+            raise
+        if pooled:
+            self._pooled_ids.add(id(client))
+        self._replenish()
+        logger.info(f"Client pool miss (idle={len(self._idle)}, in_use={self._in_use})")
+        return client, False
+
+    async def release(self, client: Any, reusable: bool = False):
+        """归还客户端
+
+        reusable=True 表示客户端尚未发送过任何查询，可以放回池中复用；
+        否则客户端持有对话上下文，在后台断开并补充新的预热客户端。
+        不是由池借出的客户端（如恢复会话的专用客户端）即使 reusable=True 也直接断开。
+        """
+        if client is None:
+            return
+        pooled = id(client) in self._pooled_ids
+        if pooled:
+            self._pooled_ids.discard(id(client))
+            self._in_use -= 1
+
+        if reusable and pooled and not self._closed and self.live_count < self.max_size:
+            self._idle.append(client)
+            return
+
+        self._spawn(self._disconnect(client))
+        self._replenish()
+
+    def record_first_byte(self, seconds: float, hit: bool):
+        """记录从发送查询到收到第一条响应的耗时"""
+        self._ttfb["hit" if hit else "miss"].append(seconds)
+
+    def record_interrupt_ready(self, seconds: float):
+        """记录从收到中断到备用客户端可用的耗时"""
+        self._interrupt_ready.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息，用于根据峰值连接速率调整池大小"""
+        total = self.hits + self.misses
+        ttfb = {kind: _summarize(samples) for kind, samples in self._ttfb.items()}
+        connect_times = list(self._connect_times)
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "connecting": self._connecting,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "connect_failures": self.connect_failures,
+            "connect_avg_ms": round(sum(connect_times) / len(connect_times) * 1000, 1) if connect_times else 0.0,
+            "time_to_first_byte": ttfb,
+            "interrupt_to_ready": _summarize(self._interrupt_ready),
+        }
+
+    async def close(self):
+        """关闭连接池，断开所有空闲客户端"""
+        self._closed = True
+        self._started = False
+        idle = list(self._idle)
+        self._idle.clear()
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*(self._disconnect(client) for client in idle), return_exceptions=True)
+        logger.info(f"Client pool closed ({len(idle)} idle clients disconnected)")
+
+    async def _connect(self) -> Any:
+        """创建并连接一个新客户端"""
+        start = time.perf_counter()
+        client = self.client_factory()
+        try:
+            await asyncio.wait_for(client.connect(), timeout=self.connect_timeout)
+        except BaseException:
+            self.connect_failures += 1
+            self._consecutive_failures += 1
+            # 连接失败或超时时 CLI 子进程可能已经启动，在后台断开，避免残留
+            self._spawn(self._disconnect(client))
+            raise
+        self._consecutive_failures = 0
+        self._connect_times.append(time.perf_counter() - start)
+        return client
+
+    async def _disconnect(self, client: Any):
+        """带超时地断开客户端"""
+        try:
+            await asyncio.wait_for(client.disconnect(), timeout=self.disconnect_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Pooled client disconnect timed out")
+        except Exception as e:
+            logger.warning(f"Error disconnecting pooled client: {e}")
+
+    def _retry_backoff(self) -> float:
+        """连续失败时重试间隔翻倍"""
+        exponent = min(max(self._consecutive_failures - 1, 0), 16)
+        return min(self.retry_delay * (2 ** exponent), self.max_retry_delay)
+
+    def _replenish(self):
+        """后台补充空闲客户端到 min_size"""
+        if self._closed or not self._started:
+            return
+        while (
+            len(self._idle) + self._connecting < self.min_size
+            and self.live_count + self._connecting < self.max_size
+        ):
+            self._connecting += 1
+            self._spawn(self._warm_one())
+
+    async def _warm_one(self):
+        """预热一个客户端并放入空闲队列；失败时按退避间隔重试，直到成功或连接池关闭"""
+        try:
+            while True:
+                try:
+                    client = await self._connect()
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    delay = self._retry_backoff()
+                    logger.error(f"Failed to pre-warm client, retrying in {delay:.1f}s: {e}")
+                    await asyncio.sleep(delay)
+                    if self._closed or not self._started:
+                        return
+        finally:
+            self._connecting -= 1
+
+        if self._closed:
+            await self._disconnect(client)
+            return
+        self._idle.append(client)
+        logger.info(f"Pre-warmed client ready (idle={len(self._idle)})")
+
+    def _spawn(self, coro):
+        """创建后台任务并保持引用，防止被垃圾回收"""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
@@ -0,0 +1,200 @@
+"""
+自定义斜杠命令注册表
+进程级共享，启动时在线程中异步加载 .claude/commands/，按文件 mtime 增量刷新，
+命令模板预编译为单次替换
+"""
+
+import asyncio
+import logging
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# 参数占位符：$ARGUMENTS 或 $1、$2 ... $N
+_PLACEHOLDER_RE = re.compile(r"\$(ARGUMENTS|\d+)")
+
+
+class CommandTemplate:
+    """预编译的命令模板
+
+    加载时把内容切分为字面量片段和占位符，展开时一次拼接完成，
+    避免逐个 str.replace 的多次扫描（也避免 $1 误伤 $10、参数中的 $2 被二次替换）。
+    """
+
+    __slots__ = ("source", "_parts", "_has_placeholders")
+
+    def __init__(self, source: str):
+        self.source = source
+        # 片段为 str（字面量）或 int（位置参数，0 表示 $ARGUMENTS）
+        self._parts: List[Union[str, int]] = []
+        pos = 0
+        for match in _PLACEHOLDER_RE.finditer(source):
+            if match.start() > pos:
+                self._parts.append(source[pos:match.start()])
+            token = match.group(1)
+            self._parts.append(0 if token == "ARGUMENTS" else int(token))
+            pos = match.end()
+        if pos < len(source):
+            self._parts.append(source[pos:])
+        self._has_placeholders = any(isinstance(part, int) for part in self._parts)
+
+    def render(self, args: str) -> str:
+        """展开模板
+
+        与原有行为一致：没有参数时 $N 原样保留，超出参数个数的 $N 也原样保留，
+        $ARGUMENTS 总是替换为完整参数字符串。
+        """
+        if not self._has_placeholders:
+            return self.source
+        arg_list = args.split() if args else []
+        out = []
+        for part in self._parts:
+            if isinstance(part, str):
+                out.append(part)
+            elif part == 0:
+                out.append(args)
+            elif part <= len(arg_list):
+                out.append(arg_list[part - 1])
+            else:
+                out.append(f"${part}")
+        return "".join(out)
+
+
+def parse_command_file(md_file: Path) -> Dict[str, Any]:
+    """读取并解析单个命令文件（YAML 前言 + 正文）"""
+    content = md_file.read_text(encoding="utf-8")
+
+    metadata = {}
+    command_content = content
+
+    if content.startswith("---"):
+        parts = content.split("---", 2)
+        if len(parts) >= 3:
+            try:
+                metadata = yaml.safe_load(parts[1]) or {}
+                command_content = parts[2].strip()
+            except Exception as e:
+                logger.warning(f"Failed to parse YAML in {md_file}: {e}")
+
+    return {
+        "name": md_file.stem,
+        "content": command_content,
+        "metadata": metadata,
+        "file_path": str(md_file),
+        "template": CommandTemplate(command_content),
+    }
+
+
+class CommandRegistry:
+    """进程级自定义命令注册表
+
+    - 命令表整体替换（copy-on-write），读取方无需加锁
+    - 后台按间隔检查目录和文件 mtime，只重新解析变化的文件
+    - derived() 缓存基于命令表计算的结果（命令列表、/help 文本），命令表变化时自动失效
+    """
+
+    def __init__(self, commands_dir: Path, poll_interval: float = 2.0):
+        self.commands_dir = Path(commands_dir)
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._commands: Dict[str, Dict[str, Any]] = {}
+        self._mtimes: Dict[Path, Tuple[float, int]] = {}
+        self._derived: Dict[str, Tuple[int, Any]] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+        self._reload_lock = asyncio.Lock()
+
+    @property
+    def commands(self) -> Dict[str, Dict[str, Any]]:
+        """当前命令表（只读快照）"""
+        return self._commands
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._commands.get(name)
+
+    def derived(self, key: str, builder: Callable[[Dict[str, Dict[str, Any]]], Any]) -> Any:
+        """获取基于命令表的派生结果，命令表未变化时直接返回缓存"""
+        cached = self._derived.get(key)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        value = builder(self._commands)
+        self._derived[key] = (self.version, value)
+        return value
+
+    async def start(self):
+        """首次加载并启动后台 mtime 检查"""
+        await self.reload()
+        if self.poll_interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def reload(self) -> bool:
+        """在线程中扫描目录，有变化时替换命令表，返回是否发生变化"""
+        async with self._reload_lock:
+            result = await asyncio.to_thread(self._scan, dict(self._mtimes), self._commands)
+            if result is None:
+                return False
+            self._commands, self._mtimes = result
+            self.version += 1
+            logger.info(f"Custom commands reloaded: {len(self._commands)} commands (version {self.version})")
+            return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to reload custom commands: {e}")
+
+    def _scan(
+        self,
+        old_mtimes: Dict[Path, Tuple[float, int]],
+        old_commands: Dict[str, Dict[str, Any]],
+    ) -> Optional[Tuple[Dict[str, Dict[str, Any]], Dict[Path, Tuple[float, int]]]]:
+        """扫描命令目录（在工作线程中执行），无变化时返回 None"""
+        if not self.commands_dir.exists():
+            if self.version == 0:
+                logger.info("No custom commands directory found")
+            elif not old_mtimes:
+                return None
+            return {}, {}
+
+        mtimes: Dict[Path, Tuple[float, int]] = {}
+        for md_file in self.commands_dir.rglob("*.md"):
+            try:
+                stat = md_file.stat()
+            except OSError:
+                continue
+            mtimes[md_file] = (stat.st_mtime, stat.st_size)
+
+        if mtimes == old_mtimes and self.version > 0:
+            return None
+
+        by_path = {cmd["file_path"]: cmd for cmd in old_commands.values()}
+        commands: Dict[str, Dict[str, Any]] = {}
+        for md_file in sorted(mtimes):
+            cached = by_path.get(str(md_file))
+            if cached is not None and old_mtimes.get(md_file) == mtimes[md_file]:
+                commands[cached["name"]] = cached
+                continue
+            try:
+                commands[md_file.stem] = parse_command_file(md_file)
+                logger.info(f"Loaded custom command: /{md_file.stem}")
+            except Exception as e:
+                logger.error(f"Failed to load command from {md_file}: {e}")
+
+        return commands, mtimes
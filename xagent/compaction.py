@@ -0,0 +1,90 @@
+"""
+对话压缩（/compact）
+让当前会话生成交接摘要（保留关键决策、选定的表和 Query Contract，丢弃可重新查询的表结构和样例数据），
+再用摘要初始化一个全新的 SDK 会话继续对话；压缩前后的上下文 token 数取自 usage
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+from claude_agent_sdk import AssistantMessage, ResultMessage, SystemMessage, TextBlock
+
+COMPACT_PROMPT = """请把到目前为止的对话压缩成一份交接摘要，供一个全新的会话继续工作。只输出摘要本身，不要调用任何工具。
+
+必须保留：
+1. 用户的目标，以及尚未解决的问题
+2. 已做出的关键决策及理由（口径、过滤条件、去重、时间语义等）
+3. 已选定的表（库名.表名、分层）及用到的关键字段；放弃的候选表及放弃原因
+4. 已确定的 Query Contract（metric、dims、grain_keys、time_field / event_type / timezone、filters、primary_asset / fallback_asset、assumptions），逐字段原样保留
+5. 已生成或验证过的 SQL（只保留最终版本）
+6. 下一步计划
+
+不要保留：完整的表结构、样例数据行、血缘明细、字段枚举分布等可以重新查询的原始工具结果。"""
+
+SEED_TEMPLATE = """以下是此前对话的压缩摘要，原会话的上下文已清空。请基于摘要继续后续工作；现在只需用一两句话确认你已了解当前进度，不要调用工具。
+
+<conversation_summary>
+{summary}
+</conversation_summary>"""
+
+# 计入上下文大小的 usage 字段
+CONTEXT_USAGE_FIELDS = ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+
+def context_tokens(usage: Optional[Dict[str, Any]]) -> Optional[int]:
+    """一次模型调用的上下文 token 数（输入 + 缓存读取 + 缓存写入）"""
+    if not usage:
+        return None
+    return sum(int(usage.get(field) or 0) for field in CONTEXT_USAGE_FIELDS)
+
+
+def build_seed_prompt(summary: str) -> str:
+    return SEED_TEMPLATE.format(summary=summary)
+
+
+async def collect_response(client: Any, prompt: str) -> Tuple[str, Optional[ResultMessage], Optional[Dict[str, Any]]]:
+    """发送一条内部查询并收集完整回复（不转发给前端）
+
+    返回 (文本, ResultMessage, 最后一次模型调用的 usage)；AssistantMessage 没有 usage 时退化为 ResultMessage.usage。
+    """
+    await client.query(prompt)
+    texts = []
+    usage = None
+    result = None
+    async for msg in client.receive_response():
+        if isinstance(msg, AssistantMessage):
+            texts.extend(block.text for block in msg.content if isinstance(block, TextBlock))
+            if msg.usage:
+                usage = msg.usage
+        elif isinstance(msg, ResultMessage):
+            result = msg
+    if usage is None and result is not None:
+        usage = result.usage
+    return "\n\n".join(texts).strip(), result, usage
+
+
+async def compact_in_place(client: Any) -> Tuple[Optional[int], Optional[ResultMessage]]:
+    """让 SDK 原地压缩当前会话（内置 /compact），会话 id 不变
+
+    返回 (压缩前的上下文 token 数, ResultMessage)；压缩后的大小要到下一轮的 usage 才能知道。
+    """
+    await client.query("/compact")
+    pre_tokens = None
+    result = None
+    async for msg in client.receive_response():
+        if isinstance(msg, SystemMessage) and msg.subtype == "compact_boundary":
+            pre_tokens = (msg.data.get("compact_metadata") or {}).get("pre_tokens")
+        elif isinstance(msg, ResultMessage):
+            result = msg
+    return pre_tokens, result
+
+
+def format_report(before: Optional[int], after: Optional[int], summary: str) -> str:
+    """压缩结果（Markdown）"""
+    lines = ["✅ **对话已压缩**，后续对话在新会话中基于以下摘要继续。", ""]
+    if before is not None and after is not None:
+        saved = f"（减少 {1 - after / before:.0%}）" if before > 0 else ""
+        lines.append(f"上下文 token：**{before:,}** → **{after:,}**{saved}")
+    else:
+        lines.append("上下文 token：未获取到 usage")
+    lines += ["", "---", "", summary]
+    return "\n".join(lines)
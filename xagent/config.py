@@ -0,0 +1,46 @@
+"""
+环境变量配置读取
+所有可调参数统一使用 XAGENT_ 前缀，读取失败时回退到默认值
+"""
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def env_str(name: str, default: str = "") -> str:
+    """读取字符串配置"""
+    return os.getenv(name, default)
+
+
+def env_int(name: str, default: int) -> int:
+    """读取整数配置"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Invalid integer for {name}: {value!r}, using {default}")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """读取浮点数配置"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid float for {name}: {value!r}, using {default}")
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """读取布尔配置（1/true/yes/on 视为开启）"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,59 @@
+"""
+后续消息队列
+轮次进行中到达的新消息不再取消当前轮次：
+- queue：排在当前轮次之后依次发送
+- steer：立即写入正在运行的 SDK 会话，由 CLI 在当前轮次中接收（每条写入的消息各自对应一个 ResultMessage）
+只有用户显式中断才取消当前轮次，未发送的排队消息随中断一并丢弃并退回前端
+"""
+
+import time
+from collections import deque
+from typing import Deque, List, Optional
+
+QUEUE = "queue"
+STEER = "steer"
+MODES = (QUEUE, STEER)
+
+
+class FollowUp:
+    """一条排队的后续消息"""
+
+    __slots__ = ("message", "enqueued_at")
+
+    def __init__(self, message: str):
+        self.message = message
+        self.enqueued_at = time.perf_counter()
+
+    def waited(self) -> float:
+        return time.perf_counter() - self.enqueued_at
+
+
+class FollowUpQueue:
+    """单个会话的待发送消息（FIFO，超过 max_pending 时拒绝入队）"""
+
+    def __init__(self, max_pending: int = 10):
+        self.max_pending = max_pending
+        self._pending: Deque[FollowUp] = deque()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def push(self, message: str) -> bool:
+        if len(self._pending) >= self.max_pending:
+            return False
+        self._pending.append(FollowUp(message))
+        return True
+
+    def pop(self) -> Optional[FollowUp]:
+        return self._pending.popleft() if self._pending else None
+
+    def clear(self) -> List[str]:
+        """清空队列，返回未发送的消息"""
+        messages = [follow_up.message for follow_up in self._pending]
+        self._pending.clear()
+        return messages
+
+
+def parse_mode(raw: Optional[str]) -> str:
+    """前端 message 帧的 mode 字段，缺省或未知时按 queue 处理"""
+    return raw if raw in MODES else QUEUE
@@ -0,0 +1,337 @@
+"""
+候选表可用性判定（四段式 Gate）
+Schema Gate（静态：粒度键、时间分区字段）→ Query Gate（最小 SQL：分区强制 + limit 采样，实际执行）→
+Shape Gate（行数、空值率、粒度基数）→ Invariant Gate（取值范围、与已知基准对账），遇到第一个失败即停止，
+每个 Gate 返回结构化证据。多个候选表在线程池中并发判定，总耗时接近最慢的一个；
+执行引擎可替换，本地以 SQLite + 样例数据代替线上引擎
+"""
+
+import abc
+import asyncio
+import dataclasses
+import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from xagent.sql_skeletons import SqlSkeletonError, check_expr
+
+logger = logging.getLogger(__name__)
+
+SCHEMA, QUERY, SHAPE, INVARIANT = "schema", "query", "shape", "invariant"
+GATES = (SCHEMA, QUERY, SHAPE, INVARIANT)
+
+_IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_TABLE_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*){0,2}$")
+
+
+class GateError(Exception):
+    """引擎执行失败（表不存在、SQL 错误、超时等）"""
+
+
+@dataclasses.dataclass
+class Candidate:
+    """一个候选表及其查询契约
+
+    metrics 为 别名 -> 聚合表达式（如 {"cost": "SUM(cost_amt)"}）；ranges 为 别名 -> (下限, 上限)，
+    None 表示不限（如 CTR ≤ 1、消耗 ≥ 0）；baselines 为 别名 -> 分区内的已知基准值，按 tolerance 相对误差对账。
+    """
+
+    table: str
+    grain_keys: List[str]
+    time_field: str
+    partition: str
+    metrics: Dict[str, str] = dataclasses.field(default_factory=dict)
+    filters: List[str] = dataclasses.field(default_factory=list)
+    sample_limit: int = 1000
+    min_rows: int = 1
+    max_null_rate: float = 0.1
+    grain_range: Optional[Tuple[Optional[int], Optional[int]]] = None  # 粒度基数的合理范围（数量级）
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = dataclasses.field(default_factory=dict)
+    baselines: Dict[str, float] = dataclasses.field(default_factory=dict)
+    tolerance: float = 0.01
+
+
+@dataclasses.dataclass
+class GateResult:
+    gate: str
+    passed: bool
+    elapsed_ms: float
+    reason: str = ""
+    evidence: Dict[str, Any] = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class Verdict:
+    """一个候选表的判定结果：passed 为四个 Gate 全部通过，failed_gate 为第一个失败的 Gate"""
+
+    table: str
+    passed: bool
+    failed_gate: Optional[str]
+    elapsed_ms: float
+    gates: List[GateResult]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+class GateEngine(abc.ABC):
+    """Gate 执行引擎接口（在工作线程中调用，实现需线程安全）
+
+    columns(table) 返回 字段名 -> 类型（表不存在时返回 None）；execute 执行只读 SQL，
+    参数占位符为 ?，返回 (列名, 行)；超时或出错时抛出 GateError。
+    未实现这两个方法的引擎在创建时即报错，而不是在线程池中判定到一半才失败。
+    """
+
+    time_types: Sequence[str] = ()  # 时间分区字段允许的类型（小写，前缀匹配），为空时不检查
+
+    @abc.abstractmethod
+    def columns(self, table: str) -> Optional[Dict[str, str]]:
+        ...
+
+    @abc.abstractmethod
+    def execute(self, sql: str, params: Sequence[Any] = (), timeout: float = 30.0) -> Tuple[List[str], List[tuple]]:
+        ...
+
+    def table_ref(self, table: str) -> str:
+        return table
+
+
+class SqliteEngine(GateEngine):
+    """本地 SQLite 引擎：每次调用单独打开只读连接，可在多个线程中并发执行
+
+    表名带库名前缀（如 bi.dws_x）时整体作为一个带引号的表名，与样例数据的建表方式一致。
+    """
+
+    time_types = ("text", "date", "varchar", "char", "string")
+
+    def __init__(self, database: Path):
+        self.database = Path(database)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.database}?mode=ro", uri=True, check_same_thread=False)
+
+    def table_ref(self, table: str) -> str:
+        return '"' + table.replace('"', '""') + '"'
+
+    def columns(self, table: str) -> Optional[Dict[str, str]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"PRAGMA table_info({self.table_ref(table)})").fetchall()
+        except sqlite3.Error as e:
+            raise GateError(str(e))
+        finally:
+            conn.close()
+        return {row[1]: (row[2] or "").lower() for row in rows} or None
+
+    def execute(self, sql: str, params: Sequence[Any] = (), timeout: float = 30.0) -> Tuple[List[str], List[tuple]]:
+        conn = self._connect()
+        deadline = time.monotonic() + timeout
+        # 每执行若干条虚拟机指令检查一次截止时间，超时后中断查询
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        try:
+            cursor = conn.execute(sql, tuple(params))
+            rows = cursor.fetchall()
+            return [d[0] for d in cursor.description or ()], rows
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline:
+                raise GateError(f"查询超时（{timeout}s）")
+            raise GateError(str(e))
+        except sqlite3.Error as e:
+            raise GateError(str(e))
+        finally:
+            conn.close()
+
+
+def load_fixtures(database: Path, tables: Dict[str, Dict[str, Any]]):
+    """把样例数据写入 SQLite：表名 -> {"columns": {字段: 类型}, "rows": [[...], ...]}"""
+    conn = sqlite3.connect(database)
+    try:
+        for table, spec in tables.items():
+            ref = '"' + table.replace('"', '""') + '"'
+            columns = spec["columns"]
+            conn.execute(f"DROP TABLE IF EXISTS {ref}")
+            conn.execute(f"CREATE TABLE {ref} ({', '.join(f'{name} {kind}' for name, kind in columns.items())})")
+            placeholders = ", ".join("?" for _ in columns)
+            conn.executemany(f"INSERT INTO {ref} VALUES ({placeholders})", spec.get("rows", []))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class GateExecutor:
+    """四段式 Gate 判定器
+
+    evaluate() 在线程池中并发判定全部候选表，结果按输入顺序返回；单个候选内的 Gate 顺序执行，遇到失败即停止。
+    """
+
+    def __init__(self, engine: GateEngine, max_workers: int = 8, query_timeout: float = 30.0):
+        self.engine = engine
+        self.query_timeout = query_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="gate")
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.failures: Dict[str, int] = {}  # 失败的 Gate -> 次数
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def evaluate(self, candidates: Sequence[Candidate]) -> List[Verdict]:
+        futures = [self._pool.submit(self.judge, candidate) for candidate in candidates]
+        return [future.result() for future in futures]
+
+    async def evaluate_async(self, candidates: Sequence[Candidate]) -> List[Verdict]:
+        """在事件循环中使用：不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        futures = [loop.run_in_executor(self._pool, self.judge, candidate) for candidate in candidates]
+        return list(await asyncio.gather(*futures))
+
+    def judge(self, candidate: Candidate) -> Verdict:
+        """依次执行四个 Gate，第一个失败即停止"""
+        start = time.perf_counter()
+        results: List[GateResult] = []
+        context: Dict[str, Any] = {}
+        for gate, check in ((SCHEMA, self._schema_gate), (QUERY, self._query_gate),
+                            (SHAPE, self._shape_gate), (INVARIANT, self._invariant_gate)):
+            gate_start = time.perf_counter()
+            try:
+                passed, reason, evidence = check(candidate, context)
+            except GateError as e:
+                passed, reason, evidence = False, str(e), {}
+            except Exception as e:
+                logger.error(f"Gate {gate} crashed for {candidate.table}: {e}")
+                passed, reason, evidence = False, f"判定出错: {e}", {}
+            results.append(GateResult(gate, passed, round((time.perf_counter() - gate_start) * 1000, 2),
+                                      reason, evidence))
+            if not passed:
+                break
+        failed = next((r.gate for r in results if not r.passed), None)
+        with self._lock:
+            self.evaluated += 1
+            if failed is not None:
+                self.failures[failed] = self.failures.get(failed, 0) + 1
+        return Verdict(candidate.table, failed is None, failed,
+                       round((time.perf_counter() - start) * 1000, 2), results)
+
+    # ---------- 四个 Gate ----------
+
+    def _schema_gate(self, candidate: Candidate, context: Dict[str, Any]):
+        """静态：表存在，粒度键和时间分区字段齐备且类型一致，指标和过滤条件是合法的单个表达式"""
+        if not _TABLE_RE.match(candidate.table):
+            return False, f"表名无效: {candidate.table}", {}
+        for name in [*candidate.grain_keys, candidate.time_field, *candidate.metrics]:
+            if not _IDENT_RE.match(name):
+                return False, f"字段名或指标别名无效: {name}", {}
+        if not candidate.grain_keys:
+            return False, "缺少粒度键", {}
+        # 指标和过滤条件与 SQL 骨架填空使用同样的表达式校验
+        try:
+            for alias, expr in candidate.metrics.items():
+                check_expr(expr, f"metrics.{alias}")
+            for i, condition in enumerate(candidate.filters):
+                check_expr(condition, f"filters[{i}]")
+        except SqlSkeletonError as e:
+            return False, str(e), {}
+        columns = self.engine.columns(candidate.table)
+        if columns is None:
+            return False, "表不存在", {}
+        required = [*candidate.grain_keys, candidate.time_field]
+        missing = [name for name in required if name not in columns]
+        evidence = {
+            "columns": len(columns),
+            "grain_keys": {name: columns.get(name) for name in candidate.grain_keys},
+            "time_field": {candidate.time_field: columns.get(candidate.time_field)},
+        }
+        if missing:
+            return False, f"缺少字段: {', '.join(missing)}", {**evidence, "missing": missing}
+        time_type = columns[candidate.time_field]
+        if self.engine.time_types and not time_type.startswith(tuple(self.engine.time_types)):
+            return False, f"时间分区字段类型不一致: {candidate.time_field} {time_type}", evidence
+        context["columns"] = columns
+        return True, "", evidence
+
+    def _query_gate(self, candidate: Candidate, context: Dict[str, Any]):
+        """可运行：强制分区、按粒度键聚合、limit 采样的最小 SQL"""
+        keys = ", ".join(candidate.grain_keys)
+        select = ", ".join([keys] + [f"{expr} AS {alias}" for alias, expr in candidate.metrics.items()])
+        sql = (f"SELECT {select} FROM {self.engine.table_ref(candidate.table)} "
+               f"WHERE {self._where(candidate)} GROUP BY {keys} LIMIT {int(candidate.sample_limit)}")
+        evidence: Dict[str, Any] = {"sql": sql, "partition": candidate.partition}
+        start = time.perf_counter()
+        try:
+            names, rows = self.engine.execute(sql, (candidate.partition,), timeout=self.query_timeout)
+        except GateError as e:
+            return False, f"最小 SQL 执行失败: {e}", evidence
+        context["names"], context["rows"] = names, rows
+        evidence["rows"] = len(rows)
+        evidence["query_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return True, "", evidence
+
+    def _shape_gate(self, candidate: Candidate, context: Dict[str, Any]):
+        """形态：采样行数、各列空值率、分区内粒度基数"""
+        names, rows = context["names"], context["rows"]
+        null_rates = {
+            name: round(sum(1 for row in rows if row[i] is None) / len(rows), 4) if rows else 0.0
+            for i, name in enumerate(names)
+        }
+        evidence: Dict[str, Any] = {"rows": len(rows), "null_rates": null_rates}
+        if len(rows) < candidate.min_rows:
+            return False, f"分区 {candidate.partition} 采样行数 {len(rows)} 少于 {candidate.min_rows}", evidence
+        too_null = {name: rate for name, rate in null_rates.items() if rate > candidate.max_null_rate}
+        if too_null:
+            return False, f"空值率过高: {', '.join(f'{k}={v:.0%}' for k, v in too_null.items())}", evidence
+        if candidate.grain_range is not None:
+            low, high = candidate.grain_range
+            sql = (f"SELECT COUNT(*) FROM (SELECT 1 FROM {self.engine.table_ref(candidate.table)} "
+                   f"WHERE {self._where(candidate)} GROUP BY {', '.join(candidate.grain_keys)}) g")
+            _, count_rows = self.engine.execute(sql, (candidate.partition,), timeout=self.query_timeout)
+            grain_count = count_rows[0][0] if count_rows else 0
+            evidence["grain_count"] = grain_count
+            if (low is not None and grain_count < low) or (high is not None and grain_count > high):
+                return False, f"粒度基数 {grain_count} 不在合理范围 [{low}, {high}] 内", evidence
+        return True, "", evidence
+
+    def _invariant_gate(self, candidate: Candidate, context: Dict[str, Any]):
+        """不变量 / 对账：采样值在取值范围内；分区汇总值与已知基准的相对误差在容差内"""
+        names, rows = context["names"], context["rows"]
+        evidence: Dict[str, Any] = {}
+        for alias, (low, high) in candidate.ranges.items():
+            if alias not in names:
+                return False, f"取值范围引用了不存在的指标: {alias}", evidence
+            index = names.index(alias)
+            values = [row[index] for row in rows if row[index] is not None]
+            violations = [v for v in values if (low is not None and v < low) or (high is not None and v > high)]
+            evidence[alias] = {
+                "min": min(values) if values else None,
+                "max": max(values) if values else None,
+                "violations": len(violations),
+            }
+            if violations:
+                return False, f"{alias} 超出范围 [{low}, {high}]：{len(violations)} 行", evidence
+        if candidate.baselines:
+            unknown = [alias for alias in candidate.baselines if alias not in candidate.metrics]
+            if unknown:
+                return False, f"基准引用了不存在的指标: {', '.join(unknown)}", evidence
+            aliases = list(candidate.baselines)
+            sql = (f"SELECT {', '.join(f'{candidate.metrics[a]} AS {a}' for a in aliases)} "
+                   f"FROM {self.engine.table_ref(candidate.table)} WHERE {self._where(candidate)}")
+            _, totals = self.engine.execute(sql, (candidate.partition,), timeout=self.query_timeout)
+            for alias, actual in zip(aliases, totals[0] if totals else [None] * len(aliases)):
+                expected = candidate.baselines[alias]
+                error = None if actual is None else abs(actual - expected) / max(abs(expected), 1e-9)
+                evidence[f"{alias}_baseline"] = {"expected": expected, "actual": actual, "relative_error": error}
+                if error is None or error > candidate.tolerance:
+                    return False, f"{alias} 与基准不一致: {actual} vs {expected}", evidence
+        return True, "", evidence
+
+    @staticmethod
+    def _where(candidate: Candidate) -> str:
+        return " AND ".join([f"{candidate.time_field} = ?"] + [f"({f})" for f in candidate.filters])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"evaluated": self.evaluated, "failures": dict(self.failures)}
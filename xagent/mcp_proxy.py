@@ -0,0 +1,331 @@
+"""
+MCP 读穿缓存代理
+在本进程内暴露一个 MCP（Streamable HTTP）端点，转发到远端 MCP 服务器；
+表结构、枚举值、血缘等只读查询结果进入有界 LRU 缓存，按工具设置 TTL，
+相同参数的并发调用合并为一次上游请求
+"""
+
+import asyncio
+import ipaddress
+import json
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = "2025-03-26"
+
+# berserker-metadata 各工具的默认缓存时间（秒），0 表示不缓存
+DEFAULT_TOOL_TTLS: Dict[str, float] = {
+    "getInfo": 3600,
+    "getHiveTableSchema": 1800,
+    "getTableGenerationSql": 1800,
+    "getFieldEnumValues": 1800,
+    "getFieldEnumDistribution": 600,
+    "getTableUpstreamLineage": 1800,
+    "getTableDownstreamLineage": 1800,
+    "getJobUpstreamLineage": 1800,
+    "getJobDownstreamLineage": 1800,
+    "getTableDataDemo": 300,
+}
+
+
+def proxy_access_denied(client_host: Optional[str], authorization: Optional[str], token: str) -> Optional[int]:
+    """代理端点的访问检查：代理带着上游凭据转发，只接受本机且携带本进程令牌的请求
+
+    通过时返回 None，否则返回应答的 HTTP 状态码（非本机 403，令牌缺失或不符 401）。
+    """
+    try:
+        loopback = client_host == "localhost" or ipaddress.ip_address(client_host or "").is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        return 403
+    expected = f"Bearer {token}".encode()
+    if not authorization or not secrets.compare_digest(authorization.encode("utf-8", "replace"), expected):
+        return 401
+    return None
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    """解析 "tool=秒,tool=秒" 形式的 TTL 覆盖配置"""
+    ttls: Dict[str, float] = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, _, value = item.partition("=")
+        try:
+            ttls[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"Invalid TTL for {name.strip()}: {value!r}")
+    return ttls
+
+
+class McpError(Exception):
+    """上游返回的 JSON-RPC 错误"""
+
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class _SessionExpired(Exception):
+    """上游会话已失效，需要重新握手"""
+
+
+class McpHttpClient:
+    """最小化的 MCP Streamable HTTP 客户端（只用到 tools/list 和 tools/call）
+
+    所有会话共享一个上游连接；上游会话过期（404）时自动重新握手。
+    """
+
+    def __init__(self, url: str, timeout: float = 60.0, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.url = url
+        self._http = httpx.AsyncClient(timeout=timeout, transport=transport)
+        self._session_id: Optional[str] = None
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
+        self._next_id = 0
+
+    async def request(self, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """发送请求并返回 result，错误时抛出 McpError"""
+        await self._ensure_initialized()
+        try:
+            return await self._rpc(method, params)
+        except _SessionExpired:
+            self._initialized = False
+            await self._ensure_initialized()
+            return await self._rpc(method, params)
+
+    async def close(self):
+        await self._http.aclose()
+
+    async def _ensure_initialized(self):
+        if self._initialized:
+            return
+        async with self._init_lock:
+            if self._initialized:
+                return
+            self._session_id = None
+            await self._rpc("initialize", {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": {"name": "xagent-mcp-proxy", "version": "1.0"},
+            })
+            await self._post({"jsonrpc": "2.0", "method": "notifications/initialized"})
+            self._initialized = True
+            logger.info(f"Connected to upstream MCP server: {self.url}")
+
+    async def _rpc(self, method: str, params: Optional[Dict[str, Any]]) -> Any:
+        self._next_id += 1
+        request_id = self._next_id
+        message: Dict[str, Any] = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+
+        response = await self._post(message)
+        if method == "initialize" and "mcp-session-id" in response.headers:
+            self._session_id = response.headers["mcp-session-id"]
+
+        reply = self._find_reply(response, request_id)
+        if reply is None:
+            raise McpError(-32603, f"No response from upstream for {method}")
+        if "error" in reply:
+            error = reply["error"]
+            raise McpError(error.get("code", -32603), error.get("message", ""), error.get("data"))
+        return reply.get("result")
+
+    async def _post(self, message: Dict[str, Any]) -> httpx.Response:
+        headers = {"Accept": "application/json, text/event-stream"}
+        if self._session_id:
+            headers["Mcp-Session-Id"] = self._session_id
+        response = await self._http.post(self.url, json=message, headers=headers)
+        if response.status_code == 404 and self._session_id:
+            raise _SessionExpired()
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _find_reply(response: httpx.Response, request_id: int) -> Optional[Dict[str, Any]]:
+        content_type = response.headers.get("content-type", "")
+        if content_type.startswith("text/event-stream"):
+            # SSE 响应：逐个 data 事件查找对应 id 的回复
+            messages = []
+            for line in response.text.splitlines():
+                if line.startswith("data:"):
+                    try:
+                        messages.append(json.loads(line[5:].strip()))
+                    except ValueError:
+                        continue
+        else:
+            body = response.json() if response.content else None
+            messages = body if isinstance(body, list) else [body]
+        for message in messages:
+            if isinstance(message, dict) and message.get("id") == request_id:
+                return message
+        return None
+
+
+class ToolResultCache:
+    """有界 LRU 缓存 + 按工具 TTL + 并发请求合并"""
+
+    def __init__(self, max_entries: int = 2048, ttls: Optional[Dict[str, float]] = None, default_ttl: float = 0.0):
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.bypassed = 0
+
+    def ttl_for(self, tool: str) -> float:
+        return self.ttls.get(tool, self.default_ttl)
+
+    @staticmethod
+    def make_key(tool: str, arguments: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        return tool, json.dumps(arguments or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+    async def get_or_fetch(
+        self,
+        tool: str,
+        arguments: Optional[Dict[str, Any]],
+        fetch: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda result: True,
+    ) -> Any:
+        """命中缓存直接返回；同 key 已有请求在途时等待它的结果；否则调用 fetch"""
+        ttl = self.ttl_for(tool)
+        if ttl <= 0:
+            self.bypassed += 1
+            return await fetch()
+
+        key = self.make_key(tool, arguments)
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # 上游请求放在独立任务中：发起方被取消（如用户中断）时，其他等待者和缓存不受影响
+            task = asyncio.create_task(self._fetch(key, ttl, fetch, cacheable))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(
+        self,
+        key: Tuple[str, str],
+        ttl: float,
+        fetch: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool],
+    ) -> Any:
+        try:
+            value = await fetch()
+        finally:
+            self._inflight.pop(key, None)
+        if cacheable(value):
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
+
+
+class McpCachingProxy:
+    """MCP 服务端：处理来自 Claude CLI 的 JSON-RPC 消息，工具调用经缓存转发到上游"""
+
+    TOOLS_LIST_KEY = "tools/list"
+
+    def __init__(self, upstream: McpHttpClient, cache: ToolResultCache, name: str = "berserker-metadata",
+                 tools_list_ttl: float = 600.0):
+        self.upstream = upstream
+        self.cache = cache
+        self.name = name
+        self.cache.ttls.setdefault(self.TOOLS_LIST_KEY, tools_list_ttl)
+
+    async def handle(self, payload: Any) -> Optional[Any]:
+        """处理单个或批量 JSON-RPC 消息，全部为通知时返回 None"""
+        if isinstance(payload, list):
+            replies = [reply for reply in await asyncio.gather(*(self._handle_one(m) for m in payload)) if reply]
+            return replies or None
+        return await self._handle_one(payload)
+
+    async def close(self):
+        await self.upstream.close()
+
+    async def _handle_one(self, message: Any) -> Optional[Dict[str, Any]]:
+        if not isinstance(message, dict) or "method" not in message:
+            return None  # 客户端发来的响应或无效消息，忽略
+        request_id = message.get("id")
+        if request_id is None:
+            return None  # 通知无需回复
+
+        method = message["method"]
+        params = message.get("params") or {}
+        try:
+            if method == "initialize":
+                result = {
+                    "protocolVersion": params.get("protocolVersion", PROTOCOL_VERSION),
+                    "capabilities": {"tools": {}},
+                    "serverInfo": {"name": f"{self.name}-proxy", "version": "1.0"},
+                }
+            elif method == "ping":
+                result = {}
+            elif method == "tools/list":
+                result = await self.cache.get_or_fetch(
+                    self.TOOLS_LIST_KEY, params,
+                    lambda: self.upstream.request("tools/list", params or None),
+                )
+            elif method == "tools/call":
+                tool = params.get("name", "")
+                arguments = params.get("arguments") or {}
+                result = await self.cache.get_or_fetch(
+                    tool, arguments,
+                    lambda: self.upstream.request("tools/call", {"name": tool, "arguments": arguments}),
+                    cacheable=lambda value: not (isinstance(value, dict) and value.get("isError")),
+                )
+            else:
+                result = await self.upstream.request(method, params or None)
+        except McpError as e:
+            error: Dict[str, Any] = {"code": e.code, "message": e.message}
+            if e.data is not None:
+                error["data"] = e.data
+            return {"jsonrpc": "2.0", "id": request_id, "error": error}
+        except Exception as e:
+            logger.error(f"MCP proxy {method} failed: {e}")
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32603, "message": str(e)}}
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
@@ -0,0 +1,328 @@
+"""
+Prometheus 指标
+不依赖 prometheus_client 的最小实现：计数器、仪表、直方图（支持标签）和抓取时计算的回调指标，
+按 Prometheus 文本格式输出；热路径上的记录只是字典查找和浮点加法
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# 默认直方图桶（秒）：覆盖毫秒级工具调用到分钟级的对话轮次
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """可增可减的仪表"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """累计分桶直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数..., +Inf 计数], 总和
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        # 只记录所在的桶，输出时再累加，observe 为 O(log n)
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """抓取时才计算的指标（如连接池当前客户端数），不占用热路径"""
+
+    def __init__(self, name: str, documentation: str, kind: str,
+                 callback: Callable[[], Dict[LabelValues, float]], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        lines = self.header()
+        for key, value in sorted(self.callback().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, kind: str,
+                 callback: Callable[[], Dict[LabelValues, float]], labelnames: Sequence[str] = ()) -> CallbackMetric:
+        """注册回调指标；同名指标重复注册时替换回调"""
+        metric = CallbackMetric(name, documentation, kind, callback, labelnames)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                lines.append(f"# {metric.name} collection failed: {_escape(str(e))}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# ---------- 对话服务指标 ----------
+
+time_to_first_token = registry.histogram(
+    "xagent_time_to_first_token_seconds",
+    "Time from sending a query to the first assistant message",
+)
+turn_duration = registry.histogram(
+    "xagent_turn_duration_seconds",
+    "Wall-clock duration of a chat turn",
+    ["outcome"],
+)
+turns_total = registry.counter(
+    "xagent_turns_total",
+    "Chat turns by outcome",
+    ["outcome"],
+)
+tool_calls_total = registry.counter(
+    "xagent_tool_calls_total",
+    "Tool calls by tool name and status",
+    ["tool", "status"],
+)
+tool_duration = registry.histogram(
+    "xagent_tool_duration_seconds",
+    "Tool execution time (PreToolUse to PostToolUse hooks, else tool_use to tool_result)",
+    ["tool"],
+)
+tokens_total = registry.counter(
+    "xagent_tokens_total",
+    "Tokens reported in result usage",
+    ["type"],
+)
+cost_usd_total = registry.counter(
+    "xagent_cost_usd_total",
+    "Total cost reported by the SDK in USD",
+)
+active_websockets = registry.gauge(
+    "xagent_active_websockets",
+    "Open WebSocket connections",
+)
+active_channels = registry.gauge(
+    "xagent_active_channels",
+    "Open conversation channels across WebSocket connections",
+)
+client_hibernations_total = registry.counter(
+    "xagent_client_hibernations_total",
+    "SDK clients disconnected while keeping the session for later resume",
+    ["reason"],
+)
+admission_wait = registry.histogram(
+    "xagent_admission_wait_seconds",
+    "Time an agent turn waited in the admission queue before sending its query",
+)
+client_resume_duration = registry.histogram(
+    "xagent_client_resume_seconds",
+    "Time to connect a dedicated client resuming a session",
+)
+interrupts_total = registry.counter(
+    "xagent_interrupts_total",
+    "User interrupts",
+)
+interrupt_to_ready = registry.histogram(
+    "xagent_interrupt_to_ready_seconds",
+    "Time from interrupt to a ready standby client",
+)
+budget_actions_total = registry.counter(
+    "xagent_budget_actions_total",
+    "Token budget actions (trim / compact / rotate)",
+    ["action"],
+)
+followup_messages_total = registry.counter(
+    "xagent_followup_messages_total",
+    "Messages received while a turn was running, by mode (queue / steer / rejected)",
+    ["mode"],
+)
+followup_preserved_turn = registry.histogram(
+    "xagent_followup_preserved_turn_seconds",
+    "Elapsed time of the running turn when a follow-up arrived (work cancel-and-restart would discard)",
+)
+followup_preserved_tool_calls_total = registry.counter(
+    "xagent_followup_preserved_tool_calls_total",
+    "Completed tool calls of the running turn when a follow-up arrived",
+)
+followup_wait = registry.histogram(
+    "xagent_followup_wait_seconds",
+    "Time a queued follow-up waited before being sent",
+)
+followup_dropped_total = registry.counter(
+    "xagent_followup_dropped_total",
+    "Queued follow-ups discarded by an explicit interrupt",
+)
+tool_results_total = registry.counter(
+    "xagent_tool_results_total",
+    "Tool results forwarded to the browser, by delivery (inline / offloaded)",
+    ["delivery"],
+)
+tool_result_chars_total = registry.counter(
+    "xagent_tool_result_chars_total",
+    "Characters of tool results, by delivery (offloaded ones stay server-side except the preview)",
+    ["delivery"],
+)
+
+# usage 字段 -> tokens_total 的 type 标签
+USAGE_TOKEN_FIELDS = {
+    "input_tokens": "input",
+    "output_tokens": "output",
+    "cache_read_input_tokens": "cache_read",
+    "cache_creation_input_tokens": "cache_creation",
+}
+
+
+class CostMeter:
+    """把 ResultMessage.total_cost_usd（客户端进程内的会话累计值）换算为本次新增的费用
+
+    每个会话一个；换用新客户端时调用 reset()。累计值变小时视为换了新进程，从头计。
+    """
+
+    def __init__(self):
+        self.last_cost_usd = 0.0
+
+    def reset(self):
+        self.last_cost_usd = 0.0
+
+    def delta(self, total_cost_usd: Optional[float]) -> float:
+        if not total_cost_usd:
+            return 0.0
+        delta = total_cost_usd - self.last_cost_usd if total_cost_usd >= self.last_cost_usd else total_cost_usd
+        self.last_cost_usd = total_cost_usd
+        return delta
+
+
+def record_usage(usage: Optional[Dict], total_cost_usd: Optional[float], cost_meter: Optional[CostMeter] = None):
+    """记录一次 ResultMessage 的 token 用量和费用（传入 cost_meter 时只累加相对上次的增量）"""
+    if usage:
+        for field, token_type in USAGE_TOKEN_FIELDS.items():
+            value = usage.get(field)
+            if value:
+                tokens_total.inc(value, type=token_type)
+    cost = cost_meter.delta(total_cost_usd) if cost_meter is not None else total_cost_usd
+    if cost:
+        cost_usd_total.inc(cost)
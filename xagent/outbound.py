@@ -0,0 +1,307 @@
+"""
+WebSocket 出站写入器
+每个连接一个，微批合并帧、快速 JSON 编码，并用有界队列实现背压：
+客户端跟不上时先合并、再丢弃排队中的 thinking 帧，最后阻塞生产者。
+一个连接上的多路会话（channel）各有独立的队列，发送时轮流取帧，单个会话的大量输出不会拖慢其他会话
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时回退到标准库
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def dumps(obj: Any) -> str:
+    """编码 JSON 文本帧（优先使用 orjson）"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str).decode("utf-8")
+        except TypeError:
+            # 非字符串键、超大整数等 orjson 不支持的情况
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class OutboundStats:
+    """进程级出站统计（所有连接汇总）"""
+
+    def __init__(self, sample_size: int = 1000):
+        self.active_writers = 0
+        self.frames_enqueued = 0
+        self.frames_sent = 0
+        self.messages_sent = 0
+        self.thinking_merged = 0
+        self.thinking_dropped = 0
+        self.backpressure_waits = 0
+        self.send_failures = 0
+        self.queue_depth = 0  # 所有连接当前排队帧数之和
+        self.max_queue_depth = 0  # 单个连接出现过的最大排队帧数
+        self._flush_latency: Deque[float] = deque(maxlen=sample_size)
+
+    def record_flush(self, seconds: float):
+        self._flush_latency.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        latency = sorted(self._flush_latency)
+        if latency:
+            avg_ms = round(sum(latency) / len(latency) * 1000, 2)
+            p95_ms = round(latency[min(len(latency) - 1, int(len(latency) * 0.95))] * 1000, 2)
+            max_ms = round(latency[-1] * 1000, 2)
+        else:
+            avg_ms = p95_ms = max_ms = 0.0
+        return {
+            "active_writers": self.active_writers,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "frames_enqueued": self.frames_enqueued,
+            "frames_sent": self.frames_sent,
+            "messages_sent": self.messages_sent,
+            "thinking_merged": self.thinking_merged,
+            "thinking_dropped": self.thinking_dropped,
+            "backpressure_waits": self.backpressure_waits,
+            "send_failures": self.send_failures,
+            "flush_latency": {"avg_ms": avg_ms, "p95_ms": p95_ms, "max_ms": max_ms},
+            "json_encoder": "orjson" if orjson is not None else "json",
+        }
+
+
+outbound_stats = OutboundStats()
+
+
+class OutboundChannel:
+    """连接上某一路会话的发送接口：send_json 的帧带上 channel 字段，进入该会话自己的队列"""
+
+    def __init__(self, writer: "OutboundWriter", channel: Optional[str],
+                 on_frame: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.writer = writer
+        self.channel = channel
+        self.on_frame = on_frame  # 收到的是不带 channel 字段的原始帧（会话记录按会话回放，与通道无关）
+
+    @property
+    def queue_depth(self) -> int:
+        return self.writer.channel_depth(self.channel)
+
+    async def send_json(self, data: Dict[str, Any]):
+        if self.on_frame is not None:
+            self.on_frame(data)
+        if self.channel is not None:
+            data = {**data, "channel": self.channel}
+        await self.writer.enqueue(self.channel, data)
+
+
+class OutboundWriter:
+    """单个 WebSocket 连接的出站写入器
+
+    提供与 WebSocket.send_json 相同的 send_json 接口，可直接替换原有调用。
+    同一微批窗口内的多个帧合并为一条 {"type": "batch", "events": [...]} 消息发送。
+    队列长度上限和背压按通道计算；组批时在有待发帧的通道间轮流取帧。
+    """
+
+    def __init__(
+        self,
+        websocket,
+        max_queue: int = 256,
+        batch_window: float = 0.01,
+        max_batch: int = 64,
+        stats: OutboundStats = outbound_stats,
+        on_frame: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.websocket = websocket
+        self.on_frame = on_frame  # 每个出站帧的旁路回调（如会话记录），连接断开后仍会调用
+        self.max_queue = max(2, max_queue)
+        self.high_watermark = self.max_queue // 2
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.stats = stats
+
+        self._queues: Dict[Optional[str], Deque[Dict[str, Any]]] = {None: deque()}
+        self._spaces: Dict[Optional[str], asyncio.Event] = {}
+        self._ready: Deque[Optional[str]] = deque()  # 有待发帧的通道（轮转顺序）
+        self._pending = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._failed = False
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def channel_depth(self, channel: Optional[str]) -> int:
+        queue = self._queues.get(channel)
+        return len(queue) if queue is not None else 0
+
+    def channel(self, channel: Optional[str],
+                on_frame: Optional[Callable[[Dict[str, Any]], None]] = None) -> OutboundChannel:
+        """某一路会话的发送接口（channel 为 None 时即默认通道，帧不带 channel 字段）"""
+        self._queues.setdefault(channel, deque())
+        return OutboundChannel(self, channel, on_frame)
+
+    def remove_channel(self, channel: Optional[str]):
+        """丢弃已关闭通道尚未发送的帧"""
+        if channel is None:
+            return
+        queue = self._queues.pop(channel, None)
+        if queue:
+            self._pending -= len(queue)
+            self.stats.queue_depth -= len(queue)
+        if channel in self._ready:
+            self._ready.remove(channel)
+        space = self._spaces.pop(channel, None)
+        if space is not None:
+            space.set()
+
+    def _space(self, channel: Optional[str]) -> asyncio.Event:
+        space = self._spaces.get(channel)
+        if space is None:
+            space = self._spaces[channel] = asyncio.Event()
+            space.set()
+        return space
+
+    def start(self):
+        """启动后台发送任务"""
+        if self._task is None:
+            self.stats.active_writers += 1
+            self._task = asyncio.create_task(self._run())
+
+    async def send_json(self, data: Dict[str, Any]):
+        """排队一个出站帧（默认通道），队列满时施加背压"""
+        if self.on_frame is not None:
+            self.on_frame(data)
+        await self.enqueue(None, data)
+
+    async def enqueue(self, channel: Optional[str], data: Dict[str, Any]):
+        if self._failed or self._closing:
+            return
+        queue = self._queues.get(channel)
+        if queue is None:
+            # 通道已关闭
+            return
+
+        if data.get("type") == "thinking" and len(queue) >= self.high_watermark:
+            # 客户端落后：与队尾的 thinking 帧合并，不再占用新的队列位置
+            last = queue[-1] if queue else None
+            if last is not None and last.get("type") == "thinking":
+                queue[-1] = {**last, "content": f"{last.get('content', '')}\n\n{data.get('content', '')}"}
+                self.stats.thinking_merged += 1
+                return
+
+        while len(queue) >= self.max_queue:
+            if self._drop_thinking(queue):
+                continue
+            # 没有可丢弃的帧，阻塞该通道的生产者直到发送任务腾出空间
+            self.stats.backpressure_waits += 1
+            space = self._space(channel)
+            space.clear()
+            await space.wait()
+            if self._failed or self._closing or self._queues.get(channel) is not queue:
+                return
+
+        if not queue:
+            self._ready.append(channel)
+        queue.append(data)
+        self._pending += 1
+        self.stats.frames_enqueued += 1
+        self.stats.queue_depth += 1
+        if len(queue) > self.stats.max_queue_depth:
+            self.stats.max_queue_depth = len(queue)
+        self._wakeup.set()
+
+    async def close(self, timeout: float = 2.0):
+        """发送剩余帧并停止后台任务"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        self._release_producers()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            self._task.cancel()
+        except Exception as e:
+            logger.warning(f"Outbound writer stopped with error: {e}")
+        finally:
+            self._task = None
+            self.stats.active_writers -= 1
+            self._clear()
+
+    def _release_producers(self):
+        for space in self._spaces.values():
+            space.set()
+
+    def _clear(self):
+        self.stats.queue_depth -= self._pending
+        self._pending = 0
+        for queue in self._queues.values():
+            queue.clear()
+        self._ready.clear()
+
+    def _drop_thinking(self, queue: Deque[Dict[str, Any]]) -> bool:
+        """丢弃该队列中最早的 thinking 帧，返回是否丢弃成功"""
+        for index, frame in enumerate(queue):
+            if frame.get("type") == "thinking":
+                del queue[index]
+                self._pending -= 1
+                self.stats.thinking_dropped += 1
+                self.stats.queue_depth -= 1
+                return True
+        return False
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        """在有待发帧的通道间轮流取帧，每轮每个通道一帧"""
+        frames = []
+        while self._ready and len(frames) < limit:
+            channel = self._ready.popleft()
+            queue = self._queues.get(channel)
+            if not queue:
+                continue
+            frames.append(queue.popleft())
+            if queue:
+                self._ready.append(channel)
+            space = self._spaces.get(channel)
+            if space is not None:
+                space.set()
+        self._pending -= len(frames)
+        self.stats.queue_depth -= len(frames)
+        return frames
+
+    async def _run(self):
+        while True:
+            while not self._pending:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # 微批窗口：等待同一时间段内的后续帧一起发送
+            if self.batch_window > 0 and self._pending < self.max_batch and not self._closing:
+                await asyncio.sleep(self.batch_window)
+
+            frames = self._take(self.max_batch)
+            count = len(frames)
+            if not count:
+                continue
+
+            payload = frames[0] if count == 1 else {"type": "batch", "events": frames}
+            start = time.perf_counter()
+            try:
+                await self.websocket.send_text(dumps(payload))
+            except Exception as e:
+                logger.info(f"Outbound send failed, dropping queued frames: {e}")
+                self._failed = True
+                self.stats.send_failures += 1
+                self._clear()
+                self._release_producers()
+                return
+            self.stats.record_flush(time.perf_counter() - start)
+            self.stats.frames_sent += count
+            self.stats.messages_sent += 1
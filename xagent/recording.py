@@ -0,0 +1,254 @@
+"""
+录制 / 回放后端
+record：包装真实 ClaudeSDKClient，按轮次把消息流（含相对时间）追加到 JSONL 语料文件；
+replay：按语料回放消息流，走同一条 send_message 路径，不启动 CLI、不访问网络，也不需要凭据。
+用于对服务端改动做可重复的性能回归
+"""
+
+import asyncio
+import dataclasses
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from claude_agent_sdk import (
+    AssistantMessage,
+    ResultMessage,
+    SystemMessage,
+    TextBlock,
+    ThinkingBlock,
+    ToolResultBlock,
+    ToolUseBlock,
+    UserMessage,
+)
+
+logger = logging.getLogger(__name__)
+
+# 只录制 send_message 处理的消息类型（子类按基类录制）
+MESSAGE_TYPES = {cls.__name__: cls for cls in (AssistantMessage, UserMessage, SystemMessage, ResultMessage)}
+BLOCK_TYPES = {cls.__name__: cls for cls in (TextBlock, ThinkingBlock, ToolUseBlock, ToolResultBlock)}
+
+
+def _fields(cls) -> List[str]:
+    return [field.name for field in dataclasses.fields(cls)]
+
+
+def _plain(value: Any) -> Any:
+    return dataclasses.asdict(value) if dataclasses.is_dataclass(value) else value
+
+
+def encode_message(msg: Any) -> Optional[Dict[str, Any]]:
+    """SDK 消息 -> 可 JSON 序列化的字典；不需要录制的消息返回 None"""
+    base = next((cls for cls in MESSAGE_TYPES.values() if isinstance(msg, cls)), None)
+    if base is None:
+        return None
+    data = {}
+    for name in _fields(base):
+        value = getattr(msg, name)
+        if name == "content" and isinstance(value, list):
+            value = [
+                {"type": type(block).__name__, **dataclasses.asdict(block)}
+                for block in value
+                if type(block).__name__ in BLOCK_TYPES
+            ]
+        data[name] = _plain(value)
+    return {"type": base.__name__, "data": data}
+
+
+def decode_message(entry: Dict[str, Any], session_id: Optional[str] = None) -> Any:
+    """字典 -> SDK 消息；session_id 不为空时替换录制时的会话 id"""
+    cls = MESSAGE_TYPES[entry["type"]]
+    names = set(_fields(cls))
+    data = {key: value for key, value in entry["data"].items() if key in names}
+    if isinstance(data.get("content"), list):
+        data["content"] = [
+            BLOCK_TYPES[block["type"]](**{k: v for k, v in block.items() if k != "type"})
+            for block in data["content"]
+        ]
+    if session_id:
+        if cls is SystemMessage and "session_id" in data.get("data", {}):
+            data["data"] = {**data["data"], "session_id": session_id}
+        elif data.get("session_id"):
+            data["session_id"] = session_id
+    return cls(**data)
+
+
+class Recorder:
+    """语料写入：每轮一行 JSON，写文件放到线程中执行"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.turns_written = 0
+
+    def _append(self, line: str):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.turns_written += 1
+
+    async def write_turn(self, turn: Dict[str, Any]):
+        line = json.dumps(turn, ensure_ascii=False, separators=(",", ":"), default=str)
+        try:
+            await asyncio.to_thread(self._append, line)
+        except OSError as e:
+            logger.error(f"Failed to write recording to {self.path}: {e}")
+
+
+class RecordingClient:
+    """包装真实客户端：透传所有调用，同时录制每轮的消息流"""
+
+    def __init__(self, client: Any, recorder: Recorder):
+        self.client = client
+        self.recorder = recorder
+        # 轮次进行中写入的引导消息各自对应一个 ResultMessage，按写入顺序录制
+        self._queries: Deque[Tuple[Optional[str], float]] = deque()
+        self._turn = 0
+
+    @property
+    def options(self):
+        return self.client.options
+
+    async def connect(self, prompt: Any = None):
+        await self.client.connect(prompt)
+
+    async def disconnect(self):
+        await self.client.disconnect()
+
+    async def interrupt(self):
+        await self.client.interrupt()
+
+    async def query(self, prompt: Any, session_id: str = "default"):
+        self._queries.append((prompt if isinstance(prompt, str) else None, time.perf_counter()))
+        await self.client.query(prompt, session_id)
+
+    async def receive_response(self) -> AsyncIterator[Any]:
+        prompt, query_time = self._queries.popleft() if self._queries else (None, time.perf_counter())
+        messages = []
+        async for msg in self.client.receive_response():
+            entry = encode_message(msg)
+            if entry is not None:
+                entry["t"] = round(time.perf_counter() - query_time, 4)
+                messages.append(entry)
+            if isinstance(msg, ResultMessage):
+                # 只录制完整的轮次（被中断的轮次没有 ResultMessage）
+                self._turn += 1
+                await self.recorder.write_turn({
+                    "session_id": msg.session_id,
+                    "turn": self._turn,
+                    "prompt": prompt,
+                    "recorded_at": time.time(),
+                    "messages": messages,
+                })
+            yield msg
+
+
+class ReplayCorpus:
+    """回放语料：按会话分组，按 prompt 查找，找不到时轮流使用"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.turns: List[Dict[str, Any]] = []
+        self._by_prompt: Dict[str, itertools.cycle] = {}
+        self._cycle: Optional[itertools.cycle] = None
+
+    def _read(self) -> List[Dict[str, Any]]:
+        turns = []
+        with self.path.open(encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    turn = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Skipping malformed recording at {self.path}:{line_no}: {e}")
+                    continue
+                if any(m.get("type") == "ResultMessage" for m in turn.get("messages", [])):
+                    turns.append(turn)
+        return turns
+
+    async def load(self):
+        self.set_turns(await asyncio.to_thread(self._read))
+        logger.info(f"Replay corpus loaded: {len(self.turns)} turns from {self.path}")
+
+    def set_turns(self, turns: List[Dict[str, Any]]):
+        self.turns = turns
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for turn in turns:
+            if turn.get("prompt"):
+                grouped.setdefault(turn["prompt"], []).append(turn)
+        self._by_prompt = {prompt: itertools.cycle(items) for prompt, items in grouped.items()}
+        self._cycle = itertools.cycle(turns) if turns else None
+
+    def sessions(self) -> List[List[Dict[str, Any]]]:
+        """按录制时的会话分组，每组按轮次排序（压测时按原会话顺序重放）"""
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for turn in self.turns:
+            grouped.setdefault(turn.get("session_id") or "", []).append(turn)
+        return [sorted(items, key=lambda t: t.get("turn", 0)) for items in grouped.values()]
+
+    def pick(self, prompt: Optional[str]) -> Dict[str, Any]:
+        if prompt in self._by_prompt:
+            return next(self._by_prompt[prompt])
+        if self._cycle is None:
+            raise RuntimeError(f"Replay corpus {self.path} has no complete turns")
+        return next(self._cycle)
+
+
+class ReplayClient:
+    """回放客户端：接口与 ClaudeSDKClient 一致
+
+    time_scale 为 1 时按录制时的节奏回放，0.1 压缩为十分之一，0 不等待；
+    max_gap 限制相邻两条消息之间的最大等待（秒）。
+    """
+
+    def __init__(self, corpus: ReplayCorpus, options: Any = None, time_scale: float = 1.0,
+                 max_gap: Optional[float] = None):
+        self.corpus = corpus
+        self.options = options
+        self.time_scale = time_scale
+        self.max_gap = max_gap
+        self.session_id = getattr(options, "resume", None) or str(uuid.uuid4())
+        self._prompts: Deque[Optional[str]] = deque()
+        self._interrupted = False
+
+    async def connect(self, prompt: Any = None):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def interrupt(self):
+        self._interrupted = True
+
+    async def query(self, prompt: Any, session_id: str = "default"):
+        self._prompts.append(prompt if isinstance(prompt, str) else None)
+        self._interrupted = False
+
+    def _delay(self, gap: float) -> float:
+        delay = max(gap, 0.0) * self.time_scale
+        return min(delay, self.max_gap) if self.max_gap is not None else delay
+
+    async def receive_response(self) -> AsyncIterator[Any]:
+        turn = self.corpus.pick(self._prompts.popleft() if self._prompts else None)
+        start = time.perf_counter()
+        due = 0.0
+        previous = 0.0
+        for entry in turn["messages"]:
+            # 按累计时间表等待，避免逐条 sleep 的误差累积
+            due += self._delay(entry.get("t", previous) - previous)
+            previous = entry.get("t", previous)
+            wait = due - (time.perf_counter() - start)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if self._interrupted:
+                return
+            yield decode_message(entry, self.session_id)
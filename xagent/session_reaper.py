@@ -0,0 +1,116 @@
+"""
+空闲会话回收
+进程内所有会话的 SDK 客户端统一管理：后台按间隔检查，空闲超过阈值的会话休眠（断开客户端、保留会话 id，
+下一条消息到达时透明恢复）；全进程持有的客户端数超过上限时，按最近活动时间先让最久未使用的空闲会话休眠
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+import weakref
+from typing import Any, AsyncIterator, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """进程级会话表（弱引用）及空闲回收
+
+    会话管理器需提供 client、current_task、last_activity_time（time.monotonic()）、client_busy()、
+    hibernate(reason)，在 client_slot(manager) 内取得客户端。
+    idle_timeout 为 0 时不按空闲时间回收；max_live_clients 为 0 时不限制客户端总数。
+    全局上限是软上限：所有持有客户端的会话都在忙时不等待，由后台检查在会话空闲后回收。
+    """
+
+    def __init__(self, idle_timeout: float = 1800.0, max_live_clients: int = 0, interval: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self.max_live_clients = max(0, max_live_clients)
+        self.interval = interval
+        self._managers: "weakref.WeakSet" = weakref.WeakSet()
+        self._reserved: Set[Any] = set()  # 已获准、正在取得客户端的会话
+        self._task: Optional[asyncio.Task] = None
+        self.hibernations = 0
+
+    def track(self, manager: Any):
+        self._managers.add(manager)
+
+    def live(self) -> List[Any]:
+        return [m for m in list(self._managers) if m.client is not None]
+
+    @staticmethod
+    def _idle(manager: Any) -> bool:
+        task = manager.current_task
+        if task is not None and not task.done():
+            return False
+        return manager.client is not None and not manager.client_busy()
+
+    @staticmethod
+    def _last_active(manager: Any) -> float:
+        return manager.last_activity_time or 0.0
+
+    def start(self):
+        if self.interval > 0 and (self.idle_timeout > 0 or self.max_live_clients > 0) and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Session reaper sweep failed: {e}")
+
+    async def sweep(self) -> int:
+        """休眠空闲超时的会话，再把客户端总数压回上限内，返回休眠的会话数"""
+        count = 0
+        if self.idle_timeout > 0:
+            cutoff = time.monotonic() - self.idle_timeout
+            for manager in self.live():
+                if self._idle(manager) and self._last_active(manager) <= cutoff:
+                    await self._hibernate(manager, "idle")
+                    count += 1
+        if self.max_live_clients > 0:
+            count += await self._evict(len(self.live()) - self.max_live_clients)
+        return count
+
+    async def _evict(self, excess: int, exclude: Any = None) -> int:
+        """按最近活动时间让最久未使用的空闲会话休眠，最多 excess 个"""
+        if excess <= 0:
+            return 0
+        candidates = sorted(
+            (m for m in self.live() if m is not exclude and self._idle(m)), key=self._last_active
+        )[:excess]
+        for manager in candidates:
+            await self._hibernate(manager, "global_cap")
+        return len(candidates)
+
+    async def _hibernate(self, manager: Any, reason: str):
+        self.hibernations += 1
+        await manager.hibernate(reason)
+
+    @contextlib.asynccontextmanager
+    async def client_slot(self, requester: Any) -> AsyncIterator[None]:
+        """requester 在此范围内取得客户端；达到全局上限时先让最久未使用的空闲会话休眠"""
+        if self.max_live_clients > 0:
+            live = [m for m in self.live() if m is not requester]
+            reserved = sum(1 for m in self._reserved if m is not requester and m.client is None)
+            excess = len(live) + reserved + 1 - self.max_live_clients
+            if excess > 0 and await self._evict(excess, exclude=requester) < excess:
+                logger.warning(f"Live SDK clients over global cap ({self.max_live_clients}): all sessions busy")
+        self._reserved.add(requester)
+        try:
+            yield
+        finally:
+            self._reserved.discard(requester)
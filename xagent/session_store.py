@@ -0,0 +1,256 @@
+"""
+持久化会话存储
+SQLite（WAL 模式）记录 SDK session_id 和渲染给前端的事件流，
+页面刷新或断线重连后可以用 session_id 恢复会话并本地回放最近的事件；
+多 worker 部署时所有 worker 共享同一个数据库文件
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 需要记录的事件类型（前端渲染对话所需的事件）
+RECORDED_EVENT_TYPES = frozenset({
+    "user_message",
+    "assistant_text",
+    "thinking",
+    "tool_use",
+    "tool_result",
+    "result",
+    "error",
+    "interrupted",
+})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    num_turns INTEGER NOT NULL DEFAULT 0,
+    total_cost_usd REAL NOT NULL DEFAULT 0,
+    worker_id TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    event TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_session ON events (session_id, id);
+"""
+
+
+class SessionStore:
+    """基于 SQLite 的会话存储
+
+    写入在专用线程中批量提交，事件循环只做入队；读取通过 asyncio.to_thread 执行，
+    WAL 模式下读写互不阻塞。
+    """
+
+    def __init__(self, db_path: Path, max_event_chars: int = 65536, retention_days: float = 7.0):
+        self.db_path = Path(db_path)
+        self.max_event_chars = max_event_chars
+        self.retention_days = retention_days
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._local = threading.local()
+
+    def start(self):
+        """初始化数据库并启动写入线程"""
+        if self._thread is not None:
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if "worker_id" not in columns:
+            # 旧版本数据库迁移
+            conn.execute("ALTER TABLE sessions ADD COLUMN worker_id TEXT")
+        if self.retention_days > 0:
+            cutoff = time.time() - self.retention_days * 86400
+            stale = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE updated_at < ?", (cutoff,)
+            )]
+            if stale:
+                conn.executemany("DELETE FROM events WHERE session_id = ?", [(sid,) for sid in stale])
+                conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(sid,) for sid in stale])
+                logger.info(f"Pruned {len(stale)} sessions older than {self.retention_days} days")
+        conn.commit()
+        conn.close()
+
+        self._thread = threading.Thread(target=self._writer_loop, name="session-store-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Session store opened: {self.db_path}")
+
+    def close(self, timeout: float = 5.0):
+        """写完剩余数据并停止写入线程"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    # ---------- 写入（非阻塞，只入队） ----------
+
+    def append_event(self, session_id: str, event: Dict[str, Any]):
+        """追加一个渲染事件"""
+        self._queue.put(("event", session_id, time.time(), self._encode_event(event)))
+
+    def update_session(
+        self,
+        session_id: str,
+        num_turns: int = 0,
+        total_cost_usd: float = 0.0,
+        worker_id: Optional[str] = None,
+    ):
+        """创建或更新会话元数据（worker_id 记录当前持有该会话的 worker）"""
+        self._queue.put(("session", session_id, time.time(), num_turns, total_cost_usd or 0.0, worker_id))
+
+    def rename_session(self, old_session_id: str, new_session_id: str):
+        """SDK 恢复会话后分配了新的 session_id 时，把历史事件迁移到新 id 下"""
+        self._queue.put(("rename", old_session_id, new_session_id))
+
+    def delete_session(self, session_id: str):
+        self._queue.put(("delete", session_id))
+
+    # ---------- 读取 ----------
+
+    async def has_session(self, session_id: str) -> bool:
+        return await asyncio.to_thread(self._has_session, session_id)
+
+    async def session_owner(self, session_id: str) -> Optional[str]:
+        """最近一次处理该会话的 worker 编号"""
+        return await asyncio.to_thread(self._session_owner, session_id)
+
+    async def recent_events(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        """按时间顺序返回会话最近的 limit 个事件"""
+        return await asyncio.to_thread(self._recent_events, session_id, limit)
+
+    def flush(self, timeout: float = 5.0):
+        """等待已入队的写入全部提交（测试和关闭时使用）"""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait(timeout)
+
+    # ---------- 内部实现 ----------
+
+    def _encode_event(self, event: Dict[str, Any]) -> str:
+        # 超大的工具结果只保留开头部分，避免数据库膨胀
+        content = event.get("content")
+        if isinstance(content, str) and len(content) > self.max_event_chars:
+            event = {**event, "content": content[:self.max_event_chars] + "\n...[truncated]", "truncated": True}
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """每个读取线程复用一个连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _has_session(self, session_id: str) -> bool:
+        row = self._reader().execute(
+            "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def _session_owner(self, session_id: str) -> Optional[str]:
+        row = self._reader().execute(
+            "SELECT worker_id FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _recent_events(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        rows = self._reader().execute(
+            "SELECT event FROM events WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, limit),
+        ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # 一次提交当前已排队的全部写入
+            while item is not None:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            stop = False
+            flushed = []
+            try:
+                for op in batch:
+                    if op is None:
+                        stop = True
+                    elif op[0] == "flush":
+                        flushed.append(op[1])
+                    else:
+                        self._apply(conn, op)
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Session store write failed: {e}")
+                conn.rollback()
+            for done in flushed:
+                done.set()
+            if stop:
+                conn.close()
+                return
+
+    def _apply(self, conn: sqlite3.Connection, op: tuple):
+        kind = op[0]
+        if kind == "event":
+            _, session_id, ts, event = op
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at, updated_at) VALUES (?, ?, ?)",
+                (session_id, ts, ts),
+            )
+            conn.execute(
+                "INSERT INTO events (session_id, ts, event) VALUES (?, ?, ?)",
+                (session_id, ts, event),
+            )
+        elif kind == "session":
+            _, session_id, ts, num_turns, total_cost_usd, worker_id = op
+            conn.execute(
+                """
+                INSERT INTO sessions (session_id, created_at, updated_at, num_turns, total_cost_usd, worker_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    updated_at = excluded.updated_at,
+                    num_turns = excluded.num_turns,
+                    total_cost_usd = excluded.total_cost_usd,
+                    worker_id = COALESCE(excluded.worker_id, sessions.worker_id)
+                """,
+                (session_id, ts, ts, num_turns, total_cost_usd, worker_id),
+            )
+        elif kind == "rename":
+            _, old_id, new_id = op
+            conn.execute("UPDATE events SET session_id = ? WHERE session_id = ?", (new_id, old_id))
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, created_at, updated_at, num_turns, total_cost_usd, worker_id) "
+                "SELECT ?, created_at, updated_at, num_turns, total_cost_usd, worker_id FROM sessions WHERE session_id = ?",
+                (new_id, old_id),
+            )
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (old_id,))
+        elif kind == "delete":
+            _, session_id = op
+            conn.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
@@ -0,0 +1,634 @@
+"""
+SQL 骨架填空（按意图族）
+聚合报表、漏斗/转化、留存/分群、排名/TopN、明细拉取、对比（A/B）各一套预编译骨架；
+模型只选择骨架并填入表、字段和过滤条件，参数在填入前校验（标识符、日期、表达式中不得出现语句分隔符、
+注释和 DDL/DML 关键字），以 SDK 自定义工具的形式提供给 Agent，不再从零手写 SQL
+"""
+
+import datetime
+import logging
+import math
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from claude_agent_sdk import create_sdk_mcp_server, tool
+
+logger = logging.getLogger(__name__)
+
+_IDENT = r"[A-Za-z_][A-Za-z0-9_]*"
+_IDENT_RE = re.compile(rf"^{_IDENT}$")
+_COLUMN_RE = re.compile(rf"^(?:{_IDENT}\.)?({_IDENT})$")
+_TABLE_RE = re.compile(rf"^{_IDENT}(?:\.{_IDENT}){{0,2}}$")
+_ALIAS_RE = re.compile(rf"^(.+?)\s+as\s+({_IDENT})$", re.IGNORECASE | re.DOTALL)
+_ORDER_RE = re.compile(r"^(.+?)(?:\s+(asc|desc))?$", re.IGNORECASE | re.DOTALL)
+_DATE_RE = re.compile(r"^(\d{4})(-?)(\d{2})\2(\d{2})$")
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+# 填入的表达式只能是单个表达式 / 条件：不允许语句分隔符、注释、子查询和改写数据的语句
+_FORBIDDEN_RE = re.compile(
+    r";|--|/\*|\*/|\b(?:select|union|insert|update|delete|drop|alter|create|truncate|grant|revoke|merge|"
+    r"overwrite|load|msck|set|use)\b",
+    re.IGNORECASE,
+)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+
+MAX_EXPR_CHARS = 500
+MAX_ITEMS = 30
+MAX_DETAIL_ROWS = 100000
+MAX_TOP_N = 1000
+MAX_RETENTION_DAY = 365
+
+
+class SqlSkeletonError(ValueError):
+    """骨架不存在或填空参数无效"""
+
+
+class SqlTemplate:
+    """预编译的 SQL 骨架
+
+    加载时把骨架切分为字面量片段和 {name} 占位符，填空时一次拼接完成。
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: List[Tuple[bool, str]] = []  # (是否为占位符, 字面量或占位符名)
+        pos = 0
+        for match in _PLACEHOLDER_RE.finditer(source):
+            if match.start() > pos:
+                self._parts.append((False, source[pos:match.start()]))
+            self._parts.append((True, match.group(1)))
+            pos = match.end()
+        if pos < len(source):
+            self._parts.append((False, source[pos:]))
+        self.names = {value for is_slot, value in self._parts if is_slot}
+
+    def render(self, values: Dict[str, str]) -> str:
+        missing = self.names - values.keys()
+        if missing:
+            raise SqlSkeletonError(f"骨架缺少填空: {', '.join(sorted(missing))}")
+        return "".join(values[value] if is_slot else value for is_slot, value in self._parts)
+
+
+class Column(NamedTuple):
+    """选择列：expr 为表达式，name 为输出列名（别名或列名本身）"""
+
+    expr: str
+    name: str
+
+    def select(self) -> str:
+        return self.expr if self.expr == self.name else f"{self.expr} AS {self.name}"
+
+
+# ---------- 参数校验 ----------
+
+def check_expr(value: Any, what: str) -> str:
+    """单个 SQL 表达式 / 条件：非空、长度受限、引号和括号配对，不含禁止的片段"""
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool) or str(value).strip() == "":
+        raise SqlSkeletonError(f"{what} 必须是非空的 SQL 表达式")
+    text = str(value).strip()
+    if len(text) > MAX_EXPR_CHARS:
+        raise SqlSkeletonError(f"{what} 过长（超过 {MAX_EXPR_CHARS} 字符）")
+    bare = _STRING_RE.sub("''", text)
+    if "'" in bare.replace("''", "") or '"' in bare.replace('""', ""):
+        raise SqlSkeletonError(f"{what} 中的引号不配对: {text}")
+    match = _FORBIDDEN_RE.search(bare)
+    if match:
+        raise SqlSkeletonError(f"{what} 中不允许出现 {match.group(0)!r}: {text}")
+    depth = 0
+    for char in bare:
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if depth < 0:
+            break
+    if depth != 0:
+        raise SqlSkeletonError(f"{what} 中的括号不配对: {text}")
+    return text
+
+
+def check_table(value: Any) -> str:
+    if not isinstance(value, str) or not _TABLE_RE.match(value.strip()):
+        raise SqlSkeletonError(f"table 必须是 库名.表名 形式的标识符: {value!r}")
+    return value.strip()
+
+
+def check_ident(value: Any, what: str) -> str:
+    """列名（可带表别名前缀）"""
+    if not isinstance(value, str) or not _COLUMN_RE.match(value.strip()):
+        raise SqlSkeletonError(f"{what} 必须是列名: {value!r}")
+    return value.strip()
+
+
+def parse_column(value: Any, what: str) -> Column:
+    """列名，或 "表达式 AS 别名"；dict 形式为 {"expr": ..., "alias": ...}"""
+    if isinstance(value, dict):
+        expr = check_expr(value.get("expr"), what)
+        alias = value.get("alias")
+    else:
+        text = check_expr(value, what)
+        match = _ALIAS_RE.match(text)
+        expr, alias = (match.group(1).strip(), match.group(2)) if match else (text, None)
+    if alias is not None:
+        if not isinstance(alias, str) or not _IDENT_RE.match(alias):
+            raise SqlSkeletonError(f"{what} 的别名必须是标识符: {alias!r}")
+        return Column(expr, alias)
+    column = _COLUMN_RE.match(expr)
+    if column is None:
+        raise SqlSkeletonError(f"{what} 是表达式时需要别名（写成 \"表达式 AS 别名\"）: {expr}")
+    return Column(expr, column.group(1))
+
+
+def parse_columns(values: Any, what: str, required: bool = False) -> List[Column]:
+    values = _as_list(values, what)
+    if required and not values:
+        raise SqlSkeletonError(f"缺少 {what}")
+    columns = [parse_column(value, f"{what}[{i}]") for i, value in enumerate(values)]
+    names = [column.name for column in columns]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise SqlSkeletonError(f"{what} 中的输出列名重复: {', '.join(duplicated)}")
+    return columns
+
+
+def parse_order(values: Any) -> List[str]:
+    """排序项：表达式加可选的 ASC / DESC"""
+    order = []
+    for i, value in enumerate(_as_list(values, "order_by")):
+        match = _ORDER_RE.match(check_expr(value, f"order_by[{i}]"))
+        direction = f" {match.group(2).upper()}" if match.group(2) else ""
+        order.append(f"{match.group(1).strip()}{direction}")
+    return order
+
+
+def parse_int(value: Any, what: str, default: Optional[int], low: int, high: int) -> Optional[int]:
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+        raise SqlSkeletonError(f"{what} 必须是整数: {value!r}")
+    number = int(value)
+    if not low <= number <= high:
+        raise SqlSkeletonError(f"{what} 必须在 {low} 到 {high} 之间: {number}")
+    return number
+
+
+def quote(value: Any) -> str:
+    """字面量：数字原样，字符串加单引号（按 Hive 规则转义）；NaN、无穷大没有合法的 SQL 字面量，直接拒绝"""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise SqlSkeletonError(f"取值必须是字符串或数字: {value!r}")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise SqlSkeletonError(f"取值必须是有限的数字: {value!r}")
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _as_list(values: Any, what: str) -> List[Any]:
+    if values is None or values == "":
+        return []
+    if not isinstance(values, list):
+        values = [values]
+    if len(values) > MAX_ITEMS:
+        raise SqlSkeletonError(f"{what} 最多 {MAX_ITEMS} 项")
+    return values
+
+
+class TimeRange(NamedTuple):
+    """时间范围：field 为分区 / 业务日期列，日期保留调用方的格式（yyyy-MM-dd 或 yyyyMMdd）"""
+
+    field: str
+    start: datetime.date
+    end: datetime.date
+    compact: bool
+
+    def literal(self, day: datetime.date) -> str:
+        return quote(day.strftime("%Y%m%d" if self.compact else "%Y-%m-%d"))
+
+    def predicate(self, extra_days: int = 0) -> str:
+        end = self.end + datetime.timedelta(days=extra_days)
+        if self.start == end:
+            return f"{self.field} = {self.literal(self.start)}"
+        return f"{self.field} BETWEEN {self.literal(self.start)} AND {self.literal(end)}"
+
+    def date_expr(self) -> str:
+        """按 yyyy-MM-dd 字符串取日期（datediff 需要）"""
+        if self.compact:
+            return f"from_unixtime(unix_timestamp({self.field}, 'yyyyMMdd'), 'yyyy-MM-dd')"
+        return self.field
+
+
+def _parse_date(value: Any, what: str) -> Tuple[datetime.date, bool]:
+    match = _DATE_RE.match(str(value).strip()) if isinstance(value, (str, int)) else None
+    if match is None:
+        raise SqlSkeletonError(f"{what} 必须是 yyyy-MM-dd 或 yyyyMMdd 格式的日期: {value!r}")
+    try:
+        day = datetime.date(int(match.group(1)), int(match.group(3)), int(match.group(4)))
+    except ValueError:
+        raise SqlSkeletonError(f"{what} 不是有效日期: {value!r}")
+    return day, match.group(2) == ""
+
+
+def parse_time_range(args: Dict[str, Any]) -> TimeRange:
+    field = check_ident(args.get("time_field") or "dt", "time_field")
+    if args.get("start_date") is None:
+        raise SqlSkeletonError("缺少 start_date（所有骨架都要求时间范围，用于分区裁剪）")
+    start, compact = _parse_date(args["start_date"], "start_date")
+    end, end_compact = _parse_date(args.get("end_date") or args["start_date"], "end_date")
+    if compact != end_compact:
+        raise SqlSkeletonError("start_date 和 end_date 的日期格式必须一致")
+    if end < start:
+        raise SqlSkeletonError(f"end_date 早于 start_date: {args.get('end_date')} < {args['start_date']}")
+    return TimeRange(field, start, end, compact)
+
+
+def _where(time_range: TimeRange, args: Dict[str, Any], *extra: str, extra_days: int = 0, indent: int = 4) -> str:
+    """时间范围 + 骨架自带条件 + filters；含 OR 的条件加括号，避免与 AND 的优先级混淆"""
+    predicates = [time_range.predicate(extra_days), *extra]
+    predicates += [check_expr(f, f"filters[{i}]") for i, f in enumerate(_as_list(args.get("filters"), "filters"))]
+    predicates = [f"({p})" if re.search(r"\bor\b", p, re.IGNORECASE) else p for p in predicates]
+    return f"\n{' ' * indent}AND ".join(predicates)
+
+
+def _list(items: Sequence[str], indent: int = 4) -> str:
+    return f",\n{' ' * indent}".join(items)
+
+
+def _clause(keyword: str, items: Sequence[str]) -> str:
+    return f"\n{keyword} {', '.join(items)}" if items else ""
+
+
+def _limit(args: Dict[str, Any], default: Optional[int] = None, high: int = MAX_DETAIL_ROWS) -> str:
+    limit = parse_int(args.get("limit"), "limit", default, 1, high)
+    return f"\nLIMIT {limit}" if limit else ""
+
+
+def _suffixes(values: Sequence[Any]) -> List[str]:
+    """分组取值转为列名后缀，无法转换或重复时按序号命名"""
+    suffixes = []
+    for i, value in enumerate(values, 1):
+        suffix = re.sub(r"[^0-9A-Za-z_]+", "_", str(value)).strip("_").lower()
+        if not suffix or suffix in suffixes:
+            suffix = f"g{i}"
+        suffixes.append(suffix)
+    return suffixes
+
+
+# ---------- 各意图族的骨架和填空 ----------
+
+AGGREGATE_SQL = """\
+SELECT
+    {select}
+FROM {table}
+WHERE {where}{group_by}{order_by}{limit}"""
+
+
+def fill_aggregate(args: Dict[str, Any]) -> Dict[str, str]:
+    """聚合报表：指标按维度（通常含日期）汇总"""
+    time_range = parse_time_range(args)
+    dims = parse_columns(args.get("dims"), "dims")
+    metrics = parse_columns(args.get("metrics"), "metrics", required=True)
+    return {
+        "select": _list([c.select() for c in dims + metrics]),
+        "table": check_table(args.get("table")),
+        "where": _where(time_range, args),
+        "group_by": _clause("GROUP BY", [c.expr for c in dims]),
+        "order_by": _clause("ORDER BY", parse_order(args.get("order_by")) or [c.name for c in dims]),
+        "limit": _limit(args),
+    }
+
+
+FUNNEL_SQL = """\
+WITH user_steps AS (
+    SELECT
+        {step_select}
+    FROM {table}
+    WHERE {where}
+    GROUP BY {step_group}
+)
+SELECT
+    {funnel_select}
+FROM user_steps{group_by}{order_by}"""
+
+
+def fill_funnel(args: Dict[str, Any]) -> Dict[str, str]:
+    """漏斗/转化：每个用户是否完成各步骤（第 k 步要求前 k-1 步都完成，不校验先后顺序），逐步统计人数和转化率"""
+    time_range = parse_time_range(args)
+    user = check_ident(args.get("user_field"), "user_field")
+    step_field = check_ident(args.get("step_field"), "step_field")
+    steps = _as_list(args.get("steps"), "steps")
+    if not 2 <= len(steps) <= 10:
+        raise SqlSkeletonError("漏斗需要 2 到 10 个步骤（steps 为 step_field 的取值）")
+    dims = parse_columns(args.get("dims"), "dims")
+
+    step_select = [f"{user} AS user_id"] + [c.select() for c in dims]
+    step_select += [
+        f"MAX(CASE WHEN {step_field} = {quote(step)} THEN 1 ELSE 0 END) AS step_{i}"
+        for i, step in enumerate(steps, 1)
+    ]
+    users = []
+    funnel_select = [c.name for c in dims]
+    for i in range(1, len(steps) + 1):
+        reached = " AND ".join(f"step_{k} = 1" for k in range(1, i + 1))
+        users.append(f"SUM(CASE WHEN {reached} THEN 1 ELSE 0 END)")
+        funnel_select.append(f"{users[-1]} AS step_{i}_users")
+        if i > 1:
+            funnel_select.append(f"ROUND({users[-1]} / NULLIF({users[0]}, 0), 4) AS step_{i}_rate")
+    return {
+        "step_select": _list(step_select, 8),
+        "table": check_table(args.get("table")),
+        "where": _where(time_range, args, f"{step_field} IN ({', '.join(quote(s) for s in steps)})", indent=8),
+        "step_group": ", ".join([user] + [c.expr for c in dims]),
+        "funnel_select": _list(funnel_select),
+        "group_by": _clause("GROUP BY", [c.name for c in dims]),
+        "order_by": _clause("ORDER BY", [c.name for c in dims]),
+    }
+
+
+RETENTION_SQL = """\
+WITH active AS (
+    SELECT DISTINCT
+        {active_select}
+    FROM {table}
+    WHERE {where}
+)
+SELECT
+    {retention_select}
+FROM active c
+LEFT JOIN active r
+    ON r.user_id = c.user_id AND r.active_date > c.active_date
+WHERE c.active_date BETWEEN {cohort_start} AND {cohort_end}
+GROUP BY {retention_group}
+ORDER BY {retention_order}"""
+
+
+def fill_retention(args: Dict[str, Any]) -> Dict[str, str]:
+    """留存/分群：以每天的活跃用户为同期群（可按维度分群），统计第 N 天仍活跃的人数和留存率"""
+    time_range = parse_time_range(args)
+    user = check_ident(args.get("user_field"), "user_field")
+    days = [parse_int(d, "retention_days", None, 1, MAX_RETENTION_DAY)
+            for d in _as_list(args.get("retention_days"), "retention_days")] or [1, 7]
+    days = sorted(set(days))
+    dims = parse_columns(args.get("dims"), "dims")
+
+    active_select = [f"{user} AS user_id", f"{time_range.date_expr()} AS active_date"] + [c.select() for c in dims]
+    cohort_users = "COUNT(DISTINCT c.user_id)"
+    retention_select = ["c.active_date AS cohort_date"] + [f"c.{c.name}" for c in dims] + [f"{cohort_users} AS cohort_users"]
+    for day in days:
+        retained = f"COUNT(DISTINCT CASE WHEN datediff(r.active_date, c.active_date) = {day} THEN r.user_id END)"
+        retention_select.append(f"{retained} AS day_{day}_users")
+        retention_select.append(f"ROUND({retained} / {cohort_users}, 4) AS day_{day}_rate")
+    return {
+        "active_select": _list(active_select, 8),
+        "table": check_table(args.get("table")),
+        # 同期群之后还要看 max(days) 天的活跃
+        "where": _where(time_range, args, extra_days=days[-1], indent=8),
+        "retention_select": _list(retention_select),
+        "cohort_start": quote(time_range.start.isoformat()),
+        "cohort_end": quote(time_range.end.isoformat()),
+        "retention_group": ", ".join(["c.active_date"] + [f"c.{c.name}" for c in dims]),
+        "retention_order": ", ".join(["cohort_date"] + [c.name for c in dims]),
+    }
+
+
+TOPN_SQL = """\
+SELECT
+    {outer_select}
+FROM (
+    SELECT
+        {ranked_select},
+        ROW_NUMBER() OVER ({window}) AS rank_no
+    FROM (
+        SELECT
+            {agg_select}
+        FROM {table}
+        WHERE {where}
+        GROUP BY {agg_group}
+    ) agg
+) ranked
+WHERE rank_no <= {n}
+ORDER BY {outer_order}"""
+
+
+def fill_topn(args: Dict[str, Any]) -> Dict[str, str]:
+    """排名/TopN：按维度汇总指标后排名取前 N，partition_by 指定时在每个分组内（如每天）各取前 N"""
+    time_range = parse_time_range(args)
+    dims = parse_columns(args.get("dims"), "dims", required=True)
+    partition = parse_columns(args.get("partition_by"), "partition_by")
+    metrics = parse_columns(args.get("metrics"), "metrics", required=True)
+    names = [c.name for c in partition + dims + metrics]
+    if len(set(names)) != len(names):
+        raise SqlSkeletonError("partition_by、dims、metrics 的输出列名不能重复")
+    rank_by = args.get("rank_by") or metrics[0].name
+    if rank_by not in {c.name for c in metrics}:
+        raise SqlSkeletonError(f"rank_by 必须是某个指标的别名: {rank_by!r}")
+    n = parse_int(args.get("n"), "n", 10, 1, MAX_TOP_N)
+    window = f"PARTITION BY {', '.join(c.name for c in partition)} " if partition else ""
+    return {
+        "outer_select": _list([c.name for c in partition] + ["rank_no"] + [c.name for c in dims + metrics]),
+        "ranked_select": _list(names, 8),
+        "window": f"{window}ORDER BY {rank_by} DESC",
+        "agg_select": _list([c.select() for c in partition + dims + metrics], 12),
+        "table": check_table(args.get("table")),
+        "where": _where(time_range, args, indent=12),
+        "agg_group": ", ".join(c.expr for c in partition + dims),
+        "n": str(n),
+        "outer_order": ", ".join([c.name for c in partition] + ["rank_no"]),
+    }
+
+
+DETAIL_SQL = """\
+SELECT
+    {columns}
+FROM {table}
+WHERE {where}{order_by}
+LIMIT {limit}"""
+
+
+def fill_detail(args: Dict[str, Any]) -> Dict[str, str]:
+    """明细拉取：显式列出字段，必带行数上限；sample_rate 按比例随机采样，offset 分页（要求 order_by）"""
+    time_range = parse_time_range(args)
+    columns = parse_columns(args.get("columns"), "columns", required=True)
+    order = parse_order(args.get("order_by"))
+    limit = parse_int(args.get("limit"), "limit", 1000, 1, MAX_DETAIL_ROWS)
+    offset = parse_int(args.get("offset"), "offset", 0, 0, 10 ** 9)
+    if offset and not order:
+        raise SqlSkeletonError("分页（offset）需要 order_by，否则各页之间的行不稳定")
+    extra = []
+    if args.get("sample_rate") is not None:
+        try:
+            rate = float(args["sample_rate"])
+        except (TypeError, ValueError):
+            rate = 0.0
+        if not 0 < rate <= 1:
+            raise SqlSkeletonError(f"sample_rate 必须在 (0, 1] 之间: {args['sample_rate']!r}")
+        if rate < 1:
+            extra.append(f"rand() < {rate}")
+    return {
+        "columns": _list([c.select() for c in columns]),
+        "table": check_table(args.get("table")),
+        "where": _where(time_range, args, *extra),
+        "order_by": _clause("ORDER BY", order),
+        "limit": f"{offset}, {limit}" if offset else str(limit),
+    }
+
+
+COMPARE_SQL = """\
+WITH grouped AS (
+    SELECT
+        {grouped_select}
+    FROM {table}
+    WHERE {where}
+    GROUP BY {grouped_group}
+)
+SELECT
+    {compare_select}
+FROM grouped{group_by}{order_by}"""
+
+
+def fill_compare(args: Dict[str, Any]) -> Dict[str, str]:
+    """对比（A/B、分组差异）：各组分别汇总指标后并排展示，其余组相对第一组（基线）的变化率"""
+    time_range = parse_time_range(args)
+    group_field = check_ident(args.get("group_field"), "group_field")
+    groups = _as_list(args.get("groups"), "groups")
+    if not 2 <= len(groups) <= 10:
+        raise SqlSkeletonError("对比需要 2 到 10 个分组（groups 为 group_field 的取值，第一个为基线）")
+    dims = parse_columns(args.get("dims"), "dims")
+    metrics = parse_columns(args.get("metrics"), "metrics", required=True)
+
+    grouped_select = [c.select() for c in dims] + [f"{group_field} AS group_value"] + [c.select() for c in metrics]
+    compare_select = [c.name for c in dims]
+    suffixes = _suffixes(groups)
+    for metric in metrics:
+        values = [f"MAX(CASE WHEN group_value = {quote(g)} THEN {metric.name} END)" for g in groups]
+        compare_select += [f"{value} AS {metric.name}_{suffix}" for value, suffix in zip(values, suffixes)]
+        compare_select += [
+            f"ROUND({value} / NULLIF({values[0]}, 0) - 1, 4) AS {metric.name}_{suffix}_lift"
+            for value, suffix in zip(values[1:], suffixes[1:])
+        ]
+    return {
+        "grouped_select": _list(grouped_select, 8),
+        "table": check_table(args.get("table")),
+        "where": _where(time_range, args, f"{group_field} IN ({', '.join(quote(g) for g in groups)})", indent=8),
+        "grouped_group": ", ".join([c.expr for c in dims] + [group_field]),
+        "compare_select": _list(compare_select),
+        "group_by": _clause("GROUP BY", [c.name for c in dims]),
+        "order_by": _clause("ORDER BY", [c.name for c in dims]),
+    }
+
+
+class Skeleton(NamedTuple):
+    family: str
+    title: str
+    template: SqlTemplate
+    fill: Callable[[Dict[str, Any]], Dict[str, str]]
+    params: str  # 给模型看的参数说明
+
+
+SKELETONS: Dict[str, Skeleton] = {s.family: s for s in (
+    Skeleton("aggregate", "聚合报表", SqlTemplate(AGGREGATE_SQL), fill_aggregate,
+             "metrics 必填；dims、order_by、limit 可选"),
+    Skeleton("funnel", "漏斗/转化", SqlTemplate(FUNNEL_SQL), fill_funnel,
+             "user_field、step_field、steps（2-10 个取值）必填；dims 可选"),
+    Skeleton("retention", "留存/分群", SqlTemplate(RETENTION_SQL), fill_retention,
+             "user_field 必填；retention_days（默认 [1, 7]）、dims 可选"),
+    Skeleton("topn", "排名/TopN", SqlTemplate(TOPN_SQL), fill_topn,
+             "dims、metrics 必填；n（默认 10）、rank_by、partition_by 可选"),
+    Skeleton("detail", "明细拉取", SqlTemplate(DETAIL_SQL), fill_detail,
+             "columns 必填；limit（默认 1000）、order_by、offset、sample_rate 可选"),
+    Skeleton("compare", "对比（A/B）", SqlTemplate(COMPARE_SQL), fill_compare,
+             "group_field、groups（第一个为基线）、metrics 必填；dims 可选"),
+)}
+
+
+class SqlSkeletonEngine:
+    """骨架表及填空统计（抓取指标时读取）"""
+
+    def __init__(self, skeletons: Optional[Dict[str, Skeleton]] = None):
+        self.skeletons = skeletons if skeletons is not None else SKELETONS
+        self.renders: Counter = Counter()  # (family, ok / invalid) -> 次数
+        self.input_chars = 0  # 模型填入的参数字符数
+        self.output_chars = 0  # 生成的 SQL 字符数
+
+    def render(self, family: str, args: Dict[str, Any]) -> str:
+        """校验参数并填入骨架；参数无效时抛出 SqlSkeletonError（说明哪一项需要修改）"""
+        skeleton = self.skeletons.get(family)
+        if skeleton is None:
+            self.renders[(str(family)[:32], "invalid")] += 1
+            raise SqlSkeletonError(f"未知的骨架: {family!r}，可选: {', '.join(self.skeletons)}")
+        try:
+            sql = skeleton.template.render(skeleton.fill(args))
+        except SqlSkeletonError:
+            self.renders[(family, "invalid")] += 1
+            raise
+        self.renders[(family, "ok")] += 1
+        self.input_chars += sum(len(str(value)) for value in args.values())
+        self.output_chars += len(sql)
+        return sql
+
+    def describe(self) -> str:
+        return "\n".join(f"- {s.family}（{s.title}）：{s.params}" for s in self.skeletons.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "renders": {f"{family}/{status}": count for (family, status), count in sorted(self.renders.items())},
+            "input_chars": self.input_chars,
+            "output_chars": self.output_chars,
+        }
+
+
+_LIST = {"type": "array", "items": {"type": "string"}}
+
+
+def build_sql_skeleton_tool(engine: SqlSkeletonEngine):
+    """fill_sql_skeleton 工具定义"""
+
+    @tool(
+        "fill_sql_skeleton",
+        "按意图族选择 SQL 骨架并填空，返回可直接运行的 Hive SQL。写取数 SQL 时优先使用它，不要从零手写；"
+        "只需给出骨架、表、字段和过滤条件（字段先用 getHiveTableSchema 确认）。"
+        "列可以写列名或 \"表达式 AS 别名\"，指标如 \"SUM(cost_amt) AS cost\"；filters 为 WHERE 条件列表。\n"
+        + engine.describe(),
+        {
+            "type": "object",
+            "properties": {
+                "family": {"type": "string", "enum": list(engine.skeletons), "description": "骨架（意图族）"},
+                "table": {"type": "string", "description": "库名.表名"},
+                "time_field": {"type": "string", "description": "分区 / 日期字段，默认 dt"},
+                "start_date": {"type": "string", "description": "开始日期，yyyy-MM-dd 或 yyyyMMdd（与分区格式一致）"},
+                "end_date": {"type": "string", "description": "结束日期（含），默认与开始日期相同"},
+                "dims": {**_LIST, "description": "维度列（TopN 中为排名对象）"},
+                "metrics": {**_LIST, "description": "指标，如 \"SUM(cost_amt) AS cost\""},
+                "filters": {**_LIST, "description": "过滤条件，如 \"status = 1\""},
+                "order_by": {**_LIST, "description": "排序，如 \"cost DESC\""},
+                "limit": {"type": "integer", "description": "行数上限"},
+                "columns": {**_LIST, "description": "明细拉取的字段"},
+                "offset": {"type": "integer", "description": "明细分页偏移"},
+                "sample_rate": {"type": "number", "description": "明细随机采样比例 (0, 1]"},
+                "user_field": {"type": "string", "description": "用户 id 字段（漏斗、留存）"},
+                "step_field": {"type": "string", "description": "步骤 / 事件字段（漏斗）"},
+                "steps": {**_LIST, "description": "漏斗各步骤对应的 step_field 取值，按顺序"},
+                "retention_days": {"type": "array", "items": {"type": "integer"}, "description": "留存天数，如 [1, 7, 30]"},
+                "n": {"type": "integer", "description": "TopN 的 N"},
+                "rank_by": {"type": "string", "description": "TopN 排名依据的指标别名，默认第一个指标"},
+                "partition_by": {**_LIST, "description": "TopN 分组内排名的分组列，如 [\"dt\"]"},
+                "group_field": {"type": "string", "description": "对比的分组字段（如实验组）"},
+                "groups": {**_LIST, "description": "对比的分组取值，第一个为基线"},
+            },
+            "required": ["family", "table", "start_date"],
+        },
+    )
+    async def fill_sql_skeleton(args: Dict[str, Any]) -> Dict[str, Any]:
+        family = str(args.get("family") or "")
+        try:
+            sql = engine.render(family, args)
+        except SqlSkeletonError as e:
+            return {"content": [{"type": "text", "text": f"参数无效：{e}\n请修改后重新调用。"}], "is_error": True}
+        skeleton = engine.skeletons[family]
+        text = f"骨架：{skeleton.title}（{family}）\n```sql\n{sql}\n```"
+        return {"content": [{"type": "text", "text": text}]}
+
+    return fill_sql_skeleton
+
+
+def create_sql_skeleton_server(engine: SqlSkeletonEngine):
+    """创建进程内 SDK MCP 服务器，提供 fill_sql_skeleton 工具"""
+    return create_sdk_mcp_server(
+        name="sql-skeleton", version="1.0.0", tools=[build_sql_skeleton_tool(engine)]
+    )
@@ -0,0 +1,228 @@
+"""
+静态资源缓存
+index.html 和 JS / CSS 在内存中缓存并预压缩（gzip，安装 brotli 时另有 br），带内容哈希指纹和强 ETag；
+index.html 中的资源地址改写为带指纹的文件名（可长期缓存），后台按间隔检查 mtime，文件变化时重新构建，
+请求路径上没有文件 I/O
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，缺失时只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+}
+FINGERPRINT_SUFFIXES = (".js", ".css")
+MIN_COMPRESS_BYTES = 512
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+
+class Asset:
+    """一个缓存的资源：原文和各编码的预压缩内容"""
+
+    __slots__ = ("name", "url_name", "media_type", "digest", "bodies")
+
+    def __init__(self, name: str, content: bytes, media_type: str, fingerprint: bool):
+        self.name = name
+        self.media_type = media_type
+        self.digest = hashlib.sha256(content).hexdigest()[:12]
+        if fingerprint:
+            stem, _, suffix = name.rpartition(".")
+            self.url_name = f"{stem}.{self.digest}.{suffix}"
+        else:
+            self.url_name = name
+        self.bodies: Dict[str, bytes] = {"identity": content}
+        if len(content) >= MIN_COMPRESS_BYTES:
+            self.bodies["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(content, quality=11)
+
+    def etag(self, encoding: str) -> str:
+        # 强 ETag 必须区分不同编码的表示
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """解析 Accept-Encoding，返回 编码 -> q 值"""
+    result: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[token.strip().lower()] = q
+    return result
+
+
+def choose_encoding(asset: Asset, accept_encoding: str) -> str:
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding in asset.bodies and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+def asset_response(asset: Asset, headers: Headers, immutable: bool = False) -> Response:
+    """按 Accept-Encoding 选择预压缩内容，If-None-Match 命中时返回 304"""
+    encoding = choose_encoding(asset, headers.get("accept-encoding", ""))
+    etag = asset.etag(encoding)
+    response_headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=response_headers)
+    if encoding != "identity":
+        response_headers["Content-Encoding"] = encoding
+    return Response(asset.bodies[encoding], media_type=asset.media_type, headers=response_headers)
+
+
+class StaticAssets:
+    """静态资源内存缓存
+
+    - 资源表整体替换（copy-on-write），请求方无需加锁
+    - 后台按间隔检查文件 mtime，有变化时在线程中重新读取、压缩并改写 index.html
+    """
+
+    def __init__(self, directory: Path, index: str = "index.html", poll_interval: float = 2.0):
+        self.directory = Path(directory)
+        self.index_name = index
+        self.poll_interval = poll_interval
+        self.version = 0
+        self._assets: Dict[str, Asset] = {}  # 原文件名和带指纹的文件名 -> 资源
+        self._index: Optional[Asset] = None
+        self._mtimes: Dict[str, Tuple[float, int]] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+        self._reload_lock = asyncio.Lock()
+
+    @property
+    def index(self) -> Optional[Asset]:
+        return self._index
+
+    def get(self, name: str) -> Optional[Asset]:
+        return self._assets.get(name)
+
+    async def start(self):
+        """首次加载并启动后台 mtime 检查"""
+        await self.reload()
+        if self.poll_interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def reload(self) -> bool:
+        """在线程中扫描目录，有变化时替换资源表，返回是否发生变化"""
+        async with self._reload_lock:
+            result = await asyncio.to_thread(self._scan, dict(self._mtimes))
+            if result is None:
+                return False
+            self._assets, self._index, self._mtimes = result
+            self.version += 1
+            logger.info(f"Static assets reloaded: {len(self._mtimes)} files (version {self.version})")
+            return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to reload static assets: {e}")
+
+    def _scan(
+        self, old_mtimes: Dict[str, Tuple[float, int]]
+    ) -> Optional[Tuple[Dict[str, Asset], Optional[Asset], Dict[str, Tuple[float, int]]]]:
+        """扫描静态目录（在工作线程中执行），无变化时返回 None"""
+        files: Dict[str, Path] = {}
+        mtimes: Dict[str, Tuple[float, int]] = {}
+        if self.directory.is_dir():
+            for path in self.directory.iterdir():
+                if not path.is_file() or (path.suffix not in FINGERPRINT_SUFFIXES and path.name != self.index_name):
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files[path.name] = path
+                mtimes[path.name] = (stat.st_mtime, stat.st_size)
+
+        if mtimes == old_mtimes and self.version > 0:
+            return None
+
+        assets: Dict[str, Asset] = {}
+        for name, path in sorted(files.items()):
+            if name == self.index_name:
+                continue
+            try:
+                asset = Asset(name, path.read_bytes(), MEDIA_TYPES[path.suffix], fingerprint=True)
+            except OSError as e:
+                logger.error(f"Failed to read static asset {path}: {e}")
+                continue
+            assets[name] = assets[asset.url_name] = asset
+
+        index = None
+        index_path = files.get(self.index_name)
+        if index_path is not None:
+            try:
+                html = index_path.read_text(encoding="utf-8")
+            except OSError as e:
+                logger.error(f"Failed to read {index_path}: {e}")
+            else:
+                # 页面引用的 JS / CSS 改为带指纹的地址
+                for name, asset in assets.items():
+                    if name == asset.name:
+                        html = html.replace(f'"/static/{name}"', f'"/static/{asset.url_name}"')
+                index = Asset(self.index_name, html.encode("utf-8"), MEDIA_TYPES[".html"], fingerprint=False)
+
+        return assets, index, mtimes
+
+
+class CachedStaticFiles(StaticFiles):
+    """缓存中的资源直接从内存返回（带指纹的地址长期缓存），其余文件交给 StaticFiles"""
+
+    def __init__(self, *args, assets: StaticAssets, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.assets = assets
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset = self.assets.get(path)
+        if asset is not None and scope["method"] in ("GET", "HEAD"):
+            return asset_response(asset, Headers(scope=scope), immutable=path != asset.name)
+        return await super().get_response(path, scope)
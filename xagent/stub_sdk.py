@@ -0,0 +1,251 @@
+"""
+离线替身 SDK 客户端
+接口与 ClaudeSDKClient 一致，按 StubProfile 生成合成的消息流（thinking、工具调用、文本、结果），
+不启动 CLI、不访问网络；用于压测和测试 WebSocket 服务
+"""
+
+import asyncio
+import os
+import re
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Optional
+
+from claude_agent_sdk import (
+    AssistantMessage,
+    ResultMessage,
+    SystemMessage,
+    TextBlock,
+    ThinkingBlock,
+    ToolResultBlock,
+    ToolUseBlock,
+    UserMessage,
+)
+
+# 文本块开头的发送时间戳，压测客户端据此计算帧延迟
+STAMP_PREFIX = "@"
+
+
+def stamp_of(text: str) -> Optional[float]:
+    """取出文本块中的发送时间戳（time.time()），没有时返回 None"""
+    if not text.startswith(STAMP_PREFIX):
+        return None
+    try:
+        return float(text[1:text.index(" ")])
+    except ValueError:
+        return None
+
+
+def _tokens(chars: int) -> int:
+    """粗略的字符数 -> token 数"""
+    return chars // 2
+
+
+def _filler(chars: int) -> str:
+    return ("lorem ipsum 数据 " * (chars // 14 + 1))[:chars]
+
+
+class StubProfile:
+    """合成消息流的形状和节奏（长度为字符数，延迟为秒）"""
+
+    FIELDS = {
+        "text_blocks": int,
+        "text_chars": int,
+        "thinking_blocks": int,
+        "thinking_chars": int,
+        "tool_calls": int,
+        "tool_result_chars": int,
+        "connect_delay": float,
+        "first_token_delay": float,
+        "block_delay": float,
+        "tool_delay": float,
+        "base_context_tokens": int,
+        "prefill_ms_per_1k_tokens": float,
+    }
+
+    def __init__(
+        self,
+        text_blocks: int = 5,
+        text_chars: int = 400,
+        thinking_blocks: int = 1,
+        thinking_chars: int = 300,
+        tool_calls: int = 1,
+        tool_result_chars: int = 2000,
+        connect_delay: float = 0.05,
+        first_token_delay: float = 0.2,
+        block_delay: float = 0.02,
+        tool_delay: float = 0.1,
+        base_context_tokens: int = 2000,
+        prefill_ms_per_1k_tokens: float = 0.0,
+    ):
+        self.text_blocks = text_blocks
+        self.text_chars = text_chars
+        self.thinking_blocks = thinking_blocks
+        self.thinking_chars = thinking_chars
+        self.tool_calls = tool_calls
+        self.tool_result_chars = tool_result_chars
+        self.connect_delay = connect_delay
+        self.first_token_delay = first_token_delay
+        self.block_delay = block_delay
+        self.tool_delay = tool_delay
+        # 上下文模型：每轮的 prompt、工具结果和回复累积进上下文，首字延迟随上下文线性增长
+        self.base_context_tokens = base_context_tokens
+        self.prefill_ms_per_1k_tokens = prefill_ms_per_1k_tokens
+
+    @classmethod
+    def from_env(cls, prefix: str = "XAGENT_STUB_") -> "StubProfile":
+        """从环境变量读取（如 XAGENT_STUB_TEXT_BLOCKS），未设置的字段使用默认值"""
+        values = {}
+        for field, cast in cls.FIELDS.items():
+            raw = os.getenv(prefix + field.upper())
+            if raw not in (None, ""):
+                values[field] = cast(raw)
+        return cls(**values)
+
+    def to_env(self, prefix: str = "XAGENT_STUB_") -> dict:
+        return {prefix + field.upper(): str(getattr(self, field)) for field in self.FIELDS}
+
+    def frames_per_turn(self) -> int:
+        """每轮产生的 assistant_text / thinking / tool_use 帧数（不含 user_message、result）"""
+        return self.text_blocks + self.thinking_blocks + self.tool_calls
+
+
+class StubClaudeSDKClient:
+    """替身客户端：替换 webui_server.ClaudeSDKClient 即可离线运行整个服务
+
+    注册了 PreToolUse/PostToolUse 钩子时会按真实 CLI 的顺序调用，便于覆盖追踪路径；
+    PostToolUse 钩子返回 updatedMCPToolOutput 时用它替换工具结果。
+    上下文随轮次累积，usage 中报告当前上下文大小；发送 "/compact" 时模拟 SDK 原地压缩。
+    轮次进行中再次 query 的消息排队，每条消息各自对应一次 receive_response。
+    """
+
+    profile = StubProfile()
+
+    def __init__(self, options: Any = None, profile: Optional[StubProfile] = None):
+        self.options = options
+        self.profile = profile or type(self).profile
+        self.session_id = getattr(options, "resume", None) or str(uuid.uuid4())
+        self.num_turns = 0
+        self.context_tokens = self.profile.base_context_tokens
+        self._prompts: Deque[str] = deque()
+        self._interrupted = False
+        self._announced = False
+
+    async def connect(self, prompt: Any = None):
+        await asyncio.sleep(self.profile.connect_delay)
+
+    async def disconnect(self):
+        pass
+
+    async def interrupt(self):
+        self._interrupted = True
+
+    async def query(self, prompt: Any, session_id: str = "default"):
+        self._prompts.append(prompt if isinstance(prompt, str) else "")
+        self._interrupted = False
+
+    async def _run_hooks(self, event: str, tool_use_id: str, tool_name: str, tool_input: dict,
+                         tool_response: Any = None) -> Any:
+        """依次调用钩子，返回（可能被 PostToolUse 钩子替换的）工具结果"""
+        hooks = getattr(self.options, "hooks", None) or {}
+        for matcher in hooks.get(event, []):
+            if matcher.matcher and not re.fullmatch(matcher.matcher, tool_name):
+                continue
+            for hook in matcher.hooks:
+                output = await hook({
+                    "hook_event_name": event,
+                    "session_id": self.session_id,
+                    "tool_name": tool_name,
+                    "tool_input": tool_input,
+                    "tool_response": tool_response,
+                }, tool_use_id, None)
+                updated = ((output or {}).get("hookSpecificOutput") or {}).get("updatedMCPToolOutput")
+                if updated is not None:
+                    tool_response = updated
+        return tool_response
+
+    def _usage(self, output_chars: int = 0) -> dict:
+        return {"input_tokens": self.context_tokens, "output_tokens": _tokens(output_chars)}
+
+    async def _compact(self) -> AsyncIterator[Any]:
+        """模拟 SDK 原地压缩：历史压缩为约十分之一"""
+        pre_tokens = self.context_tokens
+        base = self.profile.base_context_tokens
+        self.context_tokens = base + max(pre_tokens - base, 0) // 10
+        yield SystemMessage(subtype="compact_boundary", data={
+            "session_id": self.session_id,
+            "compact_metadata": {"trigger": "manual", "pre_tokens": pre_tokens},
+        })
+        yield ResultMessage(
+            subtype="success", duration_ms=0, duration_api_ms=0, is_error=False, num_turns=self.num_turns,
+            session_id=self.session_id, total_cost_usd=0.0, usage=self._usage(),
+        )
+
+    async def receive_response(self) -> AsyncIterator[Any]:
+        profile = self.profile
+        started = time.perf_counter()
+        self.num_turns += 1
+        if not self._announced:
+            self._announced = True
+            yield SystemMessage(subtype="init", data={"session_id": self.session_id, "model": "stub"})
+        prompt = self._prompts.popleft() if self._prompts else ""
+        if prompt.strip() == "/compact":
+            async for msg in self._compact():
+                yield msg
+            return
+
+        self.context_tokens += _tokens(len(prompt))
+        prefill = self.context_tokens / 1000 * profile.prefill_ms_per_1k_tokens / 1000
+        await asyncio.sleep(profile.first_token_delay + prefill)
+        for _ in range(profile.thinking_blocks):
+            if self._interrupted:
+                return
+            yield AssistantMessage(
+                content=[ThinkingBlock(thinking=_filler(profile.thinking_chars), signature="stub")], model="stub",
+                usage=self._usage(profile.thinking_chars),
+            )
+            await asyncio.sleep(profile.block_delay)
+
+        for i in range(profile.tool_calls):
+            if self._interrupted:
+                return
+            tool_use_id = f"stub_{uuid.uuid4().hex[:12]}"
+            tool_name = "mcp__berserker-metadata__getHiveTableSchema"
+            tool_input = {"table_name": f"db.table_{i}"}
+            yield AssistantMessage(
+                content=[ToolUseBlock(id=tool_use_id, name=tool_name, input=tool_input)],
+                model="stub",
+                usage=self._usage(),
+            )
+            await self._run_hooks("PreToolUse", tool_use_id, tool_name, tool_input)
+            await asyncio.sleep(profile.tool_delay)
+            output = await self._run_hooks(
+                "PostToolUse", tool_use_id, tool_name, tool_input, _filler(profile.tool_result_chars)
+            )
+            self.context_tokens += _tokens(len(output) if isinstance(output, str) else len(str(output)))
+            yield UserMessage(content=[ToolResultBlock(tool_use_id=tool_use_id, content=output, is_error=False)])
+            await asyncio.sleep(profile.block_delay)
+
+        for _ in range(profile.text_blocks):
+            if self._interrupted:
+                return
+            stamp = f"{STAMP_PREFIX}{time.time():.6f} "
+            yield AssistantMessage(
+                content=[TextBlock(text=stamp + _filler(max(profile.text_chars - len(stamp), 0)))], model="stub",
+                usage=self._usage(profile.text_chars),
+            )
+            self.context_tokens += _tokens(profile.text_chars)
+            await asyncio.sleep(profile.block_delay)
+
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        yield ResultMessage(
+            subtype="success",
+            duration_ms=elapsed_ms,
+            duration_api_ms=elapsed_ms,
+            is_error=False,
+            num_turns=self.num_turns,
+            session_id=self.session_id,
+            total_cost_usd=0.0,
+            usage=self._usage(profile.text_blocks * profile.text_chars),
+        )
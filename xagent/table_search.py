@@ -0,0 +1,385 @@
+"""
+本地找表检索引擎（AI找数 V2：BM25 + 倒排索引）
+对表名、表注释、字段名、字段注释建立倒排索引，进程内毫秒级返回 Top-K 候选表；
+表目录来自 JSONL 文件，按 mtime 增量刷新，并以 SDK 自定义工具的形式提供给 Agent
+"""
+
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
+import math
+import re
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from claude_agent_sdk import create_sdk_mcp_server, tool
+
+logger = logging.getLogger(__name__)
+
+# 各字段的词频权重（BM25F 简化版：加权词频后统一计算）
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "comment": 2.0,
+    "field_name": 1.0,
+    "field_comment": 1.0,
+}
+
+_CAMEL_RE = re.compile(r"([a-z0-9])([A-Z])")
+_ASCII_RE = re.compile(r"[a-z0-9]+")
+_CJK_RE = re.compile(r"[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词
+
+    英文/数字按下划线、点号、驼峰切分并转小写；中文无词典，取单字和相邻二元组，
+    "消耗金额" 可以同时命中 "消耗" 和 "金额"。
+    """
+    if not text:
+        return []
+    text = _CAMEL_RE.sub(r"\1 \2", text).lower()
+    tokens = _ASCII_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def query_terms(query: str) -> set:
+    """查询词集合（分词结果 + 整个查询串，用于精确表名匹配）"""
+    terms = set(tokenize(query))
+    terms.add(query.strip().lower())
+    return terms
+
+
+def _top(scores: Dict[str, float], top_k: int) -> List[Tuple[str, float]]:
+    return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def _table_terms(table: Dict[str, Any]) -> Counter:
+    """表记录 -> 加权词频"""
+    terms: Counter = Counter()
+    name = table["table"]
+
+    def add(text: str, weight: float):
+        for token in tokenize(text):
+            terms[token] += weight
+
+    add(name, FIELD_WEIGHTS["name"])
+    # 完整表名和不带库名的表名作为整体词，精确表名查询直接命中
+    terms[name.lower()] += FIELD_WEIGHTS["name"]
+    terms[name.lower().rsplit(".", 1)[-1]] += FIELD_WEIGHTS["name"]
+    add(table.get("comment") or "", FIELD_WEIGHTS["comment"])
+    for field in table.get("fields") or []:
+        add(field.get("name") or "", FIELD_WEIGHTS["field_name"])
+        add(field.get("comment") or "", FIELD_WEIGHTS["field_comment"])
+    return terms
+
+
+class TableSearchIndex:
+    """BM25 倒排索引，支持按表增量更新
+
+    只遍历查询词的倒排链计算得分，检索耗时与命中文档数相关，与表总数无关。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_len: Dict[str, float] = {}
+        self._tables: Dict[str, Dict[str, Any]] = {}
+        self._total_len = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tables
+
+    def upsert(self, table: Dict[str, Any]):
+        """新增或替换一张表"""
+        name = table["table"]
+        if name in self._tables:
+            self.remove(name)
+        terms = _table_terms(table)
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[name] = tf
+        length = sum(terms.values())
+        self._doc_terms[name] = terms
+        self._doc_len[name] = length
+        self._tables[name] = table
+        self._total_len += length
+
+    def remove(self, name: str) -> bool:
+        terms = self._doc_terms.pop(name, None)
+        if terms is None:
+            return False
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(name, None)
+                if not posting:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(name)
+        del self._tables[name]
+        return True
+
+    @property
+    def total_length(self) -> float:
+        return self._total_len
+
+    def terms_of(self, name: str) -> Counter:
+        return self._doc_terms.get(name, Counter())
+
+    def length_of(self, name: str) -> float:
+        return self._doc_len.get(name, 0.0)
+
+    def document_frequency(self, term: str) -> int:
+        posting = self._postings.get(term)
+        return len(posting) if posting else 0
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        """返回得分最高的 top_k 张表（含命中的字段）"""
+        return self.search_with_stats(query, top_k)[0]
+
+    def search_with_stats(self, query: str, top_k: int = 10, **_) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """检索并返回检索范围统计（全量索引的候选集即全部表）"""
+        terms = query_terms(query)
+        scores = self.score(terms, len(self._tables), self._total_len, self.document_frequency)
+        results = [self.describe(name, score, terms) for name, score in _top(scores, top_k)]
+        return results, {"candidates": len(self._tables), "total": len(self._tables)}
+
+    def score(
+        self,
+        terms: Iterable[str],
+        n_docs: int,
+        total_len: float,
+        df: Callable[[str], int],
+    ) -> Dict[str, float]:
+        """用给定的语料统计量（文档数、总长度、文档频率）计算本索引内文档的 BM25 得分
+
+        分片索引传入全局统计量，使不同分片的得分可以直接比较。
+        """
+        if not n_docs or total_len <= 0:
+            return {}
+        k1, doc_len = self.k1, self._doc_len
+        # norm = k1 * (1 - b + b * len / avg_len) 拆成常数项和按长度的线性项
+        base = k1 * (1 - self.b)
+        slope = k1 * self.b * n_docs / total_len
+        scores: Dict[str, float] = {}
+        for term in terms:
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            n_term = df(term)
+            weight = math.log(1 + (n_docs - n_term + 0.5) / (n_term + 0.5)) * (k1 + 1)
+            for name, tf in posting.items():
+                scores[name] = scores.get(name, 0.0) + weight * tf / (tf + base + slope * doc_len[name])
+        return scores
+
+    def describe(self, name: str, score: float, terms: Iterable[str]) -> Dict[str, Any]:
+        """构造单条检索结果"""
+        table = self._tables[name]
+        return {
+            "table": name,
+            "score": round(score, 4),
+            "comment": table.get("comment") or "",
+            "matched_fields": self._matched_fields(table, terms),
+        }
+
+    @staticmethod
+    def _matched_fields(table: Dict[str, Any], query_terms: Iterable[str], limit: int = 8) -> List[Dict[str, str]]:
+        terms = set(query_terms)
+        matched = []
+        for field in table.get("fields") or []:
+            tokens = tokenize(field.get("name") or "") + tokenize(field.get("comment") or "")
+            if terms.intersection(tokens):
+                matched.append({"name": field.get("name") or "", "comment": field.get("comment") or ""})
+                if len(matched) >= limit:
+                    break
+        return matched
+
+
+def _load_catalog(path: Path) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    """读取表目录文件（每行一个 JSON 对象），返回 表名 -> (内容摘要, 表记录)"""
+    tables: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+    with path.open(encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                table = json.loads(line)
+            except ValueError as e:
+                logger.warning(f"Invalid catalog line {path}:{line_no}: {e}")
+                continue
+            if not isinstance(table, dict) or not table.get("table"):
+                continue
+            digest = hashlib.sha1(line.encode("utf-8")).hexdigest()
+            tables[table["table"]] = (digest, table)
+    return tables
+
+
+class TableCatalog:
+    """表目录：从 JSONL 文件加载到 TableSearchIndex，按 mtime 增量刷新
+
+    文件每行格式：{"table": "db.name", "comment": "...", "fields": [{"name": "...", "comment": "..."}]}，
+    可选 "domain"、"layer" 显式指定主题域和分层（分片索引使用）。
+    刷新时只对内容变化的表重建索引项；首次加载在线程中构建完整索引后整体替换。
+    """
+
+    def __init__(self, path: Path, poll_interval: float = 30.0, index_factory: Callable[[], Any] = TableSearchIndex):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.index_factory = index_factory
+        self.index = index_factory()
+        self._digests: Dict[str, str] = {}
+        self._mtime: Optional[Tuple[float, int]] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self._reload_lock = asyncio.Lock()
+
+    async def start(self):
+        await self.reload()
+        if self.poll_interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    async def reload(self) -> bool:
+        """文件有变化时增量更新索引，返回是否发生变化"""
+        async with self._reload_lock:
+            try:
+                stat = self.path.stat()
+            except OSError:
+                if self._mtime is None and not self._digests:
+                    logger.info(f"Table catalog not found: {self.path}")
+                self._mtime = (0.0, 0)
+                return False
+            mtime = (stat.st_mtime, stat.st_size)
+            if mtime == self._mtime:
+                return False
+
+            start = time.perf_counter()
+            tables = await asyncio.to_thread(_load_catalog, self.path)
+            if not self._digests:
+                # 首次加载：在线程中构建完整索引，避免阻塞事件循环
+                self.index = await asyncio.to_thread(self._build, tables)
+                changed, removed = len(tables), 0
+            else:
+                changed = removed = 0
+                for name in [name for name in self._digests if name not in tables]:
+                    self.index.remove(name)
+                    removed += 1
+                for name, (digest, table) in tables.items():
+                    if self._digests.get(name) != digest:
+                        self.index.upsert(table)
+                        changed += 1
+            self._digests = {name: digest for name, (digest, _) in tables.items()}
+            self._mtime = mtime
+            logger.info(
+                f"Table catalog loaded: {len(self.index)} tables "
+                f"({changed} updated, {removed} removed) in {(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+            return True
+
+    def _build(self, tables: Dict[str, Tuple[str, Dict[str, Any]]]):
+        index = self.index_factory()
+        for _, table in tables.values():
+            index.upsert(table)
+        return index
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to reload table catalog: {e}")
+
+
+def format_results(results: List[Dict[str, Any]], stats: Dict[str, Any], elapsed_ms: float) -> str:
+    """把检索结果格式化为给模型阅读的文本"""
+    total = stats.get("total", 0)
+    scope = ""
+    if stats.get("domains"):
+        scope = f"，主题域: {'/'.join(stats['domains'])}"
+    if stats.get("candidates", total) < total:
+        scope += f"，检索范围 {stats['candidates']}/{total} 张表"
+    if not results:
+        return f"未找到匹配的表（已索引 {total} 张表{scope}）。可以换用业务词或字段名重新检索。"
+    lines = [f"检索到 {len(results)} 个候选（{elapsed_ms:.1f}ms{scope}）："]
+    for rank, item in enumerate(results, 1):
+        tags = f"[{item['domain']}/{item['layer']}] " if "layer" in item else ""
+        lines.append(f"{rank}. {tags}{item['table']}  score={item['score']}  {item['comment']}")
+        if item["matched_fields"]:
+            fields = ", ".join(
+                f"{field['name']}({field['comment']})" if field["comment"] else field["name"]
+                for field in item["matched_fields"]
+            )
+            lines.append(f"   命中字段: {fields}")
+        for label in item.get("risk_labels") or ():
+            lines.append(f"   ⚠️ {label}")
+    return "\n".join(lines)
+
+
+def _parse_top_k(value: Any, default: int) -> int:
+    """模型传入的 top_k：缺省或不是整数时使用默认值，限制在 1-50"""
+    if value is None or value == "" or isinstance(value, bool):
+        top_k = default
+    else:
+        try:
+            top_k = int(value)
+        except (TypeError, ValueError, OverflowError):
+            top_k = default
+    return max(1, min(top_k, 50))
+
+
+def build_search_tool(catalog: TableCatalog, default_top_k: int = 10):
+    """search_tables 工具定义"""
+
+    @tool(
+        "search_tables",
+        "按业务词、指标名、字段名检索候选数据表（BM25，覆盖表名、表注释、字段名、字段注释）。"
+        "默认优先返回问题所属主题域的 DWS/ADS 汇总表，明细层/原始层/跨主题域候选会带风险标签。"
+        "找表时先用它缩小范围，再对候选表调用 getHiveTableSchema 等工具确认。",
+        {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "检索词，如 \"广告消耗 按天\"、\"dmp 人群包\""},
+                "top_k": {"type": "integer", "description": f"返回候选数量，默认 {default_top_k}"},
+                "domain": {"type": "string", "description": "指定主题域（如 效果、花火、品牌、DMP），默认自动识别"},
+            },
+            "required": ["query"],
+        },
+    )
+    async def search_tables(args: Dict[str, Any]) -> Dict[str, Any]:
+        query = str(args.get("query") or "")
+        top_k = _parse_top_k(args.get("top_k"), default_top_k)
+        start = time.perf_counter()
+        results, stats = catalog.index.search_with_stats(query, top_k, domain=args.get("domain") or None)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        text = format_results(results, stats, elapsed_ms)
+        return {"content": [{"type": "text", "text": text}]}
+
+    return search_tables
+
+
+def create_table_search_server(catalog: TableCatalog, default_top_k: int = 10):
+    """创建进程内 SDK MCP 服务器，提供 search_tables 工具"""
+    return create_sdk_mcp_server(
+        name="table-search", version="1.0.0", tools=[build_search_tool(catalog, default_top_k)]
+    )
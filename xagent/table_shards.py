@@ -0,0 +1,245 @@
+"""
+按主题域 × 数仓分层分片的找表索引
+先用关键词分类器判定问题所属主题域（效果/花火/品牌/DMP/…），默认只检索 DWS/ADS 分片，
+候选不足时再逐层退到 DWD/DIM/ODS 或其他主题域，并给退化结果打上风险标签
+"""
+
+import heapq
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from xagent.table_search import TableSearchIndex, query_terms, tokenize
+
+logger = logging.getLogger(__name__)
+
+GENERAL_DOMAIN = "通用"
+
+# 主题域关键词（英文按分词匹配，中文按子串匹配）
+DEFAULT_DOMAIN_KEYWORDS: Dict[str, List[str]] = {
+    "效果": ["效果", "投放", "转化", "出价", "ocpx", "ocpc", "cpc", "cpm", "ctr", "cvr", "effect"],
+    "花火": ["花火", "商单", "huahuo", "pickup"],
+    "品牌": ["品牌", "闪屏", "合约", "brand", "splash", "gd"],
+    "DMP": ["dmp", "人群", "人群包", "标签", "crowd", "audience"],
+    "Bdata": ["bdata", "数据银行"],
+    "游戏": ["游戏", "game", "gamecenter"],
+    "带货": ["带货", "电商", "商品", "订单", "gmv", "goods", "mall", "order"],
+}
+
+# 默认只推荐汇总层，其余分层按顺序作为候补
+PRIMARY_LAYERS: Tuple[str, ...] = ("ads", "dws")
+FALLBACK_LAYERS: Tuple[str, ...] = ("dwd", "dim", "other", "ods")
+KNOWN_LAYERS = frozenset(PRIMARY_LAYERS + FALLBACK_LAYERS)
+
+LAYER_RISK_LABELS = {
+    "dwd": "DWD 明细层：需自行聚合，口径需确认",
+    "dim": "DIM 维表：只含维度属性，需关联事实表",
+    "other": "分层未知：口径需确认",
+    "ods": "ODS 原始层：仅作溯源证据，可能不完整",
+}
+CROSS_DOMAIN_RISK_LABEL = "跨主题域：与问题所属主题域不一致，需确认"
+
+_LAYER_RE = re.compile(r"^(ods|dwd|dws|ads|dim)(?:_|$)")
+
+
+def detect_layer(table_name: str) -> str:
+    """按表名前缀识别数仓分层（ods_/dwd_/dws_/ads_/dim_），无法识别时为 other"""
+    short_name = table_name.lower().rsplit(".", 1)[-1]
+    match = _LAYER_RE.match(short_name)
+    return match.group(1) if match else "other"
+
+
+def load_domain_keywords(path: Path) -> Dict[str, List[str]]:
+    """从 JSON 文件读取主题域关键词（{"主题域": ["关键词", ...]}），失败时使用默认配置"""
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return {str(domain): [str(k) for k in keywords] for domain, keywords in data.items()}
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning(f"Failed to load domain keywords from {path}: {e}, using defaults")
+        return dict(DEFAULT_DOMAIN_KEYWORDS)
+
+
+class DomainClassifier:
+    """关键词主题域分类器：只做集合查找和子串匹配，耗时可忽略"""
+
+    def __init__(self, keywords: Optional[Dict[str, List[str]]] = None):
+        self.keywords = keywords or DEFAULT_DOMAIN_KEYWORDS
+        self._ascii: Dict[str, set] = {}
+        self._cjk: Dict[str, List[str]] = {}
+        for domain, words in self.keywords.items():
+            for word in words:
+                word = word.lower()
+                if word.isascii():
+                    self._ascii.setdefault(domain, set()).add(word)
+                else:
+                    self._cjk.setdefault(domain, []).append(word)
+
+    @property
+    def domains(self) -> List[str]:
+        return list(self.keywords)
+
+    def scores(self, text: str) -> Dict[str, int]:
+        lowered = text.lower()
+        tokens = set(tokenize(text))
+        result: Dict[str, int] = {}
+        for domain in self.keywords:
+            hits = len(tokens & self._ascii.get(domain, set()))
+            hits += sum(1 for word in self._cjk.get(domain, ()) if word in lowered)
+            if hits:
+                result[domain] = hits
+        return result
+
+    def classify(self, query: str) -> List[str]:
+        """问题可能所属的主题域，按命中数排序；未命中任何关键词时返回空列表"""
+        scores = self.scores(query)
+        return sorted(scores, key=lambda domain: -scores[domain])
+
+    def classify_table(self, table: Dict[str, Any]) -> str:
+        """表所属主题域：取表名和表注释命中最多的主题域"""
+        domains = self.classify(f"{table['table']} {table.get('comment') or ''}")
+        return domains[0] if domains else GENERAL_DOMAIN
+
+
+class ShardedTableIndex:
+    """按 (主题域, 分层) 分片的 BM25 索引
+
+    与 TableSearchIndex 接口一致（upsert/remove/search/search_with_stats）。
+    全局维护文档频率和总长度，各分片用全局统计量打分，跨分片得分可直接比较。
+    """
+
+    def __init__(
+        self,
+        classifier: Optional[DomainClassifier] = None,
+        primary_layers: Sequence[str] = PRIMARY_LAYERS,
+        fallback_layers: Sequence[str] = FALLBACK_LAYERS,
+    ):
+        self.classifier = classifier or DomainClassifier()
+        self.primary_layers = tuple(primary_layers)
+        self.fallback_layers = tuple(fallback_layers)
+        self._shards: Dict[Tuple[str, str], TableSearchIndex] = {}
+        self._location: Dict[str, Tuple[str, str]] = {}
+        self._df: Dict[str, int] = {}
+        self._total_len = 0.0
+
+    def __len__(self) -> int:
+        return len(self._location)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._location
+
+    def shard_sizes(self) -> Dict[str, int]:
+        return {f"{domain}/{layer}": len(shard) for (domain, layer), shard in sorted(self._shards.items())}
+
+    def upsert(self, table: Dict[str, Any]):
+        """新增或替换一张表；目录中显式给出的 domain/layer 优先于自动识别"""
+        name = table["table"]
+        self.remove(name)
+        domain = table.get("domain") or self.classifier.classify_table(table)
+        layer = (table.get("layer") or detect_layer(name)).lower()
+        if layer not in KNOWN_LAYERS:
+            layer = "other"
+
+        shard = self._shards.get((domain, layer))
+        if shard is None:
+            shard = self._shards[(domain, layer)] = TableSearchIndex()
+        shard.upsert(table)
+        for term in shard.terms_of(name):
+            self._df[term] = self._df.get(term, 0) + 1
+        self._total_len += shard.length_of(name)
+        self._location[name] = (domain, layer)
+
+    def remove(self, name: str) -> bool:
+        location = self._location.pop(name, None)
+        if location is None:
+            return False
+        shard = self._shards[location]
+        for term in shard.terms_of(name):
+            count = self._df.get(term, 0) - 1
+            if count > 0:
+                self._df[term] = count
+            else:
+                self._df.pop(term, None)
+        self._total_len -= shard.length_of(name)
+        shard.remove(name)
+        if not len(shard):
+            del self._shards[location]
+        return True
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        return self.search_with_stats(query, top_k)[0]
+
+    def search_with_stats(
+        self,
+        query: str,
+        top_k: int = 10,
+        domain: Optional[str] = None,
+        prune: bool = True,
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """分阶段检索：命中主题域的汇总层 -> 命中主题域的候补层 -> 其他主题域
+
+        前一阶段凑满 top_k 时不再检索后续分片。prune=False 时一次检索全部分片（用于对比基准）。
+        """
+        terms = query_terms(query)
+        domains = [domain] if domain else self.classifier.classify(query)
+        all_domains = {d for d, _ in self._shards}
+        stats: Dict[str, Any] = {
+            "domains": domains,
+            "total": len(self),
+            "candidates": 0,
+            "shards_searched": 0,
+        }
+        if not prune:
+            results = self._search_stage(terms, list(self._shards), top_k, stats, cross_domain=False)
+            return results, stats
+
+        if domains:
+            in_domain = set(domains) | {GENERAL_DOMAIN}
+            other_domains = all_domains - in_domain
+        else:
+            in_domain, other_domains = all_domains, set()
+
+        stages: List[Tuple[Iterable[str], Iterable[str], bool]] = [(in_domain, self.primary_layers, False)]
+        stages += [(in_domain, (layer,), False) for layer in self.fallback_layers]
+        if other_domains:
+            stages.append((other_domains, self.primary_layers, True))
+            stages += [(other_domains, (layer,), True) for layer in self.fallback_layers]
+
+        results: List[Dict[str, Any]] = []
+        for stage_domains, layers, cross_domain in stages:
+            if len(results) >= top_k:
+                break
+            keys = [(d, layer) for d in stage_domains for layer in layers if (d, layer) in self._shards]
+            if keys:
+                results += self._search_stage(terms, keys, top_k - len(results), stats, cross_domain)
+        return results, stats
+
+    def _search_stage(
+        self,
+        terms: set,
+        keys: List[Tuple[str, str]],
+        top_k: int,
+        stats: Dict[str, Any],
+        cross_domain: bool,
+    ) -> List[Dict[str, Any]]:
+        n_docs, df = len(self), self._df.get
+        scores: Dict[Tuple[str, str], Dict[str, float]] = {}
+        for key in keys:
+            shard = self._shards[key]
+            stats["shards_searched"] += 1
+            stats["candidates"] += len(shard)
+            scores[key] = shard.score(terms, n_docs, self._total_len, lambda term: df(term, 0))
+
+        merged = [(score, key, name) for key, shard_scores in scores.items() for name, score in shard_scores.items()]
+        results = []
+        for score, (domain, layer), name in heapq.nlargest(top_k, merged, key=lambda item: item[0]):
+            item = self._shards[(domain, layer)].describe(name, score, terms)
+            labels = []
+            if layer in LAYER_RISK_LABELS:
+                labels.append(LAYER_RISK_LABELS[layer])
+            if cross_domain:
+                labels.append(CROSS_DOMAIN_RISK_LABEL)
+            item.update({"domain": domain, "layer": layer.upper(), "risk_labels": labels})
+            results.append(item)
+        return results
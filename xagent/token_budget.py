@@ -0,0 +1,153 @@
+"""
+会话 token 预算
+按每轮 usage 跟踪会话的上下文大小和累计费用，超过阈值时逐级处理：
+trim（截断此后的大段 MCP 工具结果）→ compact（SDK 原地压缩）→ rotate（带摘要换到新会话），
+使长时间会话的单轮延迟不随历史增长
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+from claude_agent_sdk import HookMatcher
+
+logger = logging.getLogger(__name__)
+
+TRIM = "trim"
+COMPACT = "compact"
+ROTATE = "rotate"
+
+TRIM_NOTE = "\n\n[结果过长，已截断 {dropped} 字符以节省上下文；需要完整内容时请缩小查询范围后重新调用]"
+
+
+class TokenBudget:
+    """单个会话的预算状态
+
+    阈值为 0 表示不启用该级处理。每轮结束调用 observe()，再由 next_action() 决定要做的处理：
+    - 上下文超过 trim_tokens：开启工具结果截断（每个会话一次）
+    - 超过 compact_tokens：SDK 原地压缩；压缩后仍超过则升级为 rotate
+    - 超过 rotate_tokens 或累计费用超过 rotate_cost_usd：带摘要换到新会话
+    """
+
+    def __init__(self, trim_tokens: int = 60000, compact_tokens: int = 100000, rotate_tokens: int = 150000,
+                 rotate_cost_usd: float = 0.0):
+        self.trim_tokens = trim_tokens
+        self.compact_tokens = compact_tokens
+        self.rotate_tokens = rotate_tokens
+        self.rotate_cost_usd = rotate_cost_usd
+        self.reset()
+
+    def reset(self):
+        """换到新会话后重新计数"""
+        self.context_tokens: Optional[int] = None
+        self.cost_usd = 0.0
+        self.turns = 0
+        self.trimming = False
+        self.compacted = False
+
+    def observe(self, context_tokens: Optional[int], total_cost_usd: Optional[float]):
+        """记录一轮结束时的上下文大小和会话累计费用（ResultMessage.total_cost_usd 为会话累计值）"""
+        self.turns += 1
+        if context_tokens is not None:
+            self.context_tokens = context_tokens
+        if total_cost_usd:
+            self.cost_usd = total_cost_usd
+
+    def next_action(self) -> Optional[str]:
+        tokens = self.context_tokens or 0
+        if self.rotate_tokens and tokens >= self.rotate_tokens:
+            return ROTATE
+        if self.rotate_cost_usd and self.cost_usd >= self.rotate_cost_usd:
+            return ROTATE
+        if self.compact_tokens and tokens >= self.compact_tokens:
+            return ROTATE if self.compacted else COMPACT
+        if self.trim_tokens and tokens >= self.trim_tokens and not self.trimming:
+            return TRIM
+        return None
+
+    def mark_compacted(self, context_tokens: Optional[int] = None):
+        self.compacted = True
+        self.context_tokens = context_tokens
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "context_tokens": self.context_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "turns": self.turns,
+            "trimming": self.trimming,
+            "compacted": self.compacted,
+        }
+
+
+def _trim_text(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + TRIM_NOTE.format(dropped=len(text) - max_chars)
+
+
+def trim_tool_output(output: Any, max_chars: int) -> Any:
+    """按原有结构截断 MCP 工具结果（字符串、content 块列表或带 content 的字典），未超长时原样返回"""
+    if isinstance(output, str):
+        return _trim_text(output, max_chars)
+    if isinstance(output, list):
+        budget = max_chars
+        trimmed = []
+        for block in output:
+            if isinstance(block, dict) and isinstance(block.get("text"), str):
+                text = block["text"]
+                block = {**block, "text": _trim_text(text, max(budget, 0))}
+                budget -= len(text)
+            trimmed.append(block)
+        return trimmed
+    if isinstance(output, dict) and isinstance(output.get("content"), list):
+        return {**output, "content": trim_tool_output(output["content"], max_chars)}
+    return output
+
+
+def output_chars(output: Any) -> int:
+    if isinstance(output, str):
+        return len(output)
+    if isinstance(output, list):
+        return sum(len(b["text"]) for b in output if isinstance(b, dict) and isinstance(b.get("text"), str))
+    if isinstance(output, dict) and isinstance(output.get("content"), list):
+        return output_chars(output["content"])
+    return 0
+
+
+class ToolOutputTrimmer:
+    """PostToolUse 钩子：对开启截断的会话，把超长的 MCP 工具结果截断后再交给模型
+
+    钩子由所有客户端共用，按钩子输入中的 SDK session_id 判断是否截断。
+    """
+
+    def __init__(self, max_chars: int = 4000):
+        self.max_chars = max_chars
+        self._sessions: Set[str] = set()
+        self.trimmed_results = 0
+        self.trimmed_chars = 0
+
+    def enable(self, session_id: Optional[str]):
+        if session_id:
+            self._sessions.add(session_id)
+
+    def disable(self, session_id: Optional[str]):
+        self._sessions.discard(session_id)
+
+    def is_enabled(self, session_id: Optional[str]) -> bool:
+        return session_id in self._sessions
+
+    def hooks(self) -> Dict[str, List[HookMatcher]]:
+        return {"PostToolUse": [HookMatcher(matcher="mcp__.*", hooks=[self.post_tool_use])]}
+
+    async def post_tool_use(self, input_data: Dict[str, Any], tool_use_id: Optional[str], context: Any):
+        if input_data.get("session_id") not in self._sessions:
+            return {}
+        if not str(input_data.get("tool_name", "")).startswith("mcp__"):
+            return {}
+        output = input_data.get("tool_response")
+        before = output_chars(output)
+        if before <= self.max_chars:
+            return {}
+        trimmed = trim_tool_output(output, self.max_chars)
+        self.trimmed_results += 1
+        self.trimmed_chars += before - output_chars(trimmed)
+        return {"hookSpecificOutput": {"hookEventName": "PostToolUse", "updatedMCPToolOutput": trimmed}}
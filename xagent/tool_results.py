@@ -0,0 +1,180 @@
+"""
+大工具结果卸载
+超过内联上限的工具结果不再整段经 WebSocket 推送：帧中只带预览和句柄（result_id），
+全文保存在服务端（内存 LRU，超出字节上限时溢出到磁盘目录），前端按需通过 HTTP 分段读取
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RESULT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def tool_result_text(content: Any) -> str:
+    """ToolResultBlock.content 转为文本：字符串原样返回，MCP 文本块列表拼接文本，其余按 JSON 编码"""
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list) and all(isinstance(b, dict) and b.get("type") == "text" for b in content):
+        return "\n".join(str(b.get("text", "")) for b in content)
+    return json.dumps(content, ensure_ascii=False, default=str)
+
+
+class ToolResultStore:
+    """卸载的工具结果
+
+    内存中按最近读取排序，总字节数超过 max_memory_bytes 时最久未读的结果写入 spill_dir
+    （未配置目录时直接丢弃）；磁盘上本进程写入的文件总字节数超过 max_disk_bytes 时删除最早的文件。
+    max_memory_bytes 为 0 时结果直接写入磁盘，多 worker 共用同一目录即可跨 worker 读取。
+    """
+
+    def __init__(
+        self,
+        spill_dir: Optional[Path] = None,
+        inline_chars: int = 8192,
+        preview_chars: int = 2000,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+        max_age: float = 86400.0,
+    ):
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.inline_chars = inline_chars
+        self.preview_chars = min(preview_chars, inline_chars)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age = max_age
+        self._memory: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # 本进程写入的文件（按写入顺序）
+        self._lock = asyncio.Lock()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.offloaded = 0
+        self.spilled = 0
+        self.evicted = 0
+
+    def start(self):
+        """创建溢出目录并清理过期文件（上次运行或其他 worker 遗留）"""
+        if self.spill_dir is None:
+            return
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        cutoff = time.time() - self.max_age
+        removed = 0
+        for file in [*self.spill_dir.glob("*.txt"), *self.spill_dir.glob("*.tmp")]:
+            try:
+                if file.stat().st_mtime < cutoff:
+                    file.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"Removed {removed} expired tool result file(s) from {self.spill_dir}")
+
+    def close(self):
+        """删除本进程写入的文件"""
+        for result_id in list(self._disk):
+            self._unlink(result_id)
+        self._disk.clear()
+        self.disk_bytes = 0
+        self._memory.clear()
+        self.memory_bytes = 0
+
+    async def offload(self, text: str) -> Dict[str, Any]:
+        """tool_result 帧的内容字段：短结果原样内联，长结果保存后返回预览和句柄"""
+        if len(text) <= self.inline_chars:
+            return {"content": text}
+        result_id = uuid.uuid4().hex
+        size = len(text.encode("utf-8"))
+        self._memory[result_id] = (text, size)
+        self.memory_bytes += size
+        self.offloaded += 1
+        await self._shrink_memory()
+        return {
+            "content": text[:self.preview_chars],
+            "result_id": result_id,
+            "total_chars": len(text),
+            "truncated": True,
+        }
+
+    async def read(self, result_id: str, offset: int = 0, limit: int = 65536) -> Optional[Tuple[str, int]]:
+        """读取 [offset, offset + limit) 字符，返回 (内容, 总字符数)；结果不存在或已过期时返回 None"""
+        entry = self._memory.get(result_id)
+        if entry is not None:
+            self._memory.move_to_end(result_id)
+            text = entry[0]
+        elif self.spill_dir is not None and RESULT_ID_PATTERN.match(result_id):
+            text = await asyncio.to_thread(self._load, result_id)
+            if text is None:
+                return None
+        else:
+            return None
+        offset = max(0, offset)
+        return text[offset:offset + max(0, limit)], len(text)
+
+    async def _shrink_memory(self):
+        async with self._lock:
+            while self.memory_bytes > self.max_memory_bytes and self._memory:
+                result_id, (text, size) = next(iter(self._memory.items()))
+                spilled = False
+                if self.spill_dir is not None:
+                    # 先写文件再移出内存，写入期间的读取仍能命中内存
+                    try:
+                        await asyncio.to_thread(self._write, result_id, text)
+                        spilled = True
+                    except OSError as e:
+                        logger.warning(f"Failed to spill tool result {result_id}: {e}")
+                if spilled:
+                    self._disk[result_id] = size
+                    self.disk_bytes += size
+                    self.spilled += 1
+                else:
+                    self.evicted += 1
+                del self._memory[result_id]
+                self.memory_bytes -= size
+            while self.disk_bytes > self.max_disk_bytes and self._disk:
+                result_id, size = self._disk.popitem(last=False)
+                self.disk_bytes -= size
+                self.evicted += 1
+                await asyncio.to_thread(self._unlink, result_id)
+
+    def _path(self, result_id: str) -> Path:
+        return self.spill_dir / f"{result_id}.txt"
+
+    def _write(self, result_id: str, text: str):
+        # 先写临时文件再原子替换，其他 worker 不会读到写了一半的结果
+        tmp = self.spill_dir / f"{result_id}.{os.getpid()}.tmp"
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, self._path(result_id))
+
+    def _load(self, result_id: str) -> Optional[str]:
+        try:
+            return self._path(result_id).read_text(encoding="utf-8")
+        except OSError:
+            return None
+
+    def _unlink(self, result_id: str):
+        try:
+            self._path(result_id).unlink()
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self.disk_bytes,
+            "offloaded": self.offloaded,
+            "spilled": self.spilled,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,276 @@
+"""
+对话轮次追踪
+每轮用户消息生成一棵 span 树（命令展开、client.query、模型输出、thinking、工具调用、结果），
+工具耗时优先取 SDK PreToolUse/PostToolUse 钩子的时间点；追踪写入滚动 JSONL 文件，前端结果卡片可查看时间线
+"""
+
+import asyncio
+import json
+import logging
+import logging.handlers
+import queue
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from claude_agent_sdk import HookMatcher
+
+logger = logging.getLogger(__name__)
+
+_PREVIEW_CHARS = 200
+
+
+def _preview(value: Any) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return text if len(text) <= _PREVIEW_CHARS else text[:_PREVIEW_CHARS] + "..."
+
+
+class Span:
+    __slots__ = ("span_id", "parent_id", "name", "kind", "start", "end", "attrs")
+
+    def __init__(self, span_id: int, parent_id: Optional[int], name: str, kind: str, start: float,
+                 attrs: Dict[str, Any]):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = start
+        self.end: Optional[float] = None
+        self.attrs = attrs
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class ToolHookTimer:
+    """通过 PreToolUse/PostToolUse 钩子记录工具真实的开始和结束时间
+
+    钩子按 tool_use_id 记录时间点，TurnTrace 收到对应的 ToolResultBlock 时取出；
+    所有客户端共用一个实例，只保留最近的 max_entries 条。
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._times: "OrderedDict[str, List[Optional[float]]]" = OrderedDict()
+
+    def hooks(self) -> Dict[str, List[HookMatcher]]:
+        """用于 ClaudeAgentOptions.hooks"""
+        return {
+            "PreToolUse": [HookMatcher(hooks=[self.pre_tool_use])],
+            "PostToolUse": [HookMatcher(hooks=[self.post_tool_use])],
+            "PostToolUseFailure": [HookMatcher(hooks=[self.post_tool_use])],
+        }
+
+    async def pre_tool_use(self, input_data: Dict[str, Any], tool_use_id: Optional[str], context: Any):
+        if tool_use_id:
+            self._times[tool_use_id] = [time.perf_counter(), None]
+            while len(self._times) > self.max_entries:
+                self._times.popitem(last=False)
+        return {}
+
+    async def post_tool_use(self, input_data: Dict[str, Any], tool_use_id: Optional[str], context: Any):
+        entry = self._times.get(tool_use_id) if tool_use_id else None
+        if entry is not None:
+            entry[1] = time.perf_counter()
+        return {}
+
+    def pop(self, tool_use_id: str) -> Tuple[Optional[float], Optional[float]]:
+        entry = self._times.pop(tool_use_id, None)
+        return (entry[0], entry[1]) if entry else (None, None)
+
+
+class TurnTrace:
+    """一轮对话的 span 树
+
+    时间使用 perf_counter，输出时转换为相对本轮开始的毫秒数。
+    "model" span 表示从上一个输入（查询发出、工具结果返回）到模型输出到达的等待时间。
+    """
+
+    def __init__(self, session_id: Optional[str] = None, hook_timer: Optional[ToolHookTimer] = None,
+                 **attrs: Any):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.hook_timer = hook_timer
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.root = self.span("turn", "turn", parent=None, **attrs)
+        self._mark = self.root.start
+        self._last_model: Optional[Span] = None
+        self._tools: Dict[str, Span] = {}
+
+    def span(self, name: str, kind: str, parent: Optional[Span] = None, **attrs: Any) -> Span:
+        """开始一个 span（默认挂在本轮根节点下）"""
+        if parent is None and self.spans:
+            parent = self.root
+        span = Span(len(self.spans), parent.span_id if parent else None, name, kind, time.perf_counter(), attrs)
+        self.spans.append(span)
+        return span
+
+    def end(self, span: Span, **attrs: Any):
+        span.end = time.perf_counter()
+        span.attrs.update(attrs)
+
+    def event(self, name: str, kind: str, parent: Optional[Span] = None, **attrs: Any) -> Span:
+        """瞬时事件（开始即结束）"""
+        span = self.span(name, kind, parent, **attrs)
+        span.end = span.start
+        return span
+
+    # ---------- SDK 消息流 ----------
+
+    def query_sent(self):
+        """查询已发出，开始等待模型"""
+        self._mark = time.perf_counter()
+
+    def model_output(self) -> Span:
+        """收到一条 AssistantMessage"""
+        now = time.perf_counter()
+        span = Span(len(self.spans), self.root.span_id, "model", "model", self._mark, {})
+        span.end = now
+        self.spans.append(span)
+        self._last_model = span
+        self._mark = now
+        return span
+
+    def thinking(self, text: str):
+        self.event("thinking", "thinking", parent=self._last_model, chars=len(text or ""))
+
+    def tool_use(self, tool_use_id: str, name: str, tool_input: Any):
+        span = self.span(name, "tool", tool_use_id=tool_use_id, input=_preview(tool_input))
+        self._tools[tool_use_id] = span
+
+    def tool_result(self, tool_use_id: str, content: Any, is_error: Optional[bool]) -> Optional[Span]:
+        """工具结果到达，返回对应的工具 span（未匹配到 tool_use 时返回 None）"""
+        span = self._tools.pop(tool_use_id, None)
+        if span is None:
+            return None
+        now = time.perf_counter()
+        pre, post = self.hook_timer.pop(tool_use_id) if self.hook_timer else (None, None)
+        if pre is not None and post is not None and span.start <= pre <= post <= now:
+            # 钩子时间点更准确：去掉消息在流中排队的时间
+            span.attrs["queued_ms"] = round((pre - span.start) * 1000, 2)
+            span.start, span.end = pre, post
+            span.attrs["timing"] = "hooks"
+        else:
+            span.end = now
+            span.attrs["timing"] = "stream"
+        span.attrs["is_error"] = bool(is_error)
+        span.attrs["result_chars"] = len(content) if isinstance(content, str) else len(_preview(content))
+        self._mark = now
+        return span
+
+    def result(self, **attrs: Any):
+        self.event("result", "result", **attrs)
+
+    def finish(self, outcome: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """结束本轮，未结束的 span（如中断时的工具调用）标记为 unfinished"""
+        now = time.perf_counter()
+        for span in self.spans:
+            if span.end is None:
+                span.end = now
+                if span is not self.root:
+                    span.attrs["unfinished"] = True
+        self.root.attrs["outcome"] = outcome
+        if session_id:
+            self.session_id = session_id
+        return self.to_dict()
+
+    def to_dict(self) -> Dict[str, Any]:
+        t0 = self.root.start
+
+        def ms(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round((value - t0) * 1000, 2)
+
+        return {
+            "trace_id": self.trace_id,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.root.duration * 1000, 2),
+            "spans": [
+                {
+                    "id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "start_ms": ms(span.start),
+                    "end_ms": ms(span.end),
+                    "duration_ms": round(span.duration * 1000, 2),
+                    "attrs": span.attrs,
+                }
+                for span in self.spans
+            ],
+        }
+
+
+class TraceWriter:
+    """追踪写入：后台线程追加到滚动 JSONL 文件，并在内存中保留最近的追踪
+
+    多 worker 时每个 worker 写自己的文件（traces.<worker>.jsonl），避免多个进程同时滚动同一文件；
+    查找时也会扫描其他 worker 的文件。
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, recent: int = 200,
+                 worker: Optional[str] = None):
+        base = Path(path)
+        self._pattern = f"{base.stem}*{base.suffix}*"
+        self.path = base.with_name(f"{base.stem}.{worker}{base.suffix}") if worker else base
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.recent = recent
+        self._recent: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+    def start(self):
+        if self._listener is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = logging.handlers.QueueListener(self._queue, handler)
+        self._listener.start()
+        logger.info(f"Trace writer opened: {self.path}")
+
+    def close(self):
+        """写完队列中的追踪并关闭文件"""
+        if self._listener is None:
+            return
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+
+    def write(self, trace: Dict[str, Any]):
+        """非阻塞写入"""
+        self._recent[trace["trace_id"]] = trace
+        while len(self._recent) > self.recent:
+            self._recent.popitem(last=False)
+        if self._listener is not None:
+            line = json.dumps(trace, ensure_ascii=False, separators=(",", ":"), default=str)
+            self._queue.put_nowait(logging.makeLogRecord({"msg": line}))
+
+    async def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        """按 trace_id 查找：先查内存，再在线程中扫描 JSONL 文件（含已滚动的文件）"""
+        trace = self._recent.get(trace_id)
+        if trace is not None:
+            return trace
+        return await asyncio.to_thread(self._scan, trace_id)
+
+    def _scan(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        needle = f'"trace_id":"{trace_id}"'
+        own = [self.path] + [Path(f"{self.path}.{i}") for i in range(1, self.backup_count + 1)]
+        others = sorted(set(self.path.parent.glob(self._pattern)) - set(own))
+        for file in own + others:
+            try:
+                with file.open(encoding="utf-8") as f:
+                    for line in f:
+                        if needle in line:
+                            return json.loads(line)
+            except OSError:
+                continue
+        return None
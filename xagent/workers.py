@@ -0,0 +1,85 @@
+"""
+多 worker 部署
+每个 worker 是独立的 uvicorn 进程、监听独立端口，由 nginx 按前端生成的路由键（affinity）做一致性哈希粘性路由；
+会话元数据通过共享的 SQLite 会话存储在 worker 之间可见
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID_ENV = "XAGENT_WORKER_ID"
+
+
+def worker_id() -> str:
+    """当前进程的 worker 编号（单进程模式为 "0"）"""
+    return os.getenv(WORKER_ID_ENV, "0")
+
+
+def worker_ports(base_port: int, workers: int) -> List[int]:
+    """各 worker 监听的端口：base_port, base_port + 1, ..."""
+    return [base_port + i for i in range(workers)]
+
+
+class WorkerSupervisor:
+    """启动并守护 N 个 worker 进程，异常退出的 worker 会被重新拉起"""
+
+    def __init__(self, app: str, host: str, base_port: int, workers: int, cwd: Path, restart_delay: float = 1.0):
+        self.app = app
+        self.host = host
+        self.ports = worker_ports(base_port, workers)
+        self.cwd = cwd
+        self.restart_delay = restart_delay
+        self._procs: Dict[int, subprocess.Popen] = {}
+        self._stopping = False
+
+    def _spawn(self, index: int) -> subprocess.Popen:
+        # PORT 同时用于拼接本 worker 的内部地址（如元数据缓存代理）
+        env = dict(os.environ, **{WORKER_ID_ENV: str(index), "PORT": str(self.ports[index])})
+        cmd = [
+            sys.executable, "-m", "uvicorn", self.app,
+            "--host", self.host,
+            "--port", str(self.ports[index]),
+        ]
+        proc = subprocess.Popen(cmd, env=env, cwd=str(self.cwd))
+        logger.info(f"Started worker {index} (pid={proc.pid}, port={self.ports[index]})")
+        return proc
+
+    def _stop(self, *_):
+        self._stopping = True
+
+    def run(self) -> int:
+        """阻塞运行，直到收到 SIGINT/SIGTERM"""
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        for index in range(len(self.ports)):
+            self._procs[index] = self._spawn(index)
+
+        while not self._stopping:
+            time.sleep(0.5)
+            for index, proc in list(self._procs.items()):
+                code = proc.poll()
+                if code is not None and not self._stopping:
+                    logger.warning(f"Worker {index} exited with code {code}, restarting")
+                    time.sleep(self.restart_delay)
+                    self._procs[index] = self._spawn(index)
+
+        logger.info("Stopping workers")
+        for proc in self._procs.values():
+            if proc.poll() is None:
+                proc.terminate()
+        deadline = time.time() + 10
+        for proc in self._procs.values():
+            try:
+                proc.wait(timeout=max(0.1, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        return 0